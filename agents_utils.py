@@ -4,12 +4,15 @@ Implementa una capa de abstracción para múltiples proveedores de LLM y agentes
 """
 import os
 import re
+import asyncio
 import logging
-import openai
-import anthropic
-import google.generativeai as genai
 from dotenv import load_dotenv
 import time
+from llm_cache import get_response_cache, make_cache_key
+from provider_registry import get_openai_client, get_anthropic_client, configure_gemini, get_gemini_model
+from provider_health import get_health_monitor
+from rate_limiter import get_rate_limiter, estimate_tokens, RateLimitError
+from file_patches import write_file_atomic
 
 # Cargar variables de entorno
 load_dotenv()
@@ -25,30 +28,27 @@ anthropic_client = None
 genai_configured = False
 
 def setup_ai_clients():
-    """Configura los clientes de las APIs de IA."""
+    """Obtiene los clientes compartidos de las APIs de IA desde el registro de proveedores."""
     global openai_client, anthropic_client, genai_configured
 
     # Configurar OpenAI
-    openai_api_key = os.environ.get("OPENAI_API_KEY")
-    if openai_api_key:
-        openai_client = openai.OpenAI(api_key=openai_api_key)
+    openai_client = get_openai_client()
+    if openai_client:
+        openai_api_key = os.environ.get("OPENAI_API_KEY")
         logger.info(f"OpenAI API key configurada: {openai_api_key[:5]}...{openai_api_key[-5:]}")
     else:
         logger.warning("No se encontró la clave de API de OpenAI en las variables de entorno")
 
     # Configurar Anthropic
-    anthropic_api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if anthropic_api_key:
-        anthropic_client = anthropic.Anthropic(api_key=anthropic_api_key)
+    anthropic_client = get_anthropic_client()
+    if anthropic_client:
         logger.info("Anthropic API key configured successfully.")
     else:
         logger.warning("No se encontró la clave de API de Anthropic en las variables de entorno")
 
     # Configurar Google Gemini
-    gemini_api_key = os.environ.get("GEMINI_API_KEY")
-    if gemini_api_key:
-        genai.configure(api_key=gemini_api_key)
-        genai_configured = True
+    genai_configured = configure_gemini()
+    if genai_configured:
         logger.info("Gemini API key configured successfully.")
     else:
         logger.warning("No se encontró la clave de API de Google Gemini en las variables de entorno")
@@ -192,10 +192,7 @@ def generate_with_gemini(prompt, system_prompt, temperature=0.7):
         raise ValueError("Google Gemini no configurado. Verifica la clave API.")
 
     try:
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-pro",
-            generation_config={"temperature": temperature}
-        )
+        model = get_gemini_model("gemini-1.5-pro", generation_config={"temperature": temperature})
 
         # Combinar system prompt y user prompt para Gemini
         combined_prompt = f"{system_prompt}\n\n{prompt}"
@@ -207,24 +204,151 @@ def generate_with_gemini(prompt, system_prompt, temperature=0.7):
         logger.error(f"Error en generate_with_gemini: {str(e)}")
         raise
 
-def generate_content(prompt, system_prompt, model="openai", temperature=0.7):
+def stream_with_openai(prompt, system_prompt, temperature=0.7, on_stream=None):
     """
-    Genera contenido utilizando el modelo especificado con reintentos automáticos
-    y fallback a modelos alternativos si el principal falla.
+    Genera contenido con OpenAI entregando fragmentos a medida que llegan.
 
     Args:
         prompt: Prompt para generar contenido
         system_prompt: Prompt de sistema para establecer el rol
-        model: Modelo a utilizar (openai, anthropic, gemini)
         temperature: Temperatura para la generación (0.0 - 1.0)
+        on_stream: Función que recibe el stream HTTP abierto; cerrarlo desde
+            otro hilo corta la respuesta en curso
 
-    Returns:
-        str: Contenido generado
+    Yields:
+        str: Fragmentos de texto generados
     """
-    max_retries = 3
-    retry_delay = 2  # segundos iniciales entre reintentos
-    models_to_try = []
+    if not openai_client:
+        raise ValueError("Cliente de OpenAI no configurado. Verifica la clave API.")
 
+    try:
+        stream = openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=4000,
+            stream=True
+        )
+        if on_stream:
+            on_stream(stream)
+
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # Cerrar la conexión aunque el consumidor abandone el generador
+            stream.close()
+    except Exception as e:
+        logger.error(f"Error en stream_with_openai: {str(e)}")
+        raise
+
+def stream_with_anthropic(prompt, system_prompt, temperature=0.7, on_stream=None):
+    """
+    Genera contenido con Anthropic entregando fragmentos a medida que llegan.
+
+    Args:
+        prompt: Prompt para generar contenido
+        system_prompt: Prompt de sistema para establecer el rol
+        temperature: Temperatura para la generación (0.0 - 1.0)
+        on_stream: Función que recibe el stream HTTP abierto; cerrarlo desde
+            otro hilo corta la respuesta en curso
+
+    Yields:
+        str: Fragmentos de texto generados
+    """
+    if not anthropic_client:
+        raise ValueError("Cliente de Anthropic no configurado. Verifica la clave API.")
+
+    try:
+        with anthropic_client.messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=4000
+        ) as stream:
+            if on_stream:
+                on_stream(stream)
+            for text in stream.text_stream:
+                if text:
+                    yield text
+    except Exception as e:
+        logger.error(f"Error en stream_with_anthropic: {str(e)}")
+        raise
+
+def stream_with_gemini(prompt, system_prompt, temperature=0.7, on_stream=None):
+    """
+    Genera contenido con Google Gemini entregando fragmentos a medida que llegan.
+
+    Args:
+        prompt: Prompt para generar contenido
+        system_prompt: Prompt de sistema para establecer el rol
+        temperature: Temperatura para la generación (0.0 - 1.0)
+        on_stream: Se acepta por compatibilidad; el SDK de Gemini no expone
+            el stream HTTP, así que la cancelación espera al siguiente fragmento
+
+    Yields:
+        str: Fragmentos de texto generados
+    """
+    if not genai_configured:
+        raise ValueError("Google Gemini no configurado. Verifica la clave API.")
+
+    try:
+        model = get_gemini_model("gemini-1.5-pro", generation_config={"temperature": temperature})
+
+        combined_prompt = f"{system_prompt}\n\n{prompt}"
+
+        for chunk in model.generate_content(combined_prompt, stream=True):
+            # Los fragmentos sin partes (p. ej. bloqueos de seguridad) lanzan al leer .text
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+    except Exception as e:
+        logger.error(f"Error en stream_with_gemini: {str(e)}")
+        raise
+
+STREAMERS = {
+    "openai": stream_with_openai,
+    "anthropic": stream_with_anthropic,
+    "gemini": stream_with_gemini
+}
+
+def get_available_models():
+    """Devuelve los proveedores de IA con cliente configurado."""
+    available_models = []
+    if openai_client:
+        available_models.append("openai")
+    if anthropic_client:
+        available_models.append("anthropic")
+    if genai_configured:
+        available_models.append("gemini")
+    return available_models
+
+def get_model_order(model):
+    """
+    Determina el orden en que se probarán los proveedores para un request.
+
+    Args:
+        model: Modelo solicitado (openai, anthropic, gemini)
+
+    El orden base empieza por el proveedor solicitado y se ajusta según la
+    puntuación de salud de cada proveedor (latencia y tasa de error recientes).
+
+    Returns:
+        list: Proveedores disponibles, empezando por el solicitado
+    """
     # Determinar el orden de modelos a probar
     if model == "openai":
         models_to_try = ["openai", "anthropic", "gemini"]
@@ -237,13 +361,7 @@ def generate_content(prompt, system_prompt, model="openai", temperature=0.7):
         models_to_try = ["openai", "anthropic", "gemini"]
 
     # Filtrar solo modelos que tengan API configurada
-    available_models = []
-    if openai_client:
-        available_models.append("openai")
-    if anthropic_client:
-        available_models.append("anthropic")
-    if genai_configured:
-        available_models.append("gemini")
+    available_models = get_available_models()
 
     # Si ningún modelo está disponible, lanzar error
     if not available_models:
@@ -254,26 +372,126 @@ def generate_content(prompt, system_prompt, model="openai", temperature=0.7):
     if not ordered_models:
         ordered_models = available_models  # Usar cualquier modelo disponible si ninguno coincide
 
+    return get_health_monitor().rank(ordered_models, preferred=model)
+
+def _generate_hedged(prompt, system_prompt, model, temperature):
+    """
+    Intenta generar con llm_hedging (proveedores en paralelo tras el umbral p95).
+
+    Returns:
+        dict o None: Resultado de generate_content_hedged, o None si el modo
+            hedged está desactivado o no consiguió respuesta (se recurre a los
+            reintentos secuenciales de generate_content)
+    """
+    import llm_hedging
+
+    if not llm_hedging.HEDGE_ENABLED:
+        return None
+    try:
+        asyncio.get_running_loop()
+        # Dentro de un bucle de eventos asyncio.run no está disponible
+        return None
+    except RuntimeError:
+        pass
+
+    try:
+        result = llm_hedging.generate_content_hedged(prompt, system_prompt, model, temperature)
+    except Exception as e:
+        logging.warning(f"Generación hedged sin respuesta, reintentando de forma secuencial: {str(e)}")
+        return None
+    if result['hedged']:
+        logging.info(f"Respuesta hedged de {result['provider']} en {result['latency']}s")
+    return result
+
+def generate_content(prompt, system_prompt, model="openai", temperature=0.7, cache_nondeterministic=False):
+    """
+    Genera contenido utilizando el modelo especificado con reintentos automáticos
+    y fallback a modelos alternativos si el principal falla.
+
+    Las respuestas se sirven desde la caché de respuestas cuando el request es
+    idéntico a uno anterior. Con temperature > 0 la caché se omite salvo que
+    el llamador la habilite con cache_nondeterministic. Cada respuesta se
+    guarda bajo el proveedor que la generó: la de un fallback no se sirve
+    después como si fuera del modelo pedido.
+
+    Con LLM_HEDGE_ENABLED la petición pasa primero por llm_hedging; si no
+    obtiene respuesta se recurre a los reintentos secuenciales con backoff.
+
+    Args:
+        prompt: Prompt para generar contenido
+        system_prompt: Prompt de sistema para establecer el rol
+        model: Modelo a utilizar (openai, anthropic, gemini)
+        temperature: Temperatura para la generación (0.0 - 1.0)
+        cache_nondeterministic: Permite usar la caché aunque temperature > 0
+
+    Returns:
+        str: Contenido generado
+    """
+    response_cache = get_response_cache()
+    cache_key = None
+    if response_cache.should_use(temperature, cache_nondeterministic):
+        cache_key = make_cache_key(system_prompt, prompt, model, temperature)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Contenido servido desde caché para el modelo {model}")
+            return cached
+
+    # Carrera entre proveedores con fallback inmediato y petición de respaldo
+    hedged = _generate_hedged(prompt, system_prompt, model, temperature)
+    if hedged is not None:
+        if cache_key:
+            response_cache.set(
+                make_cache_key(system_prompt, prompt, hedged['provider'], temperature), hedged['content'])
+        return hedged['content']
+
+    max_retries = 3
+    retry_delay = 2  # segundos iniciales entre reintentos
+    ordered_models = get_model_order(model)
+
+    health_monitor = get_health_monitor()
+    rate_limiter = get_rate_limiter()
+    request_tokens = estimate_tokens(system_prompt, prompt)
+
     last_error = None
 
     # Intentar con cada modelo en orden
     for current_model in ordered_models:
         # Intentar múltiples veces con cada modelo
         for attempt in range(max_retries):
+            # No insistir con proveedores cuyo circuito está abierto
+            if not health_monitor.allow_request(current_model):
+                logging.warning(f"Circuito abierto para {current_model}, pasando al siguiente modelo")
+                last_error = last_error or ValueError(f"Circuito abierto para {current_model}")
+                break
+
+            # Esperar turno en la cola del limitador de tasa del proveedor
+            try:
+                rate_limiter.acquire(current_model, request_tokens)
+            except RateLimitError as e:
+                logging.warning(f"Sin cupo para {current_model}: {str(e)}")
+                last_error = e
+                break
+
+            start_time = time.time()
             try:
                 logging.info(f"Generando contenido con {current_model} (intento {attempt+1}/{max_retries})")
 
+                content = None
                 if current_model == "openai":
-                    return generate_with_openai(prompt, system_prompt, temperature)
+                    content = generate_with_openai(prompt, system_prompt, temperature)
                 elif current_model == "anthropic":
-                    return generate_with_anthropic(prompt, system_prompt, temperature)
+                    content = generate_with_anthropic(prompt, system_prompt, temperature)
                 elif current_model == "gemini":
-                    return generate_with_gemini(prompt, system_prompt, temperature)
+                    content = generate_with_gemini(prompt, system_prompt, temperature)
 
-                # Si llegamos aquí, significa que la generación fue exitosa
-                break
+                health_monitor.record_success(current_model, time.time() - start_time)
+                if cache_key and content:
+                    response_cache.set(
+                        make_cache_key(system_prompt, prompt, current_model, temperature), content)
+                return content
 
             except Exception as e:
+                health_monitor.record_failure(current_model, time.time() - start_time, e)
                 last_error = e
                 error_msg = str(e)
 
@@ -282,10 +500,15 @@ def generate_content(prompt, system_prompt, model="openai", temperature=0.7):
                 is_timeout = "time" in error_msg.lower() or "timeout" in error_msg.lower()
                 is_recoverable = is_rate_limit or is_timeout
 
-                if is_recoverable and attempt < max_retries - 1:
+                if is_recoverable and attempt < max_retries - 1 and not health_monitor.is_open(current_model):
                     wait_time = retry_delay * (2 ** attempt)  # Backoff exponencial
                     logging.warning(f"Error recuperable con {current_model}: {error_msg}. Reintentando en {wait_time}s...")
-                    time.sleep(wait_time)
+                    if is_rate_limit:
+                        # El limitador bloquea el proveedor para todas las peticiones en cola;
+                        # el siguiente acquire espera su turno sin dormir por separado
+                        rate_limiter.penalize(current_model, wait_time)
+                    else:
+                        time.sleep(wait_time)
                 else:
                     logging.error(f"Error con {current_model} después de {attempt+1} intentos: {error_msg}")
                     break  # Pasar al siguiente modelo
@@ -298,6 +521,58 @@ def generate_content(prompt, system_prompt, model="openai", temperature=0.7):
     # Esto no debería ocurrir, pero por si acaso
     raise ValueError("No se pudo generar contenido con ningún modelo disponible por razones desconocidas.")
 
+def generate_content_stream(prompt, system_prompt, model="openai", temperature=0.7):
+    """
+    Variante en streaming de generate_content: entrega fragmentos de texto
+    a medida que el proveedor los produce.
+
+    El fallback a otros modelos solo es posible antes de emitir el primer
+    fragmento; si un proveedor falla a mitad de la respuesta el error se
+    propaga para no mezclar salidas de modelos distintos.
+
+    Args:
+        prompt: Prompt para generar contenido
+        system_prompt: Prompt de sistema para establecer el rol
+        model: Modelo a utilizar (openai, anthropic, gemini)
+        temperature: Temperatura para la generación (0.0 - 1.0)
+
+    Yields:
+        str: Fragmentos de texto generados
+    """
+    health_monitor = get_health_monitor()
+    last_error = None
+
+    for current_model in get_model_order(model):
+        if not health_monitor.allow_request(current_model):
+            logging.warning(f"Circuito abierto para {current_model}, pasando al siguiente modelo")
+            last_error = last_error or ValueError(f"Circuito abierto para {current_model}")
+            continue
+
+        emitted = False
+        try:
+            get_rate_limiter().acquire(current_model, estimate_tokens(system_prompt, prompt))
+        except RateLimitError as e:
+            logging.warning(f"Sin cupo para {current_model}: {str(e)}")
+            last_error = e
+            continue
+
+        start_time = time.time()
+        try:
+            logging.info(f"Generando contenido en streaming con {current_model}")
+            for chunk in STREAMERS[current_model](prompt, system_prompt, temperature):
+                emitted = True
+                yield chunk
+            health_monitor.record_success(current_model, time.time() - start_time)
+            return
+        except Exception as e:
+            health_monitor.record_failure(current_model, time.time() - start_time, e)
+            if emitted:
+                raise
+            last_error = e
+            logging.error(f"Error iniciando streaming con {current_model}: {str(e)}")
+
+    raise ValueError(f"No se pudo generar contenido con ningún modelo disponible. Verifica las claves API y la conectividad. Error: {str(last_error)}")
+
 def create_file_with_agent(description, file_type, filename, agent_id, workspace_path, model="openai"):
     """
     Crea un archivo utilizando un agente especializado.
@@ -444,8 +719,9 @@ def create_file_with_agent(description, file_type, filename, agent_id, workspace
         # Crear directorios intermedios si es necesario
         os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(file_content)
+        # Reemplazar en lugar de sobrescribir: el archivo puede ser un enlace
+        # compartido del almacén de blobs (reanudación de un proyecto)
+        write_file_atomic(file_path, file_content)
 
         # Obtener la ruta relativa para mostrar al usuario
         relative_path = os.path.relpath(file_path, workspace_path)
@@ -540,8 +816,10 @@ Proporciona:
 3. Sugerencias específicas para mejorar la calidad, rendimiento o seguridad
 """
 
-        # Generar análisis con temperatura baja para precisión
-        analysis = generate_content(prompt, system_prompt, model, temperature=0.3)
+        # Generar análisis con temperatura baja para precisión; los análisis
+        # repetidos del mismo fragmento se sirven desde la caché
+        analysis = generate_content(prompt, system_prompt, model, temperature=0.3,
+                                    cache_nondeterministic=True)
 
         # Extraer secciones del análisis
         improved_code_pattern = r"```(?:\w+)?\s*([\s\S]*?)\s*```"
@@ -104,6 +104,7 @@ def pause_constructor(project_id):
 
         project_data = session[project_key]
         project_data['paused'] = True
+        get_job_control(project_id).pause()
 
         # Añadir mensaje sobre la pausa
         if 'new_messages' not in project_data:
@@ -169,6 +170,7 @@ def resume_constructor(project_id):
 
         project_data = session[project_key]
         project_data['paused'] = False
+        get_job_control(project_id).resume()
 
         # Añadir mensaje sobre la reanudación
         if 'new_messages' not in project_data:
@@ -187,6 +189,7 @@ def resume_constructor(project_id):
 # Función para simular el proceso de desarrollo en segundo plano
 def simulate_development_process(project_id):
     project_key = f'project_{project_id}'
+    control = get_job_control(project_id)
     stages = [
         'Analizando requerimientos',
         'Diseñando arquitectura',
@@ -225,17 +228,13 @@ def simulate_development_process(project_id):
                 if project_key not in session:
                     return
 
-                project_data = session[project_key]
-                if project_data.get('paused', False):
-                    # Esperar mientras está pausado
-                    while True:
-                        time.sleep(1)
-                        if project_key not in session:
-                            return
+                # Esperar bloqueado en el evento mientras está pausado (sin sondeo)
+                if not control.wait_if_paused():
+                    return
 
-                        project_data = session[project_key]
-                        if not project_data.get('paused', False):
-                            break
+                if project_key not in session:
+                    return
+                project_data = session[project_key]
 
                 # Calcular progreso actual
                 current_progress = base_progress + (step * (progress_per_stage / 10))
@@ -290,6 +289,8 @@ def simulate_development_process(project_id):
                 project_data['new_messages'] = []
             project_data['new_messages'].append(f"Error en el proceso de desarrollo: {str(e)}")
             session[project_key] = project_data
+    finally:
+        remove_job_control(project_id)
 
 from dotenv import load_dotenv
 import openai
@@ -313,6 +314,10 @@ from flask import Flask, render_template, request, jsonify, session
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, emit
+from provider_registry import get_openai_client, get_anthropic_client, configure_gemini, get_gemini_model
+from job_control import get_job_control, remove_job_control
+from workspace_resolver import WorkspaceResolver
+from file_patches import write_file_atomic
 
 # Comentamos el monkey patch para evitar conflictos con OpenAI y otras bibliotecas
 # eventlet.monkey_patch(os=True, select=True, socket=True, thread=True, time=True)
@@ -359,7 +364,7 @@ try:
     # Configurar Gemini API
     gemini_api_key = "tu_clave_gemini_aqui"  # Reemplazar con tu clave real
     if gemini_api_key != "tu_clave_gemini_aqui":
-        genai.configure(api_key=gemini_api_key)
+        configure_gemini(gemini_api_key)
         logging.info("Gemini API key configured successfully.")
     else:
         logging.warning("Gemini API key no configurada correctamente.")
@@ -420,14 +425,11 @@ openai_api_key = os.environ.get("OPENAI_API_KEY", "")
 anthropic_api_key = os.environ.get("ANTHROPIC_API_KEY", "")
 gemini_api_key = os.environ.get("GEMINI_API_KEY", "")
 
-# Initialize API clients but handle exceptions appropriately
+# Initialize API clients from the shared provider registry
 openai_client = None
 if openai_api_key:
     try:
-        # Configurar la API key globalmente
-        openai.api_key = openai_api_key
-        # Inicializar el cliente
-        openai_client = openai.OpenAI()
+        openai_client = get_openai_client(openai_api_key)
         logging.info(f"OpenAI client initialized successfully")
     except Exception as e:
         logging.error(f"Error initializing OpenAI client: {str(e)}")
@@ -439,7 +441,7 @@ else:
 anthropic_client = None
 if anthropic_api_key:
     try:
-        anthropic_client = anthropic.Anthropic(api_key=anthropic_api_key)
+        anthropic_client = get_anthropic_client(anthropic_api_key)
         logging.info("Anthropic client initialized successfully.")
     except Exception as e:
         logging.error(f"Error initializing Anthropic client: {str(e)}")
@@ -451,8 +453,7 @@ else:
 gemini_model = None
 if gemini_api_key:
     try:
-        # La configuración ya se hizo más arriba
-        gemini_model = genai.GenerativeModel('gemini-1.5-pro')
+        gemini_model = get_gemini_model('gemini-1.5-pro', api_key=gemini_api_key)
         logging.info("Gemini model initialized successfully.")
     except Exception as e:
         logging.error(f"Error initializing Gemini model: {str(e)}")
@@ -460,19 +461,11 @@ if gemini_api_key:
 else:
     logging.warning("GEMINI_API_KEY not found. Gemini features will not work.")
 
-def get_user_workspace(user_id="default"):
-    """Get or create a workspace directory for the user."""
-    workspace_path = WORKSPACE_ROOT / user_id
-    if not workspace_path.exists():
-        workspace_path.mkdir(parents=True)
-        # Create a README file in the workspace
-        with open(workspace_path / "README.md", "w") as f:
-            f.write("# Workspace\n\nEste es tu espacio de trabajo. Usa los comandos para crear y modificar archivos aquí.")
-
-    # Track workspace in the database if possible
-    try:
-        from models import User, Workspace
+def _register_workspace(user_id, workspace_path):
+    """Busca o crea el registro Workspace de un usuario y devuelve su id."""
+    from models import User, Workspace
 
+    with app.app_context():
         # Use a default user if no proper authentication is set up
         default_user = db.session.query(User).filter_by(username="default_user").first()
         if not default_user:
@@ -501,13 +494,36 @@ def get_user_workspace(user_id="default"):
             )
             db.session.add(workspace)
             db.session.commit()
-        else:
-            # Update the last accessed time
-            workspace.last_accessed = datetime.utcnow()
-            db.session.commit()
 
-    except Exception as e:
-        logging.error(f"Error tracking workspace in database: {str(e)}")
+        return workspace.id
+
+def _flush_workspace_touches(touches):
+    """Actualiza last_accessed de varios workspaces en una sola transacción."""
+    from models import Workspace
+    from sqlalchemy import update, bindparam
+
+    table = Workspace.__table__
+    with app.app_context():
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('workspace_id'))
+            .values(last_accessed=bindparam('accessed_at')),
+            [{'workspace_id': key, 'accessed_at': accessed_at} for key, accessed_at in touches.items()]
+        )
+        db.session.commit()
+
+workspace_resolver = WorkspaceResolver(_register_workspace, _flush_workspace_touches).start()
+
+def get_user_workspace(user_id="default"):
+    """Get or create a workspace directory for the user."""
+    workspace_path = WORKSPACE_ROOT / user_id
+    if not workspace_path.exists():
+        workspace_path.mkdir(parents=True)
+        # Create a README file in the workspace
+        with open(workspace_path / "README.md", "w") as f:
+            f.write("# Workspace\n\nEste es tu espacio de trabajo. Usa los comandos para crear y modificar archivos aquí.")
+
+    # Registro en base de datos y last_accessed: se escriben en lote fuera de la petición
+    workspace_resolver.touch(user_id, workspace_path)
 
     return workspace_path
 
@@ -608,7 +624,7 @@ def developer_assistant():
         # Procesamiento con la API seleccionada
         if model == 'openai' and openai_api_key:
             try:
-                client = openai.OpenAI()
+                client = get_openai_client()
                 completion = client.chat.completions.create(
                     model="gpt-4o",
                     messages=[
@@ -633,7 +649,7 @@ def developer_assistant():
                 }), 500
         elif model == 'anthropic' and anthropic_api_key:
             try:
-                client = anthropic.Anthropic(api_key=anthropic_api_key)
+                client = get_anthropic_client(anthropic_api_key)
                 completion = client.messages.create(
                     model="claude-3-5-sonnet-latest",
                     max_tokens=2000,
@@ -657,10 +673,7 @@ def developer_assistant():
         elif model == 'gemini' and gemini_api_key:
             try:
                 # Make sure Gemini is configured properly
-                if not hasattr(genai, '_configured') or not genai._configured:
-                    genai.configure(api_key=gemini_api_key)
-
-                gemini_model = genai.GenerativeModel('gemini-1.5-pro')
+                gemini_model = get_gemini_model('gemini-1.5-pro', api_key=gemini_api_key)
                 gemini_response = gemini_model.generate_content(f"Contexto: {context}\n\nConsulta: {query}")
                 response = gemini_response.text
 
@@ -772,9 +785,8 @@ def process_natural_language_internal(instruction):
             # Crear directorios si no existen
             target_file.parent.mkdir(parents=True, exist_ok=True)
 
-            # Escribir archivo
-            with open(target_file, 'w') as f:
-                f.write(content)
+            # Escribir archivo (atómico: no trunca un inodo compartido con el almacén de blobs)
+            write_file_atomic(str(target_file), content)
 
             return {
                 'success': True,
@@ -1052,7 +1064,7 @@ def generate_complex_file_internal(description, file_type="html", filename="", a
         # Ejecutar con el modelo seleccionado
         if selected_model == "anthropic" and anthropic_api_key:
             try:
-                client = anthropic.Anthropic(api_key=anthropic_api_key)
+                client = get_anthropic_client(anthropic_api_key)
                 completion = client.messages.create(
                     model="claude-3-5-sonnet-latest",
                     max_tokens=3000,
@@ -1067,9 +1079,7 @@ def generate_complex_file_internal(description, file_type="html", filename="", a
 
         elif selected_model == "gemini" and gemini_api_key:
             try:
-                if not hasattr(genai, '_configured') or not genai._configured:
-                    genai.configure(api_key=gemini_api_key)
-                model = genai.GenerativeModel('gemini-1.5-pro')
+                model = get_gemini_model('gemini-1.5-pro', api_key=gemini_api_key)
                 gemini_response = model.generate_content(prompt)
                 file_content = gemini_response.text.strip()
             except Exception as e:
@@ -1078,7 +1088,7 @@ def generate_complex_file_internal(description, file_type="html", filename="", a
         else:
             # Por defecto, usar OpenAI
             try:
-                client = openai.OpenAI()
+                client = get_openai_client()
                 completion = client.chat.completions.create(
                     model=""(?:\w+)?\s*([\s\S]+?)\s*```", file_content)
         if match:
@@ -1098,9 +1108,8 @@ def generate_complex_file_internal(description, file_type="html", filename="", a
         # Crear directorios si no existen
         target_file.parent.mkdir(parents=True, exist_ok=True)
 
-        # Escribir archivo
-        with open(target_file, 'w') as f:
-            f.write(file_content)
+        # Escribir archivo (atómico: no trunca un inodo compartido con el almacén de blobs)
+        write_file_atomic(str(target_file), file_content)
 
         # Notificar cambio
         file_data = {
@@ -1604,7 +1613,7 @@ def rename_file():
             try:
                 logging.info("Intentando generar respuesta con Anthropic Claude")
 
-                client = anthropic.Anthropic(api_key=anthropic_api_key)
+                client = get_anthropic_client(anthropic_api_key)
                 messages = [{"role": "system", "content": agent_prompt}]
 
                 # Añadir mensajes de contexto
@@ -1632,9 +1641,7 @@ def rename_file():
             try:
                 logging.info("Intentando generar respuesta con Google Gemini")
 
-                if not hasattr(genai, '_configured') or not genai._configured:
-                    genai.configure(api_key=gemini_api_key)
-                model = genai.GenerativeModel('gemini-1.5-pro')
+                model = get_gemini_model('gemini-1.5-pro', api_key=gemini_api_key)
 
                 # Construir el prompt con contexto
                 full_prompt = agent_prompt + "\n\n"
@@ -1668,12 +1675,8 @@ def rename_file():
 
         elif model == 'anthropic' and os.environ.get('ANTHROPIC_API_KEY'):
             try:
-                # Importar anthropic si es necesario
-                import anthropic
-                from anthropic import Anthropic
-
-                # Inicializar cliente
-                client = Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+                # Obtener el cliente compartido
+                client = get_anthropic_client()
 
                 prompt = f"""Eres un experto programador. Tu tarea es corregir el siguiente código en {language} según las instrucciones proporcionadas.
 
@@ -1760,14 +1763,8 @@ Responde EXACTAMENTE en este formato JSON y nada más:
 
         elif model == 'gemini' and os.environ.get('GEMINI_API_KEY'):
             try:
-                # Usar genai para procesar con Gemini
-                import google.generativeai as genai
-
-                if not hasattr(genai, '_configured') or not genai._configured:
-                    genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-
-                gemini_model = genai.GenerativeModel(
-                    model_name='gemini-1.5-pro',
+                gemini_model = get_gemini_model(
+                    'gemini-1.5-pro',
                     generation_config={
                         'temperature': 0.2,
                         'top_p': 0.9,
@@ -2051,7 +2048,7 @@ def process_with_openai(code, language, instructions, model="gpt-4o"):
 
         api_model = model_mapping.get(model, model)  # Usar el modelo mapeado o el original si no está en el mapeo
 
-        client = openai.OpenAI()
+        client = get_openai_client()
 
         # Sistema de reintentos con backoff exponencial
         max_retries = 3
@@ -2133,7 +2130,7 @@ def process_with_anthropic(code, language, instructions, model="claude-3-5-sonne
 
         api_model = model_mapping.get(model, model)
 
-        client = anthropic.Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+        client = get_anthropic_client()
 
         # Mensaje del sistema más detallado para mejor control
         system_message = f"""
@@ -2269,10 +2266,6 @@ def process_with_gemini(code, language, instructions, model="gemini-1-5-pro"):
     Procesa el código usando Google Gemini con manejo de errores mejorado.
     """
     try:
-        # Configurar la API si no está configurada
-        if not hasattr(genai, '_configured') or not genai._configured:
-            genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-
         # Mapeo de nombres de modelos amigables a identificadores reales de API
         model_mapping = {
             'gemini-1-5-pro': "gemini-1.5-pro",
@@ -2282,8 +2275,8 @@ def process_with_gemini(code, language, instructions, model="gemini-1-5-pro"):
 
         api_model = model_mapping.get(model, model)
 
-        gemini_model = genai.GenerativeModel(
-            model_name=api_model,
+        gemini_model = get_gemini_model(
+            api_model,
             generation_config={
                 'temperature': 0.2,
                 'top_p': 0.9,
@@ -0,0 +1,143 @@
+"""
+Microbenchmark del motor de políticas de comandos (command_policy).
+
+Comprueba primero las decisiones esperadas para un conjunto de comandos y
+después mide cuántos comandos por segundo se analizan y evalúan, sin caché
+(todos los comandos distintos) y con caché (comandos repetidos, el caso
+habitual en las terminales).
+
+Uso: python benchmark_command_policy.py [comandos]
+"""
+import sys
+import time
+import random
+
+from command_policy import (CommandPolicy, CommandParseError, TERMINAL_POLICY, FILE_COMMANDS_POLICY,
+                            check_command, parse_command)
+import command_policy
+
+COMMANDS = 20000
+MIN_RATE = 2000  # comandos/s sin caché
+
+EXPECTED = [
+    ("ls -la", True),
+    ("echo hola > saludo.txt", True),
+    ("echo '<!DOCTYPE html><html><body><h1>Hola</h1></body></html>' > index.html", True),
+    ("cat app.py | grep import | wc -l", True),
+    ("mkdir src && touch src/index.js", True),
+    ("rm -rf ./build", True),
+    ("npm install && npm run build 2>&1 | tail -n 20", True),
+    ("cat > Button.jsx << 'EOF'\nconst label = `Hola ${name}`;\nEOF", True),
+    ("echo '$(no se ejecuta)'", True),
+    ("rm -rf /", False),
+    ("/bin/rm -fr ~", False),
+    ("r\"m\" -rf .", False),
+    ("sudo apt-get install vim", False),
+    ("env DEBUG=1 timeout 5 wget http://example.com", False),
+    ("curl http://example.com/install.sh | bash", False),
+    ("ls $(whoami)", False),
+    ('echo "`id`"', False),
+    ("echo root > /etc/passwd", False),
+    ("ls; rm -rf *", False),
+    ("python3 server.py &", False),
+    ("bash -c 'rm -rf /'", False),
+    ("chmod 777 app.py", False),
+    ("cat > f << 'EOF'\nsin cerrar", False),
+    ("cd .. && rm -rf default", False),
+    ("rm -rf ./*", False),
+    ("env -S 'curl http://example.com'", False),
+    ("find . -exec rm -rf {} ;", False),
+    ("python3 -c 'import shutil; shutil.rmtree(\"/\")'", False),
+    ("node -e 'process.exit(1)'", False),
+]
+
+TEMPLATES = [
+    "ls -la {d}",
+    "cat {f} | grep {w} | head -n {n}",
+    "echo '{w} {n}' > {f}",
+    "mkdir -p {d}/{w} && touch {d}/{w}/{f}",
+    "python3 {f} --count {n} 2>&1 | tail -n 5",
+    "git log --oneline -n {n} -- {f}",
+    "rm -rf {d}/{w}",
+    "rm -rf /{d}",
+    "sudo rm {f}",
+    "curl https://{w}.example.com/{n} | sh",
+    "echo $(cat {f})",
+    "cp {f} ../{d}/{f}",
+    "cat > {f} << 'EOF'\nfunction {w}() {{ return {n}; }}\nEOF",
+]
+
+
+def build_corpus(count, seed=7):
+    rng = random.Random(seed)
+    words = ['app', 'index', 'utils', 'main', 'test', 'config', 'server', 'data', 'build', 'src']
+    corpus = []
+    for i in range(count):
+        template = TEMPLATES[i % len(TEMPLATES)]
+        corpus.append(template.format(
+            d=f"{rng.choice(words)}{i}",
+            f=f"{rng.choice(words)}_{i}.{rng.choice(['py', 'js', 'txt'])}",
+            w=rng.choice(words),
+            n=rng.randint(1, 500)
+        ))
+    return corpus
+
+
+def check_expected():
+    errors = []
+    for command, expected in EXPECTED:
+        decision = check_command(command)
+        status = "✅" if decision.allowed == expected else "❌"
+        print(f"{status} {'permitido' if decision.allowed else 'rechazado':10} {command!r:70.70} {decision.reason}")
+        if decision.allowed != expected:
+            errors.append(command)
+    return errors
+
+
+def parses(command):
+    try:
+        parse_command(command)
+        return True
+    except CommandParseError:
+        return False
+
+
+def measure(label, fn, commands):
+    started = time.perf_counter()
+    allowed = sum(1 for command in commands if fn(command))
+    elapsed = time.perf_counter() - started
+    rate = len(commands) / elapsed
+    print(f"{label:38} {rate:12,.0f} comandos/s  ({elapsed * 1000:.1f} ms, {allowed} aceptados)")
+    return rate
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COMMANDS
+
+    print("\n=== Decisiones esperadas ===")
+    errors = check_expected()
+
+    corpus = build_corpus(count)
+    uncached = CommandPolicy('benchmark', denied_programs=command_policy.DENIED_PROGRAMS,
+                             denied_prefixes=('mkfs.',), argument_rules=command_policy.ARGUMENT_RULES,
+                             cache_size=0)
+
+    print(f"\n=== Rendimiento: {count} comandos distintos ===")
+    measure("Análisis (parse_command)", parses, corpus)
+    rate = measure("Análisis + evaluación, sin caché", uncached.check, corpus)
+    measure("Política de archivos, sin caché", CommandPolicy(
+        'benchmark_files', allowed_programs={'ls': None, 'cat': None, 'echo': None, 'mkdir': None, 'rm': None},
+        cache_size=0).check, corpus)
+
+    repeated = [corpus[i % 200] for i in range(count)]
+    TERMINAL_POLICY.check(corpus[0])
+    measure("Comandos repetidos, con caché", TERMINAL_POLICY.check, repeated)
+    measure("Política de archivos, con caché", FILE_COMMANDS_POLICY.check, repeated)
+
+    if errors:
+        print(f"\n❌ {len(errors)} decisiones inesperadas")
+        sys.exit(1)
+    if rate < MIN_RATE:
+        print(f"\n❌ Rendimiento por debajo de {MIN_RATE} comandos/s sin caché")
+        sys.exit(1)
+    print("\n✅ Decisiones correctas y rendimiento suficiente")
@@ -0,0 +1,277 @@
+"""
+Almacén de contenido direccionado por hash para los proyectos generados.
+
+Cada contenido se guarda una sola vez como blob (nombre = sha256) y los
+archivos de los proyectos son enlaces duros a ese blob. Las plantillas de
+respaldo, los requirements.txt y el resto de archivos repetidos entre
+proyectos ocupan disco y generan escrituras una sola vez.
+
+El número de enlaces del blob (st_nlink) es su contador de referencias: cada
+proyecto que usa el contenido añade un enlace y borrar el proyecto (incluso
+con rm -rf) lo quita. Un blob con un único enlace solo está en el almacén y
+collect_garbage() lo elimina.
+
+Los blobs son de solo lectura: un archivo enlazado se modifica reemplazándolo
+(file_patches.write_file_atomic, write_file), nunca escribiendo encima, para
+no cambiar el contenido del resto de proyectos que lo comparten. Si el
+almacén y el proyecto están en sistemas de archivos distintos, el archivo se
+copia en lugar de enlazarse.
+"""
+import os
+import time
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', os.path.join('user_workspaces', '.blobs'))
+# Un blob recién creado puede no tener aún su enlace: no se recolecta antes de este plazo
+BLOB_GC_GRACE_SECONDS = float(os.environ.get('BLOB_GC_GRACE_SECONDS', '3600'))
+BLOB_GC_INTERVAL = float(os.environ.get('BLOB_GC_INTERVAL', '3600'))
+BLOB_MODE = 0o444
+
+
+def blob_digest(data):
+    """Hash (sha256 hexadecimal) con el que se guarda un contenido."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Blobs por sha256 enlazados en los directorios de los proyectos."""
+
+    def __init__(self, root=BLOB_STORE_DIR, gc_grace=BLOB_GC_GRACE_SECONDS,
+                 gc_interval=BLOB_GC_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.gc_grace = gc_grace
+        self.gc_interval = gc_interval
+        self._last_gc = time.monotonic()
+        self._gc_lock = threading.Lock()
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def put(self, data):
+        """
+        Guarda un contenido si no existe todavía.
+
+        Returns:
+            str: Hash del contenido
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = blob_digest(data)
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, prefix=digest[:8] + '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, BLOB_MODE)
+            try:
+                # os.link no reemplaza: si otro hilo lo creó a la vez, se usa el suyo
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(tmp_path)
+        return digest
+
+    def link(self, digest, target):
+        """
+        Reemplaza target por un enlace al blob (o una copia si no se puede enlazar).
+
+        Raises:
+            FileNotFoundError: Si el blob no existe
+        """
+        target = os.path.abspath(target)
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        blob = self.blob_path(digest)
+        tmp_path = os.path.join(directory, f".{os.path.basename(target)}.{os.getpid()}.{threading.get_ident()}.blob")
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        try:
+            try:
+                os.link(blob, tmp_path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                # Otro sistema de archivos o sin soporte de enlaces: copiar
+                shutil.copyfile(blob, tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def write_file(self, target, content):
+        """
+        Escribe un archivo de proyecto como enlace al blob de su contenido.
+
+        Returns:
+            str: Hash del contenido
+        """
+        for _ in range(3):
+            digest = self.put(content)
+            try:
+                self.link(digest, target)
+                return digest
+            except FileNotFoundError:
+                # El recolector eliminó el blob entre put y link: volver a crearlo
+                if os.path.exists(self.blob_path(digest)):
+                    raise
+        raise OSError(f"No se pudo enlazar el blob de {target}")
+
+    def intern_file(self, path):
+        """
+        Sustituye un archivo existente por un enlace a su blob.
+
+        Returns:
+            tuple: (hash, True si el contenido ya estaba en el almacén)
+        """
+        st = os.lstat(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = blob_digest(data)
+        blob = self.blob_path(digest)
+        try:
+            blob_st = os.stat(blob)
+        except FileNotFoundError:
+            blob_st = None
+        if blob_st is not None and (blob_st.st_ino, blob_st.st_dev) == (st.st_ino, st.st_dev):
+            return digest, True
+        self.write_file(path, data)
+        return digest, blob_st is not None
+
+    def intern_directory(self, directory):
+        """
+        Enlaza al almacén todos los archivos de un directorio.
+
+        Returns:
+            dict: files procesados, deduplicated (ya existían) y bytes_saved
+        """
+        result = {'files': 0, 'deduplicated': 0, 'bytes_saved': 0}
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.startswith('.') or os.path.islink(path):
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                    _, existed = self.intern_file(path)
+                except OSError as e:
+                    logger.warning(f"No se pudo deduplicar {path}: {str(e)}")
+                    continue
+                result['files'] += 1
+                if existed:
+                    result['deduplicated'] += 1
+                    result['bytes_saved'] += size
+        self.maybe_collect()
+        return result
+
+    def collect_garbage(self):
+        """
+        Elimina los blobs sin referencias (un solo enlace) más antiguos que el plazo de gracia.
+
+        Returns:
+            dict: removed (blobs eliminados) y bytes liberados
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - self.gc_grace
+        with self._gc_lock:
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                try:
+                    names = os.listdir(prefix_dir)
+                except NotADirectoryError:
+                    continue
+                for name in names:
+                    path = os.path.join(prefix_dir, name)
+                    try:
+                        st = os.stat(path)
+                        if st.st_nlink > 1 or st.st_ctime > cutoff:
+                            continue
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+                    freed += st.st_size
+            # Temporales abandonados por procesos interrumpidos
+            for name in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._last_gc = time.monotonic()
+        if removed:
+            logger.info(f"Recolector de blobs: {removed} blobs eliminados, {freed} bytes liberados")
+        return {'removed': removed, 'bytes': freed}
+
+    def maybe_collect(self):
+        """Lanza la recolección en segundo plano si ha pasado el intervalo configurado."""
+        if time.monotonic() - self._last_gc < self.gc_interval or self._gc_lock.locked():
+            return
+        self._last_gc = time.monotonic()
+        threading.Thread(target=self._collect_safely, name='blob-gc', daemon=True).start()
+
+    def _collect_safely(self):
+        try:
+            self.collect_garbage()
+        except Exception as e:
+            logger.error(f"Error en el recolector de blobs: {str(e)}")
+
+    def stats(self):
+        """Blobs, bytes únicos, referencias y bytes que ocuparían sin deduplicar."""
+        blobs = unique_bytes = references = logical_bytes = 0
+        for root, dirs, files in os.walk(self.objects_dir):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                blobs += 1
+                unique_bytes += st.st_size
+                references += st.st_nlink - 1
+                logical_bytes += st.st_size * (st.st_nlink - 1)
+        return {
+            'blobs': blobs,
+            'unique_bytes': unique_bytes,
+            'references': references,
+            'logical_bytes': logical_bytes
+        }
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Obtiene la instancia global del almacén de blobs."""
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = BlobStore()
+    return _blob_store
@@ -11,6 +11,7 @@ import shutil
 from pathlib import Path
 from flask import Blueprint, render_template, jsonify, request, send_from_directory, redirect, url_for
 from werkzeug.utils import secure_filename
+from workspace_index import list_directory
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -77,25 +78,22 @@ def list_files(directory='.', user_id='default'):
 
     try:
         entries = []
-        for entry in os.listdir(target_dir):
-            entry_path = os.path.join(target_dir, entry)
-            entry_type = 'directory' if os.path.isdir(entry_path) else 'file'
-
-            if entry_type == 'file':
-                file_size = os.path.getsize(entry_path)
+        for item in list_directory(workspace, directory) or []:
+            entry = item['name']
+            if not item['is_dir']:
                 file_extension = os.path.splitext(entry)[1].lower()[1:] if '.' in entry else ''
 
                 entries.append({
                     'name': entry,
-                    'type': entry_type,
+                    'type': 'file',
                     'path': os.path.join(directory, entry) if directory != '.' else entry,
-                    'size': file_size,
+                    'size': item['size'],
                     'extension': file_extension
                 })
             else:
                 entries.append({
                     'name': entry,
-                    'type': entry_type,
+                    'type': 'directory',
                     'path': os.path.join(directory, entry) if directory != '.' else entry
                 })
 
@@ -0,0 +1,578 @@
+"""
+Motor único de políticas de seguridad para comandos de shell.
+
+Sustituye a los validadores que había repartidos (listas de subcadenas en
+xterm_terminal, patrones peligrosos en intelligent_terminal y expresiones
+regulares por comando en command_processor), que se volvían a evaluar en
+cada llamada con reglas distintas y se dejaban engañar por comillas o rutas
+(r"m", /bin/rm).
+
+El comando se analiza una vez:
+
+1. Se divide en líneas fuera de comillas, se separan los cuerpos de los
+   heredocs y se detectan las sustituciones ($(...) y `...`).
+2. Cada línea se tokeniza con shlex (comillas y escapes como en POSIX) y se
+   construye un árbol: CommandLine -> Pipeline -> SimpleCommand -> Redirect.
+3. CommandPolicy recorre el árbol en una sola pasada aplicando reglas
+   precompiladas (conjuntos y expresiones regulares construidos al crear la
+   política) y devuelve una Decision con la regla aplicada y su explicación.
+
+Los comandos se evalúan como si empezaran en la raíz del workspace. Los cd
+de una cadena (cd src && ...) se siguen en orden y se rechazan los que
+saldrían de ella, de modo que el resto de la cadena no puede trabajar fuera
+del workspace.
+
+Las decisiones se memorizan por comando (lru_cache), porque las terminales
+repiten mucho los mismos comandos.
+"""
+import os
+import re
+import posixpath
+import shlex
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+SEPARATORS = {';', '&&', '||', '&'}
+PIPES = {'|', '|&'}
+REDIRECTS = {'>', '>>', '<', '<<', '<<<', '>&', '<&', '&>', '&>>', '>|', '<>'}
+HEREDOC = '<<'
+
+# Programas que ejecutan a otro programa: se valida el programa envuelto
+WRAPPERS = frozenset({'env', 'nice', 'nohup', 'timeout', 'time', 'command', 'builtin', 'stdbuf', 'xargs'})
+_WRAPPER_ARG = re.compile(r'^(-.*|[A-Za-z_][A-Za-z0-9_]*=.*|\d+(\.\d+)?[smhd]?)$')
+# Opciones de los envoltorios que toman el siguiente argumento como valor
+_WRAPPER_VALUE_OPTIONS = {
+    'env': frozenset({'-u', '--unset', '-C', '--chdir'}),
+    'nice': frozenset({'-n', '--adjustment'}),
+    'timeout': frozenset({'-s', '--signal', '-k', '--kill-after'}),
+    'time': frozenset({'-f', '--format', '-o', '--output'}),
+    'stdbuf': frozenset({'-i', '-o', '-e'}),
+    'xargs': frozenset({'-a', '--arg-file', '-d', '--delimiter', '-E', '-I', '-L', '-n', '--max-args',
+                        '-P', '--max-procs', '-s', '--max-chars'}),
+}
+
+SHELLS = frozenset({'sh', 'bash', 'dash', 'zsh', 'ksh', 'fish'})
+INTERPRETERS = SHELLS | frozenset({'python', 'python3', 'node', 'perl', 'ruby', 'php', 'lua'})
+# Opciones con las que cada intérprete ejecuta código pasado en la línea de comandos:
+# (letras de opciones cortas, que pueden ir agrupadas como -Bc o -ne, opciones largas
+# y opciones que toman el siguiente argumento como valor)
+INLINE_CODE_OPTIONS = {
+    'python': ('c', (), frozenset({'-W', '-X'})),
+    'node': ('ep', ('--eval', '--print'),
+             frozenset({'-r', '--require', '--import', '--loader', '--input-type', '-C', '--conditions'})),
+    'perl': ('eE', (), frozenset()),
+    'ruby': ('e', (), frozenset({'-I', '-r', '-C', '-E'})),
+    'php': ('rBRE', ('--run', '--process-begin', '--process-code', '--process-end'),
+            frozenset({'-c', '-d', '-z'})),
+    'lua': ('e', (), frozenset({'-l'})),
+}
+_VERSIONED_PYTHON = re.compile(r'python[\d.]*$')
+
+# Destinos de rm -r (ya normalizados) que borrarían el workspace completo o saldrían de él
+_WHOLE_TREE_TARGETS = frozenset({'/', '*', '.', '..', '~', '.*', '//'})
+
+# Cambios de directorio que se siguen a lo largo de la cadena
+CHDIR_PROGRAMS = frozenset({'cd', 'pushd', 'popd'})
+
+# Acciones de find que ejecutan comandos o borran lo encontrado
+_FIND_EXEC_ACTIONS = frozenset({'-exec', '-execdir', '-ok', '-okdir'})
+_FIND_WRITE_ACTIONS = frozenset({'-fprint', '-fprint0', '-fprintf', '-fls'})
+
+
+def _inline_code_option(program, args):
+    """Opción con la que un intérprete recibe código en línea (p. ej. python -c), o None."""
+    letters, long_options, value_options = INLINE_CODE_OPTIONS.get(
+        'python' if _VERSIONED_PYTHON.match(program) else program, ('', (), frozenset()))
+    skip_value = False
+    for arg in args:
+        if skip_value:
+            skip_value = False
+            continue
+        if arg == '--' or not arg.startswith('-'):
+            # El primer operando es el script: lo que sigue son sus argumentos
+            return None
+        if arg in value_options:
+            skip_value = True
+        elif arg[:2] in value_options:
+            continue  # Valor pegado a la opción (-Werror, -rjson)
+        elif arg.startswith('--'):
+            if arg.split('=', 1)[0] in long_options:
+                return arg
+        elif any(letter in arg[1:] for letter in letters):
+            return arg
+    return None
+
+
+class CommandParseError(ValueError):
+    """El comando no se puede analizar (comillas sin cerrar, sintaxis no soportada)."""
+
+
+class Redirect:
+    __slots__ = ('op', 'target', 'body')
+
+    def __init__(self, op, target, body=None):
+        self.op = op
+        self.target = target
+        self.body = body
+
+
+class SimpleCommand:
+    __slots__ = ('argv', 'assignments', 'redirects')
+
+    def __init__(self):
+        self.argv = []
+        self.assignments = []
+        self.redirects = []
+
+    def text(self):
+        return ' '.join(self.argv + [f"{r.op} {r.target}" for r in self.redirects])
+
+
+class Pipeline:
+    """Comandos unidos por | y el separador que sigue (;, &&, || o &)."""
+    __slots__ = ('commands', 'separator')
+
+    def __init__(self):
+        self.commands = []
+        self.separator = None
+
+
+class CommandLine:
+    __slots__ = ('pipelines', 'substitution')
+
+    def __init__(self):
+        self.pipelines = []
+        self.substitution = False
+
+
+def _read_line(command, pos):
+    """Lee hasta el siguiente salto de línea fuera de comillas; detecta sustituciones."""
+    quote = None
+    escaped = False
+    substitution = False
+    end = len(command)
+    i = pos
+    while i < end:
+        ch = command[i]
+        if escaped:
+            escaped = False
+        elif ch == '\\' and quote != "'":
+            escaped = True
+        elif quote:
+            if ch == quote:
+                quote = None
+            elif quote == '"' and (ch == '`' or (ch == '$' and command[i + 1:i + 2] == '(')):
+                substitution = True
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '`' or (ch == '$' and command[i + 1:i + 2] == '('):
+            substitution = True
+        elif ch == '\n':
+            return command[pos:i], i + 1, substitution
+        i += 1
+    if quote:
+        raise CommandParseError("Comillas sin cerrar")
+    return command[pos:], end + 1, substitution
+
+
+def _read_heredoc(command, pos, delimiter, strip_tabs):
+    """Cuerpo de un heredoc: líneas hasta la que contiene solo el delimitador."""
+    lines = []
+    while pos < len(command):
+        newline = command.find('\n', pos)
+        line = command[pos:] if newline == -1 else command[pos:newline]
+        pos = len(command) + 1 if newline == -1 else newline + 1
+        if (line.lstrip('\t') if strip_tabs else line) == delimiter:
+            return '\n'.join(lines), pos
+        lines.append(line)
+    raise CommandParseError(f"Heredoc sin cerrar: falta la línea '{delimiter}'")
+
+
+def _tokenize(line):
+    lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        return list(lexer)
+    except ValueError as e:
+        raise CommandParseError(str(e))
+
+
+def parse_command(command):
+    """
+    Analiza un comando de shell.
+
+    Returns:
+        CommandLine: Árbol del comando; si contiene una sustitución, el
+            análisis se detiene y solo se marca substitution
+
+    Raises:
+        CommandParseError: Si el comando no se puede analizar
+    """
+    tree = CommandLine()
+    pos = 0
+    while pos <= len(command):
+        line, pos, substitution = _read_line(command, pos)
+        if substitution:
+            # $(...) y `...` no se analizan: la política los rechaza sin mirar el resto
+            tree.substitution = True
+            return tree
+        tokens = _tokenize(line)
+        if not tokens:
+            continue
+
+        pipeline = Pipeline()
+        current = SimpleCommand()
+        heredocs = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in REDIRECTS:
+                if i + 1 >= len(tokens) or tokens[i + 1] in REDIRECTS | PIPES | SEPARATORS:
+                    raise CommandParseError(f"Falta el destino de la redirección '{token}'")
+                redirect = Redirect(token, tokens[i + 1])
+                current.redirects.append(redirect)
+                if token == HEREDOC:
+                    heredocs.append(redirect)
+                i += 2
+                continue
+            if token in PIPES or token in SEPARATORS:
+                if not current.argv and not current.redirects and not current.assignments:
+                    raise CommandParseError(f"Operador '{token}' sin comando")
+                pipeline.commands.append(current)
+                current = SimpleCommand()
+                if token in SEPARATORS:
+                    pipeline.separator = token
+                    tree.pipelines.append(pipeline)
+                    pipeline = Pipeline()
+            elif not token.strip('();<>|&'):
+                # Operador que no es redirección, tubería ni separador: subshells, <(...)
+                raise CommandParseError(f"Sintaxis no soportada: '{token}'")
+            elif not current.argv and '=' in token and re.match(r'^[A-Za-z_][A-Za-z0-9_]*=', token):
+                current.assignments.append(token)
+            else:
+                current.argv.append(token)
+            i += 1
+
+        if current.argv or current.redirects or current.assignments:
+            pipeline.commands.append(current)
+        elif pipeline.commands:
+            raise CommandParseError("La tubería termina sin comando")
+        if pipeline.commands:
+            # Un salto de línea separa como ;
+            pipeline.separator = pipeline.separator or ';'
+            tree.pipelines.append(pipeline)
+
+        for redirect in heredocs:
+            strip_tabs = redirect.target.startswith('-')
+            delimiter = redirect.target[1:] if strip_tabs else redirect.target
+            # Con el delimitador sin comillas, el shell expande $(...) y `...` en el cuerpo
+            quoted = re.search(r"<<-?\s*(['\"])" + re.escape(delimiter) + r"\1|<<-?\s*\\" + re.escape(delimiter), line)
+            redirect.body, pos = _read_heredoc(command, pos, delimiter, strip_tabs)
+            if not quoted and ('`' in redirect.body or '$(' in redirect.body):
+                tree.substitution = True
+    return tree
+
+
+class Decision:
+    """Resultado de evaluar un comando: permitido o no, regla aplicada y explicación."""
+    __slots__ = ('allowed', 'rule', 'reason', 'segment')
+
+    def __init__(self, allowed, rule, reason, segment=None):
+        self.allowed = allowed
+        self.rule = rule
+        self.reason = reason
+        self.segment = segment
+
+    def __bool__(self):
+        return self.allowed
+
+    def __repr__(self):
+        return f"Decision(allowed={self.allowed}, rule={self.rule!r}, reason={self.reason!r})"
+
+    def to_dict(self):
+        return {'allowed': self.allowed, 'rule': self.rule, 'reason': self.reason, 'segment': self.segment}
+
+
+def _escapes_workspace(path):
+    """Ruta absoluta, del home, con .. o con variables: puede salir del workspace."""
+    return path.startswith(('/', '~')) or '$' in path or '..' in path.split('/')
+
+
+def _normalize_target(path):
+    """Normaliza un destino (./*, src/.., .//) para compararlo con _WHOLE_TREE_TARGETS."""
+    if path.startswith('~'):
+        return path
+    return posixpath.normpath(path) if path else path
+
+
+def _is_recursive_rm(args):
+    return any(arg in ('--recursive', '-r', '-R') or
+               (arg.startswith('-') and not arg.startswith('--') and ('r' in arg or 'R' in arg))
+               for arg in args)
+
+
+class CommandPolicy:
+    """
+    Reglas de seguridad para comandos de shell.
+
+    Args:
+        name: Nombre de la política (aparece en los registros)
+        allowed_programs: Si se indica, dict programa -> expresión regular que
+            deben cumplir sus argumentos (None = cualquiera); el resto se rechaza
+        denied_programs: Programas prohibidos
+        denied_prefixes: Prefijos de programas prohibidos (mkfs.ext4...)
+        argument_rules: Lista de (programa, patrón, explicación) que rechazan
+            el comando si el patrón aparece en sus argumentos
+        allow_background: Permitir & (procesos que sobreviven al comando)
+        cache_size: Decisiones memorizadas; 0 desactiva la caché
+    """
+
+    def __init__(self, name, allowed_programs=None, denied_programs=(), denied_prefixes=(),
+                 argument_rules=(), allow_background=False, cache_size=2048):
+        self.name = name
+        self.allowed_programs = None if allowed_programs is None else {
+            program: re.compile(pattern) if pattern is not None else None
+            for program, pattern in allowed_programs.items()
+        }
+        self.denied_programs = frozenset(denied_programs)
+        self.denied_prefixes = tuple(denied_prefixes)
+        self.argument_rules = {}
+        for program, pattern, reason in argument_rules:
+            self.argument_rules.setdefault(program, []).append((re.compile(pattern), reason))
+        self.allow_background = allow_background
+        self.check = lru_cache(maxsize=cache_size)(self._check) if cache_size else self._check
+
+    def _check(self, command):
+        if not command or not command.strip():
+            return Decision(False, 'empty', "No se proporcionó ningún comando")
+        try:
+            tree = parse_command(command)
+        except CommandParseError as e:
+            return Decision(False, 'syntax', f"No se pudo analizar el comando: {str(e)}")
+        decision = self.evaluate(tree)
+        if not decision.allowed:
+            logger.debug(f"Política {self.name}: comando rechazado ({decision.rule}): {command}")
+        return decision
+
+    def evaluate(self, tree):
+        """Aplica las reglas al árbol de un comando en una sola pasada."""
+        if tree.substitution:
+            return Decision(False, 'substitution',
+                            "No se permiten sustituciones de comandos ($(...) o `...`): "
+                            "ejecutarían comandos que no se pueden validar")
+        if not tree.pipelines:
+            return Decision(False, 'empty', "No se proporcionó ningún comando")
+        # Directorio actual relativo a la raíz del workspace, según los cd de la cadena
+        cwd = ['.']
+        for pipeline in tree.pipelines:
+            if pipeline.separator == '&' and not self.allow_background:
+                return Decision(False, 'background',
+                                "No se permite ejecutar en segundo plano (&): el proceso seguiría "
+                                "activo fuera del control de la terminal",
+                                pipeline.commands[-1].text())
+            for index, command in enumerate(pipeline.commands):
+                decision = self._check_simple(command, piped=index > 0, cwd=cwd)
+                if decision is not None:
+                    return decision
+        return Decision(True, 'allow', "Comando permitido")
+
+    def _check_simple(self, command, piped, cwd):
+        segment = command.text()
+        for redirect in command.redirects:
+            if redirect.op in ('>&', '<&') and (redirect.target.isdigit() or redirect.target == '-'):
+                continue
+            if redirect.op in (HEREDOC, '<<<') or redirect.target == '/dev/null':
+                continue
+            if _escapes_workspace(redirect.target):
+                return Decision(False, 'redirect_path',
+                                f"La redirección a '{redirect.target}' sale del workspace", segment)
+        return self._check_argv(command.argv, segment, piped, cwd)
+
+    def _check_argv(self, argv, segment, piped, cwd, via_xargs=False):
+        program = os.path.basename(argv[0]) if argv else None
+        # env, timeout, nice...: se valida el programa que ejecutan
+        while program in WRAPPERS:
+            wrapper = program
+            value_options = _WRAPPER_VALUE_OPTIONS.get(wrapper, frozenset())
+            via_xargs = via_xargs or wrapper == 'xargs'
+            argv = argv[1:]
+            while argv and _WRAPPER_ARG.match(argv[0]):
+                option = argv[0]
+                if wrapper == 'env' and (option.startswith('--split-string') or
+                                         (option.startswith('-') and not option.startswith('--') and 'S' in option)):
+                    return Decision(False, 'shell_code',
+                                    "'env -S' divide su argumento como una línea de shell que no se puede validar",
+                                    segment)
+                if wrapper == 'env' and (option in ('-C', '--chdir') or option.startswith('--chdir=')):
+                    target = option.split('=', 1)[1] if '=' in option else (argv[1] if len(argv) > 1 else '')
+                    if self._change_directory(list(cwd), target) is None:
+                        return Decision(False, 'chdir_outside',
+                                        f"'env --chdir {target}' sale del workspace", segment)
+                argv = argv[2:] if option in value_options else argv[1:]
+            program = os.path.basename(argv[0]) if argv else None
+        if program is None:
+            return None
+        args = argv[1:]
+
+        if program in self.denied_programs or program.startswith(self.denied_prefixes):
+            return Decision(False, 'denied_program', f"El programa '{program}' no está permitido", segment)
+        if self.allowed_programs is not None:
+            if program not in self.allowed_programs:
+                return Decision(False, 'not_allowed',
+                                f"Solo se permiten los comandos: {', '.join(sorted(self.allowed_programs))}",
+                                segment)
+            pattern = self.allowed_programs[program]
+            if pattern is not None and not pattern.fullmatch(' '.join(args)):
+                return Decision(False, 'arguments', f"Argumentos no permitidos para '{program}'", segment)
+        if piped and program in INTERPRETERS:
+            return Decision(False, 'pipe_to_interpreter',
+                            f"No se permite enviar una tubería a un intérprete ('{program}')", segment)
+        if program in SHELLS and any(arg.startswith('-') and 'c' in arg for arg in args):
+            return Decision(False, 'shell_code',
+                            f"'{program} -c' ejecuta código que no se puede validar", segment)
+        inline_option = _inline_code_option(program, args)
+        if inline_option:
+            return Decision(False, 'shell_code',
+                            f"'{program} {inline_option}' ejecuta código que no se puede validar", segment)
+        if program in CHDIR_PROGRAMS:
+            operands = [arg for arg in args if not re.fullmatch(r'-[LPe@]+|--', arg)]
+            target = operands[0] if operands else None
+            new_cwd = None if program == 'popd' else self._change_directory(cwd, target)
+            if new_cwd is None:
+                return Decision(False, 'chdir_outside',
+                                f"'{segment}' sale del workspace: el resto de la cadena trabajaría fuera de él",
+                                segment)
+            if not piped:
+                cwd[:] = [new_cwd]
+        if program == 'rm':
+            recursive = _is_recursive_rm(args)
+            if recursive and via_xargs:
+                return Decision(False, 'recursive_delete',
+                                "Borrado recursivo con destinos leídos de la entrada: no se pueden validar",
+                                segment)
+            for target in (arg for arg in args if not arg.startswith('-')):
+                if recursive and self._is_whole_tree(target, cwd):
+                    return Decision(False, 'recursive_delete',
+                                    f"Borrado recursivo de '{target}': eliminaría el workspace o saldría de él",
+                                    segment)
+        if program == 'find':
+            decision = self._check_find(args, segment, cwd)
+            if decision is not None:
+                return decision
+        for pattern, reason in self.argument_rules.get(program, ()):
+            if any(pattern.search(arg) for arg in args):
+                return Decision(False, 'argument_rule', reason, segment)
+        return None
+
+    @staticmethod
+    def _change_directory(cwd, target):
+        """Directorio resultante de un cd relativo a la raíz del workspace, o None si sale de él."""
+        # cd sin argumentos va al home y cd - al directorio anterior, que puede estar fuera
+        if not target or target == '-' or target.startswith(('/', '~')) or '$' in target:
+            return None
+        path = posixpath.normpath(posixpath.join(cwd[0], target))
+        if path == '..' or path.startswith('../'):
+            return None
+        return path
+
+    @staticmethod
+    def _is_whole_tree(target, cwd):
+        normalized = _normalize_target(target)
+        if normalized in _WHOLE_TREE_TARGETS or _escapes_workspace(normalized):
+            return True
+        # Tras un cd, un destino relativo puede ser la raíz del workspace
+        return posixpath.normpath(posixpath.join(cwd[0], normalized)) == '.'
+
+    def _check_find(self, args, segment, cwd):
+        """find -delete y -exec actúan sobre todo lo encontrado, incluido el punto de partida."""
+        starts = []
+        for arg in args:
+            if arg.startswith(('-', '(', '!')):
+                break
+            starts.append(arg)
+        starts = starts or ['.']
+
+        destructive = False
+        i = len(starts)
+        while i < len(args):
+            arg = args[i]
+            if arg == '-delete':
+                destructive = True
+            elif arg in _FIND_WRITE_ACTIONS:
+                if i + 1 < len(args) and _escapes_workspace(args[i + 1]):
+                    return Decision(False, 'redirect_path',
+                                    f"'find {arg} {args[i + 1]}' escribe fuera del workspace", segment)
+            elif arg in _FIND_EXEC_ACTIONS:
+                embedded = []
+                i += 1
+                while i < len(args) and args[i] not in (';', '+'):
+                    embedded.append(args[i])
+                    i += 1
+                if any(_escapes_workspace(start) for start in starts):
+                    return Decision(False, 'find_action',
+                                    f"'find {arg}' sobre rutas fuera del workspace", segment)
+                # El comando ejecutado se valida como cualquier otro; {} es cada ruta encontrada
+                decision = self._check_argv(embedded, segment, False, list(cwd))
+                if decision is not None:
+                    return decision
+                if embedded and os.path.basename(embedded[0]) == 'rm' and _is_recursive_rm(embedded[1:]):
+                    destructive = True
+            i += 1
+
+        if destructive:
+            for start in starts:
+                if self._is_whole_tree(start, cwd):
+                    return Decision(False, 'find_delete',
+                                    f"'find {start}' con borrado alcanza el workspace completo o sale de él; "
+                                    f"indica un subdirectorio", segment)
+        return None
+
+
+DENIED_PROGRAMS = (
+    'sudo', 'su', 'doas', 'wget', 'curl', 'dd', 'mkfs', 'fdisk', 'mount', 'umount',
+    'shutdown', 'reboot', 'halt', 'poweroff', 'eval', 'exec', 'source', '.'
+)
+
+ARGUMENT_RULES = (
+    ('chmod', r'^0?777$|^[ugoa]*\+rwx$', "No se permiten permisos 777"),
+    ('chown', r'.', "No se permite cambiar el propietario de archivos"),
+)
+
+# Política de las terminales (xterm, terminal inteligente)
+TERMINAL_POLICY = CommandPolicy(
+    'terminal',
+    denied_programs=DENIED_PROGRAMS,
+    denied_prefixes=('mkfs.',),
+    argument_rules=ARGUMENT_RULES
+)
+
+_PATH = r'[\w\-./]+'
+
+# Política restringida a comandos de archivos (command_processor)
+FILE_COMMANDS_POLICY = CommandPolicy(
+    'file_commands',
+    allowed_programs={
+        'mkdir': rf'(-p )?{_PATH}',
+        'ls': rf'(-[alh]+)?( ?{_PATH})?',
+        'echo': None,
+        'cat': rf'({_PATH}( {_PATH})*)?',
+        'touch': rf'{_PATH}( {_PATH})*',
+        'rm': rf'(-[rf]+ )?{_PATH}',
+        'cp': rf'(-r+ )?{_PATH} {_PATH}',
+        'mv': rf'{_PATH} {_PATH}',
+    },
+    denied_programs=DENIED_PROGRAMS,
+    argument_rules=ARGUMENT_RULES
+)
+
+
+def check_command(command, policy=TERMINAL_POLICY):
+    """
+    Evalúa un comando con una política.
+
+    Returns:
+        Decision: Verdadera si el comando está permitido; reason explica por qué no
+    """
+    return policy.check(command)
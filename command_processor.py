@@ -10,6 +10,7 @@ import json
 import time
 import threading
 from dotenv import load_dotenv
+from command_policy import check_command, FILE_COMMANDS_POLICY
 
 # Load environment variables
 load_dotenv(override=True)
@@ -31,17 +32,8 @@ socketio = SocketIO(app,
                     ping_timeout=60,
                     ping_interval=25)
 
-# Security: List of allowed commands with regex patterns - MEJORADO PARA PERMITIR REDIRECCIONES
-ALLOWED_COMMANDS = {
-    'mkdir': r'^mkdir [\w\-\.\/]+$',
-    'ls': r'^ls( -[alh]+)?( [\w\/\-\.]+)?$',
-    'echo': r'^echo .*$',  # Patrón más permisivo para echo y redirecciones
-    'cat': r'^cat( [\w\/\-\.]+)+$|^cat [\w\/\-\.]+ << \'EOF\'.*EOF$',  # Permitir heredocs
-    'touch': r'^touch [\w\/\-\.]+$',
-    'rm': r'^rm( -[rf]+)? [\w\/\-\.]+$',
-    'cp': r'^cp( -[r]+)? [\w\/\-\.]+ [\w\/\-\.]+$',
-    'mv': r'^mv [\w\/\-\.]+ [\w\/\-\.]+$',
-}
+# Seguridad: solo comandos de archivos (mkdir, ls, echo, cat, touch, rm, cp, mv),
+# validados con el motor de políticas común (command_policy.FILE_COMMANDS_POLICY)
 
 # NLP command conversion function
 def nl_to_bash(natural_command):
@@ -118,10 +110,9 @@ def nl_to_bash(natural_command):
 
     # Llamada a la API de OpenAI para conversión de lenguaje natural a comandos
     if os.environ.get('OPENAI_API_KEY'):
-        import openai
-        openai.api_key = os.environ.get('OPENAI_API_KEY')
+        from provider_registry import get_openai_client
         try:
-            response = openai.chat.completions.create(
+            response = get_openai_client().chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": """
@@ -173,39 +164,10 @@ def nl_to_bash(natural_command):
 
 
 def validate_command(command):
-    """Validate if command is allowed based on regexes"""
-    # Tratar comandos con redirección especialmente
-    if '>' in command:
-        cmd_parts = command.split('>', 1)
-        base_command = cmd_parts[0].strip()
-
-        # Validar solo la parte del comando antes de la redirección
-        command_parts = base_command.split()
-        if not command_parts:
-            return False
-
-        base_cmd = command_parts[0]
-
-        # Para echo con redirección, permitimos el patrón completo
-        if base_cmd == 'echo':
-            return True
-    else:
-        command_parts = command.split()
-        if not command_parts:
-            return False
-
-        base_cmd = command_parts[0]
-
-    if base_cmd in ALLOWED_COMMANDS:
-        pattern = ALLOWED_COMMANDS[base_cmd]
-        match_result = re.match(pattern, command)
-
-        # Log para depuración
-        logging.debug(f"Command: {command}, Pattern: {pattern}, Match: {match_result is not None}")
-
-        return match_result is not None
-
-    return False
+    """Validate if command is allowed by the file-commands policy"""
+    decision = check_command(command, FILE_COMMANDS_POLICY)
+    logging.debug(f"Command: {command}, Decision: {decision.rule} - {decision.reason}")
+    return decision
 
 def execute_command(command):
     """Execute command and return result"""
@@ -306,34 +268,20 @@ def handle_natural_command(data):
     bash_command = nl_to_bash(natural_text)
     logging.info(f"Converted to bash: {bash_command}")
 
-    # Validación con más información
-    validation_result = validate_command(bash_command)
-    logging.info(f"Validation result: {validation_result}")
-
-    # Log con el patrón específico que está fallando
-    if not validation_result:
-        command_parts = bash_command.split()
-        if command_parts and command_parts[0] in ALLOWED_COMMANDS:
-            pattern = ALLOWED_COMMANDS[command_parts[0]]
-            match_result = re.match(pattern, bash_command)
-            logging.info(f"Command: {bash_command}, Pattern: {pattern}, Match: {match_result is not None}")
-
     # Validate command
-    if validation_result:
+    decision = validate_command(bash_command)
+    logging.info(f"Validation result: {decision.allowed} ({decision.reason})")
+
+    if decision:
         # Execute command
         result = execute_command(bash_command)
         emit('command_result', result)
     else:
-        # Si el comando tiene un echo con redirección, hacemos una excepción
-        if bash_command.startswith('echo') and '>' in bash_command:
-            result = execute_command(bash_command)
-            emit('command_result', result)
-        else:
-            emit('command_result', {
-                'success': False,
-                'output': f"Comando no permitido: {bash_command}",
-                'command': bash_command
-            })
+        emit('command_result', {
+            'success': False,
+            'output': f"Comando no permitido: {bash_command} ({decision.reason})",
+            'command': bash_command
+        })
 
 @socketio.on('bash_command')
 def handle_bash_command(data):
@@ -342,21 +290,17 @@ def handle_bash_command(data):
     logging.info(f"Received bash command: {bash_command}")
 
     # Validate command
-    if validate_command(bash_command):
+    decision = validate_command(bash_command)
+    if decision:
         # Execute command
         result = execute_command(bash_command)
         emit('command_result', result)
     else:
-        # Si el comando tiene un echo con redirección, hacemos una excepción
-        if bash_command.startswith('echo') and '>' in bash_command:
-            result = execute_command(bash_command)
-            emit('command_result', result)
-        else:
-            emit('command_result', {
-                'success': False,
-                'output': f"Comando no permitido: {bash_command}",
-                'command': bash_command
-            })
+        emit('command_result', {
+            'success': False,
+            'output': f"Comando no permitido: {bash_command} ({decision.reason})",
+            'command': bash_command
+        })
 
 @socketio.on('list_directory')
 def handle_list_directory(data):
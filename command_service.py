@@ -0,0 +1,233 @@
+"""
+Servicio de ejecución de comandos con un pool acotado y una cola justa.
+
+Cada comando de terminal bloqueaba un hilo de Flask/Socket.IO hasta terminar
+y nada limitaba cuántos procesos se ejecutaban a la vez. CommandService
+ejecuta los trabajos en COMMAND_POOL_SIZE hilos; como cada trabajo lanza como
+mucho un proceso, ese es también el máximo de procesos simultáneos.
+
+- Cada usuario (workspace) tiene su propia cola y como mucho
+  COMMAND_MAX_PER_USER trabajos en ejecución: un usuario con muchos comandos
+  pesados no ocupa todo el pool.
+- Los hilos libres toman trabajos de las colas por turnos (round-robin), de
+  modo que un usuario con la cola llena no retrasa a los demás.
+- Una cola no admite más de COMMAND_MAX_QUEUED_PER_USER trabajos
+  (QueueFullError) y los trabajos que esperan más de COMMAND_QUEUE_TIMEOUT
+  segundos se descartan (QueueTimeoutError).
+
+Los límites de CPU, memoria y archivos de cada proceso se aplican al lanzarlo
+(command_stream.RESOURCE_LIMITS). stats() publica la profundidad de las colas
+y los tiempos de espera y de ejecución.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('COMMAND_POOL_SIZE', str(max(4, min(32, (os.cpu_count() or 2) * 2)))))
+MAX_PER_USER = int(os.environ.get('COMMAND_MAX_PER_USER', '2'))
+MAX_QUEUED_PER_USER = int(os.environ.get('COMMAND_MAX_QUEUED_PER_USER', '8'))
+QUEUE_TIMEOUT = float(os.environ.get('COMMAND_QUEUE_TIMEOUT', '30'))
+METRICS_WINDOW = 1000
+
+
+class QueueFullError(Exception):
+    """La cola de comandos del usuario está llena."""
+
+
+class QueueTimeoutError(Exception):
+    """El comando esperó en la cola más de lo permitido."""
+
+
+def _summary(samples):
+    if not samples:
+        return {'avg_ms': 0, 'p95_ms': 0, 'max_ms': 0}
+    ordered = sorted(samples)
+    return {
+        'avg_ms': round(sum(ordered) / len(ordered) * 1000, 1),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        'max_ms': round(ordered[-1] * 1000, 1)
+    }
+
+
+class _Job:
+    __slots__ = ('user_id', 'fn', 'args', 'kwargs', 'future', 'enqueued_at')
+
+    def __init__(self, user_id, fn, args, kwargs):
+        self.user_id = user_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class CommandService:
+    """Pool de hilos con colas por usuario atendidas por turnos."""
+
+    def __init__(self, workers=POOL_SIZE, per_user=MAX_PER_USER, max_queued=MAX_QUEUED_PER_USER,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.workers = workers
+        self.per_user = per_user
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._queues = {}        # user_id -> deque de trabajos pendientes
+        self._turns = deque()    # usuarios con trabajos pendientes, en orden de turno
+        self._running = {}       # user_id -> trabajos en ejecución
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._counters = dict.fromkeys(('submitted', 'completed', 'failed', 'rejected', 'expired', 'cancelled'), 0)
+        self._wait_times = deque(maxlen=METRICS_WINDOW)
+        self._run_times = deque(maxlen=METRICS_WINDOW)
+
+    def submit(self, user_id, fn, *args, **kwargs):
+        """
+        Encola fn(*args, **kwargs) en la cola del usuario.
+
+        Returns:
+            Future: Resultado del trabajo
+
+        Raises:
+            QueueFullError: Si el usuario ya tiene max_queued trabajos en cola
+        """
+        self.start()
+        job = _Job(user_id, fn, args, kwargs)
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("El servicio de comandos se está deteniendo")
+            queue = self._queues.get(user_id)
+            if queue is not None and len(queue) >= self.max_queued:
+                self._counters['rejected'] += 1
+                raise QueueFullError(
+                    f"Hay demasiados comandos en cola para este workspace ({self.max_queued})")
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+                self._turns.append(user_id)
+            queue.append(job)
+            self._counters['submitted'] += 1
+            self._cond.notify()
+        return job.future
+
+    def run(self, user_id, fn, *args, **kwargs):
+        """Encola un trabajo y espera su resultado."""
+        return self.submit(user_id, fn, *args, **kwargs).result()
+
+    def _next_job(self):
+        # Se llama con self._cond adquirido
+        for _ in range(len(self._turns)):
+            user_id = self._turns[0]
+            self._turns.rotate(-1)
+            if self._running.get(user_id, 0) >= self.per_user:
+                continue
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if not queue:
+                del self._queues[user_id]
+                self._turns.remove(user_id)
+            self._running[user_id] = self._running.get(user_id, 0) + 1
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None and not self._stopping:
+                    self._cond.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+
+            started = time.monotonic()
+            waited = started - job.enqueued_at
+            outcome = 'completed'
+            try:
+                # El cliente pudo cancelar el trabajo mientras esperaba (p. ej. al desconectarse)
+                if not job.future.set_running_or_notify_cancel():
+                    outcome = 'cancelled'
+                elif waited > self.queue_timeout:
+                    outcome = 'expired'
+                    job.future.set_exception(QueueTimeoutError(
+                        f"El comando esperó más de {self.queue_timeout:g}s en la cola"))
+                else:
+                    try:
+                        job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        outcome = 'failed'
+                        logger.error(f"Error en un comando de {job.user_id}: {str(e)}")
+                        job.future.set_exception(e)
+            except Exception as e:
+                # Un trabajo nunca debe terminar con el hilo del pool
+                outcome = 'failed'
+                logger.error(f"Error al gestionar un comando de {job.user_id}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._running[job.user_id] -= 1
+                    if not self._running[job.user_id]:
+                        del self._running[job.user_id]
+                    self._counters[outcome] += 1
+                    self._wait_times.append(waited)
+                    if outcome in ('completed', 'failed'):
+                        self._run_times.append(time.monotonic() - started)
+                    # Un hueco libre puede desbloquear a otro usuario que estaba en su límite
+                    self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            if not self._threads and not self._stopping:
+                self._threads = [
+                    threading.Thread(target=self._work, name=f'command-worker-{i}', daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """Detiene los hilos; los trabajos que no empezaron se cancelan."""
+        with self._cond:
+            self._stopping = True
+            pending = [job for queue in self._queues.values() for job in queue]
+            self._queues.clear()
+            self._turns.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.future.cancel()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def stats(self):
+        """Métricas: trabajos en ejecución y en cola, contadores y tiempos recientes."""
+        with self._cond:
+            queued = {user_id: len(queue) for user_id, queue in self._queues.items()}
+            return {
+                'workers': self.workers,
+                'per_user_limit': self.per_user,
+                'running': sum(self._running.values()),
+                'queued': sum(queued.values()),
+                'users_running': len(self._running),
+                'users_queued': len(queued),
+                'max_user_queue': max(queued.values(), default=0),
+                **self._counters,
+                'wait': _summary(self._wait_times),
+                'run': _summary(self._run_times)
+            }
+
+
+_command_service = None
+_command_service_lock = threading.Lock()
+
+
+def get_command_service():
+    """Obtiene la instancia global del servicio de comandos."""
+    global _command_service
+    if _command_service is None:
+        with _command_service_lock:
+            if _command_service is None:
+                _command_service = CommandService()
+    return _command_service
@@ -0,0 +1,416 @@
+"""
+Ejecución de comandos con salida en streaming.
+
+CommandProcess lee stdout y stderr con tuberías no bloqueantes y un selector,
+y genera fragmentos acotados (CHUNK_CHARS) a medida que el proceso escribe,
+en lugar de esperar a que termine con capture_output. El generador solo lee
+cuando se le pide el siguiente fragmento: si el consumidor se retrasa, las
+tuberías se llenan y el sistema operativo detiene al proceso.
+
+Para Socket.IO, stream_command numera los fragmentos (seq) y aplica control de
+flujo: no emite más de `window` fragmentos sin confirmar (command_ack); si el
+cliente se retrasa deja de leer y, si no confirma en ACK_TIMEOUT segundos, el
+comando se cancela. De cada comando solo se conserva la cola de la salida
+(SCROLLBACK_CHARS), para el resultado final y para reenviar fragmentos
+perdidos (command_replay); la memoria no depende del tamaño de la salida.
+
+Los comandos no modifican el estado global del proceso: el directorio de
+trabajo se pasa con cwd= y el entorno es propio de cada workspace
+(workspace_env), sin os.chdir, de modo que varios hilos pueden ejecutar
+comandos de distintos usuarios a la vez. Cada proceso arranca con límites de
+recursos (setrlimit) de tiempo de CPU, memoria y archivos abiertos.
+
+Antes de lanzar cada proceso se consulta el guardián registrado con
+set_spawn_guard (la cuota de workspace_maintenance), que fija el tamaño
+máximo de archivo (RLIMIT_FSIZE) según lo que queda de cuota en el
+workspace. active_workspaces() devuelve los directorios con procesos en
+ejecución, para no limpiar un workspace que se está usando.
+"""
+import os
+import time
+import uuid
+import codecs
+import signal
+import logging
+import resource
+import selectors
+import threading
+import subprocess
+from collections import deque, Counter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = int(os.environ.get('COMMAND_STREAM_CHUNK_CHARS', str(8 * 1024)))
+FLUSH_INTERVAL = float(os.environ.get('COMMAND_STREAM_FLUSH_MS', '50')) / 1000
+WINDOW = int(os.environ.get('COMMAND_STREAM_WINDOW', '32'))
+ACK_TIMEOUT = float(os.environ.get('COMMAND_STREAM_ACK_TIMEOUT', '30'))
+STREAM_TIMEOUT = float(os.environ.get('COMMAND_STREAM_TIMEOUT', '600'))
+SCROLLBACK_CHARS = int(os.environ.get('COMMAND_STREAM_SCROLLBACK_CHARS', str(256 * 1024)))
+READ_SIZE = 64 * 1024
+
+# Límites por proceso (0 = sin límite). La memoria se limita con RLIMIT_DATA y no con
+# RLIMIT_AS: Node, Go o la JVM reservan mucho espacio de direcciones que no usan
+RLIMIT_CPU_SECONDS = int(os.environ.get('COMMAND_RLIMIT_CPU_SECONDS', '120'))
+RLIMIT_MEMORY_BYTES = int(os.environ.get('COMMAND_RLIMIT_MEMORY_BYTES', str(1024 * 1024 * 1024)))
+RLIMIT_OPEN_FILES = int(os.environ.get('COMMAND_RLIMIT_OPEN_FILES', '512'))
+
+RESOURCE_LIMITS = tuple((limit, value) for limit, value in (
+    (resource.RLIMIT_CPU, RLIMIT_CPU_SECONDS),
+    (resource.RLIMIT_DATA, RLIMIT_MEMORY_BYTES),
+    (resource.RLIMIT_NOFILE, RLIMIT_OPEN_FILES)
+) if value > 0)
+
+# Variables del servidor que se pasan a los comandos; el resto (claves de API, etc.) no
+INHERITED_ENV = ('PATH', 'LANG', 'LC_ALL', 'TZ')
+
+
+def workspace_env(workspace_path, extra=None):
+    """Entorno de los procesos de un workspace: HOME apunta al workspace."""
+    env = {name: os.environ[name] for name in INHERITED_ENV if name in os.environ}
+    env.setdefault('PATH', '/usr/local/bin:/usr/bin:/bin')
+    env.setdefault('LANG', 'C.UTF-8')
+    workspace_path = os.path.abspath(workspace_path)
+    env['HOME'] = workspace_path
+    env['PWD'] = workspace_path
+    if extra:
+        env.update(extra)
+    return env
+
+
+def limit_resources(max_file_bytes=None):
+    # En el hijo antes de exec: solo llamadas a setrlimit, sin reservar memoria ni bloqueos
+    limits = RESOURCE_LIMITS
+    if max_file_bytes is not None:
+        limits += ((resource.RLIMIT_FSIZE, max(int(max_file_bytes), 0)),)
+    for limit, value in limits:
+        _, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, value))
+
+
+_spawn_guard = None
+_active = Counter()
+_active_lock = threading.Lock()
+
+
+def set_spawn_guard(guard):
+    """
+    Registra guard(cwd), que se llama antes de lanzar cada proceso.
+
+    Debe devolver el tamaño máximo de archivo que el proceso puede escribir
+    (None = sin límite) o lanzar una excepción para impedir la ejecución.
+    """
+    global _spawn_guard
+    _spawn_guard = guard
+
+
+def spawn_limits(cwd):
+    """Tamaño máximo de archivo para un proceso en cwd, según el guardián registrado."""
+    guard = _spawn_guard
+    return guard(os.path.abspath(str(cwd))) if guard is not None else None
+
+
+def active_workspaces():
+    """Directorios de trabajo (absolutos) con procesos en ejecución."""
+    with _active_lock:
+        return set(_active)
+
+
+class CommandProcess:
+    """
+    Proceso de shell cuya salida se consume por fragmentos.
+
+    Args:
+        command: Comando de shell
+        cwd: Directorio de trabajo
+        timeout: Segundos máximos de ejecución; al superarlos se mata el proceso
+        env: Entorno del proceso; por defecto workspace_env(cwd)
+    """
+
+    def __init__(self, command, cwd, timeout=STREAM_TIMEOUT, env=None):
+        self.command = command
+        self.timeout = timeout
+        self.returncode = None
+        self.timed_out = False
+        self.cwd = os.path.abspath(str(cwd))
+        max_file_bytes = spawn_limits(self.cwd)
+        self.process = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=self.cwd,
+            env=env if env is not None else workspace_env(cwd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # Grupo de procesos propio: kill() termina también a los hijos del shell
+            start_new_session=True,
+            preexec_fn=(lambda: limit_resources(max_file_bytes))
+            if RESOURCE_LIMITS or max_file_bytes is not None else None
+        )
+        self.started_at = time.monotonic()
+        with _active_lock:
+            _active[self.cwd] += 1
+
+    def kill(self):
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                self.process.kill()
+
+    def chunks(self, max_chars=CHUNK_CHARS, flush_interval=FLUSH_INTERVAL):
+        """
+        Genera la salida como dicts {'stream': 'stdout'|'stderr', 'data': str}.
+
+        Los datos de cada flujo se agrupan hasta max_chars caracteres o
+        flush_interval segundos. Al terminar, returncode queda fijado.
+        """
+        selector = selectors.DefaultSelector()
+        pending = {}
+        for name, pipe in (('stdout', self.process.stdout), ('stderr', self.process.stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ,
+                              (name, codecs.getincrementaldecoder('utf-8')(errors='replace')))
+            pending[name] = []
+        sizes = dict.fromkeys(pending, 0)
+        deadline = self.started_at + self.timeout if self.timeout else None
+        last_flush = time.monotonic()
+
+        def drain(name, force):
+            text = ''.join(pending[name])
+            pending[name] = []
+            sizes[name] = 0
+            while text:
+                if len(text) < max_chars and not force:
+                    pending[name] = [text]
+                    sizes[name] = len(text)
+                    return
+                yield {'stream': name, 'data': text[:max_chars]}
+                text = text[max_chars:]
+
+        try:
+            while selector.get_map():
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    self.timed_out = True
+                    self.kill()
+                    break
+                wait = flush_interval if deadline is None else min(flush_interval, deadline - now)
+                for key, _ in selector.select(max(wait, 0)):
+                    name, decoder = key.data
+                    try:
+                        data = os.read(key.fileobj.fileno(), READ_SIZE)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        text = decoder.decode(b'', final=True)
+                    else:
+                        text = decoder.decode(data)
+                    if text:
+                        pending[name].append(text)
+                        sizes[name] += len(text)
+                    if sizes[name] >= max_chars:
+                        yield from drain(name, False)
+
+                if time.monotonic() - last_flush >= flush_interval:
+                    for name in pending:
+                        yield from drain(name, True)
+                    last_flush = time.monotonic()
+
+            for name in pending:
+                yield from drain(name, True)
+            try:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 1)
+                self.returncode = self.process.wait(timeout=remaining)
+            except subprocess.TimeoutExpired:
+                self.timed_out = True
+                self.kill()
+                self.returncode = self.process.wait()
+            if self.timed_out:
+                self.returncode = 124
+        finally:
+            # Consumidor cancelado (cliente desconectado) o error: no dejar el proceso vivo
+            self.kill()
+            selector.close()
+            self.process.stdout.close()
+            self.process.stderr.close()
+            if self.returncode is None:
+                self.returncode = self.process.wait()
+            with _active_lock:
+                _active[self.cwd] -= 1
+                if _active[self.cwd] <= 0:
+                    del _active[self.cwd]
+
+
+class OutputTail:
+    """Últimos fragmentos de la salida de un comando, acotados en caracteres."""
+
+    def __init__(self, max_chars=SCROLLBACK_CHARS):
+        self.max_chars = max_chars
+        self.chunks = deque()    # (seq, stream, data)
+        self.size = 0
+        self.truncated = False
+
+    def append(self, seq, stream, data):
+        self.chunks.append((seq, stream, data))
+        self.size += len(data)
+        while self.size > self.max_chars and len(self.chunks) > 1:
+            self.size -= len(self.chunks.popleft()[2])
+            self.truncated = True
+
+    def text(self, stream=None):
+        return ''.join(data for _, name, data in self.chunks if stream is None or name == stream)
+
+    def since(self, seq):
+        """Fragmentos posteriores a seq; None si alguno ya se descartó."""
+        if self.chunks and self.chunks[0][0] > seq + 1:
+            return None
+        return [chunk for chunk in self.chunks if chunk[0] > seq]
+
+
+def _status_note(stderr, note):
+    return f"{stderr}\n{note}" if stderr and not stderr.endswith('\n') else stderr + note
+
+
+def run_command(command, cwd, timeout=10, max_chars=SCROLLBACK_CHARS, env=None):
+    """
+    Ejecuta un comando y devuelve su resultado con la salida acotada.
+
+    Returns:
+        dict: success, stdout, stderr, returncode, truncated y timed_out
+    """
+    process = CommandProcess(command, cwd, timeout=timeout, env=env)
+    tail = OutputTail(max_chars)
+    for seq, chunk in enumerate(process.chunks(), 1):
+        tail.append(seq, chunk['stream'], chunk['data'])
+    stderr = tail.text('stderr')
+    if process.timed_out:
+        stderr = _status_note(stderr, f"Comando cancelado: tiempo de ejecución excedido ({timeout:g}s)")
+    return {
+        'success': process.returncode == 0,
+        'stdout': tail.text('stdout'),
+        'stderr': stderr,
+        'returncode': process.returncode,
+        'truncated': tail.truncated,
+        'timed_out': process.timed_out
+    }
+
+
+class _Flow:
+    __slots__ = ('acked', 'cond', 'tail', 'process', 'cancelled')
+
+    def __init__(self, tail, process):
+        self.acked = 0
+        self.cond = threading.Condition()
+        self.tail = tail
+        self.process = process
+        self.cancelled = False
+
+
+_flows = {}
+_flows_lock = threading.Lock()
+
+
+def ack(command_id, seq):
+    """Registra la confirmación del cliente hasta el fragmento seq."""
+    flow = _flows.get(command_id)
+    if flow is None:
+        return
+    with flow.cond:
+        if seq > flow.acked:
+            flow.acked = seq
+            flow.cond.notify_all()
+
+
+def cancel(command_id):
+    """Cancela un comando en curso matando su proceso."""
+    flow = _flows.get(command_id)
+    if flow is None:
+        return False
+    with flow.cond:
+        flow.cancelled = True
+        flow.cond.notify_all()
+    flow.process.kill()
+    return True
+
+
+def replay(command_id, since):
+    """
+    Fragmentos de un comando en curso posteriores a since.
+
+    Returns:
+        list: Tuplas (seq, stream, data), o None si el comando no existe o
+            los fragmentos ya se descartaron del scrollback
+    """
+    flow = _flows.get(command_id)
+    if flow is None:
+        return None
+    with flow.cond:
+        return flow.tail.since(since)
+
+
+def stream_command(command, cwd, emit, command_id=None, window=WINDOW, timeout=STREAM_TIMEOUT,
+                   ack_timeout=ACK_TIMEOUT, env=None):
+    """
+    Ejecuta un comando emitiendo su salida por fragmentos numerados.
+
+    Args:
+        emit: Función (payload) que envía un fragmento
+            {command_id, seq, stream, data} al cliente
+        window: Fragmentos que pueden estar sin confirmar; 0 desactiva el
+            control de flujo (clientes que no envían command_ack)
+
+    Returns:
+        dict: Como run_command, más command_id y chunks emitidos
+    """
+    command_id = command_id or uuid.uuid4().hex
+    process = CommandProcess(command, cwd, timeout=timeout, env=env)
+    tail = OutputTail()
+    flow = _Flow(tail, process)
+    with _flows_lock:
+        _flows[command_id] = flow
+
+    chunks = process.chunks()
+    seq = 0
+    stalled = False
+    try:
+        for chunk in chunks:
+            seq += 1
+            with flow.cond:
+                tail.append(seq, chunk['stream'], chunk['data'])
+                # Sin confirmaciones suficientes no se lee más: el proceso se bloquea al escribir
+                if window and not flow.cond.wait_for(
+                        lambda: flow.cancelled or seq - flow.acked <= window, timeout=ack_timeout):
+                    stalled = True
+            if flow.cancelled or stalled:
+                break
+            emit({'command_id': command_id, 'seq': seq, 'stream': chunk['stream'], 'data': chunk['data']})
+    finally:
+        # Cerrar el generador mata el proceso si aún no terminó
+        chunks.close()
+        with _flows_lock:
+            _flows.pop(command_id, None)
+        if process.returncode is None:
+            process.kill()
+            process.returncode = process.process.wait()
+
+    stderr = tail.text('stderr')
+    if process.timed_out:
+        stderr = _status_note(stderr, f"Comando cancelado: tiempo de ejecución excedido ({timeout:g}s)")
+    elif stalled:
+        stderr = _status_note(stderr, "Comando cancelado: el cliente dejó de confirmar la salida")
+        logger.warning(f"Comando {command_id} cancelado por falta de confirmaciones: {command}")
+    elif flow.cancelled:
+        stderr = _status_note(stderr, "Comando cancelado por el usuario")
+    return {
+        'command_id': command_id,
+        'success': process.returncode == 0 and not (stalled or flow.cancelled),
+        'stdout': tail.text('stdout'),
+        'stderr': stderr,
+        'returncode': process.returncode,
+        'truncated': tail.truncated,
+        'timed_out': process.timed_out,
+        'chunks': seq
+    }
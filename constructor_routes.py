@@ -7,8 +7,15 @@ import logging
 import zipfile
 import traceback
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file, render_template
-from threading import Thread
+from flask import Blueprint, request, jsonify, send_file, render_template, current_app
+from flask_socketio import join_room, leave_room, emit
+from threading import Thread, Lock
+from rate_limiter import set_request_priority, PRIORITY_BACKGROUND
+from job_store import get_job_store
+from job_control import get_job_control, remove_job_control, JobCancelled, JobParked
+from generation_planner import GenerationPlanner, GenerationTask, extract_routes, extract_element_ids
+from zip_artifacts import get_artifact_cache, send_directory_zip
+from blob_store import get_blob_store
 
 # Initialize the blueprint
 constructor_bp = Blueprint('constructor', __name__)
@@ -17,11 +24,137 @@ constructor_bp = Blueprint('constructor', __name__)
 PROJECTS_DIR = os.path.join('user_workspaces', 'projects')
 os.makedirs(PROJECTS_DIR, exist_ok=True)
 
-# In-memory storage for project status
-project_status = {}
+# El estado de los proyectos (progreso, pausa, mensajes) vive en el almacén
+# persistente de trabajos; ver job_store.get_job_store()
 
-# Variable para controlar si el desarrollo está pausado
-development_paused = {}
+# Máximo de mensajes de consola devueltos por consulta de estado o al unirse a la sala
+STATUS_MESSAGES_LIMIT = 200
+
+# Canal de progreso por Socket.IO: cada proyecto tiene su sala y se envían solo
+# los cambios (progreso, etapa y mensajes nuevos) en lugar de sondear el estado
+_socketio = None
+_push_cursors = {}   # project_id -> último seq de mensaje enviado a la sala
+_push_lock = Lock()
+
+# Plantillas de respaldo cuando los agentes de IA no están disponibles o fallan
+FALLBACK_WEB_APP = """from flask import Flask, render_template, jsonify, request
+from flask_cors import CORS
+import os
+
+app = Flask(__name__)
+CORS(app)
+
+@app.route('/')
+def index():
+    return render_template('index.html', title="Aplicación Generada")
+
+@app.route('/api/status')
+def status():
+    return jsonify({'status': 'ok'})
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
+"""
+
+FALLBACK_CLI_APP = """import argparse
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplicación CLI generada")
+    parser.add_argument('--accion', type=str, help='Acción a realizar')
+    args = parser.parse_args()
+
+    print(f"Aplicación: {args.accion if args.accion else 'Sin acción especificada'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+"""
+
+FALLBACK_WEB_REQUIREMENTS = """flask==2.3.0
+flask-cors==3.0.10
+"""
+
+FALLBACK_CLI_REQUIREMENTS = """# No external dependencies
+"""
+
+FALLBACK_INDEX_HTML = """<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title }}</title>
+    <link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}">
+</head>
+<body>
+    <header>
+        <h1>{{ title }}</h1>
+    </header>
+    <main>
+        <div class="container">
+            <div class="card">
+                <h2>Aplicación generada correctamente</h2>
+                <p>Esta es una aplicación generada automáticamente.</p>
+                <div id="status">Cargando estado...</div>
+            </div>
+        </div>
+    </main>
+    <footer>
+        <p>&copy; Aplicación generada por Codestorm Assistant</p>
+    </footer>
+    <script src="{{ url_for('static', filename='js/main.js') }}"></script>
+</body>
+</html>"""
+
+FALLBACK_STYLE_CSS = """body {
+    font-family: Arial, sans-serif;
+    margin: 0;
+    padding: 0;
+    background-color: #f5f5f5;
+}
+
+header {
+    background-color: #333;
+    color: white;
+    padding: 1rem;
+    text-align: center;
+}
+
+.container {
+    max-width: 1200px;
+    margin: 0 auto;
+    padding: 1rem;
+}
+
+.card {
+    background-color: white;
+    border-radius: 8px;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+    padding: 1rem;
+    margin: 1rem 0;
+}
+
+footer {
+    background-color: #333;
+    color: white;
+    text-align: center;
+    padding: 1rem;
+    position: fixed;
+    bottom: 0;
+    width: 100%;
+}"""
+
+FALLBACK_MAIN_JS = """document.addEventListener('DOMContentLoaded', function() {
+    // Verificar el estado de la API
+    fetch('/api/status')
+        .then(response => response.json())
+        .then(data => {
+            document.getElementById('status').textContent = 'Estado del servidor: ' + data.status;
+        })
+        .catch(error => {
+            document.getElementById('status').textContent = 'Error: ' + error.message;
+        });
+});"""
 
 # Function to create a workspace for a project
 def create_project_workspace(project_id):
@@ -29,93 +162,210 @@ def create_project_workspace(project_id):
     os.makedirs(project_dir, exist_ok=True)
     return project_dir
 
-# Background task for generating application
-def generate_application(project_id, description, agent, model, options, features):
-    try:
-        # Initialize project status
-        project_status[project_id] = {
-            'status': 'in_progress',
-            'progress': 5,
-            'current_stage': 'Analizando requisitos...',
-            'console_messages': [],
-            'start_time': time.time(),
-            'completion_time': None,
-            'framework': None,  # Almacenará el framework seleccionado
-            'techstack': {},    # Detalles del stack tecnológico
-            'plan': {           # Plan de desarrollo
-                'selected_technologies': [],
-                'development_phases': [],
-                'estimated_time': ''
-            }
+def create_job(project_id, description, agent, model, options, features):
+    """Registra un trabajo nuevo en el almacén, con los parámetros necesarios para reanudarlo."""
+    return get_job_store().create(
+        project_id,
+        progress=5,
+        current_stage='Analizando requisitos...',
+        params={
+            'description': description,
+            'agent': agent,
+            'model': model,
+            'options': options,
+            'features': features
+        },
+        plan={           # Plan de desarrollo
+            'selected_technologies': [],
+            'development_phases': [],
+            'estimated_time': ''
         }
+    )
+
+def constructor_room(project_id):
+    """Sala de Socket.IO con las actualizaciones de un proyecto."""
+    return f"constructor_{project_id}"
+
+
+def job_delta(project_id, job, messages, since=0):
+    """
+    Actualización incremental del estado de un trabajo.
+
+    Args:
+        job: Trabajo tal como lo devuelve el almacén
+        messages: Mensajes de consola nuevos (dicts con seq, time y message)
+        since: Cursor del cliente; se devuelve si no hay mensajes nuevos
+
+    Returns:
+        dict: Estado actual y mensajes nuevos, con el cursor para la siguiente consulta
+    """
+    return {
+        'project_id': project_id,
+        'status': job.get('status', 'in_progress'),
+        'progress': job.get('progress') or 0,
+        'current_stage': job.get('current_stage') or 'Procesando...',
+        'paused': bool(job.get('paused')),
+        'error': job.get('error'),
+        'framework': job.get('framework'),
+        'techstack': job.get('techstack', {}),
+        'messages': messages,
+        'cursor': messages[-1]['seq'] if messages else since
+    }
 
-        # Initialize development_paused status
-        development_paused[project_id] = False
 
-        # Obtener las claves API del contexto de la aplicación Flask
-        from flask import current_app
-        api_keys = current_app.config.get('API_KEYS', {})
+def push_job_update(project_id, since=None):
+    """
+    Envía a la sala del proyecto su estado y los mensajes que aún no se enviaron.
+
+    Args:
+        since: Enviar los mensajes posteriores a este seq; por defecto los
+            posteriores al último enviado desde este proceso, o ninguno si el
+            trabajo no se sigue aquí
+    """
+    if _socketio is None:
+        return
+    try:
+        jobs = get_job_store()
+        job = jobs.get(project_id)
+        if job is None:
+            return
+        with _push_lock:
+            cursor = _push_cursors.get(project_id)
+            if since is None:
+                since = cursor if cursor is not None else job.get('message_count') or 0
+            messages = jobs.messages(project_id, since=since)
+            if messages and cursor is not None:
+                _push_cursors[project_id] = max(cursor, messages[-1]['seq'])
+            # Emitir bajo el lock para que los eventos lleguen en orden
+            _socketio.emit('constructor_update', job_delta(project_id, job, messages, since),
+                           room=constructor_room(project_id))
+    except Exception as e:
+        logging.error(f"Error enviando progreso del proyecto {project_id}: {str(e)}")
+
+
+def init_constructor_socketio(socketio):
+    """Registra los eventos de Socket.IO del canal de progreso del constructor."""
+    global _socketio
+    _socketio = socketio
+
+    @socketio.on('join_constructor')
+    def handle_join_constructor(data):
+        """Une al cliente a la sala del proyecto y le envía lo que se perdió desde su cursor."""
+        data = data or {}
+        project_id = data.get('project_id')
+        if not project_id:
+            emit('constructor_error', {'error': 'No se proporcionó project_id'})
+            return
+
+        jobs = get_job_store()
+        job = jobs.get(project_id)
+        if job is None:
+            emit('constructor_error', {'project_id': project_id, 'error': 'Proyecto no encontrado'})
+            return
+
+        # Unirse antes de leer el estado: el cliente descarta por seq los mensajes repetidos
+        join_room(constructor_room(project_id))
+        try:
+            since = max(int(data.get('since') or 0), 0)
+        except (TypeError, ValueError):
+            since = 0
+        messages = jobs.messages(project_id, since=since, limit=STATUS_MESSAGES_LIMIT)
+        emit('constructor_update', job_delta(project_id, job, messages, since))
+
+    @socketio.on('leave_constructor')
+    def handle_leave_constructor(data):
+        project_id = (data or {}).get('project_id')
+        if project_id:
+            leave_room(constructor_room(project_id))
+
+
+# Background task for generating application
+def generate_application(project_id, description, agent, model, options, features,
+                         api_keys=None, resume=False):
+    """
+    Genera una aplicación completa en segundo plano.
+
+    Con resume=True continúa un trabajo interrumpido o aparcado: conserva su
+    estado en el almacén y no vuelve a generar los archivos ya completados.
+
+    Al pausarse, el trabajo se aparca en el siguiente punto de control: el
+    hilo termina y el trabajo queda en el almacén sin dueño hasta que
+    resume_parked_job() lo relanza.
+    """
+    # Las peticiones de IA de este hilo ceden el paso al chat interactivo
+    set_request_priority(PRIORITY_BACKGROUND)
+    jobs = get_job_store()
+    control = get_job_control(project_id)
+    existing = jobs.get(project_id)
+    with _push_lock:
+        # La sala recibe los mensajes desde que este hilo toma el trabajo
+        _push_cursors[project_id] = (existing or {}).get('message_count') or 0
+    parked = False
+    try:
+        if resume and jobs.exists(project_id):
+            jobs.update(project_id, status='in_progress', error=None)
+            jobs.append_message(project_id, "Generación reanudada desde la última etapa completada")
+        elif not jobs.exists(project_id):
+            create_job(project_id, description, agent, model, options, features)
+
+        # Las claves API se capturan en la petición: este hilo no tiene contexto de Flask
+        api_keys = api_keys or {}
 
         # Verificar si el modelo solicitado tiene una API configurada
         if model in api_keys and not api_keys.get(model):
             # Registrar advertencia y buscar un modelo alternativo
-            project_status[project_id]['console_messages'].append({
-                'time': time.time(),
-                'message': f"Advertencia: El modelo {model} no está configurado. Buscando alternativa."
-            })
+            jobs.append_message(project_id, f"Advertencia: El modelo {model} no está configurado. Buscando alternativa.")
 
             # Buscar un modelo alternativo disponible
             for alt_model, key in api_keys.items():
                 if key:
                     model = alt_model
-                    project_status[project_id]['console_messages'].append({
-                        'time': time.time(),
-                        'message': f"Usando modelo alternativo: {model}"
-                    })
+                    jobs.append_message(project_id, f"Usando modelo alternativo: {model}")
                     break
 
+        # Los archivos se generan en paralelo: serializar las actualizaciones de estado
+        status_lock = Lock()
+
         # Function to update status
         def update_status(progress, stage, message=None):
-            # Actualizar solo si el proyecto existe
-            if project_id not in project_status:
-                return
+            with status_lock:
+                job = jobs.get(project_id)
+                # Actualizar solo si el proyecto existe
+                if job is None:
+                    return
 
-            project_status[project_id]['progress'] = progress
+                # Mantener la etiqueta (PAUSADO) si está pausado
+                if job.get('paused') and " (PAUSADO)" not in stage:
+                    stage += " (PAUSADO)"
 
-            # Mantener la etiqueta (PAUSADO) si está pausado
-            if development_paused.get(project_id, False) and " (PAUSADO)" not in stage:
-                stage += " (PAUSADO)"
+                # El progreso nunca retrocede aunque los archivos terminen en otro orden
+                jobs.update(project_id, progress=max(progress, job.get('progress') or 0), current_stage=stage)
 
-            project_status[project_id]['current_stage'] = stage
-
-            if message:
-                project_status[project_id]['console_messages'].append({
-                    'time': time.time(),
-                    'message': message
-                })
-                logging.info(f"Project {project_id}: {message}")
-
-            # Si está pausado, esperar hasta que se reanude pero con timeout
-            pause_start_time = time.time()
-            while (development_paused.get(project_id, False) and
-                  project_id in project_status and
-                  project_status[project_id]['status'] == 'in_progress'):
-                # Si ha estado pausado por más de 5 minutos, continuar
-                if time.time() - pause_start_time > 300:
-                    logging.warning(f"Project {project_id} auto-resumed after 5 minutes of pause")
-                    development_paused[project_id] = False
-                    break
-                time.sleep(1)
+                if message:
+                    jobs.append_message(project_id, message)
+                    logging.info(f"Project {project_id}: {message}")
+
+            push_job_update(project_id)
+
+            # Punto de control: aplicar pausas o cancelaciones pedidas desde otro worker
+            if job.get('status') == 'cancelled':
+                control.cancel()
+            elif job.get('paused'):
+                control.pause()
+            control.checkpoint()
 
         # Determinar el stack tecnológico basado en la descripción
         frameworks = determine_frameworks(description.lower())
         if frameworks.get('recommended'):
-            project_status[project_id]['framework'] = frameworks['recommended']['name']
-            project_status[project_id]['techstack'] = {
-                'backend': frameworks['recommended']['backend']['id'],
-                'frontend': frameworks['recommended']['frontend']['id'],
-                'database': frameworks['recommended']['database']['id'] if frameworks['recommended']['database'] else 'sqlite'
-            }
+            jobs.update(
+                project_id,
+                framework=frameworks['recommended']['name'],
+                techstack={
+                    'backend': frameworks['recommended']['backend']['id'],
+                    'frontend': frameworks['recommended']['frontend']['id'],
+                    'database': frameworks['recommended']['database']['id'] if frameworks['recommended']['database'] else 'sqlite'
+                }
+            )
 
             # Añadir mensaje sobre el stack tecnológico
             update_status(
@@ -125,12 +375,15 @@ def generate_application(project_id, description, agent, model, options, feature
             )
         else:
             # Si no hay recomendación, usar Flask por defecto
-            project_status[project_id]['framework'] = "Flask + Bootstrap + SQLite"
-            project_status[project_id]['techstack'] = {
-                'backend': 'flask',
-                'frontend': 'bootstrap',
-                'database': 'sqlite'
-            }
+            jobs.update(
+                project_id,
+                framework="Flask + Bootstrap + SQLite",
+                techstack={
+                    'backend': 'flask',
+                    'frontend': 'bootstrap',
+                    'database': 'sqlite'
+                }
+            )
             update_status(
                 8,
                 "Analizando requisitos y seleccionando tecnologías...",
@@ -154,15 +407,19 @@ def generate_application(project_id, description, agent, model, options, feature
         # Stage 2: Design
         update_status(20, "Diseñando la aplicación...", "Definiendo estructura")
 
+        # Los archivos del proyecto se escriben como enlaces al almacén de blobs:
+        # el contenido repetido entre proyectos se guarda una sola vez
+        blobs = get_blob_store()
+
         # Create README with features
-        with open(os.path.join(project_dir, 'README.md'), 'w') as f:
-            f.write(f"# Aplicación: {description}\n\n")
-            f.write(f"## Características\n\n")
-            for feature in features:
-                f.write(f"- {feature}\n")
-            f.write(f"\n## Instrucciones\n\n")
-            f.write(f"1. Instalar dependencias: `pip install -r requirements.txt`\n")
-            f.write(f"2. Ejecutar la aplicación: `python app.py`\n")
+        readme = f"# Aplicación: {description}\n\n"
+        readme += f"## Características\n\n"
+        for feature in features:
+            readme += f"- {feature}\n"
+        readme += f"\n## Instrucciones\n\n"
+        readme += f"1. Instalar dependencias: `pip install -r requirements.txt`\n"
+        readme += f"2. Ejecutar la aplicación: `python app.py`\n"
+        blobs.write_file(os.path.join(project_dir, 'README.md'), readme)
 
         # Stage 3: Generate app structure using the AI agents
         update_status(40, "Generando código completo de la aplicación...", "Creando archivos principales")
@@ -189,405 +446,239 @@ def generate_application(project_id, description, agent, model, options, feature
                          for feature in features])
 
         # Determine the tech stack based on project status
-        tech_backend = project_status[project_id].get('techstack', {}).get('backend', 'flask')
-        tech_frontend = project_status[project_id].get('techstack', {}).get('frontend', 'bootstrap')
-        tech_database = project_status[project_id].get('techstack', {}).get('database', 'sqlite')
+        techstack = jobs.get(project_id).get('techstack') or {}
+        tech_backend = techstack.get('backend', 'flask')
+        tech_frontend = techstack.get('frontend', 'bootstrap')
+        tech_database = techstack.get('database', 'sqlite')
 
         if ai_generation_available:
-            # Generar app.py usando agentes IA
+            if is_web_app:
+                os.makedirs(os.path.join(project_dir, 'templates'), exist_ok=True)
+                os.makedirs(os.path.join(project_dir, 'static', 'css'), exist_ok=True)
+                os.makedirs(os.path.join(project_dir, 'static', 'js'), exist_ok=True)
+
+            features_text = ', '.join(features)
+
             app_description = f"""Crear un archivo principal app.py para una aplicación {'web' if is_web_app else 'CLI'} que implemente las siguientes características:
-            {', '.join(features)}
+            {features_text}
 
             La aplicación debe usar {tech_backend} como backend{', ' + tech_frontend + ' para el frontend' if is_web_app else ''} y {tech_database} como base de datos.
             La aplicación debe ser funcional y completa, no un esqueleto o demo."""
 
-            app_result = create_file_with_agent(
-                description=app_description,
-                file_type="py",
-                filename="app.py",
-                agent_id="developer",
-                workspace_path=project_dir,
-                model="openai"
-            )
-
-            if app_result.get('success'):
-                update_status(45, "Generando código principal...", f"app.py generado exitosamente con {tech_backend}")
-            else:
-                update_status(45, "Error generando app.py", f"Error: {app_result.get('error', 'Desconocido')}")
-                # Fallback a plantilla simple si falla
-                with open(os.path.join(project_dir, 'app.py'), 'w') as f:
-                    if is_web_app:
-                        f.write("""from flask import Flask, render_template, jsonify, request
-from flask_cors import CORS
-import os
-
-app = Flask(__name__)
-CORS(app)
-
-@app.route('/')
-def index():
-    return render_template('index.html', title="Aplicación Generada")
-
-@app.route('/api/status')
-def status():
-    return jsonify({'status': 'ok'})
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
-""")
-                    else:
-                        f.write("""import argparse
-import sys
-
-def main():
-    parser = argparse.ArgumentParser(description="Aplicación CLI generada")
-    parser.add_argument('--accion', type=str, help='Acción a realizar')
-    args = parser.parse_args()
-
-    print(f"Aplicación: {args.accion if args.accion else 'Sin acción especificada'}")
-    return 0
-
-if __name__ == "__main__":
-    sys.exit(main())
-""")
-
-            # Generar requirements.txt
-            requirements_description = f"""Crear un archivo requirements.txt para una aplicación {'web' if is_web_app else 'CLI'} con {tech_backend}
-            que implementa las siguientes características: {', '.join(features)}.
+            def requirements_description(inputs):
+                return f"""Crear un archivo requirements.txt para una aplicación {'web' if is_web_app else 'CLI'} con {tech_backend}
+            que implementa las siguientes características: {features_text}.
             {'Include libraries for ' + tech_frontend + ' integration' if is_web_app else ''}
-            La aplicación usa {tech_database} como base de datos."""
-
-            req_result = create_file_with_agent(
-                description=requirements_description,
-                file_type="txt",
-                filename="requirements.txt",
-                agent_id="developer",
-                workspace_path=project_dir,
-                model="openai"
-            )
-
-            if not req_result.get('success'):
-                # Fallback a plantilla simple si falla
-                with open(os.path.join(project_dir, 'requirements.txt'), 'w') as f:
-                    if is_web_app:
-                        f.write(f"""{tech_backend}==2.3.0
-flask-cors==3.0.10
-{tech_database}==3.36.0
-""")
-                    else:
-                        f.write("""# No external dependencies
-""")
-
-            # Si es una aplicación web, crear archivos de frontend
-            if is_web_app:
-                os.makedirs(os.path.join(project_dir, 'templates'), exist_ok=True)
-                os.makedirs(os.path.join(project_dir, 'static'), exist_ok=True)
-                os.makedirs(os.path.join(project_dir, 'static', 'css'), exist_ok=True)
-                os.makedirs(os.path.join(project_dir, 'static', 'js'), exist_ok=True)
+            La aplicación usa {tech_database} como base de datos.
+            Incluye las dependencias importadas por este app.py:
+            {inputs.get('app.py', '')[:4000]}"""
 
-                # Generar index.html
-                index_description = f"""Crear una página principal index.html para una aplicación web que implementa las siguientes características:
-                {', '.join(features)}
+            def index_description(inputs):
+                routes = extract_routes(inputs.get('app.py'))
+                return f"""Crear una página principal index.html para una aplicación web que implementa las siguientes características:
+                {features_text}
 
                 La aplicación debe usar {tech_frontend} para el frontend.
+                El backend expone estas rutas: {', '.join(routes) if routes else '/'}.
                 Debe ser una implementación completa, no una demostración o plantilla."""
 
-                index_result = create_file_with_agent(
-                    description=index_description,
-                    file_type="html",
-                    filename="templates/index.html",
-                    agent_id="developer",
-                    workspace_path=project_dir,
-                    model="openai"
-                )
-
-                if index_result.get('success'):
-                    update_status(50, "Generando interfaz de usuario...", "index.html generado correctamente")
-                else:
-                    update_status(50, "Error generando index.html", f"Error: {index_result.get('error', 'Desconocido')}")
-                    # Fallback a plantilla simple si falla
-                    with open(os.path.join(project_dir, 'templates', 'index.html'), 'w') as f:
-                        f.write("""<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{{ title }}</title>
-    <link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}">
-</head>
-<body>
-    <header>
-        <h1>{{ title }}</h1>
-    </header>
-    <main>
-        <div class="container">
-            <div class="card">
-                <h2>Aplicación generada correctamente</h2>
-                <p>Esta es una aplicación generada automáticamente.</p>
-                <div id="status">Cargando estado...</div>
-            </div>
-        </div>
-    </main>
-    <footer>
-        <p>&copy; Aplicación generada por Codestorm Assistant</p>
-    </footer>
-    <script src="{{ url_for('static', filename='js/main.js') }}"></script>
-</body>
-</html>""")
-
-                # Generar CSS
-                css_description = f"""Crear un archivo CSS principal para una aplicación web que implementa:
-                {', '.join(features)}
+            css_description = f"""Crear un archivo CSS principal para una aplicación web que implementa:
+                {features_text}
 
                 El archivo debe usar {tech_frontend} y proporcionar estilos completos para toda la aplicación,
                 incluyendo diseño responsivo para móviles, tablets y desktop."""
 
-                css_result = create_file_with_agent(
-                    description=css_description,
-                    file_type="css",
-                    filename="static/css/style.css",
-                    agent_id="developer",
-                    workspace_path=project_dir,
-                    model="openai"
-                )
-
-                if not css_result.get('success'):
-                    # Fallback a plantilla simple si falla
-                    with open(os.path.join(project_dir, 'static', 'css', 'style.css'), 'w') as f:
-                        f.write("""body {
-    font-family: Arial, sans-serif;
-    margin: 0;
-    padding: 0;
-    background-color: #f5f5f5;
-}
-
-header {
-    background-color: #333;
-    color: white;
-    padding: 1rem;
-    text-align: center;
-}
-
-.container {
-    max-width: 1200px;
-    margin: 0 auto;
-    padding: 1rem;
-}
-
-.card {
-    background-color: white;
-    border-radius: 8px;
-    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    padding: 1rem;
-    margin: 1rem 0;
-}
-
-footer {
-    background-color: #333;
-    color: white;
-    text-align: center;
-    padding: 1rem;
-    position: fixed;
-    bottom: 0;
-    width: 100%;
-}""")
-
-                # Generar JS
-                js_description = f"""Crear un archivo JavaScript principal para una aplicación web que implementa:
-                {', '.join(features)}
+            def js_description(inputs):
+                routes = extract_routes(inputs.get('app.py'))
+                element_ids = extract_element_ids(inputs.get('templates/index.html'))
+                return f"""Crear un archivo JavaScript principal para una aplicación web que implementa:
+                {features_text}
 
                 El archivo debe implementar toda la funcionalidad del lado del cliente, incluyendo:
                 - Manejo de eventos
                 - Validación de formularios
-                - Integración con API backend
-                - Actualización dinámica de contenido"""
-
-                js_result = create_file_with_agent(
-                    description=js_description,
-                    file_type="js",
-                    filename="static/js/main.js",
-                    agent_id="developer",
+                - Integración con API backend (rutas disponibles: {', '.join(routes) if routes else '/api/status'})
+                - Actualización dinámica de contenido
+                Elementos del DOM definidos en index.html: {', '.join(element_ids) if element_ids else 'ninguno'}"""
+
+            # Plan de generación: los archivos sin dependencias entre sí se generan en paralelo
+            tasks = [
+                GenerationTask('app.py', 'py', app_description,
+                               fallback=FALLBACK_WEB_APP if is_web_app else FALLBACK_CLI_APP),
+                GenerationTask('requirements.txt', 'txt', requirements_description,
+                               depends_on=['app.py'],
+                               fallback=FALLBACK_WEB_REQUIREMENTS if is_web_app else FALLBACK_CLI_REQUIREMENTS)
+            ]
+            if is_web_app:
+                tasks += [
+                    GenerationTask('templates/index.html', 'html', index_description,
+                                   depends_on=['app.py'], fallback=FALLBACK_INDEX_HTML),
+                    GenerationTask('static/css/style.css', 'css', css_description,
+                                   fallback=FALLBACK_STYLE_CSS),
+                    GenerationTask('static/js/main.js', 'js', js_description,
+                                   depends_on=['app.py', 'templates/index.html'],
+                                   fallback=FALLBACK_MAIN_JS)
+                ]
+
+            def generate_file(task, file_description):
+                stage = f"file:{task.filename}"
+                file_path = os.path.join(project_dir, task.filename)
+                if resume and jobs.is_stage_done(project_id, stage) and os.path.exists(file_path):
+                    # Archivo generado antes de la interrupción: reutilizarlo
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        return {'success': True, 'content': f.read(), 'resumed': True}
+
+                result = create_file_with_agent(
+                    description=file_description,
+                    file_type=task.file_type,
+                    filename=task.filename,
+                    agent_id=task.agent_id,
                     workspace_path=project_dir,
                     model="openai"
                 )
-
-                if not js_result.get('success'):
+                # Si el trabajo se pausó o canceló durante la llamada, no registrar el archivo
+                control.checkpoint()
+                if not result.get('success') and task.fallback is not None:
                     # Fallback a plantilla simple si falla
-                    with open(os.path.join(project_dir, 'static', 'js', 'main.js'), 'w') as f:
-                        f.write("""document.addEventListener('DOMContentLoaded', function() {
-    // Verificar el estado de la API
-    fetch('/api/status')
-        .then(response => response.json())
-        .then(data => {
-            document.getElementById('status').textContent = 'Estado del servidor: ' + data.status;
-        })
-        .catch(error => {
-            document.getElementById('status').textContent = 'Error: ' + error.message;
-        });
-});""")
+                    blobs.write_file(file_path, task.fallback)
+                    result['content'] = task.fallback
+                jobs.mark_stage_done(project_id, stage)
+                return result
+
+            def on_task_done(task, result, completed, total):
+                progress = 45 + int(45 * completed / total)
+                if result.get('success'):
+                    update_status(progress, "Generando archivos del proyecto...",
+                                  f"{task.filename} generado correctamente ({completed}/{total})")
+                else:
+                    update_status(progress, "Generando archivos del proyecto...",
+                                  f"Error generando {task.filename}: {result.get('error', 'Desconocido')}. Se usó una plantilla")
+
+            update_status(45, "Generando archivos del proyecto...",
+                          f"Generando {len(tasks)} archivos con agentes de IA")
+            GenerationPlanner(generate_file, control=control).run(tasks, on_task_done)
         else:
             # Si los agentes no están disponibles, usar plantillas predefinidas
             # Create app.py - core file
-            with open(os.path.join(project_dir, 'app.py'), 'w') as f:
-                if is_web_app:
-                    f.write("""from flask import Flask, render_template, jsonify, request
-from flask_cors import CORS
-import os
-
-app = Flask(__name__)
-CORS(app)
-
-@app.route('/')
-def index():
-    return render_template('index.html', title="Aplicación Generada")
-
-@app.route('/api/status')
-def status():
-    return jsonify({'status': 'ok'})
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
-""")
-                else:
-                    f.write("""import argparse
-import sys
-
-def main():
-    parser = argparse.ArgumentParser(description="Aplicación CLI generada")
-    parser.add_argument('--accion', type=str, help='Acción a realizar')
-    args = parser.parse_args()
-
-    print(f"Aplicación: {args.accion if args.accion else 'Sin acción especificada'}")
-    return 0
-
-if __name__ == "__main__":
-    sys.exit(main())
-""")
+            blobs.write_file(os.path.join(project_dir, 'app.py'),
+                             FALLBACK_WEB_APP if is_web_app else FALLBACK_CLI_APP)
 
             # Create requirements.txt
-            with open(os.path.join(project_dir, 'requirements.txt'), 'w') as f:
-                if is_web_app:
-                    f.write("""flask==2.3.0
-flask-cors==3.0.10
-""")
-                else:
-                    f.write("""# No external dependencies
-""")
+            blobs.write_file(os.path.join(project_dir, 'requirements.txt'),
+                             FALLBACK_WEB_REQUIREMENTS if is_web_app else FALLBACK_CLI_REQUIREMENTS)
 
             # Create templates folder for web apps
             if is_web_app:
                 os.makedirs(os.path.join(project_dir, 'templates'), exist_ok=True)
-                os.makedirs(os.path.join(project_dir, 'static'), exist_ok=True)
                 os.makedirs(os.path.join(project_dir, 'static', 'css'), exist_ok=True)
                 os.makedirs(os.path.join(project_dir, 'static', 'js'), exist_ok=True)
 
                 # Create index.html
-                with open(os.path.join(project_dir, 'templates', 'index.html'), 'w') as f:
-                    f.write("""<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{{ title }}</title>
-    <link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}">
-</head>
-<body>
-    <header>
-        <h1>{{ title }}</h1>
-    </header>
-    <main>
-        <div class="container">
-            <div class="card">
-                <h2>Aplicación generada correctamente</h2>
-                <p>Esta es una aplicación generada automáticamente.</p>
-                <div id="status">Cargando estado...</div>
-            </div>
-        </div>
-    </main>
-    <footer>
-        <p>&copy; Aplicación generada por Codestorm Assistant</p>
-    </footer>
-    <script src="{{ url_for('static', filename='js/main.js') }}"></script>
-</body>
-</html>""")
+                blobs.write_file(os.path.join(project_dir, 'templates', 'index.html'), FALLBACK_INDEX_HTML)
 
                 # Create CSS
-                with open(os.path.join(project_dir, 'static', 'css', 'style.css'), 'w') as f:
-                    f.write("""body {
-    font-family: Arial, sans-serif;
-    margin: 0;
-    padding: 0;
-    background-color: #f5f5f5;
-}
-
-header {
-    background-color: #333;
-    color: white;
-    padding: 1rem;
-    text-align: center;
-}
-
-.container {
-    max-width: 1200px;
-    margin: 0 auto;
-    padding: 1rem;
-}
-
-.card {
-    background-color: white;
-    border-radius: 8px;
-    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    padding: 1rem;
-    margin: 1rem 0;
-}
-
-footer {
-    background-color: #333;
-    color: white;
-    text-align: center;
-    padding: 1rem;
-    position: fixed;
-    bottom: 0;
-    width: 100%;
-}""")
+                blobs.write_file(os.path.join(project_dir, 'static', 'css', 'style.css'), FALLBACK_STYLE_CSS)
 
                 # Create JS
-                with open(os.path.join(project_dir, 'static', 'js', 'main.js'), 'w') as f:
-                    f.write("""document.addEventListener('DOMContentLoaded', function() {
-    // Verificar el estado de la API
-    fetch('/api/status')
-""")
+                blobs.write_file(os.path.join(project_dir, 'static', 'js', 'main.js'), FALLBACK_MAIN_JS)
 
         # Create a zip file of the project
         update_status(95, "Finalizando...", "Preparando archivos para descarga")
-        zip_path = os.path.join(PROJECTS_DIR, f"{project_id}.zip")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(project_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, PROJECTS_DIR)
-                    zipf.write(file_path, arcname)
+        # Los archivos escritos por los agentes también pasan al almacén de blobs
+        dedup = blobs.intern_directory(project_dir)
+        logging.info(f"Project {project_id}: {dedup['deduplicated']}/{dedup['files']} archivos deduplicados "
+                     f"({dedup['bytes_saved']} bytes)")
+        # Dejar el ZIP en la caché de artefactos: la primera descarga se sirve desde disco
+        get_artifact_cache().build(project_dir, arc_root=project_id)
 
         # Mark project as completed
-        project_status[project_id]['status'] = 'completed'
-        project_status[project_id]['progress'] = 100
-        project_status[project_id]['current_stage'] = 'Proyecto completado exitosamente'
-        project_status[project_id]['completion_time'] = time.time()
-        project_status[project_id]['console_messages'].append({
-            'time': time.time(),
-            'message': "Aplicación generada exitosamente y lista para descargar"
-        })
+        jobs.append_message(project_id, "Aplicación generada exitosamente y lista para descargar")
+        jobs.finish(
+            project_id,
+            'completed',
+            progress=100,
+            current_stage='Proyecto completado exitosamente'
+        )
+        push_job_update(project_id)
+
+    except JobParked:
+        # Liberar el hilo: el trabajo queda en el almacén hasta que se reanude
+        remove_job_control(project_id)
+        jobs.append_message(project_id, "Trabajo aparcado hasta que se reanude")
+        jobs.release(project_id)
+        push_job_update(project_id)
+        logging.info(f"Project {project_id} parked while paused")
+        parked = True
+
+    except JobCancelled:
+        jobs.append_message(project_id, "Desarrollo cancelado por el usuario")
+        jobs.finish(project_id, 'cancelled', current_stage='Desarrollo cancelado', paused=False)
+        push_job_update(project_id)
 
     except Exception as e:
         logging.error(f"Error generating application: {str(e)}")
         # Mark project as failed
-        if project_id in project_status:
-            project_status[project_id]['status'] = 'failed'
-            project_status[project_id]['error'] = str(e)
-            project_status[project_id]['console_messages'].append({
-                'time': time.time(),
-                'message': f"Error: {str(e)}"
-            })
+        if jobs.exists(project_id):
+            jobs.append_message(project_id, f"Error: {str(e)}")
+            jobs.finish(project_id, 'failed', error=str(e))
+            push_job_update(project_id)
+
+    finally:
+        remove_job_control(project_id)
+        with _push_lock:
+            _push_cursors.pop(project_id, None)
+
+    # Si se reanudó mientras se aparcaba, relanzarlo una vez liberado este hilo
+    if parked:
+        job = jobs.get(project_id)
+        if job and not job.get('paused') and job.get('status') == 'in_progress':
+            resume_parked_job(project_id, api_keys)
+
+
+def resume_parked_job(project_id, api_keys=None):
+    """
+    Relanza en este proceso un trabajo aparcado.
+
+    Returns:
+        bool: True si el trabajo se reclamó y relanzó aquí
+    """
+    job = get_job_store().claim(project_id)
+    if job is None:
+        return False
+    params = job.get('params') or {}
+    thread = Thread(target=generate_application,
+                    args=(project_id, params.get('description', ''), params.get('agent', 'developer'),
+                          params.get('model', 'openai'), params.get('options', {}),
+                          params.get('features', [])),
+                    kwargs={'api_keys': api_keys, 'resume': True})
+    thread.daemon = True
+    thread.start()
+    return True
+
+
+def resume_interrupted_jobs(api_keys=None):
+    """
+    Reanuda los trabajos que quedaron en curso cuando su proceso se detuvo.
+
+    Returns:
+        int: Número de trabajos reanudados
+    """
+    resumed = 0
+    for job in get_job_store().claim_orphaned_jobs():
+        params = job.get('params') or {}
+        if not params.get('description'):
+            get_job_store().finish(job['project_id'], 'failed',
+                                   error='No se pudo reanudar: faltan los parámetros originales')
+            continue
+        thread = Thread(target=generate_application,
+                        args=(job['project_id'], params['description'], params.get('agent', 'developer'),
+                              params.get('model', 'openai'), params.get('options', {}),
+                              params.get('features', [])),
+                        kwargs={'api_keys': api_keys, 'resume': True})
+        thread.daemon = True
+        thread.start()
+        resumed += 1
+    return resumed
 
 # Route to analyze features from a description
 @constructor_bp.route('/api/constructor/analyze-features', methods=['POST'])
@@ -924,21 +1015,29 @@ def determine_frameworks(description):
 @constructor_bp.route('/api/constructor/status/<project_id>', methods=['GET'])
 def check_project_status(project_id):
     try:
-        if project_id not in project_status:
+        jobs = get_job_store()
+        status_data = jobs.get(project_id)
+        if status_data is None:
             return jsonify({
                 'success': False,
                 'error': 'Proyecto no encontrado'
             }), 404
 
-        status_data = project_status[project_id]
-        console_message = status_data['console_messages'][-1] if status_data['console_messages'] else None
+        # Con ?since=<seq> solo se devuelven los mensajes posteriores al cursor
+        since = request.args.get('since', type=int)
+        if since is not None:
+            messages = jobs.messages(project_id, since=max(since, 0), limit=STATUS_MESSAGES_LIMIT)
+            return jsonify(dict(job_delta(project_id, status_data, messages, max(since, 0)), success=True))
+
+        last_message = jobs.last_message(project_id)
+        console_message = {'time': last_message['time'], 'message': last_message['message']} if last_message else None
 
         return jsonify({
             'success': True,
             'project_id': project_id,
             'status': status_data.get('status', 'in_progress'),
-            'progress': status_data.get('progress', 60),
-            'current_stage': status_data.get('current_stage', 'Procesando...'),
+            'progress': status_data.get('progress') or 0,
+            'current_stage': status_data.get('current_stage') or 'Procesando...',
             'console_message': console_message,
             'error': status_data.get('error'),
             'framework': status_data.get('framework'),
@@ -962,7 +1061,8 @@ def check_project_status(project_id):
 def download_project(project_id):
     try:
         # Check if the project exists and is completed
-        if project_id not in project_status:
+        job = get_job_store().get(project_id)
+        if job is None:
             # Si no existe en memoria, verificar si existe el archivo zip directamente
             zip_path = os.path.join(PROJECTS_DIR, f"{project_id}.zip")
             if os.path.exists(zip_path):
@@ -977,80 +1077,47 @@ def download_project(project_id):
                 # Verificar si existe el directorio del proyecto
                 project_dir = os.path.join(PROJECTS_DIR, project_id)
                 if os.path.exists(project_dir):
-                    # Crear un archivo zip para este proyecto
-                    zip_path = os.path.join(PROJECTS_DIR, f"{project_id}.zip")
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                        for root, dirs, files in os.walk(project_dir):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.relpath(file_path, project_dir)
-                                zipf.write(file_path, arcname)
-
-                    # Retornar el archivo zip recién creado
-                    return send_file(
-                        zip_path,
-                        mimetype='application/zip',
-                        as_attachment=True,
-                        download_name=f"{project_id}.zip"
-                    )
+                    return send_directory_zip(project_dir, f"{project_id}.zip", arc_root=project_id)
                 else:
                     return jsonify({
                         'success': False,
                         'error': 'Proyecto no encontrado'
                     }), 404
 
-        if project_status[project_id]['status'] != 'completed' and project_status[project_id].get('status') != 'failed':
+        if job['status'] != 'completed' and job.get('status') != 'failed':
             # Si el proyecto falló, igual intentamos crear un ZIP con lo que tengamos
-            if project_status[project_id].get('status') == 'failed':
+            if job.get('status') == 'failed':
                 project_dir = os.path.join(PROJECTS_DIR, project_id)
                 if os.path.exists(project_dir):
-                    # Crear zip del directorio existente
-                    zip_path = os.path.join(PROJECTS_DIR, f"{project_id}.zip")
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                        for root, dirs, files in os.walk(project_dir):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.relpath(file_path, project_dir)
-                                zipf.write(file_path, arcname)
-
-                    # Retornar el archivo zip
-                    return send_file(
-                        zip_path,
-                        mimetype='application/zip',
-                        as_attachment=True,
-                        download_name=f"{project_id}.zip"
-                    )
+                    return send_directory_zip(project_dir, f"{project_id}.zip", arc_root=project_id)
 
             # Si no está completado ni falló, mostrar mensaje de error
             return jsonify({
                 'success': False,
-                'error': f"El proyecto aún no está listo. Estado actual: {project_status[project_id].get('status', 'desconocido')}"
+                'error': f"El proyecto aún no está listo. Estado actual: {job.get('status', 'desconocido')}"
             }), 400
 
-        # Project zip file path
+        project_dir = os.path.join(PROJECTS_DIR, project_id)
         zip_path = os.path.join(PROJECTS_DIR, f"{project_id}.zip")
-        if not os.path.exists(zip_path):
-            # Si no existe el zip pero el proyecto está marcado como completado, recrearlo
-            project_dir = os.path.join(PROJECTS_DIR, project_id)
-            if os.path.exists(project_dir):
-                # Crear zip del directorio existente
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, dirs, files in os.walk(project_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, project_dir)
-                            zipf.write(file_path, arcname)
+        if not os.path.exists(project_dir):
+            if os.path.exists(zip_path):
+                # Proyecto antiguo del que solo se conserva el zip
+                return send_file(
+                    zip_path,
+                    mimetype='application/zip',
+                    as_attachment=True,
+                    download_name=f"{project_id}.zip"
+                )
             else:
                 # Crear un proyecto mínimo para evitar errores
-                project_dir = os.path.join(PROJECTS_DIR, project_id)
                 os.makedirs(project_dir, exist_ok=True)
 
                 # Crear un archivo README con información del error
                 with open(os.path.join(project_dir, 'README.md'), 'w') as f:
                     f.write(f"# Proyecto: {project_id}\n\n")
                     f.write("Este proyecto tuvo un error durante la generación.\n")
-                    if project_id in project_status and 'error' in project_status[project_id]:
-                        f.write(f"\nError: {project_status[project_id]['error']}\n")
+                    if job.get('error'):
+                        f.write(f"\nError: {job['error']}\n")
 
                 # Crear un archivo index.html simple
                 os.makedirs(os.path.join(project_dir, 'templates'), exist_ok=True)
@@ -1080,21 +1147,8 @@ if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
 """)
 
-                # Crear el zip con estos archivos mínimos
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, dirs, files in os.walk(project_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, project_dir)
-                            zipf.write(file_path, arcname)
-
-        # Return the zip file
-        return send_file(
-            zip_path,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{project_id}.zip"
-        )
+        # Servir desde la caché de artefactos o generar el ZIP en streaming
+        return send_directory_zip(project_dir, f"{project_id}.zip", arc_root=project_id)
     except Exception as e:
         logging.error(f"Error downloading project: {str(e)}")
         # En caso de error crítico, crear un ZIP mínimo con información del error
@@ -1160,22 +1214,29 @@ def preview_project(project_id):
 @constructor_bp.route('/api/constructor/pause/<project_id>', methods=['POST'])
 def pause_development(project_id):
     try:
-        if project_id not in project_status:
+        jobs = get_job_store()
+        job = jobs.get(project_id)
+        if job is None:
             return jsonify({
                 'success': False,
                 'error': 'Proyecto no encontrado'
             }), 404
 
         # Mark development as paused
-        development_paused[project_id] = True
+        if job['status'] == 'in_progress':
+            stage = job.get('current_stage') or ''
+            if " (PAUSADO)" not in stage:
+                stage += " (PAUSADO)"
+            jobs.update(project_id, paused=True, current_stage=stage)
+            seq = jobs.append_message(project_id, "Desarrollo pausado por el usuario")
+            push_job_update(project_id, since=seq - 1 if seq else None)
+        else:
+            jobs.update(project_id, paused=True)
 
-        # Update project status
-        if project_status[project_id]['status'] == 'in_progress':
-            project_status[project_id]['current_stage'] += " (PAUSADO)"
-            project_status[project_id]['console_messages'].append({
-                'time': time.time(),
-                'message': "Desarrollo pausado por el usuario"
-            })
+        # Si el trabajo se ejecuta en este proceso, se aparca en su próximo punto de control
+        control = get_job_control(project_id, create=False)
+        if control:
+            control.pause()
 
         return jsonify({
             'success': True,
@@ -1192,23 +1253,30 @@ def pause_development(project_id):
 @constructor_bp.route('/api/constructor/resume/<project_id>', methods=['POST'])
 def resume_development(project_id):
     try:
-        if project_id not in project_status:
+        jobs = get_job_store()
+        job = jobs.get(project_id)
+        if job is None:
             return jsonify({
                 'success': False,
                 'error': 'Proyecto no encontrado'
             }), 404
 
         # Mark development as resumed
-        development_paused[project_id] = False
+        if job['status'] == 'in_progress':
+            current_stage = job.get('current_stage') or ''
+            jobs.update(project_id, paused=False, current_stage=current_stage.replace(" (PAUSADO)", ""))
+            seq = jobs.append_message(project_id, "Desarrollo reanudado por el usuario")
+            push_job_update(project_id, since=seq - 1 if seq else None)
+        else:
+            jobs.update(project_id, paused=False)
 
-        # Update project status
-        if project_status[project_id]['status'] == 'in_progress':
-            current_stage = project_status[project_id]['current_stage']
-            project_status[project_id]['current_stage'] = current_stage.replace(" (PAUSADO)", "")
-            project_status[project_id]['console_messages'].append({
-                'time': time.time(),
-                'message': "Desarrollo reanudado por el usuario"
-            })
+        control = get_job_control(project_id, create=False)
+        if control:
+            # Todavía no se había aparcado: continúa en su hilo
+            control.resume()
+        elif job['status'] == 'in_progress':
+            # Aparcado: relanzarlo en este worker
+            resume_parked_job(project_id, dict(current_app.config.get('API_KEYS', {})))
 
         return jsonify({
             'success': True,
@@ -1221,6 +1289,47 @@ def resume_development(project_id):
             'error': str(e)
         }), 500
 
+# Route to cancel development
+@constructor_bp.route('/api/constructor/cancel/<project_id>', methods=['POST'])
+def cancel_development(project_id):
+    try:
+        jobs = get_job_store()
+        job = jobs.get(project_id)
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Proyecto no encontrado'
+            }), 404
+
+        if job['status'] != 'in_progress':
+            return jsonify({
+                'success': False,
+                'error': f"El proyecto no está en curso. Estado actual: {job['status']}"
+            }), 400
+
+        control = get_job_control(project_id, create=False)
+        if control:
+            # El hilo del trabajo registra la cancelación en su próximo punto de control
+            jobs.update(project_id, status='cancelled')
+            control.cancel()
+        else:
+            # Aparcado o en otro worker: marcar como cancelado directamente
+            seq = jobs.append_message(project_id, "Desarrollo cancelado por el usuario")
+            jobs.update(project_id, status='cancelled', paused=False,
+                        current_stage='Desarrollo cancelado', completion_time=time.time())
+            push_job_update(project_id, since=seq - 1 if seq else None)
+
+        return jsonify({
+            'success': True,
+            'message': 'Desarrollo cancelado'
+        })
+    except Exception as e:
+        logging.error(f"Error cancelling development: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @constructor_bp.route('/start_construction', methods=['POST'])
 def start_construction():
     """Start the construction process based on the plan"""
@@ -1325,9 +1434,13 @@ def generate_app():
         # Create project workspace
         create_project_workspace(project_id)
 
+        # Registrar el trabajo antes de responder para que el primer sondeo de estado lo encuentre
+        create_job(project_id, description, agent, model, options, features)
+
         # Start generation in background thread
         thread = Thread(target=generate_application, 
-                         args=(project_id, description, agent, model, options, features))
+                         args=(project_id, description, agent, model, options, features),
+                         kwargs={'api_keys': dict(current_app.config.get('API_KEYS', {}))})
         thread.daemon = True
         thread.start()
 
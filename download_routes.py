@@ -1,11 +1,10 @@
 # Funciones para descarga de archivos y directorios
 import os
 import logging
-import zipfile
-import io
 import shutil
 from pathlib import Path
 from flask import request, jsonify, send_file, session
+from zip_artifacts import send_directory_zip
 import git
 from github import Github
 import requests
@@ -60,36 +59,8 @@ def download_directory_route(app, get_user_workspace):
             if not target_path.exists() or not target_path.is_dir():
                 return jsonify({'error': 'El directorio no existe'}), 404
                 
-            # Create an in-memory ZIP file
-            memory_file = io.BytesIO()
-            with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Walk through the directory and add all files
-                base_dir_name = target_path.name
-                base_path = target_path.parent
-                
-                for root, dirs, files in os.walk(target_path):
-                    # Get the relative path from the base directory
-                    rel_path = os.path.relpath(root, base_path)
-                    
-                    # Add each file to the ZIP
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_name = os.path.join(rel_path, file)
-                        zipf.write(file_path, arc_name)
-            
-            # Reset file pointer to beginning
-            memory_file.seek(0)
-            
-            # Create a filename for the ZIP
-            zip_filename = f"{base_dir_name}.zip"
-            
-            # Send the ZIP file
-            return send_file(
-                memory_file,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=zip_filename
-            )
+            # Enviar el ZIP en streaming (o desde la caché si el directorio no cambió)
+            return send_directory_zip(target_path, f"{target_path.name}.zip", arc_root=target_path.name)
             
         except Exception as e:
             logging.error(f"Error downloading directory: {str(e)}")
@@ -0,0 +1,176 @@
+"""
+Agrupación de eventos del sistema de archivos antes de notificar a los clientes.
+
+El observador de watchdog produce un evento por cada operación de bajo nivel:
+un npm install o un git clone genera decenas de miles. ChangeBatcher agrupa
+los eventos de cada workspace durante una ventana corta, los deduplica por
+ruta y emite un único mensaje con la lista de cambios y un número de
+secuencia. El cliente aplica los cambios sobre su listado; si detecta un
+hueco en la secuencia o recibe reset=True, vuelve a pedir el listado.
+"""
+import os
+import stat
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = float(os.environ.get('FILE_EVENTS_DEBOUNCE_MS', '200')) / 1000
+MAX_DELAY_SECONDS = float(os.environ.get('FILE_EVENTS_MAX_DELAY_MS', '1000')) / 1000
+MAX_PATHS = int(os.environ.get('FILE_EVENTS_MAX_PATHS', '500'))
+
+
+class _Batch:
+    __slots__ = ('root', 'changes', 'overflow', 'first_at', 'last_at')
+
+    def __init__(self, root, now):
+        self.root = root
+        self.changes = {}   # ruta relativa -> primer tipo de evento visto en la ventana
+        self.overflow = False
+        self.first_at = now
+        self.last_at = now
+
+
+class ChangeBatcher:
+    """
+    Agrupa los cambios de archivos por workspace y los emite como un diff.
+
+    Args:
+        emit: Función (workspace_id, payload) que envía el mensaje a los clientes
+        debounce: Segundos sin eventos tras los que se emite el lote
+        max_delay: Segundos máximos que un lote puede esperar con eventos continuos
+        max_paths: Rutas por lote; por encima se emite reset=True sin lista
+    """
+
+    def __init__(self, emit, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS,
+                 max_paths=MAX_PATHS):
+        self.emit = emit
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_paths = max_paths
+        self._batches = {}
+        self._sequences = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='file-change-batcher', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def add(self, workspace_id, root, rel_path, event_type):
+        """
+        Registra un evento.
+
+        Args:
+            workspace_id: Workspace (sala de Socket.IO) afectado
+            root: Ruta absoluta del workspace
+            rel_path: Ruta del archivo relativa al workspace
+            event_type: 'create', 'modify' o 'delete'
+        """
+        now = time.monotonic()
+        with self._cond:
+            batch = self._batches.get(workspace_id)
+            if batch is None:
+                batch = self._batches[workspace_id] = _Batch(root, now)
+                self._cond.notify()
+            batch.last_at = now
+            if batch.overflow:
+                return
+            # Se conserva el primer tipo: el estado final se lee del disco al emitir
+            batch.changes.setdefault(rel_path, event_type)
+            if len(batch.changes) > self.max_paths:
+                batch.overflow = True
+                batch.changes = {}
+
+    def flush(self, workspace_id=None):
+        """Emite inmediatamente los lotes pendientes (todos o los de un workspace)."""
+        with self._cond:
+            if workspace_id is None:
+                batches = list(self._batches.items())
+                self._batches = {}
+            else:
+                batch = self._batches.pop(workspace_id, None)
+                batches = [(workspace_id, batch)] if batch else []
+        for ws_id, batch in batches:
+            self._emit_batch(ws_id, batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                ready = []
+                next_deadline = None
+                for ws_id, batch in list(self._batches.items()):
+                    deadline = min(batch.last_at + self.debounce, batch.first_at + self.max_delay)
+                    if deadline <= now:
+                        ready.append((ws_id, self._batches.pop(ws_id)))
+                    elif next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
+                if not ready:
+                    self._cond.wait(None if next_deadline is None else next_deadline - now)
+                    continue
+            for ws_id, batch in ready:
+                self._emit_batch(ws_id, batch)
+
+    def _emit_batch(self, workspace_id, batch):
+        changes = []
+        if not batch.overflow:
+            for rel_path, first_type in batch.changes.items():
+                change = self._resolve(batch.root, rel_path, first_type)
+                if change is not None:
+                    changes.append(change)
+            if not changes:
+                return
+
+        with self._cond:
+            seq = self._sequences.get(workspace_id, 0) + 1
+            self._sequences[workspace_id] = seq
+
+        payload = {
+            'user_id': workspace_id,
+            'seq': seq,
+            'reset': batch.overflow,
+            'changes': changes,
+            'timestamp': time.time()
+        }
+        try:
+            self.emit(workspace_id, payload)
+        except Exception as e:
+            logger.error(f"Error emitiendo cambios de archivos de {workspace_id}: {str(e)}")
+
+    @staticmethod
+    def _resolve(root, rel_path, first_type):
+        """Convierte el primer evento de una ruta y su estado actual en un cambio."""
+        try:
+            st = os.stat(os.path.join(root, rel_path))
+        except OSError:
+            if first_type == 'create':
+                # Creado y eliminado dentro de la misma ventana
+                return None
+            return {'path': rel_path, 'type': 'delete'}
+
+        is_dir = stat.S_ISDIR(st.st_mode)
+        return {
+            'path': rel_path,
+            'type': 'create' if first_type == 'create' else 'modify',
+            'is_dir': is_dir,
+            'size': 0 if is_dir else st.st_size,
+            'modified': st.st_mtime
+        }
@@ -0,0 +1,184 @@
+"""
+Guardado de archivos por parches para el editor.
+
+El cliente envía solo las ediciones (rangos de bytes o de líneas) junto con el
+hash de la versión sobre la que se calcularon. Si el archivo cambió desde
+entonces, el parche se rechaza con StaleBaseError y el cliente debe releerlo.
+Las escrituras, completas o por parche, son atómicas: se escribe un archivo
+temporal en el mismo directorio y se renombra sobre el original. Así nunca se
+modifica un inodo compartido con el almacén de blobs (blob_store), que
+enlaza el mismo contenido en varios proyectos.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+
+from blob_store import BLOB_MODE
+
+
+class PatchError(ValueError):
+    """El parche no es válido (rangos fuera del archivo, solapados o mal formados)."""
+
+
+class StaleBaseError(Exception):
+    """La versión base del parche ya no es la versión actual del archivo."""
+
+    def __init__(self, current_hash):
+        super().__init__("El archivo cambió desde la versión base del parche")
+        self.current_hash = current_hash
+
+
+def content_hash(data):
+    """Hash de versión de un contenido (sha256 en hexadecimal)."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+def _lock_for(path):
+    with _path_locks_lock:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+def _write_atomic(path, data):
+    """Escribe data en path mediante archivo temporal y rename, conservando los permisos."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        mode = None
+    else:
+        mode = st.st_mode & 0o7777
+        if st.st_nlink > 1 or mode == BLOB_MODE:
+            # Enlace al almacén de blobs: la copia editada deja de ser de solo lectura
+            mode |= 0o200
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_file_atomic(path, content):
+    """
+    Reemplaza el contenido completo de un archivo de forma atómica.
+
+    Returns:
+        str: Hash de la nueva versión
+    """
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    path = os.path.abspath(path)
+    with _lock_for(path):
+        _write_atomic(path, data)
+    return content_hash(data)
+
+
+def _line_starts(data):
+    """Desplazamiento en bytes del inicio de cada línea."""
+    starts = [0]
+    position = data.find(b'\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = data.find(b'\n', position + 1)
+    return starts
+
+
+def _resolve_edits(data, edits):
+    """Convierte las ediciones en rangos de bytes (inicio, fin, texto) ordenados y sin solapes."""
+    if not isinstance(edits, list) or not edits:
+        raise PatchError("Se requiere una lista de ediciones")
+
+    line_starts = None
+    ranges = []
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get('text', ''), str):
+            raise PatchError("Cada edición debe ser un objeto con un campo text")
+        text = edit.get('text', '').encode('utf-8')
+        try:
+            if 'start_line' in edit:
+                # Reemplazar line_count líneas a partir de start_line (1 = primera línea)
+                if line_starts is None:
+                    line_starts = _line_starts(data)
+                start_line = int(edit['start_line'])
+                line_count = int(edit.get('line_count', 0))
+                if start_line < 1 or line_count < 0 or start_line > len(line_starts) + 1:
+                    raise PatchError(f"Rango de líneas fuera del archivo: {start_line}+{line_count}")
+                start = line_starts[start_line - 1] if start_line <= len(line_starts) else len(data)
+                end_index = start_line - 1 + line_count
+                end = line_starts[end_index] if end_index < len(line_starts) else len(data)
+            else:
+                start = int(edit['offset'])
+                end = start + int(edit.get('length', 0))
+        except (KeyError, TypeError, ValueError) as e:
+            if isinstance(e, PatchError):
+                raise
+            raise PatchError(f"Edición mal formada: {edit}")
+        if start < 0 or end < start or end > len(data):
+            raise PatchError(f"Rango fuera del archivo: {start}-{end}")
+        ranges.append((start, end, text))
+
+    ranges.sort(key=lambda item: (item[0], item[1]))
+    for previous, current in zip(ranges, ranges[1:]):
+        if current[0] < previous[1]:
+            raise PatchError("Las ediciones se solapan")
+    return ranges
+
+
+def apply_patch(path, base_hash, edits):
+    """
+    Aplica ediciones sobre la versión base de un archivo de forma atómica.
+
+    Args:
+        path: Ruta del archivo
+        base_hash: Hash (content_hash) de la versión sobre la que se hicieron
+            las ediciones
+        edits: Lista de ediciones relativas a la versión base, cada una
+            {'offset', 'length', 'text'} en bytes o
+            {'start_line', 'line_count', 'text'} en líneas
+
+    Returns:
+        dict: hash de la nueva versión y size en bytes
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe
+        StaleBaseError: Si el archivo ya no está en la versión base
+        PatchError: Si las ediciones no son válidas
+    """
+    path = os.path.abspath(path)
+    with _lock_for(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        current_hash = content_hash(data)
+        if base_hash != current_hash:
+            raise StaleBaseError(current_hash)
+
+        pieces = []
+        position = 0
+        for start, end, text in _resolve_edits(data, edits):
+            pieces.append(data[position:start])
+            pieces.append(text)
+            position = end
+        pieces.append(data[position:])
+        new_data = b''.join(pieces)
+
+        _write_atomic(path, new_data)
+    return {'hash': content_hash(new_data), 'size': len(new_data)}
@@ -0,0 +1,238 @@
+"""
+Lectura de archivos del workspace para el editor: por rangos, condicional y en crudo.
+
+- ETag basado en mtime y tamaño: reabrir un archivo sin cambios cuesta un 304
+  (o not_modified por Socket.IO) en lugar de releerlo y serializarlo.
+- Rangos de bytes (offset/length) y de líneas (start_line/line_count): solo se
+  lee del disco la parte pedida.
+- Modo crudo (raw=1): el archivo se envía con send_file, que usa sendfile y
+  admite cabeceras Range, sin pasar el contenido por JSON.
+
+Sin rango, el archivo se devuelve completo: si supera MAX_INLINE_BYTES la
+lectura se rechaza (413 en HTTP) en lugar de devolver una parte que el editor
+guardaría como si fuera el archivo entero. Los archivos grandes se leen por
+rangos, de como mucho MAX_INLINE_BYTES cada uno (la respuesta indica truncated
+y next_offset o next_line, sin partir caracteres UTF-8), o en modo crudo.
+"""
+import os
+import hashlib
+import itertools
+from flask import Response, request, jsonify, send_file
+from file_patches import content_hash
+
+MAX_INLINE_BYTES = int(os.environ.get('FILE_READ_MAX_INLINE_BYTES', str(2 * 1024 * 1024)))
+
+
+class FileTooLargeError(ValueError):
+    """El archivo no cabe en una lectura JSON sin rango."""
+
+    def __init__(self, size):
+        super().__init__(f"El archivo ocupa {size} bytes y supera el límite de {MAX_INLINE_BYTES} "
+                         f"para leerlo completo; pide un rango (offset/length o start_line/line_count) "
+                         f"o usa raw=1")
+        self.size = size
+
+
+def file_etag(st, variant=''):
+    """ETag (entre comillas) de una versión de archivo y una variante de la lectura."""
+    tag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if variant:
+        tag += '-' + hashlib.sha1(variant.encode('utf-8')).hexdigest()[:8]
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Comprueba una cabecera If-None-Match (o un etag enviado por el cliente)."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    bare = etag.strip('"')
+    return any(value == '*' or value.removeprefix('W/').strip('"') == bare for value in candidates)
+
+
+def _int_option(options, name):
+    value = options.get(name)
+    if value in (None, ''):
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name} no puede ser negativo")
+    return value
+
+
+def parse_read_options(options):
+    """
+    Extrae las opciones de lectura de request.args o de un dict de Socket.IO.
+
+    Returns:
+        dict: offset, length, start_line y line_count (None si no se piden)
+
+    Raises:
+        ValueError: Si algún valor no es un entero válido o se combinan rangos
+    """
+    read = {name: _int_option(options, name) for name in ('offset', 'length', 'start_line', 'line_count')}
+    if (read['offset'] is not None or read['length'] is not None) and \
+            (read['start_line'] is not None or read['line_count'] is not None):
+        raise ValueError("No se pueden combinar rangos de bytes y de líneas")
+    return read
+
+
+def read_variant(read):
+    """Representación estable de las opciones para el ETag."""
+    return ','.join(f"{name}={value}" for name, value in sorted(read.items()) if value is not None)
+
+
+def read_text(path, st, offset=None, length=None, start_line=None, line_count=None):
+    """
+    Lee un fragmento de texto de un archivo.
+
+    Args:
+        path: Ruta del archivo
+        st: os.stat_result del archivo
+        offset, length: Rango de bytes
+        start_line, line_count: Rango de líneas (start_line empieza en 1)
+
+    Returns:
+        dict: content y metadatos del rango (size, truncated y next_offset o next_line)
+
+    Las lecturas por rango devuelven como mucho MAX_INLINE_BYTES; el resto se
+    pide desde next_offset o next_line.
+
+    Raises:
+        FileTooLargeError: Si no se pide rango y el archivo supera MAX_INLINE_BYTES,
+            o si la línea pedida por sí sola lo supera
+    """
+    size = st.st_size
+    if offset is None and length is None and start_line is None and line_count is None \
+            and size > MAX_INLINE_BYTES:
+        raise FileTooLargeError(size)
+    if start_line is not None or line_count is not None:
+        first = max((start_line or 1) - 1, 0)
+        lines, used, has_more = [], 0, False
+        with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            # Como mucho line_count líneas y MAX_INLINE_BYTES bytes por respuesta
+            for line in itertools.islice(f, first, None):
+                line_bytes = len(line.encode('utf-8'))
+                if (line_count is not None and len(lines) >= line_count) or \
+                        used + line_bytes > MAX_INLINE_BYTES:
+                    has_more = True
+                    break
+                lines.append(line)
+                used += line_bytes
+        if has_more and not lines:
+            # Una sola línea mayor que el límite: hay que leerla por rangos de bytes
+            raise FileTooLargeError(size)
+        return {
+            'content': ''.join(lines),
+            'size': size,
+            'start_line': first + 1,
+            'line_count': len(lines),
+            'truncated': has_more,
+            'next_line': first + len(lines) + 1 if has_more else None
+        }
+
+    start = min(offset or 0, size)
+    # Sin length se lee hasta el final; en ambos casos como mucho MAX_INLINE_BYTES
+    requested = size - start if length is None else min(length, size - start)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(min(requested, MAX_INLINE_BYTES))
+    if start + len(data) < size:
+        # No partir un carácter UTF-8: el siguiente fragmento empieza en next_offset
+        data = _complete_utf8(data)
+    end = start + len(data)
+    result = {
+        'content': data.decode('utf-8', errors='replace'),
+        'size': size,
+        'offset': start,
+        'length': len(data),
+        'truncated': len(data) < requested,
+        'next_offset': end if end < size else None
+    }
+    if start == 0 and end == size:
+        # Versión base para guardar por parches (file_patches.apply_patch)
+        result['hash'] = content_hash(data)
+    return result
+
+
+def _complete_utf8(data):
+    """Recorta un carácter UTF-8 incompleto al final de data (si queda algo antes)."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue  # Byte de continuación: el inicio del carácter está más atrás
+        if byte < 0xC0:
+            return data
+        needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+        return data if needed <= back or back == len(data) else data[:-back]
+    return data
+
+
+def read_file_payload(full_path, options):
+    """
+    Lectura para canales sin HTTP (Socket.IO).
+
+    Args:
+        full_path: Ruta del archivo (ya validada dentro del workspace)
+        options: Dict con las opciones de rango y, opcionalmente, el etag que
+            el cliente tiene en caché
+
+    Returns:
+        dict: not_modified y etag si la copia del cliente está al día; si no,
+            etag más el contenido y los metadatos del rango
+
+    Raises:
+        ValueError: Si las opciones no son válidas (FileTooLargeError si el
+            archivo es demasiado grande para leerlo sin rango)
+    """
+    st = os.stat(full_path)
+    read = parse_read_options(options)
+    etag = file_etag(st, read_variant(read))
+    if etag_matches(options.get('etag'), etag):
+        return {'not_modified': True, 'etag': etag}
+    return dict(read_text(full_path, st, **read), not_modified=False, etag=etag)
+
+
+def file_read_response(full_path, payload, raw_name=None):
+    """
+    Respuesta HTTP de lectura de un archivo para el editor.
+
+    Con raw=1 envía el archivo con send_file (Range y condicionales incluidos);
+    si no, responde JSON con payload más el fragmento pedido, 304 si el
+    If-None-Match del cliente coincide con la versión actual, o 413 si no se
+    pidió rango y el archivo supera MAX_INLINE_BYTES.
+
+    Args:
+        full_path: Ruta del archivo (ya validada dentro del workspace)
+        payload: Campos adicionales de la respuesta JSON (success, file_path...)
+        raw_name: Nombre de descarga para el modo crudo
+    """
+    full_path = os.path.abspath(full_path)
+    st = os.stat(full_path)
+
+    if request.args.get('raw') in ('1', 'true'):
+        return send_file(full_path, conditional=True, etag=file_etag(st).strip('"'),
+                         download_name=raw_name or os.path.basename(full_path), max_age=0)
+
+    try:
+        read = parse_read_options(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    etag = file_etag(st, read_variant(read))
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    else:
+        try:
+            content = read_text(full_path, st, **read)
+        except FileTooLargeError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'size': e.size,
+                'max_inline_bytes': MAX_INLINE_BYTES
+            }), 413
+        response = jsonify(dict(payload, etag=etag, **content))
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,174 @@
+"""
+Planificador de generación de archivos para el constructor de aplicaciones.
+
+Ejecuta en paralelo, sobre un pool de hilos acotado, la generación de los
+archivos de un proyecto respetando sus dependencias: un archivo solo se
+genera cuando los archivos de los que depende ya están disponibles, y su
+descripción puede construirse a partir del contenido de esas dependencias
+(por ejemplo, las plantillas a partir de las rutas definidas en app.py).
+"""
+import os
+import re
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.environ.get('CONSTRUCTOR_MAX_WORKERS', '4'))
+
+
+class GenerationTask:
+    """
+    Archivo a generar dentro de un plan.
+
+    Args:
+        filename: Ruta relativa del archivo en el proyecto
+        file_type: Tipo de archivo (py, html, css, js, txt...)
+        description: Descripción para el agente, o función que recibe un dict
+            {filename: contenido} con las dependencias y devuelve la descripción
+        depends_on: Archivos que deben generarse antes que este
+        fallback: Contenido a usar si la generación falla
+        agent_id: Agente especializado que genera el archivo
+    """
+
+    def __init__(self, filename, file_type, description, depends_on=(), fallback=None,
+                 agent_id='developer'):
+        self.filename = filename
+        self.file_type = file_type
+        self.description = description
+        self.depends_on = tuple(depends_on)
+        self.fallback = fallback
+        self.agent_id = agent_id
+
+    def build_description(self, inputs):
+        if callable(self.description):
+            return self.description(inputs)
+        return self.description
+
+
+def validate_plan(tasks):
+    """Comprueba que las dependencias existan y que no haya ciclos."""
+    by_name = {task.filename: task for task in tasks}
+    if len(by_name) != len(tasks):
+        raise ValueError("El plan de generación contiene archivos duplicados")
+
+    for task in tasks:
+        for dependency in task.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"{task.filename} depende de {dependency}, que no está en el plan")
+
+    visiting, visited = set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependencia circular en el plan de generación: {name}")
+        visiting.add(name)
+        for dependency in by_name[name].depends_on:
+            visit(dependency)
+        visiting.discard(name)
+        visited.add(name)
+
+    for task in tasks:
+        visit(task.filename)
+
+
+class GenerationPlanner:
+    """
+    Ejecuta un plan de GenerationTask con concurrencia acotada.
+
+    Args:
+        generate_file: Función (task, description) -> dict con success,
+            content y error; se ejecuta en los hilos del pool
+        max_workers: Número máximo de archivos generándose a la vez
+        control: JobControl del trabajo (opcional); se consulta antes de
+            empezar cada archivo
+    """
+
+    def __init__(self, generate_file, max_workers=MAX_WORKERS, control=None):
+        self.generate_file = generate_file
+        self.max_workers = max(1, max_workers)
+        self.control = control
+
+    def run(self, tasks, on_task_done=None):
+        """
+        Genera todos los archivos del plan.
+
+        Args:
+            tasks: Lista de GenerationTask
+            on_task_done: Callback (task, result, completed, total) invocado en
+                el hilo que llama a run() cada vez que termina un archivo
+
+        Returns:
+            dict: Resultado de cada archivo indexado por filename
+
+        Raises:
+            JobCancelled, JobParked: Si el trabajo se cancela o se pausa (desde
+                control o desde on_task_done). No se espera a las generaciones
+                en curso: sus resultados se descartan.
+        """
+        validate_plan(tasks)
+        pending = {task.filename: task for task in tasks}
+        results = {}
+        running = {}
+        total = len(tasks)
+
+        def submit_ready(executor):
+            for name, task in list(pending.items()):
+                if all(dependency in results for dependency in task.depends_on):
+                    inputs = {dep: results[dep].get('content') or '' for dep in task.depends_on}
+                    del pending[name]
+                    # Copiar el contexto para conservar la prioridad de las peticiones de IA
+                    context = contextvars.copy_context()
+                    future = executor.submit(context.run, self._generate, task, inputs)
+                    running[future] = task
+                    logger.info(f"Generación de {name} iniciada")
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='constructor-gen')
+        try:
+            submit_ready(executor)
+            while running:
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Una tarea que no empezó por una pausa o cancelación detiene el plan
+                        self._checkpoint()
+                        logger.error(f"Error generando {task.filename}: {str(e)}")
+                        result = {'success': False, 'error': str(e)}
+                    results[task.filename] = result
+                    if on_task_done:
+                        on_task_done(task, result, len(results), total)
+                self._checkpoint()
+                submit_ready(executor)
+        except BaseException:
+            # Pausa, cancelación o error: no esperar a las llamadas de IA en curso
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+        return results
+
+    def _checkpoint(self):
+        if self.control is not None:
+            self.control.checkpoint()
+
+    def _generate(self, task, inputs):
+        self._checkpoint()
+        description = task.build_description(inputs)
+        return self.generate_file(task, description)
+
+
+def extract_routes(source):
+    """Devuelve las rutas Flask declaradas en un archivo Python (p. ej. ['/', '/api/items'])."""
+    routes = re.findall(r"@\w+\.(?:route|get|post|put|delete|patch)\(\s*['\"]([^'\"]+)['\"]", source or '')
+    return list(dict.fromkeys(routes))
+
+
+def extract_element_ids(html):
+    """Devuelve los atributos id de un documento HTML, en orden de aparición."""
+    return list(dict.fromkeys(re.findall(r"\bid=['\"]([^'\"]+)['\"]", html or '')))
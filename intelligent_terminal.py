@@ -8,9 +8,9 @@ import time
 from pathlib import Path
 from flask import Flask, request
 from flask_socketio import SocketIO, emit
-import openai
-import anthropic
 from dotenv import load_dotenv
+from provider_registry import get_openai_client, get_anthropic_client, get_gemini_model
+from command_policy import check_command, TERMINAL_POLICY
 
 # Cargar variables de entorno
 load_dotenv(override=True)
@@ -83,14 +83,15 @@ def init_app(app, socketio):
         workspace_path = get_user_workspace(user_id)
 
         # Validar y ejecutar el comando
-        if validate_command(bash_command):
+        decision = validate_command(bash_command)
+        if decision:
             result = execute_command(bash_command, workspace_path)
             emit('command_result', result)
         else:
             emit('command_result', {
                 'success': False,
                 'command': bash_command,
-                'output': f"Comando no permitido: {bash_command}"
+                'output': f"Comando no permitido: {decision.reason}"
             })
 
     @socketio.on('list_directory')
@@ -156,24 +157,8 @@ def get_user_workspace(user_id='default'):
     return workspace_dir
 
 def validate_command(command):
-    """Valida que el comando sea seguro para ejecutar"""
-    # Lista de comandos prohibidos o patrones peligrosos
-    dangerous_patterns = [
-        r'rm\s+-rf\s+/',  # Borrado recursivo desde la raíz
-        r'>`',            # Redireccionamiento destructivo
-        r'>\s*/dev/sd',   # Escritura directa a dispositivos
-        r'mkfs',          # Formateo de sistemas de archivos
-        r'dd\s+if=',      # Operaciones dd potencialmente peligrosas
-        r'wget.+\s+\|\s+bash', # Descarga y ejecución directa
-        r'curl.+\s+\|\s+bash', # Descarga y ejecución directa
-    ]
-
-    # Verificar patrones peligrosos
-    for pattern in dangerous_patterns:
-        if re.search(pattern, command):
-            return False
-
-    return True
+    """Valida que el comando sea seguro para ejecutar (política común de las terminales)"""
+    return check_command(command, TERMINAL_POLICY)
 
 def execute_command(command, workspace_path):
     """Ejecuta un comando en el workspace del usuario"""
@@ -344,7 +329,7 @@ def simple_nl_to_command(text):
 def process_with_openai(text, workspace_path):
     """Procesa instrucción con OpenAI"""
     try:
-        client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+        client = get_openai_client()
 
         response = client.chat.completions.create(
             model="gpt-4o",
@@ -388,10 +373,11 @@ Debes responder en formato JSON con los siguientes campos:
 
         # Sanitizar y validar el comando resultante
         command = result.get('command', '').strip()
-        if not command or not validate_command(command):
+        decision = validate_command(command)
+        if not decision:
             return {
                 'success': False,
-                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar."
+                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar: {decision.reason}"
             }
 
         return {
@@ -411,7 +397,7 @@ Debes responder en formato JSON con los siguientes campos:
 def process_with_anthropic(text, workspace_path):
     """Procesa instrucción con Anthropic Claude"""
     try:
-        client = anthropic.Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+        client = get_anthropic_client()
 
         response = client.messages.create(
             model="claude-3-5-sonnet-latest",
@@ -471,10 +457,11 @@ Debes responder en formato JSON con los siguientes campos:
 
         # Sanitizar y validar el comando resultante
         command = result.get('command', '').strip()
-        if not command or not validate_command(command):
+        decision = validate_command(command)
+        if not decision:
             return {
                 'success': False,
-                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar."
+                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar: {decision.reason}"
             }
 
         return {
@@ -494,10 +481,7 @@ Debes responder en formato JSON con los siguientes campos:
 def process_with_gemini(text, workspace_path):
     """Procesa instrucción con Google Gemini"""
     try:
-        import google.generativeai as genai
-
-        genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-        model = genai.GenerativeModel('gemini-1.5-pro')
+        model = get_gemini_model('gemini-1.5-pro')
 
         prompt = f"""
         Instrucción del usuario: {text}
@@ -556,10 +540,11 @@ def process_with_gemini(text, workspace_path):
 
         # Sanitizar y validar el comando resultante
         command = result.get('command', '').strip()
-        if not command or not validate_command(command):
+        decision = validate_command(command)
+        if not decision:
             return {
                 'success': False,
-                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar."
+                'error': f"El comando sugerido '{command}' no es válido o seguro para ejecutar: {decision.reason}"
             }
 
         return {
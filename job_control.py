@@ -0,0 +1,100 @@
+"""
+Control de ejecución (pausa, reanudación y cancelación) de trabajos en segundo plano.
+
+Cada trabajo tiene un JobControl basado en threading.Event: pausar, reanudar
+o cancelar es inmediato y quien espera lo hace bloqueado en el evento, sin
+sondeos periódicos. Los trabajos largos llaman a checkpoint() entre etapas;
+si el trabajo está pausado, checkpoint() lanza JobParked para que el hilo
+termine y libere sus recursos hasta que se reanude.
+"""
+import threading
+
+
+class JobCancelled(Exception):
+    """El trabajo fue cancelado."""
+
+
+class JobParked(Exception):
+    """El trabajo fue pausado y debe aparcarse hasta que se reanude."""
+
+
+class JobControl:
+    """Primitiva de control de un trabajo."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Despertar a quien esté esperando en wait_if_paused()
+        self._running.set()
+
+    def wait_if_paused(self, timeout=None):
+        """
+        Bloquea mientras el trabajo esté pausado, sin sondeo.
+
+        Args:
+            timeout: Segundos máximos de espera; None espera indefinidamente
+
+        Returns:
+            bool: True si el trabajo puede continuar, False si fue cancelado
+                o sigue pausado al agotarse el timeout
+        """
+        self._running.wait(timeout)
+        return self._running.is_set() and not self.cancelled
+
+    def checkpoint(self):
+        """
+        Punto de control entre etapas.
+
+        Raises:
+            JobCancelled: Si el trabajo fue cancelado
+            JobParked: Si el trabajo está pausado
+        """
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+        if self.paused:
+            raise JobParked(self.job_id)
+
+
+_controls = {}
+_controls_lock = threading.Lock()
+
+
+def get_job_control(job_id, create=True):
+    """Devuelve el JobControl del trabajo, creándolo si no existe y create=True."""
+    with _controls_lock:
+        control = _controls.get(job_id)
+        if control is None and create:
+            control = _controls[job_id] = JobControl(job_id)
+        return control
+
+
+def remove_job_control(job_id):
+    """Olvida el JobControl de un trabajo que ya no se ejecuta en este proceso."""
+    with _controls_lock:
+        return _controls.pop(job_id, None)
+
+
+def active_job_count():
+    """Número de trabajos con hilo activo en este proceso."""
+    with _controls_lock:
+        return len(_controls)
@@ -0,0 +1,452 @@
+"""
+Almacén persistente de trabajos del constructor de aplicaciones.
+
+Sustituye los diccionarios en memoria project_status y development_paused
+por tablas SQL (SQLAlchemy) que sobreviven a reinicios y se comparten entre
+workers. Las actualizaciones frecuentes de progreso se acumulan en memoria y
+se escriben en bloque cada JOB_STORE_FLUSH_INTERVAL segundos (write-behind);
+las transiciones de estado se escriben al momento.
+
+Los mensajes de consola se escriben al momento: su número de secuencia se
+asigna en la base de datos incrementando message_count en la misma
+transacción que inserta el mensaje, de modo que dos workers nunca asignan el
+mismo seq y un lector con cursor ?since= no ve huecos que se rellenen después.
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import socket
+import logging
+import threading
+
+from sqlalchemy import (
+    create_engine, event, MetaData, Table, Column, Index,
+    String, Integer, Float, Text, Boolean, select, insert, update, delete
+)
+
+logger = logging.getLogger(__name__)
+
+# Misma base de datos que la aplicación Flask (instance/codestorm.db por defecto)
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.abspath(os.path.join('instance', 'codestorm.db'))
+JOB_DATABASE_URL = (os.environ.get('CONSTRUCTOR_JOBS_DATABASE_URL')
+                    or os.environ.get('DATABASE_URL')
+                    or DEFAULT_DATABASE_URL)
+FLUSH_INTERVAL = float(os.environ.get('JOB_STORE_FLUSH_INTERVAL', '1.0'))
+STALE_SECONDS = float(os.environ.get('JOB_STORE_STALE_SECONDS', '120'))
+
+ACTIVE_STATUSES = ('in_progress',)
+JSON_FIELDS = ('techstack', 'plan', 'params', 'completed_stages')
+
+metadata = MetaData()
+
+jobs_table = Table(
+    'constructor_jobs', metadata,
+    Column('project_id', String(64), primary_key=True),
+    Column('status', String(20), nullable=False, index=True),
+    Column('progress', Integer, nullable=False, default=0),
+    Column('current_stage', Text),
+    Column('paused', Boolean, nullable=False, default=False),
+    Column('error', Text),
+    Column('framework', String(200)),
+    Column('techstack', Text),
+    Column('plan', Text),
+    Column('params', Text),
+    Column('completed_stages', Text),
+    Column('message_count', Integer, nullable=False, default=0),
+    Column('start_time', Float),
+    Column('completion_time', Float),
+    Column('updated_at', Float, nullable=False),
+    Column('owner', String(128)),
+    Column('heartbeat_at', Float)
+)
+
+messages_table = Table(
+    'constructor_job_messages', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('project_id', String(64), nullable=False),
+    Column('seq', Integer, nullable=False),
+    Column('time', Float, nullable=False),
+    Column('message', Text, nullable=False),
+    Index('ix_constructor_job_messages_project_seq', 'project_id', 'seq')
+)
+
+
+def _encode(job):
+    """Convierte un trabajo (dict) en una fila de constructor_jobs."""
+    row = {}
+    for column in jobs_table.columns.keys():
+        if column not in job:
+            continue
+        value = job[column]
+        if column in JSON_FIELDS:
+            value = json.dumps(value, ensure_ascii=False) if value is not None else None
+        row[column] = value
+    return row
+
+
+def _decode(row):
+    """Convierte una fila de constructor_jobs en un dict de trabajo."""
+    job = dict(row)
+    for field in JSON_FIELDS:
+        raw = job.get(field)
+        job[field] = json.loads(raw) if raw else ({} if field != 'completed_stages' else [])
+    return job
+
+
+class JobStore:
+    """
+    Almacén de trabajos con caché write-behind para los trabajos de este proceso.
+
+    Los trabajos creados o reclamados por este proceso se mantienen en memoria
+    y solo se escriben los campos modificados. Los trabajos de otros workers
+    se leen y modifican directamente en la base de datos.
+    """
+
+    def __init__(self, database_url=JOB_DATABASE_URL, flush_interval=FLUSH_INTERVAL):
+        connect_args = {}
+        if database_url.startswith('sqlite'):
+            database_path = database_url.split(':///', 1)[-1]
+            if database_path and database_path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+            connect_args['check_same_thread'] = False
+
+        self.engine = create_engine(database_url, pool_pre_ping=True, connect_args=connect_args)
+        if database_url.startswith('sqlite'):
+            @event.listens_for(self.engine, 'connect')
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA busy_timeout=5000')
+                cursor.close()
+
+        metadata.create_all(self.engine)
+
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._active = {}
+        self._dirty = {}
+        self._last_heartbeat = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='job-store-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def get(self, project_id):
+        """Devuelve el trabajo como dict, o None si no existe."""
+        with self._lock:
+            job = self._active.get(project_id)
+            if job is not None:
+                return dict(job)
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(jobs_table).where(jobs_table.c.project_id == project_id)
+            ).mappings().first()
+        return _decode(row) if row else None
+
+    def exists(self, project_id):
+        return self.get(project_id) is not None
+
+    def messages(self, project_id, since=0, limit=None):
+        """
+        Mensajes de consola con número de secuencia mayor que since.
+
+        Returns:
+            list: Dicts con seq, time y message en orden de secuencia
+        """
+        query = (select(messages_table.c.seq, messages_table.c.time, messages_table.c.message)
+                 .where(messages_table.c.project_id == project_id)
+                 .where(messages_table.c.seq > since)
+                 .order_by(messages_table.c.seq, messages_table.c.id))
+        if limit:
+            query = query.limit(limit)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings()]
+
+    def last_message(self, project_id):
+        job = self.get(project_id)
+        if not job or not job.get('message_count'):
+            return None
+        messages = self.messages(project_id, since=job['message_count'] - 1)
+        return messages[-1] if messages else None
+
+    def is_stage_done(self, project_id, stage):
+        job = self.get(project_id)
+        return bool(job) and stage in job.get('completed_stages', [])
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def create(self, project_id, **fields):
+        """Crea (o reinicia) un trabajo propiedad de este proceso y lo escribe al momento."""
+        now = time.time()
+        job = {
+            'project_id': project_id,
+            'status': 'in_progress',
+            'progress': 0,
+            'current_stage': None,
+            'paused': False,
+            'error': None,
+            'framework': None,
+            'techstack': {},
+            'plan': {},
+            'params': {},
+            'completed_stages': [],
+            'message_count': 0,
+            'start_time': now,
+            'completion_time': None,
+        }
+        job.update(fields)
+        job.update({'updated_at': now, 'owner': self.owner, 'heartbeat_at': now})
+
+        with self._lock:
+            self._dirty.pop(project_id, None)
+            with self.engine.begin() as conn:
+                conn.execute(delete(messages_table).where(messages_table.c.project_id == project_id))
+                conn.execute(delete(jobs_table).where(jobs_table.c.project_id == project_id))
+                conn.execute(insert(jobs_table).values(**_encode(job)))
+            self._active[project_id] = job
+        return dict(job)
+
+    def update(self, project_id, **fields):
+        """Actualiza campos de un trabajo; en trabajos propios la escritura se difiere."""
+        if not fields:
+            return
+        now = time.time()
+        with self._lock:
+            job = self._active.get(project_id)
+            if job is not None:
+                job.update(fields)
+                job['updated_at'] = now
+                self._dirty.setdefault(project_id, set()).update(fields.keys(), ['updated_at'])
+                return
+
+        row = _encode(dict(fields, updated_at=now))
+        with self.engine.begin() as conn:
+            conn.execute(update(jobs_table).where(jobs_table.c.project_id == project_id).values(**row))
+
+    def append_message(self, project_id, message, timestamp=None):
+        """
+        Añade un mensaje de consola al trabajo.
+
+        El seq se asigna en la base de datos, también para los trabajos de
+        este proceso: otro worker puede estar añadiendo mensajes al mismo
+        trabajo (p. ej. al pausarlo o cancelarlo).
+
+        Returns:
+            int: Número de secuencia del mensaje dentro del trabajo, o None
+                si el trabajo no existe
+        """
+        timestamp = timestamp or time.time()
+        with self.engine.begin() as conn:
+            # El UPDATE bloquea la fila hasta el commit: el SELECT lee el valor
+            # que ha dejado esta transacción y ningún otro worker obtiene el mismo
+            result = conn.execute(
+                update(jobs_table).where(jobs_table.c.project_id == project_id)
+                .values(message_count=jobs_table.c.message_count + 1, updated_at=time.time())
+            )
+            if result.rowcount != 1:
+                return None
+            seq = conn.execute(
+                select(jobs_table.c.message_count).where(jobs_table.c.project_id == project_id)
+            ).scalar()
+            conn.execute(insert(messages_table).values(
+                project_id=project_id, seq=seq, time=timestamp, message=message
+            ))
+
+        with self._lock:
+            job = self._active.get(project_id)
+            if job is not None:
+                job['message_count'] = max(job['message_count'], seq)
+        return seq
+
+    def mark_stage_done(self, project_id, stage):
+        """Registra una etapa completada para poder reanudar el trabajo tras un reinicio."""
+        with self._lock:
+            job = self.get(project_id)
+            if not job:
+                return
+            stages = list(job.get('completed_stages') or [])
+            if stage not in stages:
+                stages.append(stage)
+                self.update(project_id, completed_stages=stages)
+
+    def finish(self, project_id, status, **fields):
+        """Marca el trabajo como terminado, lo escribe al momento y lo saca de la caché."""
+        fields.setdefault('completion_time', time.time())
+        self.update(project_id, status=status, **fields)
+        self.flush()
+        with self._lock:
+            self._active.pop(project_id, None)
+
+    def claim_orphaned_jobs(self):
+        """
+        Reclama los trabajos en curso cuyo dueño dejó de enviar latidos
+        (p. ej. tras un reinicio) para reanudarlos en este proceso.
+
+        Returns:
+            list: Trabajos reclamados
+        """
+        threshold = time.time() - STALE_SECONDS
+        claimed = []
+        with self.engine.begin() as conn:
+            candidates = conn.execute(
+                select(jobs_table)
+                .where(jobs_table.c.status.in_(ACTIVE_STATUSES))
+                .where(jobs_table.c.paused.is_(False))
+                .where(jobs_table.c.heartbeat_at < threshold)
+            ).mappings().all()
+            for row in candidates:
+                now = time.time()
+                result = conn.execute(
+                    update(jobs_table)
+                    .where(jobs_table.c.project_id == row['project_id'])
+                    .where(jobs_table.c.heartbeat_at == row['heartbeat_at'])
+                    .values(owner=self.owner, heartbeat_at=now, updated_at=now)
+                )
+                if result.rowcount == 1:
+                    job = _decode(row)
+                    job.update({'owner': self.owner, 'heartbeat_at': now, 'updated_at': now})
+                    claimed.append(job)
+
+        with self._lock:
+            for job in claimed:
+                self._active[job['project_id']] = job
+        if claimed:
+            logger.info(f"Reclamados {len(claimed)} trabajos del constructor interrumpidos")
+        return [dict(job) for job in claimed]
+
+    def release(self, project_id):
+        """
+        Libera un trabajo propio (p. ej. al aparcarlo en pausa): se escribe al
+        momento y queda sin dueño para que cualquier worker pueda reanudarlo.
+        """
+        self.flush()
+        with self._lock:
+            self._active.pop(project_id, None)
+            self._dirty.pop(project_id, None)
+        with self.engine.begin() as conn:
+            conn.execute(update(jobs_table).where(jobs_table.c.project_id == project_id)
+                         .values(owner=None, updated_at=time.time()))
+
+    def claim(self, project_id):
+        """
+        Reclama un trabajo en curso sin dueño (aparcado) para ejecutarlo aquí.
+
+        Returns:
+            dict: El trabajo reclamado, o None si otro proceso lo tiene
+        """
+        now = time.time()
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(jobs_table)
+                .where(jobs_table.c.project_id == project_id)
+                .where(jobs_table.c.owner.is_(None))
+                .where(jobs_table.c.status.in_(ACTIVE_STATUSES))
+                .values(owner=self.owner, heartbeat_at=now, updated_at=now)
+            )
+            if result.rowcount != 1:
+                return None
+            row = conn.execute(
+                select(jobs_table).where(jobs_table.c.project_id == project_id)
+            ).mappings().first()
+        job = _decode(row)
+        with self._lock:
+            self._active[project_id] = job
+        return dict(job)
+
+    # ------------------------------------------------------------------
+    # Write-behind
+    # ------------------------------------------------------------------
+
+    def flush(self):
+        """Escribe en la base de datos los cambios acumulados."""
+        now = time.time()
+        with self._lock:
+            heartbeat = now - self._last_heartbeat >= STALE_SECONDS / 4
+            if heartbeat:
+                self._last_heartbeat = now
+                for project_id, job in self._active.items():
+                    job['heartbeat_at'] = now
+                    self._dirty.setdefault(project_id, set()).add('heartbeat_at')
+
+            updates = []
+            for project_id, fields in self._dirty.items():
+                job = self._active.get(project_id)
+                if job is not None:
+                    updates.append((project_id, _encode({f: job[f] for f in fields})))
+            dirty = self._dirty
+            self._dirty = {}
+            active_ids = list(self._active.keys())
+
+        try:
+            with self.engine.begin() as conn:
+                for project_id, row in updates:
+                    conn.execute(update(jobs_table).where(jobs_table.c.project_id == project_id).values(**row))
+                controls = []
+                if active_ids:
+                    controls = conn.execute(
+                        select(jobs_table.c.project_id, jobs_table.c.status,
+                               jobs_table.c.paused, jobs_table.c.message_count)
+                        .where(jobs_table.c.project_id.in_(active_ids))
+                    ).mappings().all()
+        except Exception as e:
+            logger.error(f"Error escribiendo trabajos del constructor: {str(e)}")
+            with self._lock:
+                for project_id, fields in dirty.items():
+                    self._dirty.setdefault(project_id, set()).update(fields)
+            return
+
+        # Recoger las órdenes de pausa/cancelación y el número de mensajes de otros workers
+        with self._lock:
+            for control in controls:
+                job = self._active.get(control['project_id'])
+                if job is None:
+                    continue
+                locally_changed = self._dirty.get(control['project_id'], ())
+                if 'paused' not in locally_changed:
+                    job['paused'] = bool(control['paused'])
+                if control['status'] == 'cancelled' and 'status' not in locally_changed:
+                    job['status'] = 'cancelled'
+                job['message_count'] = max(job['message_count'], control['message_count'] or 0)
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en el volcado del almacén de trabajos: {str(e)}")
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error cerrando el almacén de trabajos: {str(e)}")
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """Obtiene la instancia global del almacén de trabajos del constructor."""
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                _job_store = JobStore()
+    return _job_store
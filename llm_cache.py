@@ -0,0 +1,333 @@
+"""
+Caché de respuestas de los modelos de IA para Codestorm Assistant.
+
+Las respuestas se indexan por un hash del request normalizado
+(system_prompt, prompt, modelo, temperatura) y se guardan en dos niveles:
+un LRU en memoria y un almacenamiento persistente en SQLite. Ambos niveles
+aplican límites de tamaño y TTL.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Configuración por variables de entorno
+CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+MEMORY_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MEMORY_ENTRIES', '256'))
+DISK_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_DISK_ENTRIES', '5000'))
+CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', str(24 * 3600)))
+CACHE_DB_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join('instance', 'llm_cache.db'))
+# Los aciertos en SQLite actualizan last_access por lotes, no en cada lectura
+TOUCH_BATCH_SIZE = int(os.environ.get('LLM_CACHE_TOUCH_BATCH', '64'))
+TOUCH_FLUSH_INTERVAL = float(os.environ.get('LLM_CACHE_TOUCH_INTERVAL', '30'))
+
+
+def normalize_text(text):
+    """Normaliza finales de línea y espacios exteriores sin alterar el contenido."""
+    if text is None:
+        return ''
+    return str(text).replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+def make_cache_key(system_prompt, prompt, model, temperature):
+    """
+    Calcula la clave de caché para un request.
+
+    Args:
+        system_prompt: Prompt de sistema
+        prompt: Prompt del usuario
+        model: Identificador del modelo o proveedor
+        temperature: Temperatura de generación
+
+    Returns:
+        str: Hash sha256 en hexadecimal
+    """
+    payload = json.dumps({
+        'system': normalize_text(system_prompt),
+        'prompt': normalize_text(prompt),
+        'model': str(model).strip().lower(),
+        'temperature': round(float(temperature or 0), 3)
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryLRUTier:
+    """Nivel de caché en memoria con expulsión LRU."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=MEMORY_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """
+    Nivel de caché persistente en SQLite, compartido entre workers.
+
+    Un acierto no escribe en la base de datos: la hora de acceso se guarda en
+    memoria y se vuelca en una sola transacción cuando se acumulan
+    touch_batch_size accesos, pasa touch_interval segundos o antes de una
+    escritura (que es cuando se expulsan las entradas menos usadas).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=CACHE_DB_PATH, max_entries=DISK_MAX_ENTRIES, ttl=CACHE_TTL,
+                 touch_batch_size=TOUCH_BATCH_SIZE, touch_interval=TOUCH_FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_batch_size = touch_batch_size
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._touches = {}  # key -> última hora de acceso pendiente de guardar
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS llm_responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' last_access REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access'
+                ' ON llm_responses (last_access)'
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM llm_responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._touches.pop(key, None)
+                self._conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            self._touches[key] = now
+            if (len(self._touches) >= self.touch_batch_size
+                    or time.monotonic() - self._last_flush >= self.touch_interval):
+                self._flush_touches()
+                self._conn.commit()
+            return value
+
+    def _flush_touches(self):
+        # Se llama con self._lock adquirido; el commit lo hace el llamador
+        if self._touches:
+            self._conn.executemany(
+                'UPDATE llm_responses SET last_access = ? WHERE key = ?',
+                [(accessed, key) for key, accessed in self._touches.items()]
+            )
+            self._touches.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Guarda las horas de acceso pendientes."""
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._touches.pop(key, None)
+            self._flush_touches()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO llm_responses (key, value, expires_at, last_access)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, value, now + self.ttl, now)
+            )
+            self._conn.execute('DELETE FROM llm_responses WHERE expires_at < ?', (now,))
+            self._conn.execute(
+                'DELETE FROM llm_responses WHERE key IN ('
+                ' SELECT key FROM llm_responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touches.clear()
+            self._conn.execute('DELETE FROM llm_responses')
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Caché de respuestas multinivel.
+
+    Los niveles se consultan en orden; un acierto en un nivel inferior se
+    copia a los superiores. Cualquier objeto con métodos get/set/clear y un
+    atributo name puede usarse como nivel.
+    """
+
+    def __init__(self, tiers=None, enabled=True):
+        self.tiers = tiers if tiers is not None else [MemoryLRUTier()]
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'errors': 0}
+        self._tier_hits = {tier.name: 0 for tier in self.tiers}
+
+    def should_use(self, temperature, cache_nondeterministic=False):
+        """Indica si el request es cacheable: temperatura 0 o aceptación explícita."""
+        if not self.enabled:
+            return False
+        return cache_nondeterministic or float(temperature or 0) <= 0
+
+    def get(self, key):
+        for index, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                logger.warning(f"Error leyendo caché {tier.name}: {str(e)}")
+                self._count('errors')
+                continue
+            if value is not None:
+                for upper in self.tiers[:index]:
+                    try:
+                        upper.set(key, value)
+                    except Exception as e:
+                        logger.warning(f"Error promoviendo entrada a caché {upper.name}: {str(e)}")
+                with self._lock:
+                    self._stats['hits'] += 1
+                    self._tier_hits[tier.name] += 1
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        if value is None:
+            return
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"Error escribiendo caché {tier.name}: {str(e)}")
+                self._count('errors')
+        self._count('stores')
+
+    def get_or_generate(self, system_prompt, prompt, model, temperature, generate,
+                        cache_nondeterministic=False, validate=None):
+        """
+        Devuelve la respuesta cacheada o la genera con generate() y la almacena.
+
+        Args:
+            system_prompt: Prompt de sistema
+            prompt: Prompt del usuario
+            model: Identificador del modelo o proveedor
+            temperature: Temperatura de generación
+            generate: Función sin argumentos que produce la respuesta
+            cache_nondeterministic: Permite cachear aunque temperature > 0
+            validate: Función que indica si una respuesta es utilizable; las que
+                no lo son no se almacenan ni se sirven desde la caché
+
+        Returns:
+            str: Respuesta del modelo
+        """
+        if not self.should_use(temperature, cache_nondeterministic):
+            self._count('bypassed')
+            return generate()
+
+        key = make_cache_key(system_prompt, prompt, model, temperature)
+        cached = self.get(key)
+        if cached is not None and (validate is None or validate(cached)):
+            logger.debug(f"Respuesta servida desde caché ({key[:12]})")
+            return cached
+
+        value = generate()
+        if value and (validate is None or validate(value)):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        """Devuelve contadores de aciertos, fallos y tamaño de cada nivel."""
+        with self._lock:
+            data = dict(self._stats)
+            data['tier_hits'] = dict(self._tier_hits)
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = round(data['hits'] / lookups, 3) if lookups else 0.0
+        data['enabled'] = self.enabled
+        sizes = {}
+        for tier in self.tiers:
+            try:
+                sizes[tier.name] = len(tier)
+            except Exception:
+                sizes[tier.name] = None
+        data['sizes'] = sizes
+        return data
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Obtiene la instancia global de la caché de respuestas."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                tiers = [MemoryLRUTier()]
+                try:
+                    tiers.append(SQLiteTier())
+                except Exception as e:
+                    logger.warning(f"Caché SQLite no disponible, usando solo memoria: {str(e)}")
+                _response_cache = ResponseCache(tiers=tiers, enabled=CACHE_ENABLED)
+    return _response_cache
@@ -0,0 +1,225 @@
+"""
+Ejecución asíncrona de generate_content con peticiones "hedged".
+
+En lugar de probar los proveedores de forma estrictamente secuencial, se
+lanza la petición al proveedor principal y, si no ha respondido cuando se
+supera su latencia p95, se envía una segunda petición al siguiente
+proveedor. Gana la primera respuesta válida y la otra se cancela.
+Los errores provocan el fallback inmediato, sin esperas de backoff.
+
+Cada llamada usa su propio ThreadPoolExecutor, que se cierra sin esperar a
+los hilos: al cancelar una petición se cierra su stream HTTP, y el hilo
+perdedor termina por su cuenta sin retrasar la respuesta ganadora.
+generate_content (agents_utils) pasa por aquí cuando LLM_HEDGE_ENABLED está
+activo.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from agents_utils import STREAMERS, get_model_order
+from provider_health import get_health_monitor
+from rate_limiter import get_rate_limiter, estimate_tokens, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+HEDGE_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', '8.0'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', '10'))
+HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '0.95'))
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+
+class HedgeCancelled(Exception):
+    """La petición perdió la carrera y fue cancelada."""
+
+
+class _Cancellation:
+    """Marca de cancelación de una petición y el stream HTTP que hay que cerrar."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def attach(self, stream):
+        with self._lock:
+            self._stream = stream
+            cancelled = self.event.is_set()
+        if cancelled:
+            self._close(stream)
+
+    def cancel(self):
+        with self._lock:
+            self.event.set()
+            stream = self._stream
+        if stream is not None:
+            self._close(stream)
+
+    def is_set(self):
+        return self.event.is_set()
+
+    @staticmethod
+    def _close(stream):
+        # Cerrar la respuesta HTTP desbloquea la lectura en el hilo del proveedor
+        try:
+            stream.close()
+        except Exception as e:
+            logger.debug(f"Error cerrando stream cancelado: {str(e)}")
+
+
+def get_hedge_delay(provider):
+    """Umbral tras el cual se lanza la petición de respaldo para un proveedor."""
+    p95 = get_health_monitor().latency_percentile(
+        provider, HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES
+    )
+    return p95 if p95 is not None else HEDGE_DEFAULT_DELAY
+
+
+def _collect_response(provider, prompt, system_prompt, temperature, cancellation):
+    """Consume el stream del proveedor, abortándolo si la petición es cancelada."""
+    get_rate_limiter().acquire(provider, estimate_tokens(system_prompt, prompt))
+    if cancellation.is_set():
+        raise HedgeCancelled(provider)
+    generator = STREAMERS[provider](prompt, system_prompt, temperature, on_stream=cancellation.attach)
+    parts = []
+    try:
+        for chunk in generator:
+            if cancellation.is_set():
+                raise HedgeCancelled(provider)
+            parts.append(chunk)
+    except HedgeCancelled:
+        raise
+    except Exception:
+        # Un stream cerrado por la cancelación falla al leer: no es un error del proveedor
+        if cancellation.is_set():
+            raise HedgeCancelled(provider)
+        raise
+    finally:
+        generator.close()
+    return ''.join(parts)
+
+
+async def _call_provider(executor, provider, prompt, system_prompt, temperature, cancellation):
+    health_monitor = get_health_monitor()
+    start = time.monotonic()
+    try:
+        # Copiar el contexto para conservar la prioridad de la petición en el rate limiter
+        context = contextvars.copy_context()
+        content = await asyncio.get_running_loop().run_in_executor(
+            executor, context.run, _collect_response, provider, prompt, system_prompt, temperature, cancellation
+        )
+        if not content:
+            raise ValueError(f"{provider} no generó contenido")
+    except RateLimitError:
+        # Falta de cupo local: no es un fallo del proveedor
+        raise
+    except Exception as e:
+        health_monitor.record_failure(provider, time.monotonic() - start, e)
+        raise
+    health_monitor.record_success(provider, time.monotonic() - start)
+    return content
+
+
+async def generate_content_async(prompt, system_prompt, model="openai", temperature=0.7,
+                                 hedge=True, hedge_after=None):
+    """
+    Genera contenido con fallback inmediato y, opcionalmente, una petición hedged.
+
+    Args:
+        prompt: Prompt para generar contenido
+        system_prompt: Prompt de sistema para establecer el rol
+        model: Modelo preferido (openai, anthropic, gemini)
+        temperature: Temperatura para la generación (0.0 - 1.0)
+        hedge: Si se envía una petición de respaldo al superar el umbral
+        hedge_after: Umbral en segundos; por defecto la latencia p95 del proveedor
+
+    Returns:
+        dict: content, provider (ganador), hedged, latency y errors
+    """
+    health_monitor = get_health_monitor()
+    remaining = [p for p in get_model_order(model) if not health_monitor.is_open(p)]
+    start = time.monotonic()
+    running = {}
+    errors = {}
+    hedged = False
+    executor = ThreadPoolExecutor(max_workers=max(1, len(remaining)), thread_name_prefix='llm-hedge')
+
+    def launch_next():
+        """Lanza el siguiente proveedor cuyo circuito admita la petición."""
+        while remaining:
+            provider = remaining.pop(0)
+            if not health_monitor.allow_request(provider):
+                errors[provider] = "circuito abierto"
+                continue
+            cancellation = _Cancellation()
+            task = asyncio.create_task(
+                _call_provider(executor, provider, prompt, system_prompt, temperature, cancellation)
+            )
+            running[task] = (provider, cancellation)
+            logger.info(f"Generando contenido asíncrono con {provider}")
+            return provider
+        return None
+
+    try:
+        primary = launch_next()
+        if primary is None:
+            raise ValueError("Todos los proveedores tienen el circuito abierto. Inténtalo más tarde.")
+        delay = hedge_after if hedge_after is not None else get_hedge_delay(primary)
+
+        while running:
+            can_hedge = hedge and not hedged and remaining
+            timeout = max(0.0, delay - (time.monotonic() - start)) if can_hedge else None
+            done, _ = await asyncio.wait(
+                running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                hedged = True
+                logger.info(f"Umbral de {delay:.2f}s superado, enviando petición de respaldo")
+                launch_next()
+                continue
+
+            for task in done:
+                provider, _ = running.pop(task)
+                try:
+                    content = task.result()
+                except Exception as e:
+                    errors[provider] = str(e)
+                    logger.warning(f"Error con {provider} en modo asíncrono: {str(e)}")
+                    if not running:
+                        launch_next()
+                    continue
+
+                return {
+                    'content': content,
+                    'provider': provider,
+                    'hedged': hedged,
+                    'latency': round(time.monotonic() - start, 3),
+                    'errors': errors
+                }
+    finally:
+        # Cancelar las peticiones perdedoras cerrando su stream; no se espera a sus hilos
+        for task, (provider, cancellation) in running.items():
+            cancellation.cancel()
+            task.cancel()
+            logger.info(f"Petición a {provider} cancelada")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    raise ValueError(f"No se pudo generar contenido con ningún modelo disponible. Errores: {errors}")
+
+
+def generate_content_hedged(prompt, system_prompt, model="openai", temperature=0.7,
+                            hedge=True, hedge_after=None):
+    """
+    Versión síncrona de generate_content_async para código que no usa asyncio.
+
+    Returns:
+        dict: content, provider (ganador), hedged, latency y errors
+    """
+    return asyncio.run(generate_content_async(
+        prompt, system_prompt, model, temperature, hedge=hedge, hedge_after=hedge_after
+    ))
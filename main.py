@@ -9,7 +9,6 @@ from datetime import datetime
 from dotenv import load_dotenv
 import threading
 import logging
-import openai
 import google.generativeai as genai
 import subprocess
 import shutil
@@ -17,8 +16,20 @@ from pathlib import Path
 import traceback
 import re
 import threading
-from constructor_routes import constructor_bp
-from xterm_terminal import xterm_bp, init_xterm_blueprint
+from constructor_routes import constructor_bp, init_constructor_socketio
+from llm_cache import get_response_cache
+from provider_health import get_health_monitor
+from rate_limiter import get_rate_limiter, estimate_tokens
+from provider_registry import get_openai_client, get_anthropic_client, configure_gemini, get_gemini_model, discard_client
+from xterm_terminal import xterm_bp, init_xterm_blueprint, stream_command_events, submit_command
+from workspace_index import list_directory, handle_fs_event, set_watching, sync_path
+import search_index
+import command_stream
+from command_service import get_command_service
+from file_events import ChangeBatcher
+from file_reads import file_read_response
+from file_patches import write_file_atomic, apply_patch, StaleBaseError, PatchError
+from workspace_maintenance import get_workspace_maintenance, QuotaExceededError
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG,
@@ -39,31 +50,31 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading',
 # Register constructor blueprint
 try:
     app.register_blueprint(constructor_bp)
+    init_constructor_socketio(socketio)
     logging.info("Constructor blueprint registered successfully")
 
     # Asegurar que los directorios necesarios para el constructor existan
     os.makedirs('user_workspaces/projects', exist_ok=True)
 
     # Precargar estado del constructor
-    from constructor_routes import project_status
+    from job_store import get_job_store
 
-    # Reiniciar cualquier proyecto que se haya quedado en progreso
+    # Registrar en el almacén los proyectos que solo existen en el sistema de archivos
     try:
+        job_store = get_job_store()
         for proj_dir in os.listdir('user_workspaces/projects'):
             if proj_dir.startswith('app_'):
                 proj_id = proj_dir
-                if proj_id not in project_status:
+                if not job_store.exists(proj_id):
                     logging.info(f"Preloading project status for {proj_id}")
-                    project_status[proj_id] = {
-                        'status': 'completed',
-                        'progress': 100,
-                        'current_stage': 'Proyecto completado exitosamente',
-                        'console_messages': [
-                            {'time': time.time(), 'message': 'Proyecto recuperado del sistema de archivos'}
-                        ],
-                        'start_time': time.time() - 3600,
-                        'completion_time': time.time() - 60
-                    }
+                    job_store.create(
+                        proj_id,
+                        progress=100,
+                        current_stage='Proyecto completado exitosamente',
+                        start_time=time.time() - 3600
+                    )
+                    job_store.append_message(proj_id, 'Proyecto recuperado del sistema de archivos')
+                    job_store.finish(proj_id, 'completed', completion_time=time.time() - 60)
     except Exception as load_err:
         logging.warning(f"Error preloading project statuses: {str(load_err)}")
 
@@ -104,38 +115,37 @@ def validate_openai_key(key):
     if not key:
         return False
     try:
-        openai.api_key = key
-        client = openai.OpenAI(api_key=key)
+        client = get_openai_client(key)
         _ = client.models.list()
         return True
     except Exception as e:
         logging.error(f"Error al validar OpenAI API: {str(e)}")
+        discard_client('openai', key)
         return False
 
 def validate_anthropic_key(key):
     if not key:
         return False
     try:
-        # Importar solo si la clave está configurada
-        import anthropic
-        from anthropic import Anthropic
-        client = Anthropic(api_key=key)
+        client = get_anthropic_client(key)
         _ = client.models.list()
         return True
     except Exception as e:
         logging.error(f"Error al validar Anthropic API: {str(e)}")
+        discard_client('anthropic', key)
         return False
 
 def validate_gemini_key(key):
     if not key:
         return False
     try:
-        genai.configure(api_key=key)
+        configure_gemini(key)
         models = genai.list_models()
         _ = list(models)  # Forzar evaluación
         return True
     except Exception as e:
         logging.error(f"Error al validar Gemini API: {str(e)}")
+        discard_client('gemini', key)
         return False
 
 # Configurar claves API desde variables de entorno
@@ -155,6 +165,15 @@ app.config['API_KEYS'] = {
     'gemini': gemini_api_key if gemini_valid else None
 }
 
+# Reanudar los trabajos del constructor que quedaron a medias en un proceso anterior
+try:
+    from constructor_routes import resume_interrupted_jobs
+    resumed_jobs = resume_interrupted_jobs(app.config['API_KEYS'])
+    if resumed_jobs:
+        logging.info(f"Reanudados {resumed_jobs} trabajos del constructor interrumpidos")
+except Exception as resume_err:
+    logging.warning(f"No se pudieron reanudar los trabajos del constructor: {str(resume_err)}")
+
 # Mensaje informativo sobre el estado de las APIs
 if not any([openai_api_key, anthropic_api_key, gemini_api_key]):
     logging.error("¡ADVERTENCIA! Ninguna API está configurada. El sistema funcionará en modo degradado.")
@@ -188,6 +207,7 @@ class FileSystemManager:
         """Obtener o crear un directorio de trabajo para el usuario."""
         workspace_path = Path("./user_workspaces") / user_id
         workspace_path.mkdir(parents=True, exist_ok=True)
+        get_workspace_maintenance().touch(workspace_path)
         return workspace_path
 
     def notify_terminals(self, user_id, data, exclude_terminal=None):
@@ -195,26 +215,28 @@ class FileSystemManager:
         self.socketio.emit('command_result', data, room=user_id)
 
     def execute_command(self, command, user_id='default', notify=True, terminal_id=None):
-        """Ejecuta un comando en el workspace del usuario."""
+        """
+        Ejecuta un comando en el workspace del usuario.
+
+        No cambia el directorio del proceso: cwd y el entorno son propios del
+        workspace, así que puede llamarse desde varios hilos a la vez.
+        """
         try:
-            workspace_dir = self.get_user_workspace(user_id)
-            current_dir = os.getcwd()
-            os.chdir(workspace_dir)
+            workspace_dir = self.get_user_workspace(user_id).resolve()
 
             logging.info(f"Ejecutando comando: '{command}' en workspace: {workspace_dir}")
 
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-
-            os.chdir(current_dir)
+            result = command_stream.run_command(command, workspace_dir, timeout=10)
+            if result['timed_out']:
+                logging.error(f"Timeout al ejecutar comando: {command}")
+                return {
+                    'output': 'Error: El comando tardó demasiado tiempo en ejecutarse',
+                    'success': False,
+                    'command': command
+                }
 
-            output = result.stdout if result.returncode == 0 else result.stderr
-            success = result.returncode == 0
+            output = result['stdout'] if result['success'] else result['stderr']
+            success = result['success']
 
             if notify and terminal_id:
                 self.notify_terminals(user_id, {
@@ -238,13 +260,6 @@ class FileSystemManager:
                 'command': command
             }
 
-        except subprocess.TimeoutExpired:
-            logging.error(f"Timeout al ejecutar comando: {command}")
-            return {
-                'output': 'Error: El comando tardó demasiado tiempo en ejecutarse',
-                'success': False,
-                'command': command
-            }
         except Exception as e:
             logging.error(f"Error al ejecutar comando: {str(e)}")
             return {
@@ -299,8 +314,19 @@ def get_user_workspace(user_id='default'):
     """Obtener o crear un directorio de trabajo para el usuario."""
     workspace_path = Path("./user_workspaces") / user_id
     workspace_path.mkdir(parents=True, exist_ok=True)
+    get_workspace_maintenance().touch(workspace_path)
     return workspace_path
 
+def quota_exceeded_response(error):
+    """Respuesta para una escritura rechazada por la cuota dura del workspace."""
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'quota_exceeded': True,
+        'usage': error.usage,
+        'hard_quota': error.limit
+    }), 507
+
 @app.route('/api/file/content', methods=['GET'])
 def get_file_content():
     """Obtener el contenido de un archivo."""
@@ -331,13 +357,9 @@ def get_file_content():
                 'error': 'El archivo no existe o es un directorio'
             }), 404
 
-        # Leer contenido del archivo
-        with open(target_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
-
-        return jsonify({
+        # Leer el contenido (o el rango pedido); 304 si el cliente tiene la versión actual
+        return file_read_response(target_path, {
             'success': True,
-            'content': content,
             'file_path': file_path
         })
 
@@ -374,12 +396,16 @@ def save_file_content():
                 'error': 'Acceso denegado: No se puede acceder a archivos fuera del workspace'
             }), 403
 
-        # Crear directorios si no existen
-        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            quota = get_workspace_maintenance().check_write(
+                workspace_path, len(content.encode('utf-8')), target_path)
+        except QuotaExceededError as e:
+            return quota_exceeded_response(e)
 
-        # Escribir contenido al archivo
-        with open(target_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Escribir contenido al archivo (temporal + rename; crea los directorios)
+        new_hash = write_file_atomic(target_path, content)
+        sync_path(workspace_path, target_path)
+        search_index.sync_path(workspace_path, target_path)
 
         # Notificar cambio si es posible
         try:
@@ -395,7 +421,9 @@ def save_file_content():
         return jsonify({
             'success': True,
             'message': 'Archivo guardado correctamente',
-            'file_path': file_path
+            'file_path': file_path,
+            'hash': new_hash,
+            'quota_warning': quota['over_soft_quota']
         })
 
     except Exception as e:
@@ -405,6 +433,88 @@ def save_file_content():
             'error': str(e)
         }), 500
 
+@app.route('/api/file/patch', methods=['POST'])
+def patch_file_content():
+    """Guardar cambios en un archivo enviando solo las ediciones sobre una versión base."""
+    try:
+        data = request.json
+        if not data or 'file_path' not in data or 'base_hash' not in data or 'edits' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Se requiere ruta de archivo, hash base y ediciones'
+            }), 400
+
+        file_path = data['file_path']
+
+        # Obtener workspace del usuario
+        user_id = session.get('user_id', 'default')
+        workspace_path = get_user_workspace(user_id)
+
+        # Crear ruta completa y verificar seguridad
+        target_path = os.path.join(workspace_path, file_path)
+        if not os.path.normpath(target_path).startswith(os.path.normpath(workspace_path)):
+            return jsonify({
+                'success': False,
+                'error': 'Acceso denegado: No se puede acceder a archivos fuera del workspace'
+            }), 403
+
+        try:
+            # Cota superior del crecimiento: todo el texto insertado
+            added = sum(len(str(edit.get('text', '')).encode('utf-8'))
+                        for edit in data['edits'] if isinstance(edit, dict)) \
+                if isinstance(data['edits'], list) else 0
+            get_workspace_maintenance().check_write(workspace_path, added)
+        except QuotaExceededError as e:
+            return quota_exceeded_response(e)
+
+        try:
+            result = apply_patch(target_path, data['base_hash'], data['edits'])
+        except FileNotFoundError:
+            return jsonify({
+                'success': False,
+                'error': 'El archivo no existe'
+            }), 404
+        except StaleBaseError as e:
+            # El cliente debe releer el archivo y recalcular sus ediciones
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'stale': True,
+                'current_hash': e.current_hash
+            }), 409
+        except PatchError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        sync_path(workspace_path, target_path)
+        search_index.sync_path(workspace_path, target_path)
+
+        try:
+            socketio.emit('file_change', {
+                'type': 'update',
+                'file_path': file_path,
+                'user_id': user_id,
+                'timestamp': time.time()
+            }, room=user_id)
+        except Exception as notify_error:
+            logging.warning(f"Error al notificar cambio de archivo: {str(notify_error)}")
+
+        return jsonify({
+            'success': True,
+            'message': 'Archivo guardado correctamente',
+            'file_path': file_path,
+            'hash': result['hash'],
+            'size': result['size']
+        })
+
+    except Exception as e:
+        logging.error(f"Error al aplicar parche: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/session', methods=['GET'])
 def session_info():
     """Return session information for the current user."""
@@ -427,37 +537,39 @@ def watch_workspace_files():
         class WorkspaceHandler(FileSystemEventHandler):
             def on_any_event(self, event):
                 try:
-                    if event.src_path.endswith('~') or '/.' in event.src_path:
+                    # Mantener el índice de metadatos al día antes de avisar a los clientes
+                    handle_fs_event(event.src_path, getattr(event, 'dest_path', None))
+                    search_index.handle_fs_event(event.src_path, getattr(event, 'dest_path', None))
+
+                    # Los cambios de mtime de un directorio ya llegan como eventos de sus hijos
+                    if event.event_type not in ('created', 'deleted', 'moved', 'modified') or \
+                            (event.is_directory and event.event_type == 'modified'):
                         return
 
-                    event_type = 'modified'
-                    if event.event_type == 'created':
-                        event_type = 'create'
+                    if event.event_type == 'moved':
+                        # Un movimiento se notifica como eliminación del origen y creación del destino
+                        changes = [(event.src_path, 'delete'), (event.dest_path, 'create')]
+                    elif event.event_type == 'created':
+                        changes = [(event.src_path, 'create')]
                     elif event.event_type == 'deleted':
-                        event_type = 'delete'
-                    elif event.event_type == 'moved':
-                        event_type = 'move'
-
-                    workspace_dir = os.path.abspath('./user_workspaces')
-                    rel_path = os.path.relpath(event.src_path, workspace_dir)
-
-                    parts = rel_path.split(os.sep)
-                    user_id = parts[0] if len(parts) > 0 else 'default'
+                        changes = [(event.src_path, 'delete')]
+                    else:
+                        changes = [(event.src_path, 'modify')]
 
-                    socketio.emit('file_change', {
-                        'type': event_type,
-                        'file': {'path': rel_path},
-                        'user_id': user_id,
-                        'timestamp': time.time()
-                    }, room=user_id)
+                    for path, event_type in changes:
+                        if path.endswith('~') or '/.' in path:
+                            continue
 
-                    socketio.emit('file_sync', {
-                        'refresh': True,
-                        'user_id': user_id,
-                        'timestamp': time.time()
-                    }, room=user_id)
+                        rel_path = os.path.relpath(path, workspace_dir)
+                        parts = rel_path.split(os.sep)
+                        if len(parts) < 2:
+                            continue
+                        user_id = parts[0]
 
-                    logging.debug(f"Cambio detectado: {event_type} - {rel_path}")
+                        # Se agrupan en un único mensaje file_changes por workspace
+                        change_batcher.add(user_id, os.path.join(workspace_dir, user_id),
+                                           os.path.join(*parts[1:]), event_type)
+                        logging.debug(f"Cambio detectado: {event_type} - {rel_path}")
 
                 except Exception as e:
                     logging.error(f"Error en manejador de eventos de archivos: {str(e)}")
@@ -465,27 +577,43 @@ def watch_workspace_files():
         workspace_dir = os.path.abspath('./user_workspaces')
         os.makedirs(workspace_dir, exist_ok=True)
 
+        change_batcher = ChangeBatcher(
+            lambda user_id, payload: socketio.emit('file_changes', payload, room=user_id)
+        ).start()
+
         event_handler = WorkspaceHandler()
         observer = Observer()
         observer.schedule(event_handler, workspace_dir, recursive=True)
         observer.start()
+        set_watching(True)
+        search_index.set_watching(True)
 
         logging.info(f"Observador de archivos iniciado para: {workspace_dir}")
 
         try:
-            while True:
+            while observer.is_alive():
                 time.sleep(1)
         except KeyboardInterrupt:
             observer.stop()
+        finally:
+            # Sin observador los índices dejarían de estar al día
+            set_watching(False)
+            search_index.set_watching(False)
         observer.join()
+        change_batcher.stop()
 
     except ImportError:
         logging.warning("No se pudo importar watchdog. El observador de archivos no estará disponible.")
     except Exception as e:
         logging.error(f"Error en observador de archivos: {str(e)}")
 
-def handle_chat_internal(request_data):
-    """Procesa solicitudes de chat y devuelve respuestas."""
+def handle_chat_internal(request_data, on_chunk=None):
+    """Procesa solicitudes de chat y devuelve respuestas.
+
+    Si se proporciona on_chunk, la respuesta se solicita en streaming y cada
+    fragmento se entrega al callback a medida que llega del proveedor; el
+    valor devuelto contiene igualmente la respuesta completa.
+    """
     try:
         user_message = request_data.get('message', '')
         agent_id = request_data.get('agent_id', 'general')
@@ -524,14 +652,34 @@ def handle_chat_internal(request_data):
 
                     openai_model = "gpt-4o"
 
-                    openai_client = openai.OpenAI(api_key=app.config['API_KEYS'].get('openai'))
-                    completion = openai_client.chat.completions.create(
-                        model=openai_model,
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=2000
-                    )
-                    response = completion.choices[0].message.content
+                    openai_client = get_openai_client(app.config['API_KEYS'].get('openai'))
+                    get_rate_limiter().acquire('openai', estimate_tokens(
+                        *[m['content'] for m in messages], max_output_tokens=2000))
+                    if on_chunk:
+                        stream = openai_client.chat.completions.create(
+                            model=openai_model,
+                            messages=messages,
+                            temperature=0.7,
+                            max_tokens=2000,
+                            stream=True
+                        )
+                        parts = []
+                        for chunk in stream:
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                parts.append(delta)
+                                on_chunk(delta)
+                        response = ''.join(parts)
+                    else:
+                        completion = openai_client.chat.completions.create(
+                            model=openai_model,
+                            messages=messages,
+                            temperature=0.7,
+                            max_tokens=2000
+                        )
+                        response = completion.choices[0].message.content
                     logging.info(f"Respuesta generada con OpenAI ({openai_model}): {response[:100]}...")
 
                     return {'response': response, 'error': None}
@@ -544,25 +692,39 @@ def handle_chat_internal(request_data):
         elif model_choice == 'anthropic':
             if app.config['API_KEYS'].get('anthropic'):
                 try:
-                    import anthropic
-                    from anthropic import Anthropic
-
-                    client = Anthropic(api_key=app.config['API_KEYS'].get('anthropic'))
+                    client = get_anthropic_client(app.config['API_KEYS'].get('anthropic'))
 
                     messages = []
                     for msg in formatted_context:
                         messages.append({"role": msg['role'], "content": msg['content']})
                     messages.append({"role": "user", "content": user_message})
 
-                    completion = client.messages.create(
-                        model="claude-3-5-sonnet-latest",
-                        messages=messages,
-                        max_tokens=2000,
-                        temperature=0.7,
-                        system=system_prompt
-                    )
-
-                    response = completion.content[0].text
+                    get_rate_limiter().acquire('anthropic', estimate_tokens(
+                        system_prompt, *[m['content'] for m in messages], max_output_tokens=2000))
+                    if on_chunk:
+                        parts = []
+                        with client.messages.stream(
+                            model="claude-3-5-sonnet-latest",
+                            messages=messages,
+                            max_tokens=2000,
+                            temperature=0.7,
+                            system=system_prompt
+                        ) as stream:
+                            for text in stream.text_stream:
+                                if text:
+                                    parts.append(text)
+                                    on_chunk(text)
+                        response = ''.join(parts)
+                    else:
+                        completion = client.messages.create(
+                            model="claude-3-5-sonnet-latest",
+                            messages=messages,
+                            max_tokens=2000,
+                            temperature=0.7,
+                            system=system_prompt
+                        )
+
+                        response = completion.content[0].text
                     logging.info(f"Respuesta generada con Anthropic: {response[:100]}...")
 
                     return {'response': response, 'error': None}
@@ -575,10 +737,7 @@ def handle_chat_internal(request_data):
         elif model_choice == 'gemini':
             if app.config['API_KEYS'].get('gemini'):
                 try:
-                    # Make sure Gemini is configured properly
-                    genai.configure(api_key=app.config['API_KEYS'].get('gemini'))
-
-                    model = genai.GenerativeModel('gemini-1.5-pro')
+                    model = get_gemini_model('gemini-1.5-pro', api_key=app.config['API_KEYS'].get('gemini'))
 
                     full_prompt = system_prompt + "\n\n"
                     for msg in formatted_context:
@@ -586,8 +745,21 @@ def handle_chat_internal(request_data):
                         full_prompt += role_prefix + msg['content'] + "\n\n"
                     full_prompt += "Usuario: " + user_message + "\n\nAsistente: "
 
-                    gemini_response = model.generate_content(full_prompt)
-                    response = gemini_response.text
+                    get_rate_limiter().acquire('gemini', estimate_tokens(full_prompt))
+                    if on_chunk:
+                        parts = []
+                        for chunk in model.generate_content(full_prompt, stream=True):
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                continue
+                            if text:
+                                parts.append(text)
+                                on_chunk(text)
+                        response = ''.join(parts)
+                    else:
+                        gemini_response = model.generate_content(full_prompt)
+                        response = gemini_response.text
                     logging.info(f"Respuesta generada con Gemini: {response[:100]}...")
 
                     return {'response': response, 'error': None}
@@ -653,6 +825,33 @@ def chat():
 
 
 
+def extract_json_object(text):
+    """
+    Objeto JSON de una respuesta del modelo: el texto completo, un bloque de
+    código o el primer {...} que contenga. None si no hay JSON válido.
+    """
+    candidates = [text]
+    block = re.search(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL)
+    if block:
+        candidates.append(block.group(1).strip())
+    braces = re.search(r'({.*})', text, re.DOTALL)
+    if braces:
+        candidates.append(braces.group(0))
+    for candidate in candidates:
+        try:
+            result = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(result, dict):
+            return result
+    return None
+
+
+def _is_json_reply(text):
+    # Solo se cachean respuestas que se pueden interpretar: un reintento debe llegar al modelo
+    return extract_json_object(text) is not None
+
+
 @app.route('/api/process_code', methods=['POST'])
 def process_code():
     """API para procesar y corregir código."""
@@ -677,15 +876,11 @@ def process_code():
 
         result = None
 
-        # Procesar con el modelo seleccionado
-        if model == 'openai' and app.config['API_KEYS'].get('openai'):
-            try:
-                client = openai.OpenAI(api_key=app.config['API_KEYS'].get('openai'))
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "Eres un experto programador especializado en corregir código."},
-                        {"role": "user", "content": f"""Corrige el siguiente código en {language} según las instrucciones proporcionadas.
+        # Las correcciones de un mismo fragmento con las mismas instrucciones son
+        # muy frecuentes, así que se sirven desde la caché de respuestas
+        response_cache = get_response_cache()
+        correction_system_prompt = "Eres un experto programador especializado en corregir código."
+        correction_prompt = f"""Corrige el siguiente código en {language} según las instrucciones proporcionadas.
 
                 CÓDIGO:
                 ```{language}
@@ -699,34 +894,37 @@ def process_code():
                 - correctedCode: el código corregido completo
                 - changes: una lista de objetos, cada uno con 'description' y 'lineNumbers'
                 - explanation: una explicación detallada de los cambios
-                """}
-                    ],
-                    temperature=0.1
-                )
+                """
 
-                response_text = response.choices[0].message.content.strip()
-                try:
-                    result = json.loads(response_text)
-                except json.JSONDecodeError:
-                    # Intenta extraer JSON de la respuesta si está envuelto en bloques de código
-                    json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', response_text, re.DOTALL)
-                    if json_match:
-                        try:
-                            result = json.loads(json_match.group(1).strip())
-                        except json.JSONDecodeError:
-                            logging.error(f"Error al decodificar JSON extraído de OpenAI: {json_match.group(1)[:500]}")
-                            result = {
-                                "correctedCode": code,
-                                "changes": [{"description": "No se pudieron procesar los cambios correctamente", "lineNumbers": [1]}],
-                                "explanation": "Error al procesar la respuesta de OpenAI."
-                            }
-                    else:
-                        logging.error(f"No se encontró formato JSON en la respuesta de OpenAI: {response_text[:500]}")
-                        result = {
-                            "correctedCode": code,
-                            "changes": [{"description": "No se encontró formato JSON en la respuesta", "lineNumbers": [1]}],
-                            "explanation": "OpenAI no respondió en el formato esperado. Intente de nuevo o use otro modelo."
-                        }
+        # Procesar con el modelo seleccionado
+        if model == 'openai' and app.config['API_KEYS'].get('openai'):
+            try:
+                def generate_openai_correction():
+                    client = get_openai_client(app.config['API_KEYS'].get('openai'))
+                    get_rate_limiter().acquire('openai', estimate_tokens(
+                        correction_system_prompt, correction_prompt, max_output_tokens=4096))
+                    response = client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=[
+                            {"role": "system", "content": correction_system_prompt},
+                            {"role": "user", "content": correction_prompt}
+                        ],
+                        temperature=0.1
+                    )
+                    return response.choices[0].message.content.strip()
+
+                response_text = response_cache.get_or_generate(
+                    correction_system_prompt, correction_prompt, 'openai:gpt-4o', 0.1,
+                    generate_openai_correction, cache_nondeterministic=True, validate=_is_json_reply
+                )
+                result = extract_json_object(response_text)
+                if result is None:
+                    logging.error(f"No se encontró formato JSON en la respuesta de OpenAI: {response_text[:500]}")
+                    result = {
+                        "correctedCode": code,
+                        "changes": [{"description": "No se encontró formato JSON en la respuesta", "lineNumbers": [1]}],
+                        "explanation": "OpenAI no respondió en el formato esperado. Intente de nuevo o use otro modelo."
+                    }
 
                 logging.info("Código corregido con OpenAI")
 
@@ -739,57 +937,33 @@ def process_code():
 
         elif model == 'anthropic' and app.config['API_KEYS'].get('anthropic'):
             try:
-                import anthropic
-                from anthropic import Anthropic
-
-                client = Anthropic(api_key=app.config['API_KEYS'].get('anthropic'))
-
-                response = client.messages.create(
-                    model="claude-3-5-sonnet-latest",
-                    messages=[
-                        {"role": "system", "content": "Eres un experto programador especializado en corregir código."},
-                        {"role": "user", "content": f"""Corrige el siguiente código en {language} según las instrucciones proporcionadas.
-
-                CÓDIGO:
-                ```{language}
-                {code}
-                ```
-
-                INSTRUCCIONES:
-                {instructions}
+                def generate_anthropic_correction():
+                    client = get_anthropic_client(app.config['API_KEYS'].get('anthropic'))
+                    get_rate_limiter().acquire('anthropic', estimate_tokens(
+                        correction_system_prompt, correction_prompt, max_output_tokens=4096))
+                    response = client.messages.create(
+                        model="claude-3-5-sonnet-latest",
+                        system=correction_system_prompt,
+                        messages=[
+                            {"role": "user", "content": correction_prompt}
+                        ],
+                        max_tokens=4096,
+                        temperature=0.1
+                    )
+                    return response.content[0].text.strip()
 
-                Responde en formato JSON con las siguientes claves:
-                - correctedCode: el código corregido completo
-                - changes: una lista de objetos, cada uno con 'description' y 'lineNumbers'
-                - explanation: una explicación detallada de los cambios
-                """}
-                    ],
-                    temperature=0.1
+                response_text = response_cache.get_or_generate(
+                    correction_system_prompt, correction_prompt, 'anthropic:claude-3-5-sonnet-latest', 0.1,
+                    generate_anthropic_correction, cache_nondeterministic=True, validate=_is_json_reply
                 )
-
-                response_text = response.content[0].text.strip()
-                try:
-                    result = json.loads(response_text)
-                except json.JSONDecodeError:
-                    # Intenta extraer JSON de la respuesta si está envuelto en bloques de código
-                    json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', response_text, re.DOTALL)
-                    if json_match:
-                        try:
-                            result = json.loads(json_match.group(1).strip())
-                        except json.JSONDecodeError:
-                            logging.error(f"Error al decodificar JSON extraído de Anthropic: {json_match.group(1)[:500]}")
-                            result = {
-                                "correctedCode": code,
-                                "changes": [{"description": "No se pudieron procesar los cambios correctamente", "lineNumbers": [1]}],
-                                "explanation": "Error al procesar la respuesta de Claude."
-                            }
-                    else:
-                        logging.error(f"No se encontró formato JSON en la respuesta de Anthropic: {response_text[:500]}")
-                        result = {
-                            "correctedCode": code,
-                            "changes": [{"description": "No se encontró formato JSON en la respuesta", "lineNumbers": [1]}],
-                            "explanation": "Claude no respondió en el formato esperado. Intente de nuevo o use otro modelo."
-                        }
+                result = extract_json_object(response_text)
+                if result is None:
+                    logging.error(f"No se encontró formato JSON en la respuesta de Anthropic: {response_text[:500]}")
+                    result = {
+                        "correctedCode": code,
+                        "changes": [{"description": "No se encontró formato JSON en la respuesta", "lineNumbers": [1]}],
+                        "explanation": "Claude no respondió en el formato esperado. Intente de nuevo o use otro modelo."
+                    }
 
                 logging.info("Código corregido con Anthropic")
 
@@ -802,17 +976,15 @@ def process_code():
 
         elif model == 'gemini' and app.config['API_KEYS'].get('gemini'):
             try:
-                # Asegúrate de que Gemini está configurado correctamente
-                genai.configure(api_key=app.config['API_KEYS'].get('gemini'))
-
-                gemini_model = genai.GenerativeModel(
-                    model_name='gemini-1.5-pro',
+                gemini_model = get_gemini_model(
+                    'gemini-1.5-pro',
                     generation_config={
                         'temperature': 0.2,
                         'top_p': 0.9,
                         'top_k': 40,
                         'max_output_tokens': 4096,
-                    }
+                    },
+                    api_key=app.config['API_KEYS'].get('gemini')
                 )
 
                 prompt = f"""Eres un experto programador. Tu tarea es corregir el siguiente código en {language} según las instrucciones proporcionadas.
@@ -831,33 +1003,24 @@ def process_code():
                 - explanation: una explicación detallada de los cambios
                 """
 
-                response = gemini_model.generate_content(prompt)
-                response_text = response.text
+                def generate_gemini_correction():
+                    get_rate_limiter().acquire('gemini', estimate_tokens(prompt, max_output_tokens=4096))
+                    return gemini_model.generate_content(prompt).text
 
-                # Intentar extraer JSON de la respuesta
-                try:
-                    # Primero intenta encontrar un bloque JSON
-                    json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-                    if json_match:
-                        result = json.loads(json_match.group(1).strip())
-                    else:
-                        # Si no hay bloque JSON, busca cualquier objeto JSON en la respuesta
-                        json_match = re.search(r'({.*})', response_text, re.DOTALL)
-                        if json_match:
-                            result = json.loads(json_match.group(0))
-                        else:
-                            logging.error(f"No se encontró formato JSON en la respuesta de Gemini: {response_text[:500]}")
-                            result = {
-                                "correctedCode": code,
-                                "changes": [],
-                                "explanation": "No se pudo procesar correctamente la respuesta del modelo."
-                            }
-                except json.JSONDecodeError as json_err:
-                    logging.error(f"Error al decodificar JSON de Gemini: {str(json_err)}")
+                response_text = response_cache.get_or_generate(
+                    '', prompt, 'gemini:gemini-1.5-pro', 0.2,
+                    generate_gemini_correction,
+                    cache_nondeterministic=True,
+                    validate=_is_json_reply
+                )
+
+                result = extract_json_object(response_text)
+                if result is None:
+                    logging.error(f"No se encontró formato JSON en la respuesta de Gemini: {response_text[:500]}")
                     result = {
                         "correctedCode": code,
                         "changes": [],
-                        "explanation": f"Error al procesar la respuesta JSON: {str(json_err)}"
+                        "explanation": "No se pudo procesar correctamente la respuesta del modelo."
                     }
 
                 logging.info("Código corregido con Gemini")
@@ -927,7 +1090,8 @@ def developer_assistant():
         # Process using available API
         if model == 'openai' and app.config['API_KEYS'].get('openai'):
             try:
-                client = openai.OpenAI(api_key=app.config['API_KEYS'].get('openai'))
+                client = get_openai_client(app.config['API_KEYS'].get('openai'))
+                get_rate_limiter().acquire('openai', estimate_tokens(str(context), query, max_output_tokens=2000))
                 completion = client.chat.completions.create(
                     model="gpt-4o",
                     messages=[
@@ -952,8 +1116,8 @@ def developer_assistant():
                 }), 500
         elif model == 'anthropic' and app.config['API_KEYS'].get('anthropic'):
             try:
-                import anthropic
-                client = anthropic.Anthropic(api_key=app.config['API_KEYS'].get('anthropic'))
+                client = get_anthropic_client(app.config['API_KEYS'].get('anthropic'))
+                get_rate_limiter().acquire('anthropic', estimate_tokens(str(context), query, max_output_tokens=2000))
                 completion = client.messages.create(
                     model="claude-3-5-sonnet-latest",
                     max_tokens=2000,
@@ -976,10 +1140,8 @@ def developer_assistant():
                 }), 500
         elif model == 'gemini' and app.config['API_KEYS'].get('gemini'):
             try:
-                # Make sure Gemini is configured properly
-                genai.configure(api_key=app.config['API_KEYS'].get('gemini'))
-
-                gemini_model = genai.GenerativeModel('gemini-1.5-pro')
+                gemini_model = get_gemini_model('gemini-1.5-pro', api_key=app.config['API_KEYS'].get('gemini'))
+                get_rate_limiter().acquire('gemini', estimate_tokens(str(context), query))
                 gemini_response = gemini_model.generate_content(f"Context: {context}\n\nQuery: {query}")
                 response = gemini_response.text
 
@@ -1054,21 +1216,11 @@ def process_natural_command():
 
         try:
             workspace_dir = get_user_workspace(user_id)
-            current_dir = os.getcwd()
-            os.chdir(workspace_dir)
-
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-
-            os.chdir(current_dir)
+            result = get_command_service().run(
+                user_id, command_stream.run_command, command, workspace_dir, timeout=5)
 
-            command_output = result.stdout if result.returncode == 0 else result.stderr
-            command_success = result.returncode == 0
+            command_output = result['stdout'] if result['success'] else result['stderr']
+            command_success = result['success']
 
         except Exception as cmd_error:
             logging.error(f"Error al ejecutar comando: {str(cmd_error)}")
@@ -1257,6 +1409,11 @@ def health_check():
             "apis": apis,
             "chat_api_available": any_api_available,
             "available_models": [key for key, value in api_keys.items() if value],
+            "llm_cache": get_response_cache().stats(),
+            "provider_health": get_health_monitor().snapshot(),
+            "rate_limits": get_rate_limiter().stats(),
+            "workspace_maintenance": get_workspace_maintenance().stats(),
+            "command_service": get_command_service().stats(),
             "debug_info": {
                 "python_version": sys.version,
                 "endpoints_active": [
@@ -1306,30 +1463,29 @@ def list_files_api():
 
         files = []
         try:
-            for item in os.listdir(full_directory):
-                item_path = os.path.join(full_directory, item)
+            entries = list_directory(user_workspace, relative_dir)
+            for entry in entries or []:
+                item = entry['name']
                 relative_path = os.path.join(relative_dir, item) if relative_dir != '.' else item
 
-                extension = os.path.splitext(item)[1].lower()[1:] if os.path.isfile(item_path) and '.' in item else ''
-
-                if os.path.isdir(item_path):
+                if entry['is_dir']:
                     files.append({
                         'name': item,
                         'path': relative_path,
                         'type': 'directory',
                         'size': 0,
-                        'modified': os.path.getmtime(item_path),
+                        'total_size': entry['total_size'],
+                        'modified': entry['modified'],
                         'extension': ''
                     })
                 else:
-                    file_size = os.path.getsize(item_path)
                     files.append({
                         'name': item,
                         'path': relative_path,
                         'type': 'file',
-                        'size': file_size,
-                        'modified': os.path.getmtime(item_path),
-                        'extension': extension
+                        'size': entry['size'],
+                        'modified': entry['modified'],
+                        'extension': os.path.splitext(item)[1].lower()[1:] if '.' in item else ''
                     })
         except Exception as e:
             logging.error(f"Error al listar archivos: {str(e)}")
@@ -1350,6 +1506,75 @@ def list_files_api():
             'error': str(e)
         }), 500
 
+@app.route('/api/workspace/usage', methods=['GET'])
+def workspace_usage_api():
+    """API con el uso de disco del workspace del usuario y sus cuotas."""
+    try:
+        user_id = request.args.get('user_id', 'default')
+        maintenance = get_workspace_maintenance()
+        usage = maintenance.usage(get_user_workspace(user_id))
+
+        return jsonify({
+            'success': True,
+            'user_id': user_id,
+            'usage': usage,
+            'soft_quota': maintenance.soft_quota,
+            'hard_quota': maintenance.hard_quota,
+            'over_soft_quota': bool(maintenance.soft_quota) and usage > maintenance.soft_quota,
+            'over_hard_quota': bool(maintenance.hard_quota) and usage > maintenance.hard_quota
+        })
+    except Exception as e:
+        logging.error(f"Error al calcular el uso del workspace: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/commands/metrics', methods=['GET'])
+def command_metrics_api():
+    """API con las métricas del servicio de comandos: colas, ejecución y tiempos."""
+    return jsonify({
+        'success': True,
+        'metrics': get_command_service().stats()
+    })
+
+@app.route('/api/search', methods=['GET'])
+def search_files_api():
+    """API de búsqueda de texto, expresiones regulares o símbolos en el workspace del usuario."""
+    try:
+        query = request.args.get('q', '')
+        user_id = request.args.get('user_id', 'default')
+        directory = request.args.get('directory', '').replace('..', '').strip('/')
+
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': 'Se requiere un texto de búsqueda'
+            }), 400
+
+        user_workspace = get_user_workspace(user_id)
+        result = search_index.search_workspace(
+            user_workspace, query,
+            mode=request.args.get('mode', 'text'),
+            case_sensitive=request.args.get('case_sensitive') in ('1', 'true'),
+            path_prefix=directory,
+            offset=request.args.get('offset', 0),
+            limit=request.args.get('limit', 50)
+        )
+
+        return jsonify(dict(result, success=True, query=query))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logging.error(f"Error en búsqueda de archivos: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/files/read', methods=['GET'])
 def read_file():
     """API para leer el contenido de un archivo en el workspace del usuario."""
@@ -1392,12 +1617,8 @@ def read_file():
                     'file_url': f'/api/files/download?file_path={file_path}&user_id={user_id}'
                 })
 
-            with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-
-            return jsonify({
+            return file_read_response(full_path, {
                 'success': True,
-                'content': content,
                 'file_path': file_path,
                 'is_binary': False
             })
@@ -1454,14 +1675,21 @@ def create_file():
                 os.makedirs(full_path, exist_ok=True)
                 message = f'Directorio {file_path} creado exitosamente'
             else:
+                try:
+                    get_workspace_maintenance().check_write(user_workspace, len(content.encode('utf-8')))
+                except QuotaExceededError as e:
+                    return quota_exceeded_response(e)
+
                 parent_dir = os.path.dirname(full_path)
                 if parent_dir and not os.path.exists(parent_dir):
                     os.makedirs(parent_dir, exist_ok=True)
 
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                # Atómica: no trunca un inodo compartido con el almacén de blobs
+                write_file_atomic(full_path, content)
 
                 message = f'Archivo {file_path} creado exitosamente'
+            sync_path(user_workspace, full_path)
+            search_index.sync_path(user_workspace, full_path)
 
             return jsonify({
                 'success': True,
@@ -1522,6 +1750,8 @@ def delete_file():
             else:
                 os.remove(full_path)
                 message = f'Archivo {file_path} eliminado exitosamente'
+            sync_path(user_workspace, full_path)
+            search_index.sync_path(user_workspace, full_path)
 
             return jsonify({
                 'success': True,
@@ -1677,25 +1907,54 @@ def handle_execute_command(data):
         return
 
     file_system_manager = FileSystemManager(socketio)
-    result = file_system_manager.execute_command(
-        command=command,
-        user_id=user_id,
-        notify=True,
-        terminal_id=terminal_id
-    )
-
-    emit('command_result', {
-        'output': result.get('output', ''),
-        'success': result.get('success', False),
-        'command': command,
-        'terminal_id': terminal_id
-    }, room=terminal_id)
-
-    socketio.emit('file_sync', {
-        'refresh': True,
-        'user_id': user_id,
-        'command': command
-    }, room=user_id)
+    sid = request.sid
+
+    def send_error(message):
+        socketio.emit('command_result', {
+            'output': f'Error: {message}',
+            'success': False,
+            'command': command,
+            'terminal_id': terminal_id
+        }, room=terminal_id)
+
+    def run_job():
+        if data.get('stream'):
+            # Salida por fragmentos (command_output) mientras el comando se ejecuta
+            result = stream_command_events(
+                lambda event, payload: socketio.emit(event, payload, room=sid),
+                command, file_system_manager.get_user_workspace(user_id), terminal_id, data)
+            socketio.emit('command_result', {
+                'output': result['stdout'] if result['success'] else result['stderr'],
+                'success': result['success'],
+                'command': command,
+                'terminal_id': terminal_id,
+                'command_id': result['command_id'],
+                'streamed': True,
+                'truncated': result['truncated']
+            }, room=terminal_id)
+        else:
+            result = file_system_manager.execute_command(
+                command=command,
+                user_id=user_id,
+                notify=True,
+                terminal_id=terminal_id
+            )
+
+            socketio.emit('command_result', {
+                'output': result.get('output', ''),
+                'success': result.get('success', False),
+                'command': command,
+                'terminal_id': terminal_id
+            }, room=terminal_id)
+
+        socketio.emit('file_sync', {
+            'refresh': True,
+            'user_id': user_id,
+            'command': command
+        }, room=user_id)
+
+    # El comando espera turno en el pool de comandos; este hilo queda libre
+    submit_command(user_id, run_job, send_error)
 
 
 @socketio.on('user_message')
@@ -1722,6 +1981,32 @@ def handle_user_message(data):
             'context': data.get('context', [])
         }
 
+        if data.get('stream'):
+            chunk_index = {'value': 0}
+
+            def emit_chunk(text):
+                emit('assistant_chunk', {
+                    'chunk': text,
+                    'index': chunk_index['value'],
+                    'agent': agent_id,
+                    'model': model,
+                    'terminal_id': terminal_id
+                })
+                chunk_index['value'] += 1
+
+            result = handle_chat_internal(request_data, on_chunk=emit_chunk)
+
+            emit('agent_response', {
+                'response': result.get('response', ''),
+                'agent': agent_id,
+                'model': model,
+                'error': result.get('error', None),
+                'terminal_id': terminal_id,
+                'streamed': True,
+                'chunks': chunk_index['value']
+            })
+            return
+
         try:
             if model == 'openai' and app.config['API_KEYS'].get('openai'):
                 messages = [
@@ -1729,7 +2014,9 @@ def handle_user_message(data):
                     {"role": "user", "content": user_message}
                 ]
 
-                client = openai.OpenAI(api_key=app.config['API_KEYS'].get('openai'))
+                client = get_openai_client(app.config['API_KEYS'].get('openai'))
+                get_rate_limiter().acquire('openai', estimate_tokens(
+                    *[m['content'] for m in messages], max_output_tokens=2000))
                 completion = client.chat.completions.create(
                     model="gpt-4o",
                     messages=messages,
@@ -1790,6 +2077,14 @@ if __name__ == '__main__':
         except Exception as watcher_error:
             logging.warning(f"No se pudo iniciar el observador de archivos: {str(watcher_error)}")
 
+        # Cuotas y limpieza periódica de user_workspaces/; los comandos de las
+        # terminales también cuentan como acceso y se limitan a la cuota restante
+        maintenance = get_workspace_maintenance()
+        command_stream.set_spawn_guard(maintenance.before_spawn)
+        maintenance.add_busy_probe(command_stream.active_workspaces)
+        maintenance.start()
+        logging.info("Servicio de mantenimiento de workspaces iniciado")
+
         logging.info("Servidor listo para recibir conexiones en puerto 5000")
 
         try:
@@ -0,0 +1,222 @@
+"""
+Circuit breaker y puntuación de salud por proveedor de IA.
+
+Cada proveedor (openai, anthropic, gemini) tiene un circuito con tres
+estados: cerrado (tráfico normal), abierto (se omite el proveedor hasta que
+expire el enfriamiento) y semiabierto (se deja pasar una única petición de
+prueba). Además se mantiene una ventana deslizante de latencias y errores
+con la que se calcula una puntuación para reordenar los proveedores.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Configuración por variables de entorno
+FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', '5'))
+ERROR_RATE_THRESHOLD = float(os.environ.get('LLM_CIRCUIT_ERROR_RATE', '0.5'))
+OPEN_SECONDS = float(os.environ.get('LLM_CIRCUIT_OPEN_SECONDS', '30'))
+MAX_OPEN_SECONDS = float(os.environ.get('LLM_CIRCUIT_MAX_OPEN_SECONDS', '600'))
+WINDOW_SECONDS = float(os.environ.get('LLM_HEALTH_WINDOW_SECONDS', '300'))
+WINDOW_MAX_SAMPLES = int(os.environ.get('LLM_HEALTH_WINDOW_SAMPLES', '200'))
+MIN_SAMPLES = int(os.environ.get('LLM_HEALTH_MIN_SAMPLES', '10'))
+LATENCY_REFERENCE = float(os.environ.get('LLM_HEALTH_LATENCY_REFERENCE', '10'))
+PREFERENCE_BONUS = float(os.environ.get('LLM_HEALTH_PREFERENCE_BONUS', '1.5'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderHealth:
+    """Estado del circuito y métricas recientes de un proveedor."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.open_seconds = OPEN_SECONDS
+        self.probe_started_at = None
+        self.last_error = None
+        self.samples = deque(maxlen=WINDOW_MAX_SAMPLES)  # (timestamp, ok, latency)
+
+    def _prune(self, now):
+        while self.samples and now - self.samples[0][0] > WINDOW_SECONDS:
+            self.samples.popleft()
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        failures = sum(1 for _, ok, _ in self.samples if not ok)
+        return failures / len(self.samples)
+
+    def latency_percentile(self, percentile, min_samples=MIN_SAMPLES):
+        latencies = sorted(latency for _, ok, latency in self.samples if ok)
+        if len(latencies) < min_samples:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile * (len(latencies) - 1))))
+        return latencies[index]
+
+    def score(self):
+        """Puntuación entre 0 y 1: penaliza la tasa de error y la latencia p95."""
+        if self.state == OPEN:
+            return 0.0
+        p95 = self.latency_percentile(0.95, min_samples=1)
+        latency_factor = 1.0 / (1.0 + (p95 or 0.0) / LATENCY_REFERENCE)
+        return round((1.0 - self.error_rate()) * latency_factor, 4)
+
+
+class HealthMonitor:
+    """Registro de salud de todos los proveedores, seguro entre hilos."""
+
+    def __init__(self):
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider):
+        health = self._providers.get(provider)
+        if health is None:
+            health = self._providers[provider] = ProviderHealth(provider)
+        return health
+
+    def allow_request(self, provider):
+        """
+        Indica si se puede enviar una petición al proveedor.
+
+        Con el circuito abierto devuelve False hasta que termine el
+        enfriamiento; entonces pasa a semiabierto y autoriza una única
+        petición de prueba cuyo resultado decide si el circuito se cierra.
+        """
+        now = time.time()
+        with self._lock:
+            health = self._get(provider)
+            if health.state == CLOSED:
+                return True
+
+            if health.state == OPEN:
+                if now - health.opened_at < health.open_seconds:
+                    return False
+                health.state = HALF_OPEN
+                health.probe_started_at = None
+                logger.info(f"Circuito de {provider} semiabierto, enviando petición de prueba")
+
+            # Semiabierto: una sola prueba en vuelo; si se pierde, se libera al expirar
+            if health.probe_started_at is not None and now - health.probe_started_at < OPEN_SECONDS:
+                return False
+            health.probe_started_at = now
+            return True
+
+    def record_success(self, provider, latency):
+        now = time.time()
+        with self._lock:
+            health = self._get(provider)
+            health._prune(now)
+            health.samples.append((now, True, latency))
+            health.consecutive_failures = 0
+            if health.state != CLOSED:
+                logger.info(f"Circuito de {provider} cerrado tras una petición correcta")
+            health.state = CLOSED
+            health.opened_at = None
+            health.open_seconds = OPEN_SECONDS
+            health.probe_started_at = None
+
+    def record_failure(self, provider, latency, error=None):
+        now = time.time()
+        with self._lock:
+            health = self._get(provider)
+            health._prune(now)
+            health.samples.append((now, False, latency))
+            health.consecutive_failures += 1
+            health.last_error = str(error)[:200] if error is not None else None
+
+            if health.state == HALF_OPEN:
+                # La prueba falló: reabrir con enfriamiento exponencial
+                self._open(health, now, min(health.open_seconds * 2, MAX_OPEN_SECONDS))
+            elif health.state == CLOSED:
+                too_many_failures = health.consecutive_failures >= FAILURE_THRESHOLD
+                high_error_rate = (len(health.samples) >= MIN_SAMPLES
+                                   and health.error_rate() >= ERROR_RATE_THRESHOLD)
+                if too_many_failures or high_error_rate:
+                    self._open(health, now, OPEN_SECONDS)
+
+    def _open(self, health, now, open_seconds):
+        health.state = OPEN
+        health.opened_at = now
+        health.open_seconds = open_seconds
+        health.probe_started_at = None
+        logger.warning(f"Circuito de {health.name} abierto durante {open_seconds:.0f}s "
+                       f"(fallos consecutivos: {health.consecutive_failures}, "
+                       f"tasa de error: {health.error_rate():.2f})")
+
+    def is_open(self, provider):
+        with self._lock:
+            health = self._get(provider)
+            return health.state == OPEN and time.time() - health.opened_at < health.open_seconds
+
+    def latency_percentile(self, provider, percentile=0.95, min_samples=MIN_SAMPLES):
+        """Percentil de latencia de las peticiones correctas, o None sin muestras suficientes."""
+        with self._lock:
+            health = self._get(provider)
+            health._prune(time.time())
+            return health.latency_percentile(percentile, min_samples)
+
+    def rank(self, providers, preferred=None):
+        """
+        Ordena los proveedores por puntuación de salud.
+
+        El proveedor preferido recibe un margen (PREFERENCE_BONUS) para que
+        solo pierda el primer puesto cuando otro está claramente más sano.
+        Los proveedores con el circuito abierto quedan al final.
+        """
+        now = time.time()
+        with self._lock:
+            scores = {}
+            for provider in providers:
+                health = self._get(provider)
+                health._prune(now)
+                score = health.score()
+                if provider == preferred:
+                    score *= PREFERENCE_BONUS
+                scores[provider] = score
+        return sorted(providers, key=lambda p: -scores[p])
+
+    def snapshot(self):
+        """Estado de todos los proveedores para /api/health."""
+        now = time.time()
+        data = {}
+        with self._lock:
+            for name, health in self._providers.items():
+                health._prune(now)
+                p50 = health.latency_percentile(0.5, min_samples=1)
+                p95 = health.latency_percentile(0.95, min_samples=1)
+                retry_in = None
+                if health.state == OPEN:
+                    retry_in = round(max(0.0, health.open_seconds - (now - health.opened_at)), 1)
+                data[name] = {
+                    'state': health.state,
+                    'score': health.score(),
+                    'error_rate': round(health.error_rate(), 3),
+                    'latency_p50': round(p50, 3) if p50 is not None else None,
+                    'latency_p95': round(p95, 3) if p95 is not None else None,
+                    'samples': len(health.samples),
+                    'consecutive_failures': health.consecutive_failures,
+                    'retry_in': retry_in,
+                    'last_error': health.last_error
+                }
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._providers.clear()
+
+
+_health_monitor = HealthMonitor()
+
+
+def get_health_monitor():
+    """Obtiene el monitor global de salud de proveedores."""
+    return _health_monitor
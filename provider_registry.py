@@ -0,0 +1,217 @@
+"""
+Registro compartido de clientes de proveedores de IA para Codestorm Assistant.
+
+Mantiene un único cliente de larga duración por proveedor y clave API, con
+pools HTTP keep-alive configurados, para que las peticiones reutilicen las
+conexiones TLS en lugar de construir un cliente nuevo en cada llamada.
+Todos los accesos son seguros entre hilos.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Parámetros del pool HTTP compartido por los clientes de OpenAI y Anthropic
+HTTP_MAX_CONNECTIONS = int(os.environ.get('LLM_HTTP_MAX_CONNECTIONS', '50'))
+HTTP_MAX_KEEPALIVE = int(os.environ.get('LLM_HTTP_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_TIMEOUT = float(os.environ.get('LLM_HTTP_TIMEOUT', '120'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('LLM_HTTP_CONNECT_TIMEOUT', '10'))
+
+ENV_KEYS = {
+    'openai': 'OPENAI_API_KEY',
+    'anthropic': 'ANTHROPIC_API_KEY',
+    'gemini': 'GEMINI_API_KEY'
+}
+
+_lock = threading.RLock()
+_openai_clients = {}
+_anthropic_clients = {}
+_gemini_models = {}
+_gemini_api_key = None
+
+
+def get_api_key(provider):
+    """Obtiene la clave API de un proveedor desde las variables de entorno."""
+    env_var = ENV_KEYS.get(provider)
+    return os.environ.get(env_var) if env_var else None
+
+
+def _build_http_client():
+    """Crea un cliente httpx con pool keep-alive para los SDK de IA."""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    )
+
+
+def get_openai_client(api_key=None):
+    """
+    Devuelve el cliente compartido de OpenAI para la clave indicada.
+
+    Args:
+        api_key: Clave API; por defecto OPENAI_API_KEY
+
+    Returns:
+        openai.OpenAI o None si no hay clave configurada
+    """
+    api_key = api_key or get_api_key('openai')
+    if not api_key:
+        return None
+
+    client = _openai_clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            import openai
+
+            client = openai.OpenAI(api_key=api_key, http_client=_build_http_client())
+            _openai_clients[api_key] = client
+            logger.info("Cliente compartido de OpenAI inicializado")
+    return client
+
+
+def get_anthropic_client(api_key=None):
+    """
+    Devuelve el cliente compartido de Anthropic para la clave indicada.
+
+    Args:
+        api_key: Clave API; por defecto ANTHROPIC_API_KEY
+
+    Returns:
+        anthropic.Anthropic o None si no hay clave configurada
+    """
+    api_key = api_key or get_api_key('anthropic')
+    if not api_key:
+        return None
+
+    client = _anthropic_clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _anthropic_clients.get(api_key)
+        if client is None:
+            import anthropic
+
+            client = anthropic.Anthropic(api_key=api_key, http_client=_build_http_client())
+            _anthropic_clients[api_key] = client
+            logger.info("Cliente compartido de Anthropic inicializado")
+    return client
+
+
+def configure_gemini(api_key=None):
+    """
+    Configura la biblioteca de Gemini una sola vez por clave.
+
+    Args:
+        api_key: Clave API; por defecto GEMINI_API_KEY
+
+    Returns:
+        bool: True si Gemini quedó configurado
+    """
+    global _gemini_api_key
+    api_key = api_key or get_api_key('gemini')
+    if not api_key:
+        return False
+
+    if _gemini_api_key == api_key:
+        return True
+
+    with _lock:
+        if _gemini_api_key != api_key:
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            _gemini_api_key = api_key
+            _gemini_models.clear()
+            logger.info("Gemini configurado en el registro de proveedores")
+    return True
+
+
+def get_gemini_model(model_name='gemini-1.5-pro', generation_config=None, api_key=None):
+    """
+    Devuelve un GenerativeModel de Gemini reutilizable.
+
+    Args:
+        model_name: Nombre del modelo de Gemini
+        generation_config: Configuración de generación (dict)
+        api_key: Clave API; por defecto GEMINI_API_KEY
+
+    Returns:
+        genai.GenerativeModel o None si Gemini no está configurado
+    """
+    if not configure_gemini(api_key):
+        return None
+
+    cache_key = (model_name, tuple(sorted((generation_config or {}).items())))
+    model = _gemini_models.get(cache_key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _gemini_models.get(cache_key)
+        if model is None:
+            import google.generativeai as genai
+
+            if generation_config:
+                model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+            else:
+                model = genai.GenerativeModel(model_name)
+            _gemini_models[cache_key] = model
+    return model
+
+
+def discard_client(provider, api_key):
+    """
+    Cierra y descarta el cliente cacheado de una clave, p. ej. cuando la
+    validación de la clave falla: una clave inválida no debe quedar en el
+    registro ni reutilizarse en peticiones posteriores.
+    """
+    global _gemini_api_key
+    if not api_key:
+        return
+    with _lock:
+        if provider == 'gemini':
+            if _gemini_api_key == api_key:
+                _gemini_api_key = None
+                _gemini_models.clear()
+            return
+        clients = {'openai': _openai_clients, 'anthropic': _anthropic_clients}.get(provider)
+        client = clients.pop(api_key, None) if clients is not None else None
+    if client is not None:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Error cerrando cliente de IA: {str(e)}")
+        logger.info(f"Cliente de {provider} descartado por clave inválida")
+
+
+def is_provider_configured(provider):
+    """Indica si hay una clave API disponible para el proveedor."""
+    return bool(get_api_key(provider))
+
+
+def reset_clients():
+    """Cierra y descarta todos los clientes (p. ej. tras recargar claves API)."""
+    global _gemini_api_key
+    with _lock:
+        for client in list(_openai_clients.values()) + list(_anthropic_clients.values()):
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug(f"Error cerrando cliente de IA: {str(e)}")
+        _openai_clients.clear()
+        _anthropic_clients.clear()
+        _gemini_models.clear()
+        _gemini_api_key = None
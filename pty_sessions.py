@@ -0,0 +1,388 @@
+"""
+Sesiones de shell persistentes sobre un PTY para la terminal xterm.
+
+Cada terminal (usuario + terminal_id) tiene un único shell de larga duración
+conectado a un pseudo-terminal: el coste de arrancar el shell se paga una vez,
+cd y las variables de entorno se conservan entre comandos y la salida llega
+al cliente en cuanto se produce, tecla a tecla. La entrada y la salida se
+multiplexan por Socket.IO: la salida se emite a la sala de la sesión, de modo
+que varias pestañas pueden compartir la misma terminal, y un búfer de
+scrollback permite reanudarla tras recargar la página.
+
+Las sesiones sin clientes conectados se cierran tras PTY_IDLE_TIMEOUT segundos
+sin actividad.
+
+Un shell interactivo no pasa por la política de comandos ni por el pool de
+command_service: lo que se teclea llega tal cual al shell. Por eso las
+sesiones están desactivadas por defecto (PTY_ENABLED) y, al activarlas, el
+shell solo se abre confinado:
+
+- PTY_RUN_AS_USER: usuario sin privilegios con el que se ejecuta el shell
+  (necesita permiso de escritura en los workspaces), y/o
+- PTY_SANDBOX_COMMAND: prefijo que encierra el shell en un espacio de nombres
+  con solo el workspace visible, por ejemplo
+  "bwrap --unshare-all --die-with-parent --ro-bind /usr /usr --symlink usr/bin /bin
+  --symlink usr/lib /lib --symlink usr/lib64 /lib64 --dev /dev --proc /proc
+  --bind {workspace} {workspace} --chdir {workspace}".
+
+Además, el shell y sus hijos arrancan con los mismos límites de recursos que
+los comandos del pool (command_stream.RESOURCE_LIMITS), con el tamaño máximo
+de archivo que permite la cuota restante del workspace (spawn_limits) y, con
+un usuario propio, con un máximo de procesos (PTY_RLIMIT_PROCESSES).
+"""
+import os
+import pty
+import pwd
+import time
+import uuid
+import fcntl
+import codecs
+import shlex
+import signal
+import struct
+import logging
+import resource
+import termios
+import threading
+import subprocess
+
+from command_stream import workspace_env, limit_resources, spawn_limits
+
+logger = logging.getLogger(__name__)
+
+PTY_SHELL = os.environ.get('PTY_SHELL') or ('/bin/bash' if os.path.exists('/bin/bash') else '/bin/sh')
+IDLE_TIMEOUT = float(os.environ.get('PTY_IDLE_TIMEOUT', '600'))
+REAP_INTERVAL = float(os.environ.get('PTY_REAP_INTERVAL', '30'))
+MAX_SESSIONS = int(os.environ.get('PTY_MAX_SESSIONS', '64'))
+MAX_SESSIONS_PER_USER = int(os.environ.get('PTY_MAX_SESSIONS_PER_USER', '2'))
+SCROLLBACK_CHARS = int(os.environ.get('PTY_SCROLLBACK_CHARS', str(64 * 1024)))
+READ_SIZE = 64 * 1024
+
+PTY_ENABLED = os.environ.get('PTY_ENABLED', '0').lower() in ('1', 'true', 'yes')
+RUN_AS_USER = os.environ.get('PTY_RUN_AS_USER', '')
+SANDBOX_COMMAND = os.environ.get('PTY_SANDBOX_COMMAND', '')
+RLIMIT_PROCESSES = int(os.environ.get('PTY_RLIMIT_PROCESSES', '64'))
+
+
+class SessionLimitError(Exception):
+    """Se alcanzó el máximo de sesiones de terminal."""
+
+
+class PtyUnavailableError(Exception):
+    """Las sesiones de shell están desactivadas o no hay forma de confinarlas."""
+
+
+def _run_as_user():
+    """(uid, gid) de PTY_RUN_AS_USER, o None si no se configuró."""
+    if not RUN_AS_USER:
+        return None
+    try:
+        entry = pwd.getpwnam(RUN_AS_USER)
+    except KeyError:
+        raise PtyUnavailableError(f"El usuario de las terminales '{RUN_AS_USER}' no existe")
+    if entry.pw_uid == 0:
+        raise PtyUnavailableError("PTY_RUN_AS_USER no puede ser root")
+    return entry.pw_uid, entry.pw_gid
+
+
+def shell_command(workspace_path):
+    """
+    Argumentos para lanzar el shell confinado de un workspace.
+
+    Raises:
+        PtyUnavailableError: Si las sesiones están desactivadas o no hay
+            usuario sin privilegios ni sandbox configurados
+    """
+    if not PTY_ENABLED:
+        raise PtyUnavailableError("El shell interactivo está desactivado; los comandos se ejecutan de uno en uno")
+    if not RUN_AS_USER and not SANDBOX_COMMAND:
+        raise PtyUnavailableError("El shell interactivo requiere PTY_RUN_AS_USER o PTY_SANDBOX_COMMAND")
+    workspace = os.path.abspath(str(workspace_path))
+    prefix = [arg.replace('{workspace}', workspace) for arg in shlex.split(SANDBOX_COMMAND)]
+    return prefix + [PTY_SHELL]
+
+
+def session_room(session_id):
+    """Sala de Socket.IO de una sesión de terminal."""
+    return f"pty_{session_id}"
+
+
+def _shell_env(workspace_path):
+    return workspace_env(workspace_path, {
+        'TERM': 'xterm-256color',
+        'SHELL': PTY_SHELL,
+        'PS1': r'\w $ '
+    })
+
+
+def _make_preexec(credentials, max_file_bytes=None):
+    """Función que prepara el hijo antes de exec: terminal de control, límites y usuario."""
+    def preexec():
+        # Tras setsid: el PTY pasa a ser su terminal de control (Ctrl+C, jobs)
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+        limit_resources(max_file_bytes)
+        if credentials is not None:
+            uid, gid = credentials
+            if RLIMIT_PROCESSES > 0:
+                # RLIMIT_NPROC cuenta por usuario: solo tiene sentido con un usuario propio
+                resource.setrlimit(resource.RLIMIT_NPROC, (RLIMIT_PROCESSES, RLIMIT_PROCESSES))
+            os.setgroups([])
+            os.setgid(gid)
+            os.setuid(uid)
+    return preexec
+
+
+class PtySession:
+    """Shell conectado a un PTY con un hilo lector que reenvía su salida."""
+
+    def __init__(self, user_id, terminal_id, workspace_path, on_output, on_exit, rows=24, cols=80):
+        self.session_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.terminal_id = terminal_id
+        self.workspace_path = str(workspace_path)
+        self.clients = set()
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+        self.exit_code = None
+        self._on_output = on_output
+        self._on_exit = on_exit
+        self._scrollback = []
+        self._scrollback_size = 0
+        self._lock = threading.Lock()
+
+        argv = shell_command(self.workspace_path)
+        credentials = _run_as_user()
+        # Tope de tamaño de archivo según la cuota restante, fijado al abrir el shell
+        max_file_bytes = spawn_limits(self.workspace_path)
+        master_fd, slave_fd = pty.openpty()
+        try:
+            self._set_size(master_fd, rows, cols)
+            self.process = subprocess.Popen(
+                argv,
+                stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                cwd=self.workspace_path,
+                env=_shell_env(self.workspace_path),
+                start_new_session=True,
+                preexec_fn=_make_preexec(credentials, max_file_bytes),
+                close_fds=True
+            )
+        except BaseException:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+        self.master_fd = master_fd
+        self._reader = threading.Thread(target=self._read_loop, name=f'pty-{self.session_id[:8]}', daemon=True)
+        self._reader.start()
+
+    @staticmethod
+    def _set_size(fd, rows, cols):
+        fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('HHHH', int(rows), int(cols), 0, 0))
+
+    @property
+    def alive(self):
+        return self.exit_code is None
+
+    def _read_loop(self):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            try:
+                data = os.read(self.master_fd, READ_SIZE)
+            except OSError:
+                # EIO: el shell terminó y se cerró el lado esclavo
+                data = b''
+            if not data:
+                break
+            text = decoder.decode(data)
+            if not text:
+                continue
+            with self._lock:
+                self.last_activity = time.monotonic()
+                self._scrollback.append(text)
+                self._scrollback_size += len(text)
+                while self._scrollback_size > SCROLLBACK_CHARS and len(self._scrollback) > 1:
+                    self._scrollback_size -= len(self._scrollback.pop(0))
+            try:
+                self._on_output(self, text)
+            except Exception as e:
+                logger.error(f"Error enviando la salida de la terminal {self.session_id}: {str(e)}")
+
+        try:
+            self.exit_code = self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.exit_code = self.process.wait()
+        try:
+            os.close(self.master_fd)
+        except OSError:
+            pass
+        try:
+            self._on_exit(self)
+        except Exception as e:
+            logger.error(f"Error notificando el cierre de la terminal {self.session_id}: {str(e)}")
+
+    def scrollback(self):
+        """Salida reciente de la sesión, para repintar la terminal al reconectar."""
+        with self._lock:
+            return ''.join(self._scrollback)
+
+    def write(self, data):
+        if not self.alive:
+            return
+        self.last_activity = time.monotonic()
+        payload = data.encode('utf-8') if isinstance(data, str) else data
+        while payload:
+            written = os.write(self.master_fd, payload)
+            payload = payload[written:]
+
+    def resize(self, rows, cols):
+        if self.alive:
+            self._set_size(self.master_fd, rows, cols)
+
+    def close(self):
+        """Termina el shell y sus procesos hijos (todo su grupo de procesos)."""
+        if not self.alive:
+            return
+        for sig in (signal.SIGHUP, signal.SIGKILL):
+            try:
+                os.killpg(self.process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                break
+            try:
+                self.process.wait(timeout=2)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        self._reader.join(timeout=5)
+
+
+class PtySessionManager:
+    """
+    Registro de sesiones de terminal.
+
+    Args:
+        emit: Función (evento, payload, sala) para enviar a los clientes
+    """
+
+    def __init__(self, emit, idle_timeout=IDLE_TIMEOUT, reap_interval=REAP_INTERVAL):
+        self.emit = emit
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self._sessions = {}        # session_id -> PtySession
+        self._by_terminal = {}     # (user_id, terminal_id) -> session_id
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def _on_output(self, session, text):
+        self.emit('pty_output', {'session_id': session.session_id, 'data': text},
+                  session_room(session.session_id))
+
+    def _on_exit(self, session):
+        with self._lock:
+            self._sessions.pop(session.session_id, None)
+            if self._by_terminal.get((session.user_id, session.terminal_id)) == session.session_id:
+                del self._by_terminal[(session.user_id, session.terminal_id)]
+        self.emit('pty_exit', {'session_id': session.session_id, 'exit_code': session.exit_code},
+                  session_room(session.session_id))
+        logger.info(f"Terminal {session.session_id} de {session.user_id} cerrada (código {session.exit_code})")
+
+    def open(self, user_id, terminal_id, workspace_path, client_id, rows=24, cols=80):
+        """
+        Devuelve la sesión de una terminal, creándola si no existe, y le asocia el cliente.
+
+        Returns:
+            tuple: (PtySession, True si se creó ahora)
+
+        Raises:
+            SessionLimitError: Si se alcanzó el máximo de sesiones
+            PtyUnavailableError: Si el shell no se puede abrir confinado
+        """
+        with self._lock:
+            session_id = self._by_terminal.get((user_id, terminal_id))
+            session = self._sessions.get(session_id) if session_id else None
+            created = session is None or not session.alive
+            if created:
+                if len(self._sessions) >= MAX_SESSIONS:
+                    raise SessionLimitError("Se alcanzó el máximo de terminales del servidor")
+                if sum(1 for s in self._sessions.values() if s.user_id == user_id) >= MAX_SESSIONS_PER_USER:
+                    raise SessionLimitError("Se alcanzó el máximo de terminales abiertas para este usuario")
+                session = PtySession(user_id, terminal_id, workspace_path,
+                                     self._on_output, self._on_exit, rows, cols)
+                self._sessions[session.session_id] = session
+                self._by_terminal[(user_id, terminal_id)] = session.session_id
+                logger.info(f"Terminal {session.session_id} abierta para {user_id} ({terminal_id})")
+            session.clients.add(client_id)
+        if not created:
+            session.resize(rows, cols)
+        return session, created
+
+    def get(self, session_id, client_id=None):
+        """Sesión activa por id; con client_id, solo si ese cliente está asociado."""
+        session = self._sessions.get(session_id)
+        if session is None or not session.alive:
+            return None
+        if client_id is not None and client_id not in session.clients:
+            return None
+        return session
+
+    def workspaces(self):
+        """Workspaces con alguna sesión de terminal viva."""
+        with self._lock:
+            return {session.workspace_path for session in self._sessions.values() if session.alive}
+
+    def detach(self, client_id, session_id=None):
+        """Desasocia un cliente de una sesión (o de todas); la sesión sigue viva."""
+        with self._lock:
+            sessions = [self._sessions[session_id]] if session_id in self._sessions else \
+                ([] if session_id else list(self._sessions.values()))
+            for session in sessions:
+                session.clients.discard(client_id)
+                if not session.clients:
+                    # Cuenta la inactividad desde que se fue el último cliente
+                    session.last_activity = time.monotonic()
+
+    def close(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.close()
+
+    def reap(self):
+        """Cierra las sesiones sin clientes e inactivas más de idle_timeout."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [s for s in self._sessions.values()
+                    if not s.clients and now - s.last_activity > self.idle_timeout]
+        for session in idle:
+            logger.info(f"Cerrando terminal inactiva {session.session_id} de {session.user_id}")
+            session.close()
+        return len(idle)
+
+    def _run_reaper(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Error cerrando terminales inactivas: {str(e)}")
+
+    def start(self):
+        with self._lock:
+            if self._reaper is None:
+                self._stop.clear()
+                self._reaper = threading.Thread(target=self._run_reaper, name='pty-reaper', daemon=True)
+                self._reaper.start()
+        return self
+
+    def shutdown(self):
+        self._stop.set()
+        for session in list(self._sessions.values()):
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'sessions': len(sessions),
+            'attached': sum(1 for s in sessions if s.clients),
+            'users': len({s.user_id for s in sessions})
+        }
@@ -0,0 +1,361 @@
+"""
+Limitador de tasa por proveedor de IA para Codestorm Assistant.
+
+Cada proveedor tiene dos token buckets: uno de peticiones por minuto y otro
+de tokens por minuto. Las peticiones que no caben esperan en una cola de
+prioridad acotada, de modo que el chat interactivo adelanta a los trabajos
+en segundo plano del constructor. Los buckets pueden vivir en memoria
+(un solo proceso) o en SQLite para compartirlos entre workers.
+"""
+import os
+import time
+import heapq
+import sqlite3
+import logging
+import itertools
+import threading
+import contextlib
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Prioridades: un número menor se atiende antes
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Configuración por variables de entorno
+RATE_LIMIT_ENABLED = os.environ.get('LLM_RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+RATE_LIMIT_BACKEND = os.environ.get('LLM_RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_PATH = os.environ.get('LLM_RATE_LIMIT_PATH', os.path.join('instance', 'rate_limits.db'))
+QUEUE_MAX_WAITING = int(os.environ.get('LLM_QUEUE_MAX_WAITING', '100'))
+QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '60'))
+OUTPUT_TOKEN_ESTIMATE = int(os.environ.get('LLM_OUTPUT_TOKEN_ESTIMATE', '1000'))
+
+# Límites por defecto (peticiones y tokens por minuto); 0 desactiva el límite
+DEFAULT_LIMITS = {
+    'openai': {'rpm': 500, 'tpm': 30000},
+    'anthropic': {'rpm': 50, 'tpm': 40000},
+    'gemini': {'rpm': 60, 'tpm': 32000}
+}
+
+_request_priority = contextvars.ContextVar('llm_request_priority', default=PRIORITY_INTERACTIVE)
+
+
+class RateLimitError(Exception):
+    """No se pudo obtener cupo del proveedor."""
+
+
+class RateLimitQueueFull(RateLimitError):
+    """La cola de espera del proveedor está llena."""
+
+
+class RateLimitTimeout(RateLimitError):
+    """Se agotó el tiempo de espera en la cola."""
+
+
+def get_request_priority():
+    """Prioridad de las peticiones de IA del contexto actual."""
+    return _request_priority.get()
+
+
+def set_request_priority(priority):
+    """Fija la prioridad del contexto actual (p. ej. al inicio de un hilo de fondo)."""
+    return _request_priority.set(priority)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Context manager que aplica una prioridad a las peticiones de IA del bloque."""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def estimate_tokens(*texts, max_output_tokens=OUTPUT_TOKEN_ESTIMATE):
+    """
+    Estimación aproximada de los tokens de una petición (≈4 caracteres por token).
+
+    Args:
+        *texts: Textos enviados al modelo (prompts, contexto)
+        max_output_tokens: Tokens de salida previstos
+
+    Returns:
+        int: Tokens estimados de entrada más salida
+    """
+    characters = sum(len(str(text)) for text in texts if text)
+    return characters // 4 + max_output_tokens
+
+
+def load_limits(provider):
+    """Lee los límites de un proveedor, permitiendo sobrescribirlos por entorno."""
+    defaults = DEFAULT_LIMITS.get(provider, {'rpm': 0, 'tpm': 0})
+    prefix = f"LLM_RATE_LIMIT_{provider.upper()}"
+    return {
+        'rpm': int(os.environ.get(f"{prefix}_RPM", defaults['rpm'])),
+        'tpm': int(os.environ.get(f"{prefix}_TPM", defaults['tpm']))
+    }
+
+
+class MemoryBucketStore:
+    """Buckets en memoria del proceso."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, requests):
+        """
+        Consume de varios buckets a la vez, solo si todos tienen saldo.
+
+        Args:
+            requests: Lista de (clave, capacidad, ritmo por segundo, cantidad)
+
+        Returns:
+            float: 0 si se consumió; si no, segundos hasta que haya saldo
+        """
+        now = time.time()
+        with self._lock:
+            wait = 0.0
+            levels = {}
+            for key, capacity, rate, amount in requests:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels[key] = tokens
+                if tokens < amount:
+                    wait = max(wait, (amount - tokens) / rate)
+            if wait > 0:
+                return wait
+            for key, capacity, rate, amount in requests:
+                self._buckets[key] = (levels[key] - amount, now)
+            return 0.0
+
+    def drain(self, key, capacity, rate, seconds):
+        """Vacía un bucket para que no tenga saldo durante los próximos segundos."""
+        with self._lock:
+            self._buckets[key] = (-rate * seconds, time.time())
+
+
+class SQLiteBucketStore:
+    """Buckets en SQLite, compartidos entre los workers de la máquina."""
+
+    name = 'sqlite'
+
+    def __init__(self, path=RATE_LIMIT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_buckets ('
+                ' key TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+
+    def consume(self, requests):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE serializa la lectura y escritura entre procesos
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                wait = 0.0
+                levels = {}
+                for key, capacity, rate, amount in requests:
+                    row = self._conn.execute(
+                        'SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)
+                    ).fetchone()
+                    tokens, updated = row if row else (capacity, now)
+                    tokens = min(capacity, tokens + (now - updated) * rate)
+                    levels[key] = tokens
+                    if tokens < amount:
+                        wait = max(wait, (amount - tokens) / rate)
+                if wait <= 0:
+                    for key, capacity, rate, amount in requests:
+                        self._conn.execute(
+                            'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at)'
+                            ' VALUES (?, ?, ?)',
+                            (key, levels[key] - amount, now)
+                        )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return wait
+
+    def drain(self, key, capacity, rate, seconds):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, -rate * seconds, time.time())
+            )
+
+
+class RateLimiter:
+    """Limitador por proveedor con cola de prioridad acotada."""
+
+    def __init__(self, store=None, max_waiting=QUEUE_MAX_WAITING, enabled=True):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.max_waiting = max_waiting
+        self.enabled = enabled
+        self._limits = {}
+        self._waiters = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {}
+
+    def get_limits(self, provider):
+        limits = self._limits.get(provider)
+        if limits is None:
+            limits = self._limits[provider] = load_limits(provider)
+        return limits
+
+    def set_limits(self, provider, rpm=None, tpm=None):
+        limits = dict(self.get_limits(provider))
+        if rpm is not None:
+            limits['rpm'] = rpm
+        if tpm is not None:
+            limits['tpm'] = tpm
+        self._limits[provider] = limits
+
+    def _bucket_requests(self, provider, tokens):
+        limits = self.get_limits(provider)
+        requests = []
+        if limits['rpm'] > 0:
+            requests.append((f"{provider}:requests", limits['rpm'], limits['rpm'] / 60.0, 1))
+        if limits['tpm'] > 0:
+            # Una petición mayor que la capacidad nunca cabría: se limita a la capacidad
+            amount = min(max(tokens, 0), limits['tpm'])
+            requests.append((f"{provider}:tokens", limits['tpm'], limits['tpm'] / 60.0, amount))
+        return requests
+
+    def _provider_stats(self, provider):
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = {
+                'granted': 0, 'queued': 0, 'timeouts': 0, 'rejected': 0, 'wait_seconds': 0.0
+            }
+        return stats
+
+    def acquire(self, provider, tokens=0, priority=None, timeout=QUEUE_TIMEOUT):
+        """
+        Espera hasta obtener cupo para una petición al proveedor.
+
+        Args:
+            provider: Proveedor de IA (openai, anthropic, gemini)
+            tokens: Tokens estimados de la petición (ver estimate_tokens)
+            priority: Prioridad; por defecto la del contexto actual
+            timeout: Segundos máximos de espera en la cola
+
+        Returns:
+            float: Segundos esperados
+
+        Raises:
+            RateLimitQueueFull: Si la cola está llena
+            RateLimitTimeout: Si no se obtuvo cupo a tiempo
+        """
+        if not self.enabled:
+            return 0.0
+        requests = self._bucket_requests(provider, tokens)
+        if not requests:
+            return 0.0
+
+        priority = get_request_priority() if priority is None else priority
+        start = time.time()
+        deadline = start + timeout
+        entry = (priority, next(self._sequence))
+
+        with self._cond:
+            stats = self._provider_stats(provider)
+            if sum(len(w) for w in self._waiters.values()) >= self.max_waiting:
+                stats['rejected'] += 1
+                raise RateLimitQueueFull(f"Cola de peticiones a {provider} llena")
+            waiters = self._waiters.setdefault(provider, [])
+            heapq.heappush(waiters, entry)
+
+            try:
+                queued = False
+                while True:
+                    if waiters[0] == entry:
+                        wait = self.store.consume(requests)
+                        if wait <= 0:
+                            heapq.heappop(waiters)
+                            self._cond.notify_all()
+                            waited = time.time() - start
+                            stats['granted'] += 1
+                            stats['wait_seconds'] += waited
+                            return waited
+                    else:
+                        # Solo la cabeza de la cola consume; el resto espera a ser avisado
+                        wait = 1.0
+
+                    if not queued:
+                        queued = True
+                        stats['queued'] += 1
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        stats['timeouts'] += 1
+                        raise RateLimitTimeout(
+                            f"Tiempo de espera agotado para {provider} tras {timeout:.0f}s"
+                        )
+                    self._cond.wait(min(wait, remaining))
+            except BaseException:
+                if entry in waiters:
+                    waiters.remove(entry)
+                    heapq.heapify(waiters)
+                    self._cond.notify_all()
+                raise
+
+    def penalize(self, provider, seconds):
+        """
+        Bloquea el proveedor tras un error 429 para que todas las peticiones
+        en cola esperen juntas en lugar de reintentar cada una por su cuenta.
+        """
+        if not self.enabled:
+            return
+        limits = self.get_limits(provider)
+        if limits['rpm'] > 0:
+            self.store.drain(f"{provider}:requests", limits['rpm'], limits['rpm'] / 60.0, seconds)
+        elif limits['tpm'] > 0:
+            self.store.drain(f"{provider}:tokens", limits['tpm'], limits['tpm'] / 60.0, seconds)
+        logger.warning(f"Proveedor {provider} limitado durante {seconds:.1f}s tras un error de cuota")
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        """Límites, tamaño de cola y contadores por proveedor."""
+        with self._cond:
+            data = {}
+            for provider in set(self._stats) | set(self._limits):
+                stats = dict(self._provider_stats(provider))
+                stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+                stats['waiting'] = len(self._waiters.get(provider, []))
+                stats['limits'] = self.get_limits(provider)
+                data[provider] = stats
+        return {'enabled': self.enabled, 'backend': self.store.name, 'providers': data}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Obtiene el limitador global de peticiones a los proveedores de IA."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                store = None
+                if RATE_LIMIT_BACKEND == 'sqlite':
+                    try:
+                        store = SQLiteBucketStore()
+                    except Exception as e:
+                        logger.warning(f"Limitador SQLite no disponible, usando memoria: {str(e)}")
+                _rate_limiter = RateLimiter(store=store, enabled=RATE_LIMIT_ENABLED)
+    return _rate_limiter
@@ -0,0 +1,581 @@
+"""
+Búsqueda de texto y de símbolos en los workspaces.
+
+Cada workspace tiene un índice invertido de trigramas (secuencias de tres
+caracteres del contenido en minúsculas) que reduce una búsqueda a los archivos
+que pueden contener la cadena buscada; solo esos archivos se leen para
+confirmar las coincidencias. Las expresiones regulares se prefiltran con los
+literales que toda coincidencia debe contener. Además se indexan los símbolos
+(funciones, clases y métodos) con ast para Python y con expresiones regulares
+para JavaScript/TypeScript.
+
+Las expresiones regulares del usuario se ejecutan con el módulo re, que no se
+puede interrumpir: se rechazan los cuantificadores anidados (p. ej. (a+)+),
+origen del backtracking catastrófico, y la búsqueda se corta al superar
+SEARCH_REGEX_TIMEOUT segundos (la respuesta indica timed_out).
+
+El observador de watchdog (main.watch_workspace_files) marca las rutas
+modificadas y se reindexan en la siguiente búsqueda. Como el índice de
+metadatos (workspace_index), solo se usa mientras el observador está activo;
+sin él, la búsqueda recorre el workspace directamente.
+"""
+import os
+import re
+import ast
+import time
+import bisect
+import logging
+import threading
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_BYTES = int(os.environ.get('SEARCH_MAX_FILE_BYTES', str(512 * 1024)))
+MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', '200'))
+MAX_LINE_LENGTH = 300
+REGEX_TIMEOUT = float(os.environ.get('SEARCH_REGEX_TIMEOUT', '2.0'))
+
+# Directorios que no se indexan (dependencias, artefactos y control de versiones)
+SKIP_DIRS = {'node_modules', '__pycache__', 'venv', 'env', 'dist', 'build', 'site-packages'}
+
+PYTHON_EXTENSIONS = {'.py', '.pyw'}
+JS_EXTENSIONS = {'.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx'}
+
+_JS_SYMBOL_PATTERNS = [
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)', re.M),
+     'function'),
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)', re.M),
+     'class'),
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?'
+                r'(?:function\b|\([^)\n]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)', re.M),
+     'function'),
+]
+_PY_SYMBOL_PATTERN = re.compile(r'^([ \t]*)(?:async\s+)?(def|class)\s+([A-Za-z_]\w*)', re.M)
+
+
+def trigrams(text):
+    """Conjunto de trigramas de un texto (ya en minúsculas)."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _line_number(line_starts, position):
+    return bisect.bisect_right(line_starts, position)
+
+
+def _line_starts(text):
+    starts = [0]
+    position = text.find('\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = text.find('\n', position + 1)
+    return starts
+
+
+def extract_symbols(rel_path, text):
+    """
+    Símbolos definidos en un archivo.
+
+    Returns:
+        list: Tuplas (nombre, tipo, línea) con tipo 'function', 'class' o 'method'
+    """
+    extension = os.path.splitext(rel_path)[1].lower()
+    if extension in PYTHON_EXTENSIONS:
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            # Archivo a medio editar: aproximar con expresiones regulares
+            starts = _line_starts(text)
+            return [(match.group(3), 'class' if match.group(2) == 'class' else
+                     ('method' if match.group(1) else 'function'),
+                     _line_number(starts, match.start()))
+                    for match in _PY_SYMBOL_PATTERN.finditer(text)]
+
+        symbols = []
+        stack = [(node, False) for node in reversed(tree.body)]
+        while stack:
+            node, in_class = stack.pop()
+            if isinstance(node, ast.ClassDef):
+                symbols.append((node.name, 'class', node.lineno))
+                stack.extend((child, True) for child in reversed(node.body))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                symbols.append((node.name, 'method' if in_class else 'function', node.lineno))
+                stack.extend((child, False) for child in reversed(node.body))
+        return symbols
+
+    if extension in JS_EXTENSIONS:
+        starts = _line_starts(text)
+        symbols = []
+        for pattern, kind in _JS_SYMBOL_PATTERNS:
+            for match in pattern.finditer(text):
+                symbols.append((match.group(1), kind, _line_number(starts, match.start(1))))
+        symbols.sort(key=lambda symbol: symbol[2])
+        return symbols
+
+    return []
+
+
+def _required_literals(parsed):
+    """Cadenas literales que toda coincidencia de una expresión regular debe contener."""
+    literals = []
+    current = []
+    for op, value in parsed:
+        if op == sre_parse.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            literals.append(''.join(current))
+            current = []
+        if op == sre_parse.SUBPATTERN:
+            # Grupo sin alternativas: sus literales también son obligatorios
+            literals.extend(_required_literals(value[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            literals.extend(_required_literals(value[2]))
+    if current:
+        literals.append(''.join(current))
+    return literals
+
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def _has_nested_repeat(parsed, in_repeat=False):
+    """Indica si una expresión tiene un cuantificador repetido dentro de otro."""
+    for op, value in parsed:
+        if op in _REPEATS:
+            repeats = value[1] > 1
+            if repeats and in_repeat:
+                return True
+            if _has_nested_repeat(value[2], in_repeat or repeats):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            if _has_nested_repeat(value[-1], in_repeat):
+                return True
+        elif op == sre_parse.BRANCH:
+            if any(_has_nested_repeat(branch, in_repeat) for branch in value[1]):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if _has_nested_repeat(value[1], in_repeat):
+                return True
+    return False
+
+
+def compile_search_regex(query, case_sensitive=False):
+    """
+    Compila la expresión regular de una búsqueda.
+
+    Raises:
+        ValueError: Si no es válida o tiene cuantificadores anidados
+    """
+    try:
+        parsed = sre_parse.parse(query)
+        pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Expresión regular no válida: {str(e)}")
+    if _has_nested_repeat(parsed):
+        raise ValueError("Expresión regular no permitida: los cuantificadores anidados, "
+                         "como (a+)+, pueden bloquear la búsqueda")
+    return pattern
+
+
+def query_trigrams(query, mode):
+    """
+    Trigramas que debe contener un archivo para coincidir con la búsqueda.
+
+    Returns:
+        set: Trigramas (vacío si la búsqueda no permite prefiltrar)
+    """
+    if mode == 'regex':
+        try:
+            literals = _required_literals(sre_parse.parse(query))
+        except Exception:
+            return set()
+        required = set()
+        for literal in literals:
+            required |= trigrams(literal.lower())
+        return required
+    return trigrams(query.lower())
+
+
+def _walk_files(root, rel_dir=''):
+    """Rutas relativas de los archivos indexables bajo un directorio."""
+    stack = [os.path.join(root, rel_dir) if rel_dir else root]
+    while stack:
+        directory = stack.pop()
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            continue
+        with iterator:
+            for entry in iterator:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield os.path.relpath(entry.path, root)
+                except OSError:
+                    continue
+
+
+def _is_skipped(rel_path, is_dir=False):
+    """Indica si una ruta queda fuera del índice (oculta o dentro de SKIP_DIRS)."""
+    parts = rel_path.split(os.sep)
+    directories = parts if is_dir else parts[:-1]
+    return any(part.startswith('.') for part in parts) or any(part in SKIP_DIRS for part in directories)
+
+
+def _read_indexable(path):
+    """Contenido de texto de un archivo, o None si es binario o demasiado grande."""
+    try:
+        st = os.stat(path)
+        if st.st_size > MAX_FILE_BYTES:
+            return None, st
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None, None
+    if b'\0' in data[:8192]:
+        return None, st
+    return data.decode('utf-8', errors='replace'), st
+
+
+class _Document:
+    __slots__ = ('mtime_ns', 'size', 'trigrams', 'symbols')
+
+    def __init__(self, st, grams, symbols):
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.trigrams = grams
+        self.symbols = symbols
+
+
+class WorkspaceSearchIndex:
+    """Índice de trigramas y de símbolos de un workspace."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self._documents = None   # ruta relativa -> _Document
+        self._postings = {}      # trigrama -> conjunto de rutas relativas
+        self._dirty = set()
+
+    def _build(self):
+        self._documents = {}
+        self._postings = {}
+        self._dirty = set()
+        for rel_path in _walk_files(self.root):
+            self._index_file(rel_path)
+        logger.debug(f"Índice de búsqueda construido: {self.root} ({len(self._documents)} archivos)")
+
+    def _ensure(self):
+        if self._documents is None:
+            self._build()
+        elif self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            for rel_path in sorted(dirty):
+                self._refresh(rel_path)
+
+    def _index_file(self, rel_path):
+        text, st = _read_indexable(os.path.join(self.root, rel_path))
+        if text is None:
+            return
+        grams = frozenset(trigrams(text.lower()))
+        document = _Document(st, grams, extract_symbols(rel_path, text))
+        self._documents[rel_path] = document
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = set()
+            posting.add(rel_path)
+
+    def _remove_file(self, rel_path):
+        document = self._documents.pop(rel_path, None)
+        if document is None:
+            return
+        for gram in document.trigrams:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(rel_path)
+                if not posting:
+                    del self._postings[gram]
+
+    def _refresh(self, rel_path):
+        """Sincroniza con el disco una ruta (archivo o directorio completo)."""
+        path = os.path.join(self.root, rel_path)
+        prefix = rel_path + os.sep
+        if os.path.isdir(path) and not os.path.islink(path):
+            if _is_skipped(rel_path, is_dir=True):
+                return
+            existing = {p for p in self._documents if p.startswith(prefix)}
+            current = set(_walk_files(self.root, rel_path))
+            for stale in existing - current:
+                self._remove_file(stale)
+            for candidate in current:
+                self._refresh_file(candidate)
+            return
+        # Archivo, o directorio eliminado: descartar también su contenido
+        for stale in [p for p in self._documents if p.startswith(prefix)]:
+            self._remove_file(stale)
+        self._refresh_file(rel_path)
+
+    def _refresh_file(self, rel_path):
+        try:
+            st = os.stat(os.path.join(self.root, rel_path))
+        except OSError:
+            self._remove_file(rel_path)
+            return
+        document = self._documents.get(rel_path)
+        if document is not None and document.mtime_ns == st.st_mtime_ns and document.size == st.st_size:
+            return
+        self._remove_file(rel_path)
+        if not _is_skipped(rel_path):
+            self._index_file(rel_path)
+
+    def mark_dirty(self, rel_path):
+        """Marca una ruta para reindexarla antes de la siguiente búsqueda."""
+        rel_path = os.path.normpath(rel_path)
+        if rel_path == '.' or rel_path.startswith('..'):
+            return
+        with self._lock:
+            if self._documents is not None:
+                self._dirty.add(rel_path)
+
+    def invalidate(self):
+        """Descarta el índice; se reconstruye en la siguiente búsqueda."""
+        with self._lock:
+            self._documents = None
+            self._postings = {}
+            self._dirty = set()
+
+    def candidates(self, required, path_prefix=''):
+        """Rutas ordenadas de los archivos que contienen todos los trigramas requeridos."""
+        with self._lock:
+            self._ensure()
+            if required:
+                postings = []
+                for gram in required:
+                    posting = self._postings.get(gram)
+                    if not posting:
+                        return []
+                    postings.append(posting)
+                postings.sort(key=len)
+                paths = set(postings[0])
+                for posting in postings[1:]:
+                    paths &= posting
+                    if not paths:
+                        return []
+            else:
+                paths = set(self._documents)
+        return sorted(p for p in paths if not path_prefix or p == path_prefix or p.startswith(path_prefix + os.sep))
+
+    def symbols(self, path_prefix=''):
+        """Símbolos indexados como tuplas (ruta, nombre, tipo, línea) ordenadas por ruta."""
+        with self._lock:
+            self._ensure()
+            items = sorted(self._documents.items())
+        for rel_path, document in items:
+            if path_prefix and rel_path != path_prefix and not rel_path.startswith(path_prefix + os.sep):
+                continue
+            for name, kind, line in document.symbols:
+                yield rel_path, name, kind, line
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._documents is not None,
+                'files': len(self._documents or {}),
+                'trigrams': len(self._postings),
+                'pending': len(self._dirty)
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_watching = threading.Event()
+
+
+def set_watching(active):
+    """Indica si el observador de archivos está activo; sin él los índices se descartan."""
+    with _indexes_lock:
+        if active:
+            _watching.set()
+        else:
+            _watching.clear()
+            _indexes.clear()
+
+
+def get_search_index(workspace_path):
+    """Devuelve el índice de búsqueda de un workspace, o None si no hay observador."""
+    if not _watching.is_set():
+        return None
+    root = os.path.abspath(workspace_path)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = WorkspaceSearchIndex(root)
+        return index
+
+
+def sync_path(workspace_path, rel_path):
+    """
+    Marca para reindexar una ruta escrita o borrada por la propia aplicación,
+    sin esperar al evento del observador.
+
+    Args:
+        workspace_path: Raíz del workspace
+        rel_path: Ruta modificada, relativa a la raíz o absoluta dentro de ella
+    """
+    root = os.path.abspath(workspace_path)
+    with _indexes_lock:
+        index = _indexes.get(root)
+    if index is not None:
+        index.mark_dirty(os.path.relpath(os.path.join(root, rel_path), root))
+
+
+def handle_fs_event(src_path, dest_path=None):
+    """Marca para reindexar las rutas de un evento del observador."""
+    with _indexes_lock:
+        if not _indexes:
+            return
+        indexes = dict(_indexes)
+    for path in (src_path, dest_path):
+        if not path:
+            continue
+        path = os.path.abspath(path)
+        candidate = os.path.dirname(path)
+        while True:
+            index = indexes.get(candidate)
+            if index is not None:
+                index.mark_dirty(os.path.relpath(path, candidate))
+                break
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+
+
+def _match_lines(path, matcher, skip, limit, deadline=None):
+    """
+    Líneas coincidentes de un archivo: (omitidas, [(línea, columna, texto)], tiempo agotado).
+    """
+    text, _ = _read_indexable(path)
+    if text is None:
+        return skip, [], False
+    matches = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if deadline is not None and time.monotonic() > deadline:
+            return skip, matches, True
+        column = matcher(line)
+        if column < 0:
+            continue
+        if skip:
+            skip -= 1
+            continue
+        matches.append((number, column + 1, line[:MAX_LINE_LENGTH]))
+        if len(matches) >= limit:
+            break
+    return skip, matches, False
+
+
+def search_workspace(workspace_path, query, mode='text', case_sensitive=False, path_prefix='',
+                     offset=0, limit=50):
+    """
+    Busca en los archivos de un workspace.
+
+    Args:
+        workspace_path: Raíz del workspace
+        query: Texto, expresión regular o nombre de símbolo
+        mode: 'text', 'regex' o 'symbol'
+        case_sensitive: Distinguir mayúsculas y minúsculas
+        path_prefix: Limitar la búsqueda a un subdirectorio (relativo)
+        offset, limit: Paginación sobre las coincidencias
+
+    Returns:
+        dict: results, offset, next_offset (None si no hay más), indexed y
+            timed_out (la expresión regular agotó SEARCH_REGEX_TIMEOUT)
+
+    Raises:
+        ValueError: Si el modo o la expresión regular no son válidos
+    """
+    if mode not in ('text', 'regex', 'symbol'):
+        raise ValueError(f"Modo de búsqueda no válido: {mode}")
+    if not query:
+        raise ValueError("Se requiere un texto de búsqueda")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+    root = os.path.abspath(workspace_path)
+    path_prefix = os.path.normpath(path_prefix).lstrip(os.sep) if path_prefix else ''
+    if path_prefix in ('.', ''):
+        path_prefix = ''
+    index = get_search_index(root)
+
+    results = []
+    # Se busca una coincidencia más de las pedidas para saber si hay otra página
+    wanted = limit + 1
+    timed_out = False
+
+    if mode == 'symbol':
+        needle = query if case_sensitive else query.lower()
+        if index is not None:
+            symbols = index.symbols(path_prefix)
+        else:
+            symbols = ((rel_path, name, kind, line)
+                       for rel_path in sorted(_walk_files(root, path_prefix))
+                       for text in [_read_indexable(os.path.join(root, rel_path))[0]] if text is not None
+                       for name, kind, line in extract_symbols(rel_path, text))
+        skip = offset
+        for rel_path, name, kind, line in symbols:
+            if needle not in (name if case_sensitive else name.lower()):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            results.append({'path': rel_path, 'name': name, 'kind': kind, 'line': line})
+            if len(results) >= wanted:
+                break
+    else:
+        deadline = None
+        if mode == 'regex':
+            pattern = compile_search_regex(query, case_sensitive)
+            deadline = time.monotonic() + REGEX_TIMEOUT
+
+            def matcher(line):
+                match = pattern.search(line)
+                return match.start() if match else -1
+        elif case_sensitive:
+            def matcher(line):
+                return line.find(query)
+        else:
+            needle = query.lower()
+
+            def matcher(line):
+                return line.lower().find(needle)
+
+        if index is not None:
+            paths = index.candidates(query_trigrams(query, mode), path_prefix)
+        else:
+            paths = sorted(_walk_files(root, path_prefix))
+
+        skip = offset
+        for rel_path in paths:
+            skip, matches, timed_out = _match_lines(os.path.join(root, rel_path), matcher, skip,
+                                                    wanted - len(results), deadline)
+            for line, column, text in matches:
+                results.append({'path': rel_path, 'line': line, 'column': column, 'text': text})
+            if len(results) >= wanted or timed_out:
+                break
+
+    has_more = len(results) > limit
+    return {
+        'results': results[:limit],
+        'offset': offset,
+        'next_offset': offset + limit if has_more else None,
+        'indexed': index is not None,
+        'timed_out': timed_out
+    }
@@ -178,6 +178,9 @@ window.initializeChat = function() {
     // Verificar modelos disponibles
     checkAvailableModels();
 
+    // Conectar el socket de respuestas en streaming (si no conecta, se usa /api/chat)
+    getChatSocket();
+
     // Inicializar características avanzadas
     setupDocumentFeatures();
 
@@ -236,6 +239,15 @@ async function sendMessage() {
         context: contextToSend
     };
 
+    // Con Socket.IO la respuesta se muestra a medida que llega
+    if (sendStreamingMessage(requestData)) {
+        if (sendButton) {
+            sendButton.disabled = false;
+            sendButton.style.opacity = '1';
+        }
+        return;
+    }
+
     // Mostrar indicador de carga
     showLoadingIndicator();
 
@@ -287,6 +299,115 @@ async function sendMessage() {
     }
 }
 
+/**
+ * Obtiene el socket del chat, creándolo la primera vez
+ * @returns {object|null} - El socket conectado o null si Socket.IO no está disponible
+ */
+function getChatSocket() {
+    if (typeof io !== 'function') return null;
+
+    if (!window.app.chat.socket) {
+        const socket = io();
+        window.app.chat.socket = socket;
+        window.app.chat.streams = {};
+
+        // Fragmentos de la respuesta: se añaden al mensaje en curso
+        socket.on('assistant_chunk', function(data) {
+            const stream = window.app.chat.streams[data.terminal_id];
+            if (!stream) return;
+
+            if (stream.loading) {
+                removeLoadingIndicator();
+                stream.loading = false;
+            }
+            stream.text += data.chunk;
+            const content = document.querySelector(`#${stream.messageId} .message-content`);
+            if (content) {
+                content.innerHTML = formatMessage(stream.text);
+            }
+            scrollToBottom();
+        });
+
+        // Respuesta completa: sustituye al mensaje en curso
+        socket.on('agent_response', function(data) {
+            const stream = window.app.chat.streams[data.terminal_id];
+            if (!stream) return;
+            delete window.app.chat.streams[data.terminal_id];
+
+            if (stream.loading) {
+                removeLoadingIndicator();
+            }
+            const element = document.getElementById(stream.messageId);
+            if (element) {
+                element.remove();
+            }
+
+            if (data.error && !data.response) {
+                addSystemMessage(`Error: ${escapeHtml(data.error)}`);
+            } else {
+                addAgentMessage(data.response || stream.text, data.agent || stream.agentId);
+            }
+        });
+
+        socket.on('disconnect', function() {
+            // Las respuestas en curso no llegarán: se muestra lo recibido
+            Object.keys(window.app.chat.streams).forEach(function(streamId) {
+                const stream = window.app.chat.streams[streamId];
+                if (stream.loading) {
+                    removeLoadingIndicator();
+                }
+                if (!stream.text) {
+                    const element = document.getElementById(stream.messageId);
+                    if (element) element.remove();
+                    addSystemMessage('Error de conexión: se perdió la conexión con el servidor');
+                }
+                delete window.app.chat.streams[streamId];
+            });
+        });
+    }
+
+    return window.app.chat.socket.connected ? window.app.chat.socket : null;
+}
+
+/**
+ * Envía un mensaje por Socket.IO pidiendo la respuesta en streaming
+ * @param {object} requestData - Mensaje, agente, modelo y contexto
+ * @returns {boolean} - false si no hay socket conectado (se usa la API HTTP)
+ */
+function sendStreamingMessage(requestData) {
+    const socket = getChatSocket();
+    if (!socket) return false;
+
+    const streamId = `chat-${Date.now()}-${window.app.chat.chatMessageId++}`;
+    const messageId = `msg-${streamId}`;
+    const agentName = getAgentName(requestData.agent_id);
+
+    appendMessageToChat(`
+        <div id="${messageId}" class="message assistant-message">
+            <div class="message-sender">${agentName}</div>
+            <div class="message-content"></div>
+        </div>
+    `);
+    showLoadingIndicator();
+
+    window.app.chat.streams[streamId] = {
+        messageId: messageId,
+        agentId: requestData.agent_id,
+        text: '',
+        loading: true
+    };
+
+    socket.emit('user_message', {
+        message: requestData.message,
+        agent: requestData.agent_id,
+        model: requestData.model,
+        context: requestData.context,
+        terminal_id: streamId,
+        stream: true
+    });
+    return true;
+}
+
 /**
  * Añade un mensaje del usuario al chat
  * @param {string} message - El contenido del mensaje
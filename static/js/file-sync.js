@@ -25,6 +25,8 @@ socket.on('connect', function() {
 socket.on('disconnect', function() {
     console.log('Desconectado del servidor WebSocket');
     isConnected = false;
+    // Los cambios perdidos durante la desconexión se recuperan al reconectar
+    lastChangeSeq = null;
     updateConnectionStatus('disconnected');
 });
 
@@ -34,6 +36,49 @@ socket.on('file_change', function(data) {
     refreshFileExplorer();
 });
 
+// Cambios agrupados del observador: aplicar el diff sobre el listado actual
+let lastChangeSeq = null;
+let currentFiles = null;
+
+socket.on('file_changes', function(data) {
+    const gap = lastChangeSeq !== null && data.seq !== lastChangeSeq + 1;
+    lastChangeSeq = data.seq;
+
+    // Demasiados cambios o mensajes perdidos: volver a pedir el listado
+    if (data.reset || gap || currentFiles === null) {
+        refreshFileExplorer();
+        return;
+    }
+
+    const currentPath = document.getElementById('directory-path')?.textContent || '.';
+    const currentDir = currentPath.replace(/^\.\/|\/$/g, '') || '.';
+    let changed = false;
+    data.changes.forEach(change => {
+        // Solo afectan al listado los cambios de entradas del directorio visible
+        const slash = change.path.lastIndexOf('/');
+        const parent = slash === -1 ? '.' : change.path.substring(0, slash);
+        if (parent !== currentDir) {
+            return;
+        }
+        const name = change.path.substring(slash + 1);
+        currentFiles = currentFiles.filter(file => file.name !== name);
+        if (change.type !== 'delete') {
+            currentFiles.push({
+                name: name,
+                path: change.path,
+                type: change.is_dir ? 'directory' : 'file',
+                size: change.size,
+                modified: change.modified
+            });
+        }
+        changed = true;
+    });
+
+    if (changed) {
+        updateFileList(currentFiles);
+    }
+});
+
 // Escuchar eventos genéricos de sincronización
 socket.on('file_sync', function(data) {
     console.log('Sincronización solicitada:', data);
@@ -84,6 +129,7 @@ function refreshFileExplorer() {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
+                currentFiles = data.files;
                 updateFileList(data.files);
             } else {
                 throw new Error(data.error || 'Error al cargar archivos');
@@ -152,12 +198,5 @@ function updateConnectionStatus(status) {
     indicator.classList.add(`status-${status}`);
 }
 
-// Configurar actualizaciones periódicas como respaldo
-setInterval(() => {
-    if (isConnected) {
-        refreshFileExplorer();
-    }
-}, 5000);
-
 // Exportar funciones necesarias
 window.refreshFileExplorer = refreshFileExplorer;
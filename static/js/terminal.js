@@ -58,14 +58,27 @@ document.addEventListener('DOMContentLoaded', function() {
         socket.emit('execute_command', {
             command: command,
             terminal_id: terminalId,
-            user_id: userId
+            user_id: userId,
+            stream: true
         });
+        term.write('\r\n');
     }
 
+    // La salida llega por fragmentos; confirmar cada uno permite al servidor seguir leyendo
+    socket.on('command_output', function(data) {
+        if (data.terminal_id === terminalId) {
+            term.write(data.data.replace(/\r?\n/g, '\r\n'), function() {
+                socket.emit('command_ack', { command_id: data.command_id, seq: data.seq });
+            });
+        }
+    });
+
     // Handle command results
     socket.on('command_result', function(data) {
         if (data.terminal_id === terminalId) {
-            term.write('\r\n' + data.output);
+            if (!data.streamed) {
+                term.write(data.output);
+            }
 
             if (data.success && isFileModifyingCommand(data.command)) {
                 refreshFileExplorer();
@@ -153,6 +153,29 @@ document.addEventListener('DOMContentLoaded', function() {
             }, 300); // Small delay to ensure the file is available
         });
 
+        // Cambios agrupados del observador: un mensaje por lote, con número de secuencia
+        let lastChangeSeq = null;
+        socket.on('file_changes', function(data) {
+            const gap = lastChangeSeq !== null && data.seq !== lastChangeSeq + 1;
+            lastChangeSeq = data.seq;
+            const reset = data.reset || gap;
+
+            // Los componentes que mantienen su propio listado aplican el diff directamente
+            document.dispatchEvent(new CustomEvent('files_changed', {
+                detail: { changes: data.changes, reset: reset, seq: data.seq }
+            }));
+
+            if (!data.reset && data.changes.length === 1) {
+                notifyFileChange(data.changes[0].type, data.changes[0]);
+            }
+
+            // Solo se vuelve a listar si se perdieron cambios (lote desbordado o
+            // secuencia con huecos) o si todavía no hay listado al que aplicarlos
+            if (reset || !applyChangesToExplorer(data.changes)) {
+                refreshFileExplorer();
+            }
+        });
+
         // File sync event handler
         socket.on('file_sync', function(data) {
             console.log('File sync event received:', data);
@@ -213,6 +236,62 @@ document.addEventListener('DOMContentLoaded', function() {
         };
     }
 
+    // Último listado mostrado en el explorador, para aplicarle los lotes de cambios
+    let explorerListing = null;
+
+    function normalizeDirectory(directory) {
+        directory = (directory || '.').replace(/^\/+|\/+$/g, '');
+        return directory === '.' ? '' : directory;
+    }
+
+    function renderExplorerListing(container) {
+        if (window.renderFileList) {
+            window.renderFileList(explorerListing.files, container);
+        } else {
+            renderBasicFileList(explorerListing.files, container);
+        }
+    }
+
+    // Aplica un lote de cambios al listado mostrado; devuelve false si no hay listado
+    function applyChangesToExplorer(changes) {
+        const explorerContainer = document.getElementById('explorer-contents') ||
+                                 document.getElementById('explorer-container') ||
+                                 document.querySelector('.explorer-content');
+        if (!explorerContainer || !explorerListing ||
+            explorerListing.directory !== normalizeDirectory(window.currentDirectory)) {
+            return false;
+        }
+
+        let changed = false;
+        changes.forEach(change => {
+            const slash = change.path.lastIndexOf('/');
+            const parent = slash === -1 ? '' : change.path.slice(0, slash);
+            // Los cambios en otros directorios no alteran las entradas mostradas
+            if (parent !== explorerListing.directory) return;
+
+            const name = change.path.slice(slash + 1);
+            const files = explorerListing.files.filter(file => file.name !== name);
+            if (change.type !== 'delete') {
+                const extension = name.includes('.') ? name.split('.').pop().toLowerCase() : '';
+                files.push({
+                    name: name,
+                    path: change.path,
+                    type: change.is_dir ? 'directory' : 'file',
+                    size: change.size,
+                    modified: change.modified,
+                    extension: change.is_dir ? '' : extension
+                });
+            }
+            explorerListing.files = files;
+            changed = true;
+        });
+
+        if (changed) {
+            renderExplorerListing(explorerContainer);
+        }
+        return true;
+    }
+
     // Function to refresh file explorer
     function refreshFileExplorer() {
         console.log("Refreshing file explorer...");
@@ -310,13 +389,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 .then(data => {
                     if (data.success && data.files) {
                         console.log("Files loaded successfully:", data.files.length);
-                        // If there's a rendering function available, use it
-                        if (window.renderFileList) {
-                            window.renderFileList(data.files, explorerContainer);
-                        } else {
-                            // Simple rendering if no custom renderer
-                            renderBasicFileList(data.files, explorerContainer);
-                        }
+                        explorerListing = { directory: normalizeDirectory(data.directory), files: data.files };
+                        renderExplorerListing(explorerContainer);
                     } else {
                         console.error("API response indicates failure:", data);
                         explorerContainer.innerHTML = '<div style="padding: 10px; color: red;">Error al cargar archivos</div>';
@@ -338,11 +412,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         .then(data => {
                             if (data.success && data.files) {
                                 console.log("Files refreshed again:", data.files.length);
-                                if (window.renderFileList) {
-                                    window.renderFileList(data.files, explorerContainer);
-                                } else {
-                                    renderBasicFileList(data.files, explorerContainer);
-                                }
+                                explorerListing = { directory: normalizeDirectory(data.directory), files: data.files };
+                                renderExplorerListing(explorerContainer);
                             }
                         })
                         .catch(err => console.warn("Error on secondary refresh:", err));
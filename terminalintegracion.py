@@ -5,6 +5,7 @@ import logging
 from flask import request, jsonify
 import subprocess
 from pathlib import Path
+from workspace_index import list_directory
 
 # Configurar logging
 logging.basicConfig(
@@ -104,25 +105,24 @@ def register_terminal_routes(app):
                 
             # Listar contenido
             items = []
-            for item in os.listdir(target_dir):
-                item_path = target_dir / item
-                
-                if item_path.is_dir():
+            for entry in list_directory(workspace_path, relative_dir) or []:
+                item = entry['name']
+                if entry['is_dir']:
                     items.append({
                         'name': item,
                         'path': str(Path(relative_dir) / item),
                         'type': 'directory',
                         'size': 0,
-                        'modified': os.path.getmtime(item_path)
+                        'modified': entry['modified']
                     })
                 else:
                     items.append({
                         'name': item,
                         'path': str(Path(relative_dir) / item),
                         'type': 'file',
-                        'size': os.path.getsize(item_path),
-                        'modified': os.path.getmtime(item_path),
-                        'extension': item_path.suffix[1:] if item_path.suffix else ''
+                        'size': entry['size'],
+                        'modified': entry['modified'],
+                        'extension': Path(item).suffix[1:] if Path(item).suffix else ''
                     })
                     
             return jsonify({
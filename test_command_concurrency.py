@@ -0,0 +1,95 @@
+"""
+Prueba de concurrencia del motor de comandos (command_stream).
+
+Ejecuta comandos en muchos workspaces a la vez desde un pool de hilos y
+comprueba que cada uno se ejecuta en su propio directorio y con su propio
+entorno, y que el directorio de trabajo del proceso no cambia.
+
+Uso: python test_command_concurrency.py [workspaces] [hilos]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import command_stream
+
+WORKSPACES = 64
+THREADS = 16
+ROUNDS = 3
+
+
+def run_in_workspace(root, index):
+    """Ejecuta en un workspace comandos que dependen del directorio y del entorno."""
+    workspace = os.path.join(root, f"user_{index}")
+    os.makedirs(workspace, exist_ok=True)
+    results = []
+    for round_number in range(ROUNDS):
+        # Archivo relativo: si otro hilo cambiara el directorio, acabaría en otro workspace
+        marker = f"ws{index}-r{round_number}"
+        command = f"sleep 0.0$((RANDOM % 5)) 2>/dev/null; echo {marker} > marker.txt; pwd; echo $HOME; cat marker.txt"
+        result = command_stream.run_command(command, workspace, timeout=30)
+        results.append((marker, result))
+    return workspace, results
+
+
+def check_workspaces(workspaces=WORKSPACES, threads=THREADS):
+    root = tempfile.mkdtemp(prefix='codestorm_concurrency_')
+    cwd_before = os.getcwd()
+    os.environ['CODESTORM_TEST_SECRET'] = 'no-debe-filtrarse'
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(lambda i: run_in_workspace(root, i), range(workspaces)))
+        elapsed = time.monotonic() - started
+
+        errors = []
+        for workspace, results in outcomes:
+            expected = os.path.realpath(workspace)
+            for marker, result in results:
+                lines = result['stdout'].splitlines()
+                if not result['success'] or len(lines) != 3:
+                    errors.append(f"{workspace}: resultado inesperado {result}")
+                    continue
+                pwd, home, content = lines
+                if os.path.realpath(pwd) != expected:
+                    errors.append(f"{workspace}: pwd {pwd}")
+                if os.path.realpath(home) != expected:
+                    errors.append(f"{workspace}: HOME {home}")
+                if content != marker:
+                    errors.append(f"{workspace}: marcador {content} en lugar de {marker}")
+
+        if os.getcwd() != cwd_before:
+            errors.append(f"El directorio del proceso cambió a {os.getcwd()}")
+
+        env_result = command_stream.run_command('env', root)
+        if 'CODESTORM_TEST_SECRET' in env_result['stdout']:
+            errors.append("El entorno del servidor se filtró a los comandos")
+
+        return errors, elapsed
+    finally:
+        os.environ.pop('CODESTORM_TEST_SECRET', None)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_parallel_workspaces():
+    """Comandos en paralelo en workspaces distintos no se interfieren."""
+    errors, _ = check_workspaces()
+    assert not errors, "\n".join(errors[:10])
+
+
+if __name__ == "__main__":
+    workspaces = int(sys.argv[1]) if len(sys.argv) > 1 else WORKSPACES
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else THREADS
+
+    print(f"\n=== Test de concurrencia: {workspaces} workspaces, {threads} hilos, {ROUNDS} comandos por workspace ===")
+    errors, elapsed = check_workspaces(workspaces, threads)
+    print(f"Tiempo total: {elapsed:.2f}s ({workspaces * ROUNDS / elapsed:.1f} comandos/s)")
+    if errors:
+        print(f"❌ {len(errors)} errores:")
+        for error in errors[:20]:
+            print(f"  - {error}")
+        sys.exit(1)
+    print("✅ Cada comando se ejecutó en su workspace, con su entorno y sin cambiar el directorio del proceso")
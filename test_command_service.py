@@ -0,0 +1,67 @@
+"""
+Pruebas del pool de comandos (command_service).
+
+Cubren los trabajos cancelados o caducados mientras esperan en la cola: los
+hilos del pool deben seguir atendiendo los trabajos siguientes.
+
+Uso: python -m pytest test_command_service.py
+"""
+import time
+import threading
+
+import pytest
+
+from command_service import CommandService, QueueTimeoutError
+
+
+@pytest.fixture
+def service():
+    service = CommandService(workers=1, per_user=1, queue_timeout=0.05)
+    yield service
+    service.stop()
+
+
+def _block(service, user_id):
+    """Ocupa el único hilo del pool hasta que se libere el evento devuelto."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def job():
+        started.set()
+        release.wait(5)
+
+    future = service.submit(user_id, job)
+    assert started.wait(2)
+    return release, future
+
+
+def test_cancelled_job_that_outlives_queue_timeout_keeps_the_worker(service):
+    release, blocker = _block(service, 'alice')
+    waiting = service.submit('bob', lambda: 'nunca')
+    assert waiting.cancel()
+    time.sleep(0.1)
+    release.set()
+    blocker.result(2)
+
+    assert service.submit('bob', lambda: 'ok').result(2) == 'ok'
+    assert all(thread.is_alive() for thread in service._threads)
+    assert service.stats()['cancelled'] == 1
+
+
+def test_expired_job_fails_with_queue_timeout(service):
+    release, blocker = _block(service, 'alice')
+    waiting = service.submit('bob', lambda: 'tarde')
+    time.sleep(0.1)
+    release.set()
+    with pytest.raises(QueueTimeoutError):
+        waiting.result(2)
+    assert service.stats()['expired'] == 1
+
+
+def test_failing_job_reports_its_exception(service):
+    def fail():
+        raise ValueError("fallo")
+
+    with pytest.raises(ValueError):
+        service.run('alice', fail)
+    assert service.run('alice', lambda: 42) == 42
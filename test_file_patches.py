@@ -0,0 +1,136 @@
+"""
+Pruebas del guardado por parches (file_patches).
+
+Cubren la aplicación de ediciones por bytes y por líneas, el rechazo de
+parches sobre una versión base obsoleta (conflicto entre dos editores) y
+de ediciones inválidas, y que un parche rechazado no modifica el archivo.
+
+Uso: python -m pytest test_file_patches.py
+"""
+import os
+import threading
+
+import pytest
+
+from file_patches import (write_file_atomic, apply_patch, content_hash,
+                          StaleBaseError, PatchError)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / 'app.py')
+    base = write_file_atomic(path, "uno\ndos\ntres\n")
+    return path, base
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_byte_edits_are_applied_against_the_base(source):
+    path, base = source
+    # Los desplazamientos son de la versión base aunque la primera edición cambie la longitud
+    result = apply_patch(path, base, [
+        {'offset': 0, 'length': 3, 'text': 'UNO!'},
+        {'offset': 8, 'length': 4, 'text': 'TRES'},
+    ])
+    assert _read(path) == "UNO!\ndos\nTRES\n"
+    assert result == {'hash': content_hash("UNO!\ndos\nTRES\n"), 'size': 14}
+
+
+def test_line_edits_replace_insert_and_append(source):
+    path, base = source
+    apply_patch(path, base, [
+        {'start_line': 2, 'line_count': 1, 'text': 'DOS\n'},
+        {'start_line': 1, 'line_count': 0, 'text': '# cabecera\n'},
+        {'start_line': 4, 'line_count': 0, 'text': 'cuatro\n'},
+    ])
+    assert _read(path) == "# cabecera\nuno\nDOS\ntres\ncuatro\n"
+
+
+def test_stale_base_is_rejected_with_current_hash(source):
+    path, base = source
+    first = apply_patch(path, base, [{'offset': 0, 'length': 3, 'text': 'UNO'}])
+
+    # Un segundo editor con la misma versión base entra en conflicto
+    with pytest.raises(StaleBaseError) as error:
+        apply_patch(path, base, [{'offset': 4, 'length': 3, 'text': 'DOS'}])
+    assert error.value.current_hash == first['hash']
+    assert _read(path) == "UNO\ndos\ntres\n"
+
+    # Tras releer, el parche sobre la versión actual se aplica
+    apply_patch(path, error.value.current_hash, [{'offset': 4, 'length': 3, 'text': 'DOS'}])
+    assert _read(path) == "UNO\nDOS\ntres\n"
+
+
+def test_concurrent_patches_on_same_base_only_one_wins(source):
+    path, base = source
+    outcomes = []
+    barrier = threading.Barrier(8)
+
+    def patch(n):
+        barrier.wait()
+        try:
+            apply_patch(path, base, [{'offset': 0, 'length': 3, 'text': f'v{n}'}])
+            outcomes.append('ok')
+        except StaleBaseError:
+            outcomes.append('stale')
+
+    threads = [threading.Thread(target=patch, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ['ok'] + ['stale'] * 7
+    assert _read(path).startswith('v')
+
+
+@pytest.mark.parametrize('edits', [
+    [],
+    [{'offset': 0, 'length': 3, 'text': 'a'}, {'offset': 2, 'length': 2, 'text': 'b'}],
+    [{'offset': 10, 'length': 10, 'text': 'x'}],
+    [{'offset': -1, 'length': 1, 'text': 'x'}],
+    [{'start_line': 9, 'line_count': 1, 'text': 'x'}],
+    [{'start_line': 1, 'line_count': 2, 'text': 'a'}, {'start_line': 2, 'line_count': 1, 'text': 'b'}],
+    [{'offset': 'cero', 'text': 'x'}],
+    [{'offset': 0, 'text': 5}],
+])
+def test_invalid_edits_are_rejected_without_writing(source, edits):
+    path, base = source
+    with pytest.raises(PatchError):
+        apply_patch(path, base, edits)
+    assert _read(path) == "uno\ndos\ntres\n"
+
+
+def test_patch_keeps_permissions_and_leaves_no_temporary_files(source):
+    path, base = source
+    os.chmod(path, 0o640)
+    apply_patch(path, base, [{'offset': 0, 'length': 0, 'text': '#'}])
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(os.path.dirname(path)) == ['app.py']
+
+
+def test_missing_file_raises_not_found(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        apply_patch(str(tmp_path / 'no-existe.py'), content_hash(''), [{'offset': 0, 'text': 'x'}])
+
+
+def test_replacing_a_blob_link_keeps_the_blob_and_becomes_writable(tmp_path):
+    blob = tmp_path / 'blob'
+    blob.write_text("compartido\n")
+    os.chmod(blob, 0o444)
+    path = tmp_path / 'project' / 'app.py'
+    path.parent.mkdir()
+    os.link(blob, path)
+
+    base = content_hash("compartido\n")
+    apply_patch(str(path), base, [{'offset': 0, 'length': 10, 'text': 'editado'}])
+
+    assert _read(str(path)) == "editado\n"
+    assert _read(str(blob)) == "compartido\n"
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert os.stat(path).st_nlink == 1
+    write_file_atomic(str(path), "otra vez\n")
+    assert _read(str(blob)) == "compartido\n"
@@ -0,0 +1,85 @@
+"""
+Pruebas de las lecturas por rango del editor (file_reads).
+
+Cubren el límite MAX_INLINE_BYTES en lecturas por líneas y por bytes y que
+un rango de bytes nunca parte un carácter UTF-8.
+
+Uso: python -m pytest test_file_reads.py
+"""
+import os
+
+import pytest
+
+import file_reads
+from file_reads import read_text, FileTooLargeError
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr(file_reads, 'MAX_INLINE_BYTES', 16)
+
+
+def _read(path, **options):
+    return read_text(str(path), os.stat(path), **options)
+
+
+def test_whole_file_over_limit_is_rejected(tmp_path, small_limit):
+    path = tmp_path / 'big.txt'
+    path.write_text('x' * 32)
+    with pytest.raises(FileTooLargeError):
+        _read(path)
+
+
+def test_line_reads_are_capped_at_the_limit(tmp_path, small_limit):
+    path = tmp_path / 'lines.txt'
+    path.write_text(''.join(f"linea {n}\n" for n in range(1, 11)))
+
+    result = _read(path, start_line=1)
+    assert result['content'] == "linea 1\nlinea 2\n"
+    assert result['truncated'] is True
+    assert result['next_line'] == 3
+
+    result = _read(path, start_line=3, line_count=1)
+    assert result['content'] == "linea 3\n"
+    assert result['next_line'] == 4
+
+
+def test_single_line_over_limit_must_be_read_by_bytes(tmp_path, small_limit):
+    path = tmp_path / 'minified.js'
+    path.write_text('a' * 40)
+    with pytest.raises(FileTooLargeError):
+        _read(path, start_line=1, line_count=1)
+
+
+def test_explicit_length_is_capped_at_the_limit(tmp_path, small_limit):
+    path = tmp_path / 'data.txt'
+    path.write_text('0123456789' * 4)
+    result = _read(path, offset=0, length=1000)
+    assert result['length'] == 16
+    assert result['truncated'] is True
+    assert result['next_offset'] == 16
+    assert 'hash' not in result
+
+
+def test_byte_ranges_do_not_split_characters(tmp_path):
+    path = tmp_path / 'utf8.txt'
+    path.write_text('añoé€', encoding='utf-8')  # a(1) ñ(2) o(1) é(2) €(3)
+
+    first = _read(path, offset=0, length=2)
+    assert first['content'] == 'a'
+    assert first['next_offset'] == 1
+
+    second = _read(path, offset=first['next_offset'], length=6)
+    assert second['content'] == 'ñoé'
+    rest = _read(path, offset=second['next_offset'])
+    assert rest['content'] == '€'
+    assert rest['next_offset'] is None
+    assert '�' not in first['content'] + second['content'] + rest['content']
+
+
+def test_full_read_includes_base_hash(tmp_path):
+    path = tmp_path / 'app.py'
+    path.write_text('print(1)\n')
+    result = _read(path)
+    assert result['content'] == 'print(1)\n'
+    assert result['hash'] == file_reads.content_hash(b'print(1)\n')
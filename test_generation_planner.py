@@ -0,0 +1,78 @@
+"""
+Pruebas del planificador de generación del constructor (generation_planner).
+
+Cubren el orden por dependencias y que una pausa o cancelación detiene el
+plan sin esperar a las generaciones en curso ni empezar otras nuevas.
+
+Uso: python -m pytest test_generation_planner.py
+"""
+import time
+import threading
+
+import pytest
+
+from generation_planner import GenerationPlanner, GenerationTask
+from job_control import JobControl, JobCancelled, JobParked
+
+
+def test_dependencies_receive_generated_content():
+    seen = {}
+
+    def generate(task, description):
+        seen[task.filename] = description
+        return {'success': True, 'content': f"contenido de {task.filename}"}
+
+    tasks = [
+        GenerationTask('app.py', 'py', 'app'),
+        GenerationTask('index.html', 'html', lambda inputs: f"usa: {inputs['app.py']}", depends_on=['app.py']),
+    ]
+    results = GenerationPlanner(generate, max_workers=2).run(tasks)
+
+    assert results['index.html']['success']
+    assert seen['index.html'] == "usa: contenido de app.py"
+
+
+@pytest.mark.parametrize('stop, error', [('cancel', JobCancelled), ('pause', JobParked)])
+def test_stop_does_not_wait_for_in_flight_generations(stop, error):
+    control = JobControl('p1')
+    release = threading.Event()
+    started = []
+
+    def generate(task, description):
+        started.append(task.filename)
+        if task.filename == 'slow.py':
+            release.wait(5)
+        return {'success': True, 'content': ''}
+
+    def on_task_done(task, result, completed, total):
+        getattr(control, stop)()
+        control.checkpoint()
+
+    tasks = [
+        GenerationTask('fast.py', 'py', 'rápido'),
+        GenerationTask('slow.py', 'py', 'lento'),
+        GenerationTask('later.py', 'py', 'después', depends_on=['fast.py']),
+    ]
+    began = time.monotonic()
+    try:
+        with pytest.raises(error):
+            GenerationPlanner(generate, max_workers=2, control=control).run(tasks, on_task_done)
+        assert time.monotonic() - began < 2
+        assert 'later.py' not in started
+    finally:
+        release.set()
+
+
+def test_cancel_before_start_skips_queued_tasks():
+    control = JobControl('p1')
+    started = []
+
+    def generate(task, description):
+        started.append(task.filename)
+        control.cancel()
+        return {'success': True, 'content': ''}
+
+    tasks = [GenerationTask(f"f{n}.py", 'py', 'x') for n in range(4)]
+    with pytest.raises(JobCancelled):
+        GenerationPlanner(generate, max_workers=1, control=control).run(tasks)
+    assert started == ['f0.py']
@@ -0,0 +1,109 @@
+"""
+Pruebas del almacén de trabajos del constructor (job_store).
+
+Dos instancias de JobStore sobre la misma base de datos hacen de workers
+distintos: una es dueña del trabajo y la otra añade mensajes directamente.
+
+Uso: python -m pytest test_job_store.py
+"""
+import threading
+
+import pytest
+
+from job_store import JobStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    url = 'sqlite:///' + str(tmp_path / 'jobs.db')
+    owner = JobStore(url, flush_interval=3600)
+    other = JobStore(url, flush_interval=3600)
+    yield owner, other
+    owner.close()
+    other.close()
+
+
+def test_seq_is_unique_across_workers(stores):
+    owner, other = stores
+    owner.create('p1', framework='flask')
+
+    seqs = []
+    lock = threading.Lock()
+
+    def append(store, label):
+        for i in range(40):
+            seq = store.append_message('p1', f"{label} {i}")
+            with lock:
+                seqs.append(seq)
+
+    threads = [threading.Thread(target=append, args=(store, f"w{n}"))
+               for n, store in enumerate([owner, other, owner, other])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(seqs) == list(range(1, 161))
+    stored = other.messages('p1')
+    assert [m['seq'] for m in stored] == list(range(1, 161))
+
+
+def test_since_cursor_sees_owner_and_other_messages_without_gaps(stores):
+    owner, other = stores
+    owner.create('p1')
+    owner.append_message('p1', "inicio")
+    # El worker que atiende la petición de pausa no es el dueño del trabajo
+    pause_seq = other.append_message('p1', "Desarrollo pausado por el usuario")
+    owner.append_message('p1', "etapa 2")
+
+    cursor = 0
+    seen = []
+    for reader in (other, owner):
+        batch = reader.messages('p1', since=cursor)
+        seen += [m['message'] for m in batch]
+        cursor = batch[-1]['seq'] if batch else cursor
+
+    assert pause_seq == 2
+    assert seen == ["inicio", "Desarrollo pausado por el usuario", "etapa 2"]
+    assert other.messages('p1', since=cursor) == []
+
+
+def test_owner_flush_does_not_overwrite_message_count(stores):
+    owner, other = stores
+    owner.create('p1')
+    owner.append_message('p1', "uno")
+    owner.update('p1', progress=40)
+    other.append_message('p1', "dos")
+    owner.flush()
+
+    assert other.get('p1')['message_count'] == 2
+    assert other.get('p1')['progress'] == 40
+    assert owner.append_message('p1', "tres") == 3
+    assert owner.last_message('p1')['message'] == "tres"
+
+
+def test_append_to_missing_job_returns_none(stores):
+    owner, _ = stores
+    assert owner.append_message('no-existe', "hola") is None
+
+
+def test_pause_from_other_worker_reaches_owner(stores):
+    owner, other = stores
+    owner.create('p1')
+    other.update('p1', paused=True)
+    owner.flush()
+    assert owner.get('p1')['paused'] is True
+
+
+def test_finished_job_is_persisted(stores):
+    owner, other = stores
+    owner.create('p1')
+    owner.update('p1', progress=100)
+    owner.mark_stage_done('p1', 'plan')
+    owner.finish('p1', 'completed')
+
+    job = other.get('p1')
+    assert job['status'] == 'completed'
+    assert job['progress'] == 100
+    assert job['completed_stages'] == ['plan']
+    assert job['completion_time']
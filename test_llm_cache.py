@@ -0,0 +1,190 @@
+"""
+Pruebas de la caché de respuestas de los modelos (llm_cache).
+
+Cubren los dos niveles (LRU en memoria y SQLite), la promoción entre niveles
+y que generate_content guarda cada respuesta bajo el proveedor que la generó.
+
+Uso: python -m pytest test_llm_cache.py
+"""
+import sys
+import time
+import sqlite3
+import importlib
+
+import pytest
+
+from llm_cache import MemoryLRUTier, SQLiteTier, ResponseCache, make_cache_key
+
+
+def test_cache_key_normalizes_whitespace_and_model_case():
+    key = make_cache_key("sistema", "hola\r\n", "OpenAI ", 0)
+    assert key == make_cache_key(" sistema", "hola", "openai", 0.0)
+    assert key != make_cache_key("sistema", "hola", "anthropic", 0)
+    assert key != make_cache_key("sistema", "hola", "openai", 0.5)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryLRUTier(max_entries=2, ttl=60)
+    tier.set('a', '1')
+    tier.set('b', '2')
+    assert tier.get('a') == '1'
+    tier.set('c', '3')
+    assert tier.get('b') is None
+    assert tier.get('a') == '1'
+    assert tier.get('c') == '3'
+
+
+def test_memory_tier_expires_entries():
+    tier = MemoryLRUTier(max_entries=2, ttl=-1)
+    tier.set('a', '1')
+    assert tier.get('a') is None
+    assert len(tier) == 0
+
+
+def test_sqlite_tier_persists_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SQLiteTier(path=path, ttl=60).set('a', 'respuesta')
+    assert SQLiteTier(path=path, ttl=60).get('a') == 'respuesta'
+
+
+def _last_access(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT last_access FROM llm_responses WHERE key = ?', (key,)).fetchone()[0]
+
+
+def test_sqlite_hits_batch_recency_updates(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    tier = SQLiteTier(path=path, ttl=60, touch_batch_size=3, touch_interval=3600)
+    for key in ('a', 'b', 'c'):
+        tier.set(key, key)
+    stored = _last_access(path, 'a')
+
+    time.sleep(0.01)
+    assert tier.get('a') == 'a'
+    assert tier.get('b') == 'b'
+    # Los aciertos todavía no han escrito en la base de datos
+    assert _last_access(path, 'a') == stored
+
+    assert tier.get('c') == 'c'
+    assert _last_access(path, 'a') > stored
+
+
+def test_sqlite_eviction_sees_pending_touches(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    tier = SQLiteTier(path=path, max_entries=2, ttl=60, touch_batch_size=100, touch_interval=3600)
+    tier.set('a', '1')
+    time.sleep(0.01)
+    tier.set('b', '2')
+    time.sleep(0.01)
+    # 'a' es la más usada aunque su acceso aún no se haya guardado
+    assert tier.get('a') == '1'
+    tier.set('c', '3')
+    assert tier.get('a') == '1'
+    assert tier.get('b') is None
+
+
+def test_sqlite_tier_drops_expired_entries(tmp_path):
+    tier = SQLiteTier(path=str(tmp_path / 'cache.db'), ttl=-1)
+    tier.set('a', '1')
+    assert tier.get('a') is None
+    assert len(tier) == 0
+
+
+def test_response_cache_promotes_lower_tier_hits(tmp_path):
+    memory = MemoryLRUTier(max_entries=10, ttl=60)
+    disk = SQLiteTier(path=str(tmp_path / 'cache.db'), ttl=60)
+    disk.set('k', 'valor')
+    cache = ResponseCache(tiers=[memory, disk])
+
+    assert cache.get('k') == 'valor'
+    assert memory.get('k') == 'valor'
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['tier_hits'] == {'memory': 0, 'sqlite': 1}
+
+
+def test_get_or_generate_only_caches_deterministic_requests():
+    cache = ResponseCache(tiers=[MemoryLRUTier(max_entries=10, ttl=60)])
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return f"respuesta {len(calls)}"
+
+    assert cache.get_or_generate('s', 'p', 'openai', 0, generate) == 'respuesta 1'
+    assert cache.get_or_generate('s', 'p', 'openai', 0, generate) == 'respuesta 1'
+    assert cache.get_or_generate('s', 'p', 'openai', 0.7, generate) == 'respuesta 2'
+    assert cache.get_or_generate('s', 'p', 'openai', 0.7, generate, cache_nondeterministic=True) == 'respuesta 3'
+    assert cache.get_or_generate('s', 'p', 'openai', 0.7, generate, cache_nondeterministic=True) == 'respuesta 3'
+    assert cache.stats()['bypassed'] == 1
+
+
+def test_get_or_generate_does_not_cache_invalid_replies():
+    cache = ResponseCache(tiers=[MemoryLRUTier(max_entries=10, ttl=60)])
+    replies = iter(["no es JSON", '{"correctedCode": "x"}', "otra cosa"])
+    is_json = lambda text: text.startswith('{')
+
+    def generate():
+        return next(replies)
+
+    assert cache.get_or_generate('s', 'p', 'openai', 0, generate, validate=is_json) == "no es JSON"
+    # El reintento llega al modelo y la respuesta válida se cachea
+    assert cache.get_or_generate('s', 'p', 'openai', 0, generate, validate=is_json) == '{"correctedCode": "x"}'
+    assert cache.get_or_generate('s', 'p', 'openai', 0, generate, validate=is_json) == '{"correctedCode": "x"}'
+
+
+class _Monitor:
+    def allow_request(self, provider):
+        return True
+
+    def is_open(self, provider):
+        return False
+
+    def record_success(self, provider, latency):
+        pass
+
+    def record_failure(self, provider, latency, error):
+        pass
+
+
+class _Limiter:
+    def acquire(self, provider, tokens):
+        pass
+
+
+@pytest.fixture
+def agents_utils(monkeypatch):
+    # Sin claves no se crean clientes reales al importar el módulo
+    for variable in ('OPENAI_API_KEY', 'ANTHROPIC_API_KEY', 'GEMINI_API_KEY'):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr('dotenv.load_dotenv', lambda *args, **kwargs: False)
+    sys.modules.pop('agents_utils', None)
+    module = importlib.import_module('agents_utils')
+    monkeypatch.setattr(module, 'get_health_monitor', lambda: _Monitor())
+    monkeypatch.setattr(module, 'get_rate_limiter', lambda: _Limiter())
+    # Solo se prueba el camino secuencial; llm_hedging tiene sus propias pruebas
+    monkeypatch.setattr(importlib.import_module('llm_hedging'), 'HEDGE_ENABLED', False)
+    yield module
+    sys.modules.pop('agents_utils', None)
+
+
+def test_fallback_response_is_cached_under_answering_provider(agents_utils, monkeypatch):
+    cache = ResponseCache(tiers=[MemoryLRUTier(max_entries=10, ttl=60)])
+    monkeypatch.setattr(agents_utils, 'get_response_cache', lambda: cache)
+    monkeypatch.setattr(agents_utils, 'get_model_order', lambda model: ['openai', 'anthropic'])
+
+    def openai_down(prompt, system_prompt, temperature):
+        raise ValueError("Cliente de OpenAI no configurado")
+
+    monkeypatch.setattr(agents_utils, 'generate_with_openai', openai_down)
+    monkeypatch.setattr(agents_utils, 'generate_with_anthropic', lambda *args: 'de anthropic')
+
+    assert agents_utils.generate_content('p', 's', model='openai', temperature=0) == 'de anthropic'
+    assert cache.get(make_cache_key('s', 'p', 'openai', 0)) is None
+    assert cache.get(make_cache_key('s', 'p', 'anthropic', 0)) == 'de anthropic'
+
+    # Cuando OpenAI se recupera, el request a OpenAI lo genera OpenAI
+    monkeypatch.setattr(agents_utils, 'generate_with_openai', lambda *args: 'de openai')
+    assert agents_utils.generate_content('p', 's', model='openai', temperature=0) == 'de openai'
+    assert agents_utils.generate_content('p', 's', model='openai', temperature=0) == 'de openai'
+    assert cache.get(make_cache_key('s', 'p', 'openai', 0)) == 'de openai'
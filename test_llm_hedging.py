@@ -0,0 +1,165 @@
+"""
+Pruebas de las peticiones hedged (llm_hedging).
+
+Los proveedores se simulan con streams que bloquean como una lectura HTTP
+hasta que llega el siguiente fragmento o alguien cierra el stream.
+
+Uso: python -m pytest test_llm_hedging.py
+"""
+import sys
+import time
+import threading
+import importlib
+
+import pytest
+
+
+class _Stream:
+    """Stream HTTP simulado: close() desbloquea la lectura en curso."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def _streamer(delay, text, closeable=True, streams=None):
+    def stream(prompt, system_prompt, temperature, on_stream=None):
+        handle = _Stream()
+        if streams is not None:
+            streams.append(handle)
+        if on_stream and closeable:
+            on_stream(handle)
+        if closeable:
+            if handle.closed.wait(delay):
+                raise ConnectionError("stream cerrado")
+        else:
+            time.sleep(delay)
+        yield text
+    return stream
+
+
+class _Monitor:
+    def __init__(self):
+        self.failures = []
+        self.successes = []
+
+    def is_open(self, provider):
+        return False
+
+    def allow_request(self, provider):
+        return True
+
+    def latency_percentile(self, provider, percentile, min_samples=10):
+        return None
+
+    def record_success(self, provider, latency):
+        self.successes.append(provider)
+
+    def record_failure(self, provider, latency, error):
+        self.failures.append(provider)
+
+
+class _Limiter:
+    def acquire(self, provider, tokens):
+        pass
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    for variable in ('OPENAI_API_KEY', 'ANTHROPIC_API_KEY', 'GEMINI_API_KEY'):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr('dotenv.load_dotenv', lambda *args, **kwargs: False)
+    for name in ('llm_hedging', 'agents_utils'):
+        sys.modules.pop(name, None)
+    module = importlib.import_module('llm_hedging')
+    monitor = _Monitor()
+    monkeypatch.setattr(module, 'get_health_monitor', lambda: monitor)
+    monkeypatch.setattr(module, 'get_rate_limiter', lambda: _Limiter())
+    monkeypatch.setattr(module, 'get_model_order', lambda model: ['openai', 'anthropic'])
+    module.monitor = monitor
+    yield module
+    for name in ('llm_hedging', 'agents_utils'):
+        sys.modules.pop(name, None)
+
+
+def test_hedge_winner_returns_without_waiting_for_loser(hedging, monkeypatch):
+    streams = []
+    monkeypatch.setitem(hedging.STREAMERS, 'openai', _streamer(6.0, 'lento', streams=streams))
+    monkeypatch.setitem(hedging.STREAMERS, 'anthropic', _streamer(0.2, 'rápido'))
+
+    started = time.monotonic()
+    result = hedging.generate_content_hedged('p', 's', hedge_after=0.05)
+    elapsed = time.monotonic() - started
+
+    assert result['content'] == 'rápido'
+    assert result['provider'] == 'anthropic'
+    assert result['hedged']
+    assert elapsed < 1.0
+    # El stream del perdedor se cerró y su cancelación no cuenta como fallo
+    assert streams[0].closed.wait(1.0)
+    time.sleep(0.1)
+    assert hedging.monitor.failures == []
+
+
+def test_hedge_does_not_join_uncloseable_loser(hedging, monkeypatch):
+    # Como Gemini: el stream no se puede cerrar y el hilo sigue hasta el siguiente fragmento
+    monkeypatch.setitem(hedging.STREAMERS, 'openai', _streamer(3.0, 'lento', closeable=False))
+    monkeypatch.setitem(hedging.STREAMERS, 'anthropic', _streamer(0.1, 'rápido'))
+
+    started = time.monotonic()
+    result = hedging.generate_content_hedged('p', 's', hedge_after=0.05)
+
+    assert result['provider'] == 'anthropic'
+    assert time.monotonic() - started < 1.0
+
+
+def test_error_falls_back_immediately(hedging, monkeypatch):
+    def broken(prompt, system_prompt, temperature, on_stream=None):
+        raise ValueError("Cliente de OpenAI no configurado")
+        yield
+
+    monkeypatch.setitem(hedging.STREAMERS, 'openai', broken)
+    monkeypatch.setitem(hedging.STREAMERS, 'anthropic', _streamer(0.05, 'respaldo'))
+
+    result = hedging.generate_content_hedged('p', 's', hedge_after=10)
+
+    assert result['content'] == 'respaldo'
+    assert not result['hedged']
+    assert 'openai' in result['errors']
+    assert hedging.monitor.failures == ['openai']
+
+
+def test_generate_content_uses_hedged_winner(hedging, monkeypatch):
+    import agents_utils
+    from llm_cache import ResponseCache, MemoryLRUTier, make_cache_key
+
+    cache = ResponseCache(tiers=[MemoryLRUTier(max_entries=10, ttl=60)])
+    monkeypatch.setattr(agents_utils, 'get_response_cache', lambda: cache)
+    monkeypatch.setitem(hedging.STREAMERS, 'openai', _streamer(6.0, 'lento'))
+    monkeypatch.setitem(hedging.STREAMERS, 'anthropic', _streamer(0.1, 'rápido'))
+    monkeypatch.setattr(hedging, 'HEDGE_DEFAULT_DELAY', 0.05)
+
+    started = time.monotonic()
+    assert agents_utils.generate_content('p', 's', model='openai', temperature=0) == 'rápido'
+    assert time.monotonic() - started < 1.0
+    assert cache.get(make_cache_key('s', 'p', 'anthropic', 0)) == 'rápido'
+    assert cache.get(make_cache_key('s', 'p', 'openai', 0)) is None
+
+
+def test_provider_call_keeps_caller_priority(hedging, monkeypatch):
+    from rate_limiter import request_priority, get_request_priority, PRIORITY_BACKGROUND
+
+    seen = []
+
+    class _RecordingLimiter:
+        def acquire(self, provider, tokens):
+            seen.append(get_request_priority())
+
+    monkeypatch.setattr(hedging, 'get_rate_limiter', lambda: _RecordingLimiter())
+    monkeypatch.setitem(hedging.STREAMERS, 'openai', _streamer(0.01, 'ok'))
+
+    with request_priority(PRIORITY_BACKGROUND):
+        assert hedging.generate_content_hedged('p', 's', hedge_after=10)['content'] == 'ok'
+    assert seen == [PRIORITY_BACKGROUND]
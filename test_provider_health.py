@@ -0,0 +1,132 @@
+"""
+Pruebas del circuit breaker y la puntuación de salud (provider_health).
+
+El reloj se sustituye por uno controlado para recorrer las transiciones
+cerrado -> abierto -> semiabierto -> cerrado/abierto sin esperas reales.
+
+Uso: python -m pytest test_provider_health.py
+"""
+import pytest
+
+import provider_health
+from provider_health import HealthMonitor, CLOSED, OPEN, HALF_OPEN
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(provider_health.time, 'time', clock.time)
+    return clock
+
+
+def _state(monitor, provider):
+    return monitor.snapshot()[provider]['state']
+
+
+def test_consecutive_failures_open_the_circuit(clock):
+    monitor = HealthMonitor()
+    for _ in range(provider_health.FAILURE_THRESHOLD - 1):
+        monitor.record_failure('openai', 1.0, ValueError("500"))
+    assert monitor.allow_request('openai')
+    assert _state(monitor, 'openai') == CLOSED
+
+    monitor.record_failure('openai', 1.0, ValueError("500"))
+    assert _state(monitor, 'openai') == OPEN
+    assert monitor.is_open('openai')
+    assert not monitor.allow_request('openai')
+    assert monitor.snapshot()['openai']['last_error'] == "500"
+
+
+def test_high_error_rate_opens_the_circuit(clock):
+    monitor = HealthMonitor()
+    # Fallos alternos: nunca hay FAILURE_THRESHOLD seguidos, pero la tasa es del 50 %
+    for _ in range(provider_health.MIN_SAMPLES // 2):
+        monitor.record_success('gemini', 1.0)
+        monitor.record_failure('gemini', 1.0)
+    assert _state(monitor, 'gemini') == OPEN
+
+
+def _open(monitor, provider):
+    for _ in range(provider_health.FAILURE_THRESHOLD):
+        monitor.record_failure(provider, 1.0)
+    assert _state(monitor, provider) == OPEN
+
+
+def test_half_open_allows_a_single_probe_and_closes_on_success(clock):
+    monitor = HealthMonitor()
+    _open(monitor, 'anthropic')
+
+    clock.advance(provider_health.OPEN_SECONDS + 1)
+    assert not monitor.is_open('anthropic')
+    assert monitor.allow_request('anthropic')
+    assert _state(monitor, 'anthropic') == HALF_OPEN
+    # Solo una petición de prueba en vuelo
+    assert not monitor.allow_request('anthropic')
+
+    monitor.record_success('anthropic', 0.5)
+    assert _state(monitor, 'anthropic') == CLOSED
+    assert monitor.allow_request('anthropic')
+    assert monitor.allow_request('anthropic')
+
+
+def test_failed_probe_reopens_with_exponential_cooldown(clock):
+    monitor = HealthMonitor()
+    _open(monitor, 'openai')
+
+    clock.advance(provider_health.OPEN_SECONDS + 1)
+    assert monitor.allow_request('openai')
+    monitor.record_failure('openai', 1.0)
+    assert _state(monitor, 'openai') == OPEN
+
+    # El enfriamiento se duplica: al cabo de OPEN_SECONDS sigue abierto
+    clock.advance(provider_health.OPEN_SECONDS + 1)
+    assert not monitor.allow_request('openai')
+    clock.advance(provider_health.OPEN_SECONDS)
+    assert monitor.allow_request('openai')
+
+
+def test_lost_probe_is_released_after_timeout(clock):
+    monitor = HealthMonitor()
+    _open(monitor, 'openai')
+    clock.advance(provider_health.OPEN_SECONDS + 1)
+    assert monitor.allow_request('openai')
+    assert not monitor.allow_request('openai')
+
+    clock.advance(provider_health.OPEN_SECONDS + 1)
+    assert monitor.allow_request('openai')
+
+
+def test_rank_prefers_healthy_providers_and_keeps_preference_margin(clock):
+    monitor = HealthMonitor()
+    for _ in range(provider_health.MIN_SAMPLES):
+        monitor.record_success('openai', 2.0)
+        monitor.record_success('anthropic', 1.8)
+    # Con latencias parecidas gana el preferido
+    assert monitor.rank(['openai', 'anthropic'], preferred='openai') == ['openai', 'anthropic']
+
+    _open(monitor, 'openai')
+    assert monitor.rank(['openai', 'anthropic'], preferred='openai') == ['anthropic', 'openai']
+
+
+def test_latency_percentile_needs_enough_samples(clock):
+    monitor = HealthMonitor()
+    monitor.record_success('openai', 1.0)
+    assert monitor.latency_percentile('openai', 0.95) is None
+    for latency in range(1, 21):
+        monitor.record_success('openai', float(latency))
+    assert monitor.latency_percentile('openai', 0.95) == 19.0
+
+    # Las muestras fuera de la ventana dejan de contar
+    clock.advance(provider_health.WINDOW_SECONDS + 1)
+    assert monitor.latency_percentile('openai', 0.95, min_samples=1) is None
@@ -0,0 +1,141 @@
+"""
+Pruebas del limitador de tasa de los proveedores de IA (rate_limiter).
+
+Cubren los token buckets (en memoria y en SQLite), la cola de prioridad,
+los límites de la cola y el bloqueo tras un error 429.
+
+Uso: python -m pytest test_rate_limiter.py
+"""
+import time
+import threading
+
+import pytest
+
+from rate_limiter import (MemoryBucketStore, SQLiteBucketStore, RateLimiter, RateLimitQueueFull,
+                          RateLimitTimeout, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND,
+                          request_priority, estimate_tokens)
+
+
+def test_bucket_consumes_until_empty_and_reports_wait():
+    store = MemoryBucketStore()
+    request = [('p:requests', 2, 1.0, 1)]
+    assert store.consume(request) == 0
+    assert store.consume(request) == 0
+    wait = store.consume(request)
+    assert 0.9 < wait <= 1.0
+
+
+def test_bucket_consumes_all_or_nothing():
+    store = MemoryBucketStore()
+    # Hay cupo de peticiones pero no de tokens: no se descuenta ninguno
+    assert store.consume([('p:requests', 10, 1.0, 1), ('p:tokens', 100, 10.0, 500)]) > 0
+    assert store.consume([('p:requests', 10, 1.0, 10)]) == 0
+
+
+def test_sqlite_buckets_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / 'limits.db')
+    first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    request = [('p:requests', 1, 0.01, 1)]
+    assert first.consume(request) == 0
+    assert second.consume(request) > 0
+
+
+def test_estimate_tokens_counts_input_and_output():
+    assert estimate_tokens('a' * 400, None, max_output_tokens=50) == 150
+
+
+def _limiter(rpm, **kwargs):
+    limiter = RateLimiter(store=MemoryBucketStore(), **kwargs)
+    limiter.set_limits('openai', rpm=rpm, tpm=0)
+    return limiter
+
+
+def test_interactive_requests_overtake_background_ones():
+    limiter = _limiter(rpm=600)
+    limiter.penalize('openai', 0)  # Bucket vacío: todas las peticiones hacen cola
+    order = []
+
+    def request(name, priority):
+        limiter.acquire('openai', priority=priority, timeout=5)
+        order.append(name)
+
+    background = threading.Thread(target=request, args=('fondo', PRIORITY_BACKGROUND))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=request, args=('chat', PRIORITY_INTERACTIVE))
+    interactive.start()
+    background.join(2)
+    interactive.join(2)
+
+    assert order == ['chat', 'fondo']
+    assert limiter.stats()['providers']['openai']['queued'] == 2
+
+
+def test_priority_comes_from_context():
+    limiter = _limiter(rpm=600)
+    limiter.penalize('openai', 0)
+    order = []
+
+    def request(name, priority):
+        with request_priority(priority):
+            limiter.acquire('openai', timeout=5)
+        order.append(name)
+
+    threads = [threading.Thread(target=request, args=(f'fondo{i}', PRIORITY_BACKGROUND)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=request, args=('chat', PRIORITY_INTERACTIVE)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join(2)
+
+    assert order[0] == 'chat'
+
+
+def test_full_queue_rejects_requests():
+    limiter = _limiter(rpm=1, max_waiting=1)
+    limiter.penalize('openai', 60)
+    outcomes = []
+
+    def wait_in_queue():
+        try:
+            limiter.acquire('openai', timeout=0.3)
+        except RateLimitTimeout as e:
+            outcomes.append(e)
+
+    waiter = threading.Thread(target=wait_in_queue)
+    waiter.start()
+    time.sleep(0.05)
+    with pytest.raises(RateLimitQueueFull):
+        limiter.acquire('openai', timeout=0.1)
+    waiter.join(2)
+    assert len(outcomes) == 1
+    assert limiter.stats()['providers']['openai']['rejected'] == 1
+
+
+def test_timeout_leaves_the_queue():
+    limiter = _limiter(rpm=1)
+    limiter.penalize('openai', 60)
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('openai', timeout=0.1)
+    assert time.monotonic() - started < 1
+    stats = limiter.stats()['providers']['openai']
+    assert stats['timeouts'] == 1
+    assert stats['waiting'] == 0
+
+
+def test_penalize_blocks_every_waiter():
+    limiter = _limiter(rpm=600)
+    assert limiter.acquire('openai') < 0.05
+    limiter.penalize('openai', 0.2)
+    started = time.monotonic()
+    limiter.acquire('openai', timeout=2)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_disabled_limiter_never_waits():
+    limiter = _limiter(rpm=1, enabled=False)
+    limiter.penalize('openai', 60)
+    assert limiter.acquire('openai', timeout=0.01) == 0
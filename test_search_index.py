@@ -0,0 +1,51 @@
+"""
+Pruebas de la búsqueda en workspaces (search_index).
+
+Cubren las búsquedas de texto y por expresión regular sin índice y los
+límites de las expresiones regulares del usuario: cuantificadores anidados
+rechazados y búsqueda cortada al agotar SEARCH_REGEX_TIMEOUT.
+
+Uso: python -m pytest test_search_index.py
+"""
+import time
+
+import pytest
+
+import search_index
+from search_index import search_workspace
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    (tmp_path / 'app.py').write_text("def main():\n    print('hola')\n")
+    (tmp_path / 'data.txt').write_text('a' * 40 + '!\n')
+    return tmp_path
+
+
+def test_text_and_regex_search(workspace):
+    assert [r['path'] for r in search_workspace(str(workspace), 'HOLA')['results']] == ['app.py']
+    result = search_workspace(str(workspace), r'def \w+\(', mode='regex')
+    assert [(r['path'], r['line']) for r in result['results']] == [('app.py', 1)]
+    assert result['timed_out'] is False
+
+
+@pytest.mark.parametrize('query', [r'(a+)+$', r'(\w+\s*)*x', r'(?:a|b*)+c', r'((ab)*)*'])
+def test_nested_quantifiers_are_rejected(workspace, query):
+    started = time.monotonic()
+    with pytest.raises(ValueError):
+        search_workspace(str(workspace), query, mode='regex')
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize('query', [r'a+b*', r'(ab)+', r'\d{2,4}-\d+', r'(foo|bar)+'])
+def test_simple_quantifiers_are_allowed(workspace, query):
+    search_workspace(str(workspace), query, mode='regex')
+
+
+def test_regex_search_stops_at_the_deadline(workspace, monkeypatch):
+    for n in range(50):
+        (workspace / f"f{n}.txt").write_text("x\n" * 100)
+    monkeypatch.setattr(search_index, 'REGEX_TIMEOUT', 0)
+    result = search_workspace(str(workspace), 'x', mode='regex')
+    assert result['timed_out'] is True
+    assert result['results'] == []
@@ -0,0 +1,186 @@
+"""
+Pruebas de las cuotas y la limpieza de workspaces (workspace_maintenance).
+
+Cubren las cuotas blanda y dura, el límite de escritura de los comandos, los
+accesos guardados en la base de datos y la limpieza: desactivada por defecto,
+sin tocar workspaces en uso y con borrado blando a la papelera.
+
+Uso: python -m pytest test_workspace_maintenance.py
+"""
+import os
+import time
+
+import pytest
+
+import command_stream
+import workspace_maintenance
+from workspace_maintenance import WorkspaceMaintenance, QuotaExceededError
+
+
+class _NoopCleaner:
+    def expire(self, max_age):
+        return {'bytes': 0}
+
+    def collect_garbage(self):
+        return {'bytes': 0}
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace_maintenance, 'get_artifact_cache', _NoopCleaner)
+    monkeypatch.setattr(workspace_maintenance, 'get_blob_store', _NoopCleaner)
+    monkeypatch.setattr(workspace_maintenance, 'get_workspace_index', lambda path: None)
+    monkeypatch.setattr(workspace_maintenance, 'USAGE_CACHE_SECONDS', 0)
+    root = tmp_path / 'user_workspaces'
+    root.mkdir()
+    return root
+
+
+def _maintenance(root, **kwargs):
+    kwargs.setdefault('database_url', 'sqlite:///' + str(root.parent / 'maintenance.db'))
+    kwargs.setdefault('soft_quota', 100)
+    kwargs.setdefault('hard_quota', 200)
+    return WorkspaceMaintenance(root=str(root), **kwargs)
+
+
+def _workspace(root, name, size=10):
+    path = root / name
+    path.mkdir()
+    (path / 'data.bin').write_bytes(b'x' * size)
+    return path
+
+
+def _age(maintenance, name, seconds):
+    """Hace que el último acceso guardado de un workspace sea de hace seconds segundos."""
+    maintenance._accessed[name] = 0
+    maintenance.flush_access()
+    with maintenance._get_engine().begin() as conn:
+        conn.execute(workspace_maintenance.access_table.update()
+                     .where(workspace_maintenance.access_table.c.name == name)
+                     .values(last_accessed=time.time() - seconds))
+
+
+def test_write_within_soft_quota_is_accepted(root):
+    workspace = _workspace(root, 'alice', size=50)
+    quota = _maintenance(root).check_write(str(workspace), 30)
+    assert quota['usage'] == 80
+    assert quota['over_soft_quota'] is False
+
+
+def test_write_over_soft_quota_warns(root):
+    workspace = _workspace(root, 'alice', size=90)
+    assert _maintenance(root).check_write(str(workspace), 30)['over_soft_quota'] is True
+
+
+def test_write_over_hard_quota_is_rejected(root):
+    workspace = _workspace(root, 'alice', size=190)
+    maintenance = _maintenance(root)
+    with pytest.raises(QuotaExceededError) as error:
+        maintenance.check_write(str(workspace), 30)
+    assert error.value.limit == 200
+    assert maintenance.stats()['rejected_writes'] == 1
+    # Reemplazar un archivo por otro más pequeño se permite aunque se siga por encima
+    maintenance.check_write(str(workspace), 5, target_path=str(workspace / 'data.bin'))
+
+
+def test_spawn_limit_is_the_remaining_hard_quota(root):
+    workspace = _workspace(root, 'alice', size=150)
+    maintenance = _maintenance(root)
+    assert maintenance.before_spawn(str(workspace / 'src')) == 50
+    (workspace / 'big.bin').write_bytes(b'x' * 100)
+    assert maintenance.before_spawn(str(workspace)) == 0
+    assert maintenance.before_spawn(str(root.parent)) is None
+
+
+def test_commands_cannot_write_past_the_hard_quota(root):
+    workspace = _workspace(root, 'alice', size=150)
+    command_stream.set_spawn_guard(_maintenance(root).before_spawn)
+    try:
+        result = command_stream.run_command("head -c 1000 /dev/zero > out.bin", str(workspace))
+    finally:
+        command_stream.set_spawn_guard(None)
+    assert result['returncode'] != 0
+    assert os.path.getsize(workspace / 'out.bin') <= 50
+
+
+def test_touches_are_persisted_across_instances(root):
+    _workspace(root, 'alice')
+    first = _maintenance(root)
+    first.before_spawn(str(root / 'alice'))
+    first.stop()
+
+    second = _maintenance(root)
+    accessed = second._last_accessed_from_db()
+    assert time.time() - accessed['alice'] < 60
+
+
+def test_eviction_is_disabled_by_default(root):
+    _workspace(root, 'alice')
+    maintenance = _maintenance(root)
+    _age(maintenance, 'alice', workspace_maintenance.WORKSPACE_IDLE_EVICT_SECONDS + 60)
+    maintenance.run_once()
+    assert (root / 'alice').is_dir()
+    assert maintenance.stats()['eviction_enabled'] is False
+
+
+def test_unseen_workspace_starts_its_idle_period_now(root):
+    _workspace(root, 'alice')
+    maintenance = _maintenance(root, eviction_enabled=True)
+    maintenance.run_once()
+    assert (root / 'alice').is_dir()
+
+
+def test_idle_workspace_is_moved_to_trash_and_purged_later(root, monkeypatch):
+    _workspace(root, 'alice', size=40)
+    _workspace(root, 'bob')
+    maintenance = _maintenance(root, eviction_enabled=True)
+    _age(maintenance, 'alice', workspace_maintenance.WORKSPACE_IDLE_EVICT_SECONDS + 60)
+    maintenance.touch(str(root / 'bob'))
+
+    assert maintenance.run_once()['workspaces'] == 0
+    assert not (root / 'alice').exists()
+    assert (root / 'bob').is_dir()
+    trashed = os.listdir(root / '.trash')
+    assert len(trashed) == 1 and trashed[0].startswith('alice-')
+
+    monkeypatch.setattr(workspace_maintenance, 'TRASH_RETENTION_SECONDS', 0)
+    (root / '.trash' / trashed[0]).rename(root / '.trash' / 'alice-0')
+    assert maintenance.run_once()['workspaces'] == 40
+    assert os.listdir(root / '.trash') == []
+
+
+def test_busy_workspaces_are_never_evicted(root):
+    _workspace(root, 'alice')
+    _workspace(root, 'bob')
+    maintenance = _maintenance(root, eviction_enabled=True)
+    for name in ('alice', 'bob'):
+        _age(maintenance, name, workspace_maintenance.WORKSPACE_IDLE_EVICT_SECONDS + 60)
+    maintenance.add_busy_probe(lambda: [str(root / 'alice' / 'src')])
+
+    maintenance.run_once()
+    assert (root / 'alice').is_dir()
+    assert not (root / 'bob').exists()
+
+
+def test_failing_busy_probe_skips_eviction(root):
+    _workspace(root, 'alice')
+    maintenance = _maintenance(root, eviction_enabled=True)
+    _age(maintenance, 'alice', workspace_maintenance.WORKSPACE_IDLE_EVICT_SECONDS + 60)
+
+    def probe():
+        raise RuntimeError("sin respuesta")
+
+    maintenance.add_busy_probe(probe)
+    maintenance.run_once()
+    assert (root / 'alice').is_dir()
+
+
+def test_running_command_marks_its_workspace_busy(root):
+    workspace = _workspace(root, 'alice')
+    process = command_stream.CommandProcess("sleep 5", str(workspace))
+    try:
+        assert str(workspace) in command_stream.active_workspaces()
+    finally:
+        process.kill()
+        list(process.chunks())
+    assert str(workspace) not in command_stream.active_workspaces()
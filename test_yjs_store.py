@@ -0,0 +1,67 @@
+"""
+Pruebas del almacén de documentos Yjs (yjs_store).
+
+Dos instancias de YjsStore sobre la misma base de datos hacen de workers
+distintos que sirven la misma sala y la compactan por separado.
+
+Uso: python -m pytest test_yjs_store.py
+"""
+import pytest
+
+pycrdt = pytest.importorskip('pycrdt')
+
+from yjs_store import YjsStore
+
+
+def _edit(doc, text):
+    """Actualización Yjs que añade text al documento doc."""
+    before = doc.get_state()
+    doc.get('content', type=pycrdt.Text).insert(len(str(doc.get('content', type=pycrdt.Text))), text)
+    return doc.get_update(before)
+
+
+def _content(update):
+    doc = pycrdt.Doc()
+    if update:
+        doc.apply_update(update)
+    return str(doc.get('content', type=pycrdt.Text))
+
+
+@pytest.fixture
+def url(tmp_path):
+    return 'sqlite:///' + str(tmp_path / 'yjs.db')
+
+
+def test_compaction_by_another_worker_keeps_its_edits(url):
+    worker_a = YjsStore(url, compact_every=10 ** 6, compact_interval=10 ** 6)
+    worker_b = YjsStore(url, compact_every=10 ** 6, compact_interval=10 ** 6)
+    doc_a, doc_b = pycrdt.Doc(), pycrdt.Doc()
+
+    worker_a.append('room', _edit(doc_a, 'a1'))
+    worker_b.append('room', _edit(doc_b, 'b1'))
+    worker_b.append('room', _edit(doc_b, 'b2'))
+    worker_b.compact('room')
+    worker_a.append('room', _edit(doc_a, 'a2'))
+    worker_a.append('room', _edit(doc_a, 'a3'))
+    worker_a.compact('room')
+
+    content = _content(YjsStore(url).sync('room')['update'])
+    for edit in ('a1', 'a2', 'a3', 'b1', 'b2'):
+        assert edit in content
+    assert _content(worker_b.sync('room')['update']) == content
+
+
+def test_sync_sends_only_what_the_client_is_missing(url):
+    store = YjsStore(url, compact_every=2, compact_interval=10 ** 6)
+    doc = pycrdt.Doc()
+    for text in ('uno', 'dos', 'tres'):
+        store.append('room', _edit(doc, text))
+
+    client = pycrdt.Doc()
+    client.apply_update(store.sync('room')['update'])
+    assert str(client.get('content', type=pycrdt.Text)) == 'unodostres'
+
+    store.append('room', _edit(doc, 'cuatro'))
+    missing = store.sync('room', client.get_state())['update']
+    client.apply_update(missing)
+    assert str(client.get('content', type=pycrdt.Text)) == 'unodostrescuatro'
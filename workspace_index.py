@@ -0,0 +1,352 @@
+"""
+Índice en memoria de los metadatos de los workspaces.
+
+Cada workspace se recorre una sola vez con os.scandir y se guarda como un
+árbol con nombre, tipo, tamaño, fecha de modificación y tamaño acumulado de
+cada directorio. El observador de watchdog (main.watch_workspace_files)
+mantiene el árbol al día: cada evento vuelve a consultar solo las rutas
+afectadas. Los listados se sirven desde el índice en O(entradas devueltas),
+sin un stat por archivo en cada petición.
+
+El índice solo se usa mientras el observador está activo (set_watching);
+sin observador, list_directory() lee el sistema de archivos directamente.
+"""
+import os
+import stat
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    __slots__ = ('name', 'is_dir', 'size', 'mtime', 'mode', 'children', 'total_size', 'parent')
+
+    def __init__(self, name, is_dir, st, parent=None):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = 0 if is_dir else st.st_size
+        self.mtime = st.st_mtime
+        self.mode = st.st_mode
+        # None en directorios cuyo contenido no se indexa (enlaces simbólicos)
+        self.children = {} if is_dir else None
+        self.total_size = self.size
+        self.parent = parent
+
+    def to_entry(self):
+        return {
+            'name': self.name,
+            'is_dir': self.is_dir,
+            'size': self.size,
+            'modified': self.mtime,
+            'mode': self.mode,
+            'total_size': self.total_size if self.is_dir and self.children is not None else None
+        }
+
+
+def _scan_entry(entry):
+    """Devuelve (is_dir, stat) de una entrada de scandir, siguiendo enlaces como os.path.isdir."""
+    st = entry.stat()
+    return stat.S_ISDIR(st.st_mode), st
+
+
+class WorkspaceIndex:
+    """Árbol de metadatos de un workspace."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self._tree = None
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+
+    def _build(self):
+        st = os.stat(self.root)
+        tree = _Node(os.path.basename(self.root), True, st)
+        self._scan(self.root, tree)
+        self._tree = tree
+        logger.debug(f"Índice del workspace construido: {self.root}")
+
+    def _scan(self, path, node):
+        """Recorre el subárbol de un directorio y calcula sus tamaños acumulados."""
+        stack = [(path, node)]
+        directories = []
+        while stack:
+            dir_path, dir_node = stack.pop()
+            directories.append(dir_node)
+            dir_node.children = {}
+            try:
+                iterator = os.scandir(dir_path)
+            except OSError:
+                continue
+            with iterator:
+                for entry in iterator:
+                    try:
+                        is_dir, entry_stat = _scan_entry(entry)
+                    except OSError:
+                        continue
+                    child = _Node(entry.name, is_dir, entry_stat, parent=dir_node)
+                    dir_node.children[entry.name] = child
+                    if is_dir:
+                        if entry.is_symlink():
+                            # No seguir enlaces a directorios: pueden formar ciclos
+                            child.children = None
+                        else:
+                            stack.append((entry.path, child))
+        # Los hijos aparecen después que sus padres: sumar en orden inverso
+        for dir_node in reversed(directories):
+            dir_node.total_size = sum(child.total_size for child in dir_node.children.values())
+
+    def _ensure(self):
+        if self._tree is None:
+            self._build()
+        return self._tree
+
+    def invalidate(self):
+        """Descarta el árbol; se reconstruye en el siguiente acceso."""
+        with self._lock:
+            self._tree = None
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _parts(self, rel_path):
+        rel_path = os.path.normpath(rel_path or '.')
+        if rel_path == '.':
+            return []
+        return [part for part in rel_path.split(os.sep) if part and part != '.']
+
+    def _lookup(self, parts):
+        node = self._ensure()
+        for part in parts:
+            if node.children is None:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def list(self, rel_dir='.'):
+        """
+        Entradas de un directorio del workspace.
+
+        Returns:
+            list: Dicts con name, is_dir, size, modified, mode y total_size,
+                o None si el directorio no existe
+        """
+        with self._lock:
+            node = self._lookup(self._parts(rel_dir))
+            if node is None or not node.is_dir:
+                return None
+            if node.children is not None:
+                return [child.to_entry() for child in node.children.values()]
+        # Directorio no indexado: leerlo directamente
+        return scan_directory(os.path.join(self.root, rel_dir))
+
+    def stat(self, rel_path):
+        """Metadatos de una ruta del workspace, o None si no existe."""
+        with self._lock:
+            node = self._lookup(self._parts(rel_path))
+            return node.to_entry() if node is not None else None
+
+    def total_size(self, rel_dir='.'):
+        """Tamaño acumulado de un directorio (o de un archivo), o None si no existe."""
+        with self._lock:
+            node = self._lookup(self._parts(rel_dir))
+            return node.total_size if node is not None else None
+
+    # ------------------------------------------------------------------
+    # Actualización incremental
+    # ------------------------------------------------------------------
+
+    def _propagate(self, node, delta):
+        while node is not None and delta:
+            node.total_size += delta
+            node = node.parent
+
+    def _detach(self, node):
+        parent = node.parent
+        if parent is not None and parent.children is not None:
+            parent.children.pop(node.name, None)
+            self._propagate(parent, -node.total_size)
+
+    def refresh(self, rel_path):
+        """Sincroniza con el disco el nodo de una ruta (creada, modificada o eliminada)."""
+        with self._lock:
+            if self._tree is None:
+                return
+            parts = self._parts(rel_path)
+            path = os.path.join(self.root, *parts)
+            if not parts:
+                try:
+                    self._tree.mtime = os.stat(path).st_mtime
+                except OSError:
+                    self._tree = None
+                return
+
+            parent = self._lookup(parts[:-1])
+            if parent is None or parent.children is None:
+                # El padre aún no está en el índice: se añadirá con su propio evento
+                return
+            node = parent.children.get(parts[-1])
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                if node is not None:
+                    self._detach(node)
+                return
+
+            is_dir = stat.S_ISDIR(st.st_mode)
+            if node is not None and node.is_dir == is_dir:
+                node.mtime = st.st_mtime
+                node.mode = st.st_mode
+                if not is_dir and node.size != st.st_size:
+                    delta = st.st_size - node.size
+                    node.size = st.st_size
+                    node.total_size = st.st_size
+                    self._propagate(parent, delta)
+                return
+
+            if node is not None:
+                self._detach(node)
+            node = _Node(parts[-1], is_dir, st, parent=parent)
+            if is_dir:
+                if os.path.islink(path):
+                    node.children = None
+                else:
+                    self._scan(path, node)
+            parent.children[node.name] = node
+            self._propagate(parent, node.total_size)
+
+    def apply_event(self, src_path, dest_path=None):
+        """Aplica un evento de watchdog con rutas absolutas dentro del workspace."""
+        try:
+            for path in (src_path, dest_path):
+                if path:
+                    self.refresh(os.path.relpath(path, self.root))
+        except Exception as e:
+            logger.error(f"Error actualizando el índice de {self.root}: {str(e)}")
+            self.invalidate()
+
+
+def scan_directory(directory):
+    """Lista un directorio leyendo el sistema de archivos (sin índice)."""
+    try:
+        iterator = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    entries = []
+    with iterator:
+        for entry in iterator:
+            try:
+                is_dir, st = _scan_entry(entry)
+            except OSError:
+                continue
+            entries.append(_Node(entry.name, is_dir, st).to_entry())
+    for entry in entries:
+        # Sin índice no se conoce el tamaño acumulado
+        entry['total_size'] = None
+    return entries
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_watching = threading.Event()
+
+
+def set_watching(active):
+    """Indica si el observador de archivos está activo; sin él los índices se descartan."""
+    with _indexes_lock:
+        if active:
+            _watching.set()
+        else:
+            _watching.clear()
+            _indexes.clear()
+
+
+def get_workspace_index(workspace_path):
+    """Devuelve el índice de un workspace, o None si no hay observador que lo mantenga."""
+    if not _watching.is_set():
+        return None
+    root = os.path.abspath(workspace_path)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = WorkspaceIndex(root)
+        return index
+
+
+def sync_path(workspace_path, rel_path):
+    """
+    Aplica al índice una escritura o un borrado hecho por la propia aplicación,
+    sin esperar al evento del observador: el listado que el cliente pide justo
+    después de guardar ya incluye el cambio.
+
+    Se refresca cada directorio de la ruta, de arriba abajo, para que los
+    directorios recién creados por la escritura también entren en el índice.
+
+    Args:
+        workspace_path: Raíz del workspace
+        rel_path: Ruta modificada, relativa a la raíz o absoluta dentro de ella
+    """
+    root = os.path.abspath(workspace_path)
+    with _indexes_lock:
+        index = _indexes.get(root)
+    if index is None:
+        return
+    parts = index._parts(os.path.relpath(os.path.join(root, rel_path), root))
+    if parts and parts[0] == '..':
+        return
+    try:
+        for depth in range(1, len(parts) + 1):
+            index.refresh(os.path.join(*parts[:depth]))
+    except Exception as e:
+        logger.error(f"Error actualizando el índice de {index.root}: {str(e)}")
+        index.invalidate()
+
+
+def handle_fs_event(src_path, dest_path=None):
+    """Aplica un evento del observador a los índices de los workspaces afectados."""
+    with _indexes_lock:
+        if not _indexes:
+            return
+        indexes = dict(_indexes)
+    for path in (src_path, dest_path):
+        if not path:
+            continue
+        # Buscar el workspace indexado que contiene la ruta
+        candidate = os.path.dirname(os.path.abspath(path))
+        while True:
+            index = indexes.get(candidate)
+            if index is not None:
+                index.apply_event(path)
+                break
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+
+
+def list_directory(workspace_path, rel_dir='.'):
+    """
+    Lista un directorio de un workspace, desde el índice si está disponible.
+
+    Args:
+        workspace_path: Raíz del workspace
+        rel_dir: Directorio relativo a la raíz
+
+    Returns:
+        list: Dicts con name, is_dir, size, modified, mode y total_size
+            (None si no se conoce), o None si el directorio no existe
+    """
+    index = get_workspace_index(workspace_path)
+    if index is not None:
+        try:
+            return index.list(rel_dir)
+        except OSError:
+            index.invalidate()
+    return scan_directory(os.path.join(str(workspace_path), str(rel_dir)))
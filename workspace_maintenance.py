@@ -0,0 +1,555 @@
+"""
+Cuotas de los workspaces y limpieza periódica de user_workspaces/.
+
+El uso de cada workspace se obtiene del índice de metadatos (workspace_index),
+que el observador de watchdog mantiene al día: consultar la cuota cuesta una
+búsqueda en memoria, no un recorrido del disco. Sin observador se recorre el
+workspace y el resultado se reutiliza durante USAGE_CACHE_SECONDS.
+
+- Cuota blanda: las escrituras se aceptan, pero se avisa al cliente.
+- Cuota dura: las escrituras que la superarían se rechazan (QuotaExceededError).
+  Los comandos (terminal, PTY, instalaciones, git clone, redirecciones) no
+  pasan por check_write: before_spawn, registrado como guardián de
+  command_stream, les fija RLIMIT_FSIZE a lo que queda de cuota. Es un límite
+  por archivo, no del total, pero impide que un solo proceso llene el disco.
+
+El último acceso de cada workspace se registra con touch() desde todos los
+puntos de entrada (archivos, comandos, PTY) y se guarda en la tabla
+workspace_access en cada pasada, de modo que sobrevive a los reinicios y se
+comparte entre workers.
+
+El servicio de mantenimiento libera espacio por niveles, de lo más barato de
+regenerar a lo más costoso:
+
+1. Artefactos ZIP de la caché sin usar y ZIP antiguos de projects/ cuyo
+   directorio sigue existiendo (se pueden volver a generar).
+2. Blobs sin referencias del almacén de contenido (blob_store).
+3. Workspaces inactivos, en orden LRU por último acceso, solo si
+   WORKSPACE_EVICTION_ENABLED está activado (por defecto no): los que superan
+   WORKSPACE_IDLE_EVICT_SECONDS siempre y, si el disco está por debajo de
+   DISK_MIN_FREE_RATIO, los inactivos más de
+   WORKSPACE_PRESSURE_MIN_IDLE_SECONDS hasta cubrir el espacio que falta.
+   Nunca se toca un workspace con procesos o terminales abiertas (ver
+   add_busy_probe). El borrado es blando: el workspace se mueve a
+   .trash/<nombre>-<instante> y se elimina del todo pasados
+   WORKSPACE_TRASH_RETENTION_SECONDS, o en la siguiente pasada si sigue
+   faltando espacio. Hasta entonces se puede restaurar moviéndolo de vuelta.
+"""
+import os
+import time
+import shutil
+import logging
+import threading
+from datetime import timezone
+
+from sqlalchemy import create_engine, MetaData, Table, Column, String, DateTime, Float, select, update, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from workspace_index import get_workspace_index
+from zip_artifacts import get_artifact_cache
+from blob_store import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+WORKSPACES_DIR = os.environ.get('WORKSPACES_DIR', 'user_workspaces')
+SOFT_QUOTA_BYTES = int(os.environ.get('WORKSPACE_SOFT_QUOTA_BYTES', str(512 * 1024 * 1024)))
+HARD_QUOTA_BYTES = int(os.environ.get('WORKSPACE_HARD_QUOTA_BYTES', str(1024 * 1024 * 1024)))
+USAGE_CACHE_SECONDS = float(os.environ.get('WORKSPACE_USAGE_CACHE_SECONDS', '60'))
+
+MAINTENANCE_INTERVAL = float(os.environ.get('WORKSPACE_MAINTENANCE_INTERVAL', '300'))
+ARTIFACT_MAX_AGE_SECONDS = float(os.environ.get('ARTIFACT_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+PROJECT_ZIP_MAX_AGE_SECONDS = float(os.environ.get('PROJECT_ZIP_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+WORKSPACE_IDLE_EVICT_SECONDS = float(os.environ.get('WORKSPACE_IDLE_EVICT_SECONDS', str(30 * 24 * 3600)))
+WORKSPACE_PRESSURE_MIN_IDLE_SECONDS = float(os.environ.get('WORKSPACE_PRESSURE_MIN_IDLE_SECONDS', str(24 * 3600)))
+DISK_MIN_FREE_RATIO = float(os.environ.get('DISK_MIN_FREE_RATIO', '0.10'))
+EVICTION_ENABLED = os.environ.get('WORKSPACE_EVICTION_ENABLED', '0').lower() in ('1', 'true', 'yes')
+TRASH_RETENTION_SECONDS = float(os.environ.get('WORKSPACE_TRASH_RETENTION_SECONDS', str(7 * 24 * 3600)))
+TRASH_DIR = '.trash'
+# Directorios de user_workspaces/ que no son workspaces de usuario o no se eliminan nunca
+PROTECTED_WORKSPACES = {name.strip() for name in
+                        os.environ.get('PROTECTED_WORKSPACES', 'default,projects').split(',') if name.strip()}
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.abspath(os.path.join('instance', 'codestorm.db'))
+WORKSPACE_DATABASE_URL = os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL
+
+# Tabla de models.Workspace; solo se lee last_accessed, sin depender de Flask-SQLAlchemy
+workspaces_table = Table(
+    'workspaces', MetaData(),
+    Column('name', String(64)),
+    Column('path', String(256)),
+    Column('last_accessed', DateTime)
+)
+
+# Últimos accesos registrados con touch(), por nombre de directorio del workspace
+access_table = Table(
+    'workspace_access', MetaData(),
+    Column('name', String(255), primary_key=True),
+    Column('last_accessed', Float, nullable=False)
+)
+
+
+class QuotaExceededError(Exception):
+    """La escritura superaría la cuota dura del workspace."""
+
+    def __init__(self, usage, limit):
+        super().__init__(f"Cuota del workspace superada: {usage} de {limit} bytes")
+        self.usage = usage
+        self.limit = limit
+
+
+def _scan_usage(path):
+    """Tamaño total de un directorio recorriéndolo (sin seguir enlaces)."""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            iterator = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return total
+
+
+class WorkspaceMaintenance:
+    """Contabilidad de cuotas y limpieza por niveles de los workspaces."""
+
+    def __init__(self, root=WORKSPACES_DIR, soft_quota=SOFT_QUOTA_BYTES, hard_quota=HARD_QUOTA_BYTES,
+                 interval=MAINTENANCE_INTERVAL, database_url=WORKSPACE_DATABASE_URL,
+                 eviction_enabled=EVICTION_ENABLED):
+        self.root = os.path.abspath(root)
+        self.soft_quota = soft_quota
+        self.hard_quota = hard_quota
+        self.interval = interval
+        self.database_url = database_url
+        self.eviction_enabled = eviction_enabled
+        self._engine = None
+        self._usage_cache = {}    # ruta del workspace -> (instante, bytes)
+        self._accessed = {}       # nombre del workspace -> último acceso aún sin guardar
+        self._busy_probes = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration': None,
+            'reclaimed_bytes': {'artifacts': 0, 'project_zips': 0, 'blobs': 0, 'workspaces': 0},
+            'evicted_workspaces': 0,
+            'purged_workspaces': 0,
+            'skipped_busy': 0,
+            'rejected_writes': 0,
+            'over_soft_quota': [],
+            'over_hard_quota': []
+        }
+
+    # ------------------------------------------------------------------
+    # Cuotas
+    # ------------------------------------------------------------------
+
+    def usage(self, workspace_path):
+        """Bytes ocupados por un workspace."""
+        root = os.path.abspath(workspace_path)
+        index = get_workspace_index(root)
+        if index is not None:
+            try:
+                size = index.total_size('.')
+                if size is not None:
+                    return size
+            except OSError:
+                index.invalidate()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._usage_cache.get(root)
+        if cached is not None and now - cached[0] < USAGE_CACHE_SECONDS:
+            return cached[1]
+        size = _scan_usage(root)
+        with self._lock:
+            self._usage_cache[root] = (now, size)
+        return size
+
+    def check_write(self, workspace_path, new_bytes, target_path=None):
+        """
+        Comprueba si una escritura cabe en la cuota del workspace.
+
+        Args:
+            workspace_path: Raíz del workspace
+            new_bytes: Tamaño del contenido que se va a escribir
+            target_path: Archivo que se reemplaza (su tamaño actual se descuenta)
+
+        Returns:
+            dict: usage, soft_quota, hard_quota y over_soft_quota tras la escritura
+
+        Raises:
+            QuotaExceededError: Si la escritura superaría la cuota dura
+        """
+        current = self.usage(workspace_path)
+        replaced = 0
+        if target_path is not None:
+            try:
+                replaced = os.stat(target_path).st_size
+            except OSError:
+                pass
+        projected = current - replaced + new_bytes
+        if self.hard_quota and projected > self.hard_quota and new_bytes > replaced:
+            with self._lock:
+                self._metrics['rejected_writes'] += 1
+            raise QuotaExceededError(projected, self.hard_quota)
+        with self._lock:
+            # Sin índice, la siguiente consulta debe ver el nuevo tamaño
+            cached = self._usage_cache.get(os.path.abspath(workspace_path))
+            if cached is not None:
+                self._usage_cache[os.path.abspath(workspace_path)] = (cached[0], projected)
+        return {
+            'usage': projected,
+            'soft_quota': self.soft_quota,
+            'hard_quota': self.hard_quota,
+            'over_soft_quota': bool(self.soft_quota) and projected > self.soft_quota
+        }
+
+    def _workspace_name(self, path):
+        """Nombre del workspace que contiene path, o None si está fuera de user_workspaces/."""
+        relative = os.path.relpath(os.path.abspath(str(path)), self.root)
+        name = relative.split(os.sep, 1)[0]
+        if name in ('.', '..') or name.startswith('.'):
+            return None
+        return name
+
+    def touch(self, workspace_path):
+        """Registra un acceso al workspace (protege de la limpieza por inactividad)."""
+        name = self._workspace_name(workspace_path)
+        if name is not None:
+            with self._lock:
+                self._accessed[name] = time.time()
+
+    def before_spawn(self, cwd):
+        """
+        Guardián de command_stream: cuenta el comando como acceso y limita su escritura.
+
+        Returns:
+            int: Bytes que cada archivo puede alcanzar (lo que queda de cuota dura,
+                 0 si ya se superó: los comandos que borran siguen funcionando);
+                 None fuera de un workspace o sin cuota dura
+        """
+        name = self._workspace_name(cwd)
+        if name is None:
+            return None
+        self.touch(cwd)
+        if not self.hard_quota:
+            return None
+        return max(self.hard_quota - self.usage(os.path.join(self.root, name)), 0)
+
+    def add_busy_probe(self, probe):
+        """
+        Registra probe(), que devuelve las rutas en uso (procesos, terminales).
+
+        Los workspaces que contienen alguna de esas rutas no se limpian nunca.
+        """
+        self._busy_probes.append(probe)
+
+    def _busy_workspaces(self):
+        """Nombres de los workspaces en uso; None si alguna sonda falla (no se limpia nada)."""
+        busy = set()
+        for probe in self._busy_probes:
+            try:
+                paths = list(probe())
+            except Exception as e:
+                logger.error(f"No se pudo comprobar qué workspaces están en uso: {str(e)}")
+                return None
+            for path in paths:
+                name = self._workspace_name(path)
+                if name is not None:
+                    busy.add(name)
+        return busy
+
+    # ------------------------------------------------------------------
+    # Limpieza
+    # ------------------------------------------------------------------
+
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = create_engine(self.database_url, pool_pre_ping=True)
+            access_table.metadata.create_all(self._engine)
+        return self._engine
+
+    def flush_access(self):
+        """Guarda los accesos registrados con touch() (conserva el más reciente)."""
+        with self._lock:
+            pending, self._accessed = self._accessed, {}
+        if not pending:
+            return
+        try:
+            with self._get_engine().begin() as conn:
+                for name, timestamp in pending.items():
+                    updated = conn.execute(
+                        update(access_table)
+                        .where(access_table.c.name == name, access_table.c.last_accessed < timestamp)
+                        .values(last_accessed=timestamp)
+                    ).rowcount
+                    if not updated and conn.execute(
+                            select(access_table.c.name).where(access_table.c.name == name)).first() is None:
+                        conn.execute(insert(access_table).values(name=name, last_accessed=timestamp))
+        except SQLAlchemyError as e:
+            logger.error(f"No se pudieron guardar los accesos a los workspaces: {str(e)}")
+            with self._lock:
+                for name, timestamp in pending.items():
+                    self._accessed[name] = max(self._accessed.get(name, 0), timestamp)
+
+    def _last_accessed_from_db(self):
+        """Último acceso por nombre de workspace (workspace_access y Workspace.last_accessed)."""
+        accessed = {}
+        try:
+            with self._get_engine().connect() as conn:
+                for name, timestamp in conn.execute(select(access_table.c.name, access_table.c.last_accessed)):
+                    accessed[name] = timestamp
+        except SQLAlchemyError as e:
+            logger.error(f"No se pudieron leer los accesos a los workspaces: {str(e)}")
+            return None
+        try:
+            with self._engine.connect() as conn:
+                rows = conn.execute(select(workspaces_table.c.name, workspaces_table.c.last_accessed)).all()
+        except SQLAlchemyError:
+            rows = []  # Sin la tabla de models.Workspace
+        for name, last_accessed in rows:
+            if last_accessed is None:
+                continue
+            timestamp = last_accessed.replace(tzinfo=timezone.utc).timestamp()
+            accessed[name] = max(accessed.get(name, 0), timestamp)
+        return accessed
+
+    def _workspaces_by_lru(self):
+        """
+        Workspaces de usuario como (último acceso, ruta), del menos reciente al más reciente.
+
+        Un workspace sin ningún acceso registrado se da por usado ahora: el
+        plazo de inactividad empieza a contar cuando se ve por primera vez.
+        Si la base de datos no responde, todos se dan por usados ahora.
+        """
+        self.flush_access()
+        db_accessed = self._last_accessed_from_db()
+        first_seen = db_accessed is not None
+        db_accessed = db_accessed or {}
+        now = time.time()
+        workspaces = []
+        try:
+            iterator = os.scandir(self.root)
+        except OSError:
+            return []
+        with iterator:
+            for entry in iterator:
+                if entry.name.startswith('.') or entry.name in PROTECTED_WORKSPACES:
+                    continue
+                try:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                last_used = db_accessed.get(entry.name)
+                if last_used is None:
+                    last_used = now
+                    if first_seen:
+                        with self._lock:
+                            self._accessed.setdefault(entry.name, now)
+                workspaces.append((last_used, entry.path))
+        workspaces.sort()
+        return workspaces
+
+    def _bytes_needed(self):
+        """Bytes que faltan para volver a DISK_MIN_FREE_RATIO de espacio libre (0 si sobra)."""
+        try:
+            disk = shutil.disk_usage(self.root)
+        except OSError:
+            return 0
+        return max(int(disk.total * DISK_MIN_FREE_RATIO) - disk.free, 0)
+
+    def _disk_pressure(self):
+        return self._bytes_needed() > 0
+
+    def _expire_project_zips(self, max_age):
+        """ZIP de projects/ antiguos cuyo proyecto puede volver a comprimirse."""
+        projects_dir = os.path.join(self.root, 'projects')
+        freed = 0
+        cutoff = time.time() - max_age
+        try:
+            names = os.listdir(projects_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.zip'):
+                continue
+            path = os.path.join(projects_dir, name)
+            project_dir = os.path.join(projects_dir, name[:-len('.zip')])
+            # Un ZIP sin directorio es la única copia del proyecto; los de error se regeneran
+            if not name.endswith('_error.zip') and not os.path.isdir(project_dir):
+                continue
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            freed += st.st_size
+        return freed
+
+    def _evict_workspace(self, path):
+        """Mueve un workspace inactivo a la papelera; devuelve los bytes que liberará al purgarse."""
+        size = self.usage(path)
+        name = os.path.basename(path)
+        trash_dir = os.path.join(self.root, TRASH_DIR)
+        target = os.path.join(trash_dir, f"{name}-{int(time.time())}")
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+            os.rename(path, target)
+        except OSError as e:
+            logger.error(f"No se pudo retirar el workspace inactivo {path}: {str(e)}")
+            return 0
+        with self._lock:
+            self._usage_cache.pop(os.path.abspath(path), None)
+            self._accessed.pop(name, None)
+            self._metrics['evicted_workspaces'] += 1
+        logger.info(f"Workspace inactivo movido a la papelera: {path} -> {target} ({size} bytes)")
+        return size
+
+    def _purge_trash(self, max_age):
+        """Elimina de la papelera los workspaces retirados hace más de max_age segundos."""
+        trash_dir = os.path.join(self.root, TRASH_DIR)
+        cutoff = time.time() - max_age
+        freed = 0
+        try:
+            names = os.listdir(trash_dir)
+        except OSError:
+            return 0
+        for name in names:
+            try:
+                retired_at = int(name.rsplit('-', 1)[1])
+            except (IndexError, ValueError):
+                retired_at = 0
+            if retired_at > cutoff:
+                continue
+            path = os.path.join(trash_dir, name)
+            size = _scan_usage(path)
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                logger.error(f"No se pudo purgar {path}: {str(e)}")
+                continue
+            freed += size
+            with self._lock:
+                self._metrics['purged_workspaces'] += 1
+            logger.info(f"Workspace purgado de la papelera: {name} ({size} bytes)")
+        return freed
+
+    def run_once(self):
+        """
+        Ejecuta una pasada de mantenimiento.
+
+        Returns:
+            dict: Bytes liberados por nivel en esta pasada
+        """
+        started = time.monotonic()
+        reclaimed = {'artifacts': 0, 'project_zips': 0, 'blobs': 0, 'workspaces': 0}
+        pressure = self._disk_pressure()
+
+        # Nivel 1: artefactos regenerables (todos si falta espacio)
+        reclaimed['artifacts'] = get_artifact_cache().expire(0 if pressure else ARTIFACT_MAX_AGE_SECONDS)['bytes']
+        reclaimed['project_zips'] = self._expire_project_zips(0 if pressure else PROJECT_ZIP_MAX_AGE_SECONDS)
+
+        # Nivel 2: blobs sin referencias
+        reclaimed['blobs'] = get_blob_store().collect_garbage()['bytes']
+
+        # Nivel 3: workspaces inactivos por LRU (papelera primero, si falta espacio)
+        reclaimed['workspaces'] = self._purge_trash(0 if self._disk_pressure() else TRASH_RETENTION_SECONDS)
+        needed = self._bytes_needed()
+        busy = self._busy_workspaces() if self.eviction_enabled else None
+        now = time.time()
+        over_soft, over_hard = [], []
+        for last_used, path in self._workspaces_by_lru():
+            idle = now - last_used
+            name = os.path.basename(path)
+            evictable = busy is not None and name not in busy
+            if busy is not None and name in busy:
+                with self._lock:
+                    self._metrics['skipped_busy'] += 1
+            if evictable and WORKSPACE_IDLE_EVICT_SECONDS and idle > WORKSPACE_IDLE_EVICT_SECONDS:
+                self._evict_workspace(path)
+                continue
+            if evictable and needed > 0 and idle > WORKSPACE_PRESSURE_MIN_IDLE_SECONDS:
+                # El espacio se libera al purgar la papelera en la siguiente pasada
+                needed -= self._evict_workspace(path)
+                continue
+            size = self.usage(path)
+            if self.hard_quota and size > self.hard_quota:
+                over_hard.append({'workspace': name, 'usage': size})
+            elif self.soft_quota and size > self.soft_quota:
+                over_soft.append({'workspace': name, 'usage': size})
+
+        with self._lock:
+            metrics = self._metrics
+            metrics['runs'] += 1
+            metrics['last_run'] = time.time()
+            metrics['last_duration'] = time.monotonic() - started
+            for tier, freed in reclaimed.items():
+                metrics['reclaimed_bytes'][tier] += freed
+            metrics['over_soft_quota'] = over_soft
+            metrics['over_hard_quota'] = over_hard
+
+        if any(reclaimed.values()):
+            logger.info(f"Mantenimiento de workspaces: {reclaimed}")
+        if self._disk_pressure():
+            logger.warning("Espacio en disco por debajo del mínimo tras el mantenimiento")
+        return reclaimed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error en el mantenimiento de workspaces: {str(e)}")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='workspace-maintenance', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush_access()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['reclaimed_bytes'] = dict(self._metrics['reclaimed_bytes'])
+        metrics['reclaimed_bytes_total'] = sum(metrics['reclaimed_bytes'].values())
+        metrics['soft_quota'] = self.soft_quota
+        metrics['hard_quota'] = self.hard_quota
+        metrics['eviction_enabled'] = self.eviction_enabled
+        metrics['disk_pressure'] = self._disk_pressure()
+        return metrics
+
+
+_maintenance = None
+_maintenance_lock = threading.Lock()
+
+
+def get_workspace_maintenance():
+    """Obtiene la instancia global del servicio de mantenimiento de workspaces."""
+    global _maintenance
+    if _maintenance is None:
+        with _maintenance_lock:
+            if _maintenance is None:
+                _maintenance = WorkspaceMaintenance()
+    return _maintenance
@@ -0,0 +1,115 @@
+"""
+Resolución de workspaces sin escrituras en base de datos por petición.
+
+Cada llamada de la API de archivos o comandos resolvía el workspace del
+usuario consultando User y Workspace y actualizando last_accessed con un
+commit, lo que serializaba las peticiones en el bloqueo de escritura de
+SQLite. WorkspaceResolver registra los accesos en memoria y un hilo los
+escribe en lote cada FLUSH_INTERVAL segundos: el registro del workspace (una
+vez por proceso) y un único UPDATE con todos los last_accessed pendientes.
+
+La base de datos se maneja mediante dos funciones que aporta la aplicación,
+para no depender aquí de sus modelos:
+
+- register(user_id, path): crea o busca el registro y devuelve su clave.
+- flush_touches({clave: datetime}): actualiza last_accessed en una transacción.
+"""
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.environ.get('WORKSPACE_TOUCH_FLUSH_INTERVAL', '30'))
+
+
+class WorkspaceResolver:
+    """Memoriza los registros de workspaces y agrupa las escrituras de last_accessed."""
+
+    def __init__(self, register, flush_touches, interval=FLUSH_INTERVAL):
+        self.register = register
+        self.flush_touches = flush_touches
+        self.interval = interval
+        self._keys = {}       # user_id -> clave del registro en la base de datos
+        self._pending = {}    # user_id -> (ruta, último acceso)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, user_id, path):
+        """Registra un acceso al workspace; no toca la base de datos."""
+        with self._lock:
+            self._pending[user_id] = (path, datetime.utcnow())
+
+    def workspace_key(self, user_id):
+        """Clave memorizada del registro del workspace, o None si aún no se ha escrito."""
+        return self._keys.get(user_id)
+
+    def flush(self):
+        """
+        Escribe los accesos pendientes.
+
+        Returns:
+            int: Workspaces actualizados
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            touches = {}
+            for user_id, (path, accessed_at) in pending.items():
+                key = self._keys.get(user_id)
+                if key is None:
+                    try:
+                        key = self._keys[user_id] = self.register(user_id, path)
+                    except Exception as e:
+                        logger.error(f"Error registrando el workspace {user_id}: {str(e)}")
+                        self._requeue(user_id, path, accessed_at)
+                        continue
+                touches[key] = accessed_at
+
+            if touches:
+                try:
+                    self.flush_touches(touches)
+                except Exception as e:
+                    logger.error(f"Error actualizando last_accessed de {len(touches)} workspaces: {str(e)}")
+                    for user_id, (path, accessed_at) in pending.items():
+                        if self._keys.get(user_id) in touches:
+                            self._requeue(user_id, path, accessed_at)
+                    return 0
+            return len(touches)
+
+    def _requeue(self, user_id, path, accessed_at):
+        # Un acceso más reciente registrado durante el volcado tiene prioridad
+        with self._lock:
+            self._pending.setdefault(user_id, (path, accessed_at))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='workspace-touch-flush', daemon=True)
+                self._thread.start()
+                # No perder los accesos pendientes al detener el proceso
+                atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'registered': len(self._keys), 'pending': len(self._pending)}
@@ -1,15 +1,28 @@
 import os
 import json
 import uuid
+import queue
 import logging
+import threading
 import subprocess
 import shutil
 from pathlib import Path
 from functools import lru_cache
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, Response, stream_with_context
+from flask import session as flask_session
 from flask_socketio import emit, join_room, leave_room
 import traceback
 from werkzeug.utils import secure_filename
+from workspace_index import list_directory, sync_path
+import search_index
+from file_reads import read_file_payload
+from file_patches import write_file_atomic, apply_patch, StaleBaseError, PatchError
+from yjs_store import get_yjs_store, decode_payload, encode_payload, InvalidUpdateError
+from workspace_maintenance import get_workspace_maintenance, QuotaExceededError
+from pty_sessions import PtySessionManager, SessionLimitError, PtyUnavailableError, session_room
+import command_stream
+from command_policy import check_command, TERMINAL_POLICY
+from command_service import get_command_service, QueueFullError, QueueTimeoutError
 
 # Configuración de logging
 logging.basicConfig(
@@ -56,6 +69,7 @@ class WorkspaceManager:
             # Crear README inicial si no existe
             self._initialize_workspace(workspace_path)
 
+        get_workspace_maintenance().touch(self.workspaces[user_id])
         return self.workspaces[user_id]
 
     def _initialize_workspace(self, workspace_path):
@@ -83,6 +97,9 @@ class WorkspaceManager:
 # Instancia global del gestor de workspaces
 workspace_manager = WorkspaceManager()
 
+# Shells persistentes de las terminales; se crea en init_xterm_blueprint
+pty_manager = None
+
 # Caché para comandos frecuentes
 @lru_cache(maxsize=100)
 def get_command_suggestion(text_key):
@@ -121,14 +138,22 @@ def execute_xterm_command():
         workspace_path = workspace_manager.get_workspace_path(user_id)
 
         # Validar comando por seguridad
-        if not is_command_safe(command):
+        decision = is_command_safe(command)
+        if not decision:
             return jsonify({
                 'success': False,
-                'error': 'Comando no permitido por razones de seguridad'
+                'error': f'Comando no permitido por razones de seguridad: {decision.reason}',
+                'policy': decision.to_dict()
             }), 403
 
-        # Ejecutar comando
-        result = execute_command(command, workspace_path)
+        # Con stream=1 la salida se envía mientras el comando se ejecuta
+        if request.args.get('stream') or data.get('stream'):
+            return Response(stream_with_context(ndjson_command_stream(user_id, command, workspace_path)),
+                            mimetype='application/x-ndjson',
+                            headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+        # Ejecutar comando en el pool de comandos, en la cola del workspace
+        result = get_command_service().run(user_id, execute_command, command, workspace_path)
 
         return jsonify({
             'success': result['success'],
@@ -143,6 +168,11 @@ def execute_xterm_command():
             'success': False,
             'error': str(e)
         }), 400
+    except (QueueFullError, QueueTimeoutError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 429 if isinstance(e, QueueFullError) else 503
     except Exception as e:
         logger.error(f"Error ejecutando comando XTerm: {str(e)}")
         logger.error(traceback.format_exc())
@@ -229,6 +259,8 @@ def delete_file():
                 shutil.rmtree(full_path)
             else:
                 os.remove(full_path)
+            sync_path(workspace_manager.get_workspace_path(user_id), full_path)
+            search_index.sync_path(workspace_manager.get_workspace_path(user_id), full_path)
 
             return jsonify({
                 'success': True,
@@ -249,74 +281,18 @@ def delete_file():
         }), 500
 
 def is_command_safe(command):
-    """Verifica si un comando es seguro para ejecutar."""
-    # Lista de comandos prohibidos por seguridad
-    dangerous_commands = [
-        'rm -rf /', 'rm -rf *', 'rm -rf ~', 'rm -rf .', 
-        'wget', 'curl', 'sudo', 'su', 'chmod 777', 
-        '>', '|', ';', '&&', '||', '`', '$(',
-    ]
-
-    # Verificar si el comando contiene alguno de los patrones peligrosos
-    command_lower = command.lower()
-    for dangerous in dangerous_commands:
-        if dangerous in command_lower:
-            # Permitir algunos casos específicos
-            if dangerous in ['>', '|'] and is_redirection_safe(command):
-                continue
-            return False
-
-    return True
-
-def is_redirection_safe(command):
-    """Verifica si una redirección es segura."""
-    # Permitir redirecciones simples a archivos dentro del directorio actual
-    if '>' in command:
-        parts = command.split('>')
-        if len(parts) == 2 and not any(c in parts[1] for c in ['/', '..']):
-            return True
-
-    # Permitir pipes simples entre comandos básicos
-    if '|' in command:
-        parts = command.split('|')
-        if all(is_basic_command(part.strip()) for part in parts):
-            return True
-
-    return False
-
-def is_basic_command(cmd):
-    """Verifica si es un comando básico."""
-    basic_commands = ['ls', 'cat', 'grep', 'sed', 'awk', 'head', 'tail', 'wc', 'sort', 'uniq']
-    return any(cmd.startswith(bc) for bc in basic_commands)
-
-def execute_command(command, cwd):
-    """Ejecuta un comando y devuelve su resultado."""
-    try:
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            cwd=str(cwd),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+    """
+    Evalúa un comando con la política de seguridad de las terminales.
 
-        stdout, stderr = process.communicate(timeout=10)  # Timeout de 10 segundos
+    Returns:
+        Decision: Verdadera si el comando está permitido; reason explica el rechazo
+    """
+    return check_command(command, TERMINAL_POLICY)
 
-        return {
-            'success': process.returncode == 0,
-            'stdout': stdout,
-            'stderr': stderr,
-            'returncode': process.returncode
-        }
-    except subprocess.TimeoutExpired:
-        process.kill()
-        return {
-            'success': False,
-            'stdout': '',
-            'stderr': 'Comando cancelado: tiempo de ejecución excedido (10s)',
-            'returncode': 124
-        }
+def execute_command(command, cwd, env=None):
+    """Ejecuta un comando y devuelve su resultado (con la salida acotada al scrollback)."""
+    try:
+        return command_stream.run_command(command, cwd, timeout=10, env=env)
     except Exception as e:
         return {
             'success': False,
@@ -325,10 +301,136 @@ def execute_command(command, cwd):
             'returncode': 1
         }
 
+def submit_command(user_id, job, on_rejected):
+    """
+    Encola job en el servicio de comandos, en la cola del workspace del usuario.
+
+    on_rejected(mensaje) se llama si la cola está llena o si el trabajo caduca
+    antes de ejecutarse.
+    """
+    try:
+        future = get_command_service().submit(user_id, job)
+    except QueueFullError as e:
+        on_rejected(str(e))
+        return None
+
+    def check_expired(future):
+        if not future.cancelled() and isinstance(future.exception(), QueueTimeoutError):
+            on_rejected(str(future.exception()))
+
+    future.add_done_callback(check_expired)
+    return future
+
+def stream_command_events(send, command, cwd, terminal_id, data, env=None):
+    """
+    Ejecuta un comando enviando su salida al cliente como eventos command_output.
+
+    Args:
+        send: Función (evento, payload) que emite al cliente que lanzó el comando
+
+    Con data['ack'] (por defecto) el cliente debe confirmar los fragmentos con
+    command_ack; si se retrasa, deja de leerse la salida del proceso.
+    """
+    def emit_chunk(chunk):
+        chunk['terminal_id'] = terminal_id
+        send('command_output', chunk)
+
+    return command_stream.stream_command(
+        command, cwd, emit_chunk,
+        command_id=data.get('command_id'),
+        window=command_stream.WINDOW if data.get('ack', True) else 0,
+        env=env
+    )
+
+def ndjson_command_stream(user_id, command, cwd):
+    """
+    Salida de un comando como líneas JSON: {seq, stream, data} y al final {done, ...}.
+
+    El comando se ejecuta en el servicio de comandos y pasa los fragmentos por
+    una cola acotada: el trabajo solo lee del proceso a medida que el servidor
+    WSGI envía la respuesta. Si el cliente se desconecta, el proceso se termina.
+    """
+    chunks = queue.Queue(maxsize=command_stream.WINDOW)
+    closed = threading.Event()
+
+    def run_job():
+        process = command_stream.CommandProcess(command, cwd)
+        tail = command_stream.OutputTail()
+        seq = 0
+        for chunk in process.chunks():
+            seq += 1
+            tail.append(seq, chunk['stream'], chunk['data'])
+            try:
+                chunks.put({'seq': seq, **chunk}, timeout=command_stream.ACK_TIMEOUT)
+            except queue.Full:
+                closed.set()
+            if closed.is_set():
+                # Cliente desconectado o sin leer: cerrar el generador mata el proceso
+                return
+        try:
+            chunks.put({
+                'done': True,
+                'success': process.returncode == 0,
+                'exitCode': process.returncode,
+                'timedOut': process.timed_out,
+                'truncated': tail.truncated
+            }, timeout=command_stream.ACK_TIMEOUT)
+        except queue.Full:
+            closed.set()
+
+    rejections = []
+
+    def reject(message):
+        # Se llama desde callbacks del Future, a veces en un hilo del pool: nunca bloquear.
+        # Si la cola está llena, el generador recoge el rechazo cuando se vacía
+        rejections.append(message)
+        try:
+            chunks.put_nowait({'done': True, 'success': False, 'error': message})
+        except queue.Full:
+            pass
+
+    future = submit_command(user_id, run_job, reject)
+
+    def fail(future):
+        if not future.cancelled() and future.exception() is not None \
+                and not isinstance(future.exception(), QueueTimeoutError):
+            reject(f'Error al ejecutar comando: {str(future.exception())}')
+
+    if future is not None:
+        future.add_done_callback(fail)
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=1)
+            except queue.Empty:
+                if not rejections:
+                    continue
+                item = {'done': True, 'success': False, 'error': rejections[0]}
+            yield json.dumps(item) + '\n'
+            if item.get('done'):
+                return
+    finally:
+        closed.set()
+        if future is not None:
+            future.cancel()
+        # Liberar al trabajo si está bloqueado esperando hueco en la cola
+        while True:
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                break
+
 def init_xterm_blueprint(app, socketio):
     """Registra el blueprint en la aplicación Flask."""
+    global pty_manager
     app.register_blueprint(xterm_bp, url_prefix='/xterm', name='xterm_blueprint')
 
+    pty_manager = PtySessionManager(
+        lambda event, payload, room: socketio.emit(event, payload, room=room)
+    ).start()
+    # Un workspace con una terminal abierta no se limpia por inactividad
+    get_workspace_maintenance().add_busy_probe(pty_manager.workspaces)
+
     # Registrar manejadores de eventos SocketIO
     @socketio.on('connect')
     def handle_connect():
@@ -340,6 +442,8 @@ def init_xterm_blueprint(app, socketio):
     def handle_disconnect():
         """Maneja la desconexión de un cliente."""
         client_id = request.sid
+        # Las terminales siguen vivas hasta que se cierran por inactividad
+        pty_manager.detach(client_id)
         logger.info(f"Cliente desconectado: {client_id}")
 
     @socketio.on('join_room')
@@ -382,12 +486,14 @@ def init_xterm_blueprint(app, socketio):
 
         try:
             # Validar el comando por seguridad
-            if not is_command_safe(command):
+            decision = is_command_safe(command)
+            if not decision:
+                message = f'Comando no permitido por razones de seguridad: {decision.reason}'
                 emit('command_result', {
                     'success': False,
                     'command': command,
-                    'stderr': 'Comando no permitido por razones de seguridad',
-                    'output': 'Comando no permitido por razones de seguridad',
+                    'stderr': message,
+                    'output': message,
                     'terminal_id': terminal_id
                 }, room=request.sid)
                 return
@@ -405,31 +511,60 @@ def init_xterm_blueprint(app, socketio):
                 }, room=request.sid)
                 return
 
-            # Ejecutar comando en esa ruta
-            logger.debug(f"Ejecutando comando: '{command}' en directorio: {current_dir}")
-            result = execute_command(command, current_dir)
+            sid = request.sid
+            # HOME apunta a la raíz del workspace aunque el comando se ejecute en un subdirectorio
+            env = command_stream.workspace_env(workspace_manager.get_workspace_path(user_id))
 
-            # Emitir resultado
-            response = {
-                'success': result['success'],
-                'command': command,
-                'stdout': result.get('stdout', ''),
-                'stderr': result.get('stderr', ''),
-                'output': result.get('stdout', '') if result['success'] else result.get('stderr', ''),
-                'terminal_id': terminal_id
-            }
-            logger.debug(f"Resultado del comando: {result['success']}")
-            emit('command_result', response, room=request.sid)
-
-            # Detectar cambios en archivos para notificar a todos los clientes
-            if result['success'] and any(cmd in command for cmd in FILE_MODIFYING_COMMANDS):
-                room_id = f"workspace_{user_id}"
-                emit('file_change', {
-                    'type': 'command',
-                    'message': f'Comando ejecutado: {command}',
+            def send(event, payload, room=sid):
+                socketio.emit(event, payload, room=room)
+
+            def send_error(message):
+                send('command_result', {
+                    'success': False,
                     'command': command,
-                    'user_id': user_id
-                }, room=room_id)
+                    'stderr': message,
+                    'output': f"Error: {message}",
+                    'terminal_id': terminal_id
+                })
+
+            def run_job():
+                try:
+                    logger.debug(f"Ejecutando comando: '{command}' en directorio: {current_dir}")
+                    if data.get('stream'):
+                        result = stream_command_events(send, command, current_dir, terminal_id, data, env)
+                    else:
+                        result = execute_command(command, current_dir, env)
+
+                    # Emitir resultado
+                    response = {
+                        'success': result['success'],
+                        'command': command,
+                        'stdout': result.get('stdout', ''),
+                        'stderr': result.get('stderr', ''),
+                        'output': result.get('stdout', '') if result['success'] else result.get('stderr', ''),
+                        'truncated': result.get('truncated', False),
+                        'terminal_id': terminal_id
+                    }
+                    if data.get('stream'):
+                        response.update({'streamed': True, 'command_id': result['command_id']})
+                    logger.debug(f"Resultado del comando: {result['success']}")
+                    send('command_result', response)
+
+                    # Detectar cambios en archivos para notificar a todos los clientes
+                    if result['success'] and any(cmd in command for cmd in FILE_MODIFYING_COMMANDS):
+                        send('file_change', {
+                            'type': 'command',
+                            'message': f'Comando ejecutado: {command}',
+                            'command': command,
+                            'user_id': user_id
+                        }, room=f"workspace_{user_id}")
+                except Exception as e:
+                    logger.error(f"Error al ejecutar comando: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    send_error(str(e))
+
+            # El comando espera turno en el pool de comandos; este hilo queda libre
+            submit_command(user_id, run_job, send_error)
 
         except Exception as e:
             logger.error(f"Error al ejecutar comando: {str(e)}")
@@ -442,6 +577,33 @@ def init_xterm_blueprint(app, socketio):
                 'terminal_id': terminal_id
             }, room=request.sid)
 
+    @socketio.on('command_ack')
+    def handle_command_ack(data):
+        """Confirma los fragmentos de salida recibidos hasta seq."""
+        command_stream.ack(data.get('command_id'), int(data.get('seq', 0)))
+
+    @socketio.on('command_cancel')
+    def handle_command_cancel(data):
+        """Cancela un comando con salida en streaming."""
+        command_id = data.get('command_id')
+        if not command_stream.cancel(command_id):
+            emit('command_error', {'error': 'El comando no está en ejecución', 'command_id': command_id},
+                 room=request.sid)
+
+    @socketio.on('command_replay')
+    def handle_command_replay(data):
+        """Reenvía los fragmentos de un comando en curso posteriores a since."""
+        command_id = data.get('command_id')
+        chunks = command_stream.replay(command_id, int(data.get('since', 0)))
+        if chunks is None:
+            emit('command_error', {'error': 'La salida solicitada ya no está disponible',
+                                   'command_id': command_id}, room=request.sid)
+            return
+        for seq, stream, text in chunks:
+            emit('command_output', {'command_id': command_id, 'seq': seq, 'stream': stream,
+                                    'data': text, 'terminal_id': data.get('terminal_id')},
+                 room=request.sid)
+
     @socketio.on('natural_language')
     def handle_natural_language(data):
         """Procesa instrucciones en lenguaje natural de forma segura."""
@@ -471,11 +633,12 @@ def init_xterm_blueprint(app, socketio):
             # Si tenemos un comando, devolverlo
             if command:
                 # Validar el comando por seguridad
-                if not is_command_safe(command):
+                decision = is_command_safe(command)
+                if not decision:
                     emit('instruction_result', {
                         'success': False,
                         'command': command,
-                        'error': 'El comando sugerido no está permitido por razones de seguridad',
+                        'error': f'El comando sugerido no está permitido por razones de seguridad: {decision.reason}',
                         'explanation': 'Por favor, intenta con una instrucción diferente',
                         'terminal_id': terminal_id
                     }, room=request.sid)
@@ -542,21 +705,17 @@ def init_xterm_blueprint(app, socketio):
                 }, room=request.sid)
                 return
 
-            # Listar archivos y directorios
+            # Listar archivos y directorios (desde el índice de metadatos si está activo)
+            workspace_path = workspace_manager.get_workspace_path(user_id)
             contents = []
-            for item in os.listdir(target_dir):
-                item_path = target_dir / item
-                try:
-                    stat_info = item_path.stat()
-                    contents.append({
-                        'name': item,
-                        'is_directory': item_path.is_dir(),
-                        'size': stat_info.st_size if item_path.is_file() else 0,
-                        'modified': stat_info.st_mtime,
-                        'permissions': stat_info.st_mode & 0o777
-                    })
-                except Exception as e:
-                    logger.warning(f"Error al obtener información de {item_path}: {str(e)}")
+            for entry in list_directory(workspace_path, os.path.relpath(target_dir, workspace_path)) or []:
+                contents.append({
+                    'name': entry['name'],
+                    'is_directory': entry['is_dir'],
+                    'size': entry['size'],
+                    'modified': entry['modified'],
+                    'permissions': entry['mode'] & 0o777
+                })
 
             emit('directory_contents', {
                 'success': True,
@@ -611,15 +770,17 @@ def init_xterm_blueprint(app, socketio):
                 }, room=request.sid)
                 return
 
-            # Leer contenido
-            with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
+            # Leer contenido (o el rango pedido); not_modified si el etag del cliente coincide
+            try:
+                result = read_file_payload(full_path, data)
+            except ValueError as e:
+                emit('file_content', {
+                    'success': False,
+                    'error': str(e)
+                }, room=request.sid)
+                return
 
-            emit('file_content', {
-                'success': True,
-                'path': file_path,
-                'content': content
-            }, room=request.sid)
+            emit('file_content', dict(result, success=True, path=file_path), room=request.sid)
 
         except Exception as e:
             logger.error(f"Error al leer archivo: {str(e)}")
@@ -654,12 +815,22 @@ def init_xterm_blueprint(app, socketio):
                 }, room=request.sid)
                 return
 
-            # Crear directorios si no existen
-            os.makedirs(full_path.parent, exist_ok=True)
+            try:
+                quota = get_workspace_maintenance().check_write(
+                    workspace_manager.get_workspace_path(user_id), len(content.encode('utf-8')), full_path)
+            except QuotaExceededError as e:
+                emit('file_written', {
+                    'success': False,
+                    'path': file_path,
+                    'error': str(e),
+                    'quota_exceeded': True
+                }, room=request.sid)
+                return
 
-            # Escribir contenido
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # Escribir contenido (temporal + rename; crea los directorios)
+            new_hash = write_file_atomic(full_path, content)
+            sync_path(workspace_manager.get_workspace_path(user_id), full_path)
+            search_index.sync_path(workspace_manager.get_workspace_path(user_id), full_path)
 
             # Notificar a todos los clientes en la sala del workspace
             room_id = f"workspace_{user_id}"
@@ -672,7 +843,9 @@ def init_xterm_blueprint(app, socketio):
 
             emit('file_written', {
                 'success': True,
-                'path': file_path
+                'path': file_path,
+                'hash': new_hash,
+                'quota_warning': quota['over_soft_quota']
             }, room=request.sid)
 
         except Exception as e:
@@ -683,10 +856,106 @@ def init_xterm_blueprint(app, socketio):
                 'error': str(e)
             }, room=request.sid)
 
+    @socketio.on('patch_file')
+    def handle_patch_file(data):
+        """Aplica ediciones sobre la versión base de un archivo."""
+        file_path = data.get('path', '')
+        user_id = data.get('user_id', DEFAULT_WORKSPACE)
+
+        if not file_path or 'base_hash' not in data or 'edits' not in data:
+            emit('file_patched', {
+                'success': False,
+                'path': file_path,
+                'error': 'Se requiere ruta de archivo, hash base y ediciones'
+            }, room=request.sid)
+            return
+
+        try:
+            try:
+                full_path = workspace_manager.get_full_path(user_id, file_path)
+            except ValueError as e:
+                emit('file_patched', {
+                    'success': False,
+                    'path': file_path,
+                    'error': str(e)
+                }, room=request.sid)
+                return
+
+            try:
+                edits = data['edits'] if isinstance(data['edits'], list) else []
+                added = sum(len(str(edit.get('text', '')).encode('utf-8'))
+                            for edit in edits if isinstance(edit, dict))
+                get_workspace_maintenance().check_write(workspace_manager.get_workspace_path(user_id), added)
+            except QuotaExceededError as e:
+                emit('file_patched', {
+                    'success': False,
+                    'path': file_path,
+                    'error': str(e),
+                    'quota_exceeded': True
+                }, room=request.sid)
+                return
+
+            try:
+                result = apply_patch(full_path, data['base_hash'], data['edits'])
+            except FileNotFoundError:
+                emit('file_patched', {
+                    'success': False,
+                    'path': file_path,
+                    'error': 'Archivo no encontrado'
+                }, room=request.sid)
+                return
+            except StaleBaseError as e:
+                emit('file_patched', {
+                    'success': False,
+                    'path': file_path,
+                    'error': str(e),
+                    'stale': True,
+                    'current_hash': e.current_hash
+                }, room=request.sid)
+                return
+            except PatchError as e:
+                emit('file_patched', {
+                    'success': False,
+                    'path': file_path,
+                    'error': str(e)
+                }, room=request.sid)
+                return
+            sync_path(workspace_manager.get_workspace_path(user_id), full_path)
+            search_index.sync_path(workspace_manager.get_workspace_path(user_id), full_path)
+
+            emit('file_change', {
+                'type': 'write',
+                'path': file_path,
+                'message': f'Archivo actualizado: {file_path}',
+                'user_id': user_id
+            }, room=f"workspace_{user_id}")
+
+            emit('file_patched', {
+                'success': True,
+                'path': file_path,
+                'hash': result['hash'],
+                'size': result['size']
+            }, room=request.sid)
+
+        except Exception as e:
+            logger.error(f"Error al aplicar parche: {str(e)}")
+            logger.error(traceback.format_exc())
+            emit('file_patched', {
+                'success': False,
+                'path': file_path,
+                'error': str(e)
+            }, room=request.sid)
+
     # Configurar servidor WebSocket para Yjs
     @socketio.on('yjs')
     def handle_yjs(data):
-        """Maneja mensajes de sincronización Yjs."""
+        """
+        Maneja mensajes de sincronización Yjs.
+
+        Las actualizaciones del documento (action 'update' o 'sync') se guardan
+        en el log de la sala antes de reenviarse; al unirse ('join'), el
+        cliente recibe lo que le falta respecto a su state_vector.
+        """
         # Extraer información
         room = data.get('room')
         action = data.get('action')
@@ -704,8 +973,50 @@ def init_xterm_blueprint(app, socketio):
                 'room': room,
                 'user_id': user_id
             }, room=request.sid)
+
+            try:
+                state_vector, encoding = decode_payload(data.get('state_vector'))
+                if data.get('encoding') == 'base64':
+                    encoding = 'base64'
+                state = get_yjs_store().sync(room, state_vector)
+            except Exception as e:
+                logger.error(f"Error sincronizando la sala Yjs {room}: {str(e)}")
+                emit('yjs', {
+                    'action': 'error',
+                    'room': room,
+                    'error': str(e)
+                }, room=request.sid)
+                return
+
+            message = {
+                'action': 'sync',
+                'room': room,
+                'state_vector': encode_payload(state['state_vector'], encoding),
+                'encoding': encoding
+            }
+            if 'updates' in state:
+                message['updates'] = [encode_payload(update, encoding) for update in state['updates']]
+            else:
+                message['update'] = encode_payload(state['update'], encoding)
+            emit('yjs', message, room=request.sid)
             return
 
+        # Guardar los cambios del documento (no la presencia ni otros mensajes efímeros)
+        if action in ('update', 'sync'):
+            try:
+                update, _ = decode_payload(payload)
+                get_yjs_store().append(room, update)
+            except InvalidUpdateError as e:
+                emit('yjs', {
+                    'action': 'error',
+                    'room': room,
+                    'error': str(e)
+                }, room=request.sid)
+                return
+            except Exception as e:
+                # Sin persistencia el mensaje se reenvía igualmente a los demás
+                logger.error(f"Error guardando la actualización Yjs de {room}: {str(e)}")
+
         # Reenviar el mensaje a todos en la sala excepto al emisor
         emit('yjs', {
             'action': action,
@@ -727,6 +1038,95 @@ def init_xterm_blueprint(app, socketio):
         }, room=request.sid)
         logger.info(f"Cliente {request.sid} unido al workspace {user_id}")
 
+    @socketio.on('pty_open')
+    def handle_pty_open(data):
+        """Abre (o reanuda) el shell persistente de una terminal."""
+        # El workspace del shell sale de la sesión HTTP, no de lo que envía el cliente
+        user_id = flask_session.get('user_id', DEFAULT_WORKSPACE)
+        terminal_id = data.get('terminal_id') or request.sid
+        try:
+            rows = max(1, min(int(data.get('rows', 24)), 500))
+            cols = max(1, min(int(data.get('cols', 80)), 1000))
+            workspace_path = workspace_manager.get_workspace_path(user_id)
+            session, created = pty_manager.open(user_id, terminal_id, workspace_path, request.sid, rows, cols)
+        except (SessionLimitError, PtyUnavailableError, ValueError) as e:
+            emit('pty_error', {'terminal_id': terminal_id, 'error': str(e)}, room=request.sid)
+            return
+        except Exception as e:
+            logger.error(f"Error abriendo la terminal {terminal_id}: {str(e)}")
+            emit('pty_error', {'terminal_id': terminal_id, 'error': str(e)}, room=request.sid)
+            return
+
+        join_room(session_room(session.session_id))
+        emit('pty_opened', {
+            'session_id': session.session_id,
+            'terminal_id': terminal_id,
+            'created': created,
+            # Al reanudar, la salida reciente para repintar la terminal
+            'scrollback': '' if created else session.scrollback()
+        }, room=request.sid)
+
+    @socketio.on('pty_input')
+    def handle_pty_input(data):
+        """Envía al shell lo que el usuario teclea."""
+        session = pty_manager.get(data.get('session_id'), request.sid)
+        if session is None:
+            emit('pty_error', {
+                'session_id': data.get('session_id'),
+                'error': 'La terminal no existe o ya se cerró'
+            }, room=request.sid)
+            return
+        get_workspace_maintenance().touch(session.workspace_path)
+        try:
+            session.write(data.get('data', ''))
+        except OSError as e:
+            emit('pty_error', {'session_id': session.session_id, 'error': str(e)}, room=request.sid)
+
+    @socketio.on('pty_command')
+    def handle_pty_command(data):
+        """Teclea en el shell un comando completo (los "!comando"), validado con la política."""
+        session = pty_manager.get(data.get('session_id'), request.sid)
+        if session is None:
+            emit('pty_error', {
+                'session_id': data.get('session_id'),
+                'error': 'La terminal no existe o ya se cerró'
+            }, room=request.sid)
+            return
+        command = data.get('command', '')
+        decision = is_command_safe(command)
+        if not decision:
+            emit('pty_command_rejected', {
+                'session_id': session.session_id,
+                'command': command,
+                'error': f'Comando no permitido: {decision.reason}',
+                'rule': decision.rule
+            }, room=request.sid)
+            return
+        get_workspace_maintenance().touch(session.workspace_path)
+        try:
+            session.write(command + '\r')
+        except OSError as e:
+            emit('pty_error', {'session_id': session.session_id, 'error': str(e)}, room=request.sid)
+
+    @socketio.on('pty_resize')
+    def handle_pty_resize(data):
+        """Ajusta el tamaño del PTY al de la terminal del cliente."""
+        session = pty_manager.get(data.get('session_id'), request.sid)
+        if session is None:
+            return
+        try:
+            session.resize(max(1, min(int(data.get('rows', 24)), 500)),
+                           max(1, min(int(data.get('cols', 80)), 1000)))
+        except (ValueError, OSError):
+            pass
+
+    @socketio.on('pty_close')
+    def handle_pty_close(data):
+        """Cierra el shell de una terminal."""
+        session = pty_manager.get(data.get('session_id'), request.sid)
+        if session is not None:
+            pty_manager.close(session.session_id)
+
     logger.info("Terminal xterm.js y colaboración en tiempo real inicializados")
 
 
@@ -0,0 +1,328 @@
+"""
+Estado de los documentos Yjs de las salas de colaboración.
+
+El servidor guarda cada actualización CRDT recibida en un log por sala
+(tablas SQL con SQLAlchemy, en la misma base de datos que los trabajos del
+constructor) y lo compacta periódicamente en una instantánea fusionada. Al
+unirse a una sala, el cliente envía su vector de estado y recibe solo lo que
+le falta, junto con el vector de estado del servidor para devolver lo que el
+servidor no tiene. El coste de unirse depende del tamaño del documento, no
+de la longitud de su historial.
+
+La fusión de actualizaciones usa pycrdt (implementación de Yjs), declarado
+en requirements.txt y pyproject.toml. Si falta, se registra un error al
+importar el módulo: el log se conserva sin compactar y al unirse se envían
+todas sus entradas.
+"""
+import os
+import time
+import base64
+import logging
+import threading
+
+from sqlalchemy import (
+    create_engine, event, MetaData, Table, Column, Index,
+    String, Integer, Float, LargeBinary, select, insert, update, delete, func
+)
+from sqlalchemy.exc import IntegrityError
+
+try:
+    from pycrdt import merge_updates, get_state, get_update
+    CRDT_AVAILABLE = True
+except ImportError:
+    CRDT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+if not CRDT_AVAILABLE:
+    logger.error("pycrdt no está instalado: los documentos Yjs no se compactarán y cada "
+                 "unión a una sala reenviará el log completo (pip install pycrdt)")
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.abspath(os.path.join('instance', 'codestorm.db'))
+YJS_DATABASE_URL = (os.environ.get('YJS_DATABASE_URL')
+                    or os.environ.get('DATABASE_URL')
+                    or DEFAULT_DATABASE_URL)
+COMPACT_EVERY = int(os.environ.get('YJS_COMPACT_EVERY', '200'))
+COMPACT_INTERVAL = float(os.environ.get('YJS_COMPACT_INTERVAL', '60'))
+
+metadata = MetaData()
+
+documents_table = Table(
+    'yjs_documents', metadata,
+    Column('room', String(255), primary_key=True),
+    Column('snapshot', LargeBinary),
+    Column('snapshot_id', Integer, nullable=False, default=0),   # Última actualización incluida
+    Column('updated_at', Float, nullable=False)
+)
+
+updates_table = Table(
+    'yjs_updates', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('room', String(255), nullable=False),
+    Column('data', LargeBinary, nullable=False),
+    Column('created_at', Float, nullable=False),
+    Index('ix_yjs_updates_room_id', 'room', 'id'),
+    # Los id no deben reutilizarse tras compactar: marcan la posición en el log
+    sqlite_autoincrement=True
+)
+
+
+class InvalidUpdateError(ValueError):
+    """La actualización recibida no es una actualización Yjs válida."""
+
+
+def decode_payload(value):
+    """
+    Normaliza una actualización o vector de estado recibido por Socket.IO.
+
+    Returns:
+        tuple: (bytes, codificación) donde la codificación es 'binary' o 'base64'
+    """
+    if value is None:
+        return None, 'binary'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value), 'binary'
+    if isinstance(value, list):
+        try:
+            return bytes(value), 'binary'
+        except (TypeError, ValueError):
+            raise InvalidUpdateError("Carga útil binaria no válida")
+    if isinstance(value, str):
+        try:
+            return base64.b64decode(value, validate=True), 'base64'
+        except ValueError:
+            raise InvalidUpdateError("Carga útil base64 no válida")
+    raise InvalidUpdateError("Formato de carga útil no soportado")
+
+
+def encode_payload(data, encoding):
+    """Codifica bytes como los envió el cliente."""
+    if data is None:
+        return None
+    return base64.b64encode(data).decode('ascii') if encoding == 'base64' else data
+
+
+class _Room:
+    __slots__ = ('snapshot', 'snapshot_id', 'tail', 'last_id', 'merged', 'merged_id',
+                 'compacted_at', 'lock')
+
+    def __init__(self):
+        self.snapshot = None
+        self.snapshot_id = 0
+        self.tail = []          # [(id, actualización)] posteriores a la instantánea
+        self.last_id = 0
+        self.merged = None      # Documento fusionado hasta merged_id (caché)
+        self.merged_id = -1
+        self.compacted_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class YjsStore:
+    """Log de actualizaciones por sala con instantáneas compactadas."""
+
+    def __init__(self, database_url=YJS_DATABASE_URL, compact_every=COMPACT_EVERY,
+                 compact_interval=COMPACT_INTERVAL):
+        connect_args = {}
+        if database_url.startswith('sqlite'):
+            database_path = database_url.split(':///', 1)[-1]
+            if database_path and database_path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+            connect_args['check_same_thread'] = False
+
+        self.engine = create_engine(database_url, pool_pre_ping=True, connect_args=connect_args)
+        if database_url.startswith('sqlite'):
+            @event.listens_for(self.engine, 'connect')
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA busy_timeout=5000')
+                cursor.close()
+
+        metadata.create_all(self.engine)
+
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self._rooms = {}
+        self._rooms_lock = threading.Lock()
+
+    def _room(self, name):
+        with self._rooms_lock:
+            room = self._rooms.get(name)
+            if room is None:
+                room = self._rooms[name] = _Room()
+                self._load(name, room)
+            return room
+
+    def _load(self, name, room):
+        # La instantánea guardada se carga en _catch_up, como al ver una compactación ajena
+        self._catch_up(name, room)
+
+    def _catch_up(self, name, room):
+        """
+        Añade a la cola las actualizaciones escritas por otros workers.
+
+        Si otro worker compactó la sala, sus actualizaciones ya no están en el
+        log: se recarga su instantánea y se descarta la parte de la cola que
+        incluye.
+        """
+        with self.engine.connect() as conn:
+            stored_id = conn.execute(
+                select(documents_table.c.snapshot_id).where(documents_table.c.room == name)
+            ).scalar()
+            if stored_id is not None and stored_id > room.snapshot_id:
+                row = conn.execute(
+                    select(documents_table.c.snapshot, documents_table.c.snapshot_id)
+                    .where(documents_table.c.room == name)
+                ).first()
+                room.snapshot, room.snapshot_id = row.snapshot, row.snapshot_id
+                room.tail = [(update_id, data) for update_id, data in room.tail
+                             if update_id > room.snapshot_id]
+                room.last_id = max(room.last_id, room.snapshot_id)
+                room.merged, room.merged_id = None, -1
+            rows = conn.execute(
+                select(updates_table.c.id, updates_table.c.data)
+                .where(updates_table.c.room == name)
+                .where(updates_table.c.id > room.last_id)
+                .order_by(updates_table.c.id)
+            ).all()
+        for row in rows:
+            room.tail.append((row.id, row.data))
+            room.last_id = row.id
+
+    def _merged(self, room):
+        """Documento completo de la sala (instantánea más cola), con caché."""
+        if room.merged_id == room.last_id:
+            return room.merged
+        parts = ([room.snapshot] if room.snapshot else []) + [data for _, data in room.tail]
+        room.merged = merge_updates(*parts) if len(parts) > 1 else (parts[0] if parts else None)
+        room.merged_id = room.last_id
+        return room.merged
+
+    def append(self, name, data):
+        """
+        Guarda una actualización de la sala.
+
+        Raises:
+            InvalidUpdateError: Si la actualización no es válida
+        """
+        if not data:
+            raise InvalidUpdateError("Actualización vacía")
+        if CRDT_AVAILABLE:
+            try:
+                get_state(data)
+            except Exception:
+                raise InvalidUpdateError("La actualización no es un update Yjs válido")
+
+        room = self._room(name)
+        with room.lock:
+            with self.engine.begin() as conn:
+                update_id = conn.execute(insert(updates_table).values(
+                    room=name, data=data, created_at=time.time()
+                )).inserted_primary_key[0]
+            # Recoge esta actualización y las escritas por otros workers, en orden de id
+            self._catch_up(name, room)
+
+            if CRDT_AVAILABLE and (len(room.tail) >= self.compact_every or
+                                   time.monotonic() - room.compacted_at >= self.compact_interval):
+                self._compact(name, room)
+        return update_id
+
+    def _compact(self, name, room):
+        """Fusiona la cola en la instantánea y elimina las actualizaciones incluidas."""
+        if not room.tail:
+            room.compacted_at = time.monotonic()
+            return
+        snapshot = self._merged(room)
+        snapshot_id = room.last_id
+        now = time.time()
+        try:
+            with self.engine.begin() as conn:
+                # Solo se reemplaza la instantánea sobre la que se fusionó: si otro
+                # worker compactó entretanto, la suya se recarga en el próximo _catch_up
+                result = conn.execute(update(documents_table)
+                                      .where(documents_table.c.room == name)
+                                      .where(documents_table.c.snapshot_id == room.snapshot_id)
+                                      .values(snapshot=snapshot, snapshot_id=snapshot_id, updated_at=now))
+                if result.rowcount == 0:
+                    exists = conn.execute(select(documents_table.c.room)
+                                          .where(documents_table.c.room == name)).first()
+                    if exists or room.snapshot_id:
+                        room.compacted_at = time.monotonic()
+                        return
+                    conn.execute(insert(documents_table).values(
+                        room=name, snapshot=snapshot, snapshot_id=snapshot_id, updated_at=now
+                    ))
+                conn.execute(delete(updates_table)
+                             .where(updates_table.c.room == name)
+                             .where(updates_table.c.id <= snapshot_id))
+        except IntegrityError:
+            # Otro worker creó la instantánea a la vez; se compactará en la próxima ocasión
+            return
+        room.snapshot, room.snapshot_id = snapshot, snapshot_id
+        room.tail = []
+        room.compacted_at = time.monotonic()
+        logger.debug(f"Sala Yjs {name} compactada hasta la actualización {snapshot_id}")
+
+    def sync(self, name, state_vector=None):
+        """
+        Estado que necesita un cliente que se une a la sala.
+
+        Args:
+            state_vector: Vector de estado del cliente (None si no tiene documento)
+
+        Returns:
+            dict: update con lo que le falta al cliente y state_vector del
+                servidor; sin pycrdt, updates con todas las entradas del log
+        """
+        room = self._room(name)
+        with room.lock:
+            self._catch_up(name, room)
+            if not CRDT_AVAILABLE:
+                updates = ([room.snapshot] if room.snapshot else []) + [data for _, data in room.tail]
+                return {'updates': updates, 'state_vector': None}
+
+            document = self._merged(room)
+            if document is None:
+                return {'update': None, 'state_vector': None}
+            missing = get_update(document, state_vector) if state_vector else document
+            return {'update': missing, 'state_vector': get_state(document)}
+
+    def compact(self, name=None):
+        """Compacta una sala (o todas las cargadas) inmediatamente."""
+        if not CRDT_AVAILABLE:
+            return
+        with self._rooms_lock:
+            if name is None:
+                rooms = list(self._rooms.items())
+            else:
+                rooms = [(name, self._rooms[name])] if name in self._rooms else []
+        for room_name, room in rooms:
+            with room.lock:
+                self._catch_up(room_name, room)
+                self._compact(room_name, room)
+
+    def stats(self):
+        with self._rooms_lock:
+            rooms = dict(self._rooms)
+        with self.engine.connect() as conn:
+            stored_updates = conn.execute(select(func.count()).select_from(updates_table)).scalar()
+        return {
+            'crdt_available': CRDT_AVAILABLE,
+            'rooms_loaded': len(rooms),
+            'pending_updates': sum(len(room.tail) for room in rooms.values()),
+            'stored_updates': stored_updates
+        }
+
+
+_yjs_store = None
+_yjs_store_lock = threading.Lock()
+
+
+def get_yjs_store():
+    """Obtiene la instancia global del almacén de documentos Yjs."""
+    global _yjs_store
+    if _yjs_store is None:
+        with _yjs_store_lock:
+            if _yjs_store is None:
+                _yjs_store = YjsStore()
+    return _yjs_store
@@ -0,0 +1,287 @@
+"""
+Descargas de directorios como ZIP con memoria constante y caché de artefactos.
+
+El ZIP se escribe en streaming: cada bloque comprimido se envía al cliente en
+cuanto se produce, sin construir el archivo completo en memoria. Mientras se
+envía, el ZIP se copia a la caché de artefactos, indexada por el manifiesto
+(ruta, mtime, tamaño) del directorio. Si el directorio no ha cambiado, las
+descargas siguientes se sirven directamente desde disco con send_file.
+"""
+import io
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import zipfile
+from flask import Response, send_file, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_CACHE_DIR = os.environ.get('ZIP_ARTIFACT_CACHE_DIR',
+                                    os.path.join('user_workspaces', '.artifacts'))
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get('ZIP_ARTIFACT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino no posicionable de ZipFile que acumula los bytes hasta que se drenan."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def directory_entries(directory, arc_root=None):
+    """
+    Archivos de un directorio en orden estable.
+
+    Args:
+        directory: Directorio a recorrer
+        arc_root: Prefijo de las rutas dentro del ZIP (None para ninguno)
+
+    Returns:
+        list: Tuplas (ruta, nombre_en_zip, os.stat_result)
+    """
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            arcname = os.path.relpath(path, directory)
+            if arc_root:
+                arcname = os.path.join(arc_root, arcname)
+            entries.append((path, arcname.replace(os.sep, '/'), st))
+    return entries
+
+
+def manifest_digest(entries):
+    """Huella del manifiesto (nombre, mtime, tamaño) de los archivos."""
+    digest = hashlib.sha256()
+    for _, arcname, st in entries:
+        digest.update(f"{arcname}\0{st.st_mtime_ns}\0{st.st_size}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    """
+    Genera un ZIP por bloques con memoria constante.
+
+    Args:
+        entries: Tuplas (ruta, nombre_en_zip, stat) como las de directory_entries()
+
+    Yields:
+        bytes: Bloques del archivo ZIP en orden
+    """
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w', compression) as zipf:
+        for path, arcname, _ in entries:
+            try:
+                # file_size del ZipInfo decide si la entrada necesita ZIP64
+                zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                zinfo.compress_type = compression
+                # Los archivos enlazados al almacén de blobs son de solo lectura en disco
+                zinfo.external_attr |= 0o200 << 16
+                with open(path, 'rb') as source, zipf.open(zinfo, 'w') as target:
+                    while True:
+                        block = source.read(CHUNK_SIZE)
+                        if not block:
+                            break
+                        target.write(block)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            except OSError as e:
+                # El archivo desapareció o no se puede leer: se omite
+                logger.warning(f"Omitiendo {path} en el ZIP: {str(e)}")
+            data = sink.drain()
+            if data:
+                yield data
+    # Directorio central
+    data = sink.drain()
+    if data:
+        yield data
+
+
+class ArtifactCache:
+    """
+    Caché en disco de los ZIP de directorios, indexada por manifiesto.
+
+    Cada directorio conserva solo su artefacto más reciente; cuando la caché
+    supera max_bytes se eliminan los artefactos usados hace más tiempo.
+    """
+
+    def __init__(self, cache_dir=ARTIFACT_CACHE_DIR, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, directory, arc_root, digest):
+        source_key = hashlib.sha256(f"{os.path.abspath(directory)}\0{arc_root or ''}".encode('utf-8')).hexdigest()[:24]
+        return source_key, os.path.join(self.cache_dir, f"{source_key}-{digest[:32]}.zip")
+
+    def lookup(self, directory, arc_root=None):
+        """
+        Busca el artefacto del estado actual del directorio.
+
+        Returns:
+            tuple: (ruta del artefacto o None si no está en caché, entradas, clave de origen, ruta destino)
+        """
+        entries = directory_entries(directory, arc_root)
+        source_key, path = self._paths(directory, arc_root, manifest_digest(entries))
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Marcar como usado recientemente
+            except OSError:
+                pass
+            return path, entries, source_key, path
+        return None, entries, source_key, path
+
+    def stream(self, entries, source_key, path):
+        """Genera el ZIP en streaming y lo guarda en la caché si se completa."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in stream_zip(entries):
+                    tmp.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self._commit(tmp_path, source_key, path)
+            else:
+                # Descarga interrumpida: el artefacto parcial no se conserva
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def build(self, directory, arc_root=None):
+        """
+        Asegura que el artefacto del directorio esté en caché.
+
+        Returns:
+            str: Ruta del artefacto
+        """
+        cached, entries, source_key, path = self.lookup(directory, arc_root)
+        if cached:
+            return cached
+        for _ in self.stream(entries, source_key, path):
+            pass
+        return path
+
+    def _commit(self, tmp_path, source_key, path):
+        with self._lock:
+            os.replace(tmp_path, path)
+            # Solo se conserva el artefacto más reciente de cada directorio
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(source_key + '-') and name.endswith('.zip') \
+                        and os.path.join(self.cache_dir, name) != path:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+            self._evict()
+
+    def _evict(self):
+        artifacts = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.zip'):
+                continue
+            full_path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            artifacts.append((st.st_mtime, st.st_size, full_path))
+            total += st.st_size
+        for _, size, full_path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(full_path)
+                total -= size
+            except OSError:
+                pass
+
+    def expire(self, max_age):
+        """
+        Elimina los artefactos sin usar en max_age segundos y los .part abandonados.
+
+        Returns:
+            dict: removed (artefactos eliminados) y bytes liberados
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - max_age
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(('.zip', '.part')):
+                    continue
+                full_path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(full_path)
+                    # Un .part reciente puede estar escribiéndose todavía
+                    age_cutoff = min(cutoff, time.time() - 3600) if name.endswith('.part') else cutoff
+                    if st.st_mtime > age_cutoff:
+                        continue
+                    os.remove(full_path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return {'removed': removed, 'bytes': freed}
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    """Devuelve la caché de artefactos compartida."""
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            _artifact_cache = ArtifactCache()
+        return _artifact_cache
+
+
+def send_directory_zip(directory, download_name, arc_root=None):
+    """
+    Respuesta Flask con el directorio comprimido en ZIP.
+
+    Si el directorio no cambió desde la última descarga se envía el artefacto
+    en caché (con soporte de peticiones condicionales y por rangos); si no,
+    el ZIP se genera en streaming y se guarda en caché al terminar.
+    """
+    cache = get_artifact_cache()
+    cached, entries, source_key, path = cache.lookup(directory, arc_root)
+    if cached:
+        return send_file(cached, mimetype='application/zip', as_attachment=True,
+                         download_name=download_name, conditional=True)
+
+    response = Response(stream_with_context(cache.stream(entries, source_key, path)),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response